@@ -21,15 +21,24 @@ def write_file(filename, content, mode=_DEF_PERMS,
         except OSError:
             pass
 
+    # content may also be an iterable of chunks, written one at a time
+    if isinstance(content, (str, bytes)):
+        chunks = [content]
+        size = "%d bytes/chars" % len(content)
+    else:
+        chunks = content
+        size = "streamed"
+
     tf = None
     try:
         tf = tempfile.NamedTemporaryFile(dir=os.path.dirname(filename),
                                          delete=False, mode=omode)
         LOG.debug(
             "Atomically writing to file %s (via temporary file %s) - %s: [%o]"
-            " %d bytes/chars",
-            filename, tf.name, omode, mode, len(content))
-        tf.write(content)
+            " %s",
+            filename, tf.name, omode, mode, size)
+        for chunk in chunks:
+            tf.write(chunk)
         tf.close()
         os.chmod(tf.name, mode)
         os.rename(tf.name, filename)
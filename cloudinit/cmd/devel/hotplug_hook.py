@@ -0,0 +1,248 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Handle reconfiguration on hotplug events."""
+
+import argparse
+import os
+import select
+import time
+from collections import OrderedDict
+from functools import partial
+
+from cloudinit import log
+from cloudinit import net
+from cloudinit import sources
+from cloudinit.event import EventScope, EventType
+from cloudinit.reporting import events
+from cloudinit.stages import Init
+from . import addLogHandlerCLI
+
+NAME = 'hotplug-hook'
+
+LOG = log.getLogger(NAME)
+
+# Present in the run dir while hotplug events are enabled for the instance.
+# The udev rule only queues events when this file exists.
+HOTPLUG_ENABLED_FILE = 'hotplug.enabled'
+# FIFO the udev rule writes events to. cloud-init-hotplugd.socket listens on
+# it and starts cloud-init-hotplugd.service to handle the queued events.
+HOTPLUG_FIFO_FILE = 'hotplug.fifo'
+
+# First file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+# Seconds to wait for a burst of events to be queued before handling them
+SETTLE_DELAY = 0.1
+# Seconds to wait between metadata refreshes which do not yet reflect the
+# queued events
+RETRY_DELAYS = (1, 3, 5, 10)
+
+SUPPORTED_SUBSYSTEMS = ('net',)
+
+
+def get_parser(parser=None):
+    """Build or extend an arg parser for hotplug-hook utility.
+
+    @param parser: Optional existing ArgumentParser instance representing the
+        subcommand which will be extended to support the args of this utility.
+
+    @returns: ArgumentParser with proper argument configuration.
+    """
+    if not parser:
+        parser = argparse.ArgumentParser(prog=NAME, description=__doc__)
+    parser.add_argument(
+        '-s', '--subsystem', required=True, choices=SUPPORTED_SUBSYSTEMS,
+        help='subsystem of the hotplugged device')
+    parser.add_argument(
+        '-d', '--devpath', metavar='PATH',
+        help='sysfs path of the hotplugged device')
+    parser.add_argument(
+        '-u', '--udevaction', choices=['add', 'remove'],
+        help='udev action of the event')
+    parser.add_argument(
+        '--listen', action='store_true', default=False,
+        help=('handle the events queued on the FIFO passed by'
+              ' cloud-init-hotplugd.socket instead of a single event'))
+    return parser
+
+
+def parse_events(data):
+    """Return the last action per devpath of the queued event lines.
+
+    Each line holds an action and a devpath, as written by the udev rule.
+    Bursts of events for one device coalesce into its final action, so a
+    device added and removed again before it was handled is only removed.
+
+    @return: OrderedDict of devpath to action, in order of first event.
+    """
+    actions = OrderedDict()
+    for line in data.splitlines():
+        action, _, devpath = line.strip().partition(' ')
+        if action not in ('add', 'remove') or not devpath:
+            LOG.warning('Ignoring malformed hotplug event: %s', line)
+            continue
+        actions[devpath] = action
+    return actions
+
+
+def read_events(fd, settle=SETTLE_DELAY):
+    """Read events from fd until none arrived for settle seconds.
+
+    Writes of a single event line to a FIFO are atomic, so every read
+    returns whole lines.
+
+    @return: OrderedDict of devpath to action, see parse_events.
+    """
+    data = b''
+    while select.select([fd], [], [], settle)[0]:
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    return parse_events(data.decode('utf-8', 'replace'))
+
+
+def listen_fd():
+    """Return the FIFO file descriptor passed by systemd, or None."""
+    if os.environ.get('LISTEN_PID') != str(os.getpid()):
+        return None
+    if int(os.environ.get('LISTEN_FDS', 0)) < 1:
+        return None
+    return SD_LISTEN_FDS_START
+
+
+def _events_applied(netcfg, actions):
+    """Return whether netcfg reflects the add and remove actions."""
+    physdevs = net.extract_physdevs(netcfg)
+    macs = set(dev[0] for dev in physdevs)
+    names = set(dev[1] for dev in physdevs)
+    for devpath, action in actions.items():
+        name = os.path.basename(devpath)
+        if action == 'add':
+            # a device already gone again has nothing to wait for
+            mac = net.get_interface_mac(name)
+            if mac and mac not in macs:
+                return False
+        elif name in names:
+            return False
+    return True
+
+
+def handle_net_events(hotplug_init, actions):
+    """Refresh network metadata and apply it for the coalesced actions.
+
+    Only the network metadata of the cached datasource is refreshed and
+    only network configuration is rendered; no config modules run. Config
+    is rendered only when it changed and only the added interfaces are
+    brought up.
+
+    @return 0 on success, 1 on failure.
+    """
+    datasource = hotplug_init.datasource
+    netcfg = None
+    for delay in RETRY_DELAYS + (None,):
+        if not datasource.update_metadata_if_supported([EventType.HOTPLUG]):
+            LOG.warning(
+                'Datasource %s does not support hotplug events', datasource)
+            return 1
+        netcfg = datasource.network_config
+        if netcfg and _events_applied(netcfg, actions):
+            break
+        if delay is None:
+            LOG.warning(
+                'Metadata of %s does not reflect hotplug events: %s',
+                datasource, ', '.join(
+                    '%s %s' % (action, devpath)
+                    for devpath, action in actions.items()))
+            return 1
+        LOG.debug('Metadata does not yet reflect hotplug events,'
+                  ' retrying in %s seconds', delay)
+        time.sleep(delay)
+
+    distro = hotplug_init.distro
+    try:
+        distro.apply_network_config_names(netcfg)
+    except Exception as e:
+        LOG.warning("Failed to rename devices: %s", e)
+
+    if distro.network_config_changed(netcfg):
+        LOG.info('Applying network configuration for hotplug events: %s',
+                 netcfg)
+        try:
+            distro.apply_network_config(netcfg, bring_up=False)
+        finally:
+            net.invalidate_interface_snapshot()
+    else:
+        LOG.debug('Network configuration unchanged by hotplug events')
+
+    added_macs = set(
+        net.get_interface_mac(os.path.basename(devpath))
+        for devpath, action in actions.items() if action == 'add')
+    added = [dev[1] for dev in net.extract_physdevs(netcfg)
+             if dev[0] in added_macs]
+    if added and not distro._bring_up_interfaces(added):
+        LOG.warning('Failed to bring up hotplugged interfaces: %s',
+                    ', '.join(added))
+        return 1
+    hotplug_init._write_to_cache()
+    return 0
+
+
+def handle_events(hotplug_init, actions):
+    """Handle coalesced actions against the cached datasource.
+
+    @return 0 on success, 1 on failure.
+    """
+    try:
+        hotplug_init.fetch(existing='trust')
+    except sources.DataSourceNotFoundException:
+        LOG.warning('No cached datasource found, ignoring hotplug events')
+        return 1
+    if not hotplug_init.update_event_enabled(
+            EventType.HOTPLUG, scope=EventScope.NETWORK):
+        LOG.debug('Hotplug events are not enabled')
+        return 0
+    with events.ReportEventStack(
+            name='handle-events',
+            description='handle %d hotplug events' % len(actions),
+            parent=hotplug_init.reporter):
+        return handle_net_events(hotplug_init, actions)
+
+
+def handle_args(name, args):
+    """Handle a single hotplug event or the events queued by udev.
+
+    With --listen, events are read from the FIFO passed by systemd until
+    none arrived for SETTLE_DELAY. Events written after that start the
+    service again, so nothing is left queued when it exits.
+
+    @return 0 on success, 1 on failure.
+    """
+    addLogHandlerCLI(LOG, log.DEBUG)
+    if args.listen:
+        fd = listen_fd()
+        if fd is None:
+            LOG.error('No FIFO passed by cloud-init-hotplugd.socket')
+            return 1
+        next_events = partial(read_events, fd)
+    elif args.devpath and args.udevaction:
+        queued = [OrderedDict([(args.devpath, args.udevaction)])]
+        next_events = partial(next, iter(queued), None)
+    else:
+        LOG.error('Either --listen or --devpath and --udevaction are required')
+        return 1
+
+    reporter = events.ReportEventStack(
+        name=NAME, description='cloud-init hotplug hook',
+        reporting_enabled=True)
+    hotplug_init = Init(ds_deps=[], reporter=reporter)
+    hotplug_init.read_cfg()
+    result = 0
+    actions = next_events()
+    while actions:
+        if handle_events(hotplug_init, actions):
+            result = 1
+        actions = next_events()
+    return result
+
+# vi: ts=4 expandtab
@@ -10,7 +10,9 @@ import os
 import shutil
 import sys
 
+from cloudinit.profiling import get_profile_dir
 from cloudinit.sources import INSTANCE_JSON_SENSITIVE_FILE
+from cloudinit.stages import Init
 from cloudinit.temp_utils import tempdir
 from cloudinit.subp import (ProcessExecutionError, subp)
 from cloudinit.util import (chdir, copy, ensure_dir, write_file)
@@ -81,6 +83,13 @@ def _collect_file(path, out_dir, verbosity):
         _debug("file %s did not exist\n" % path, 2, verbosity)
 
 
+def _get_profile_dir():
+    """Return the profiling dir configured in the system config on disk."""
+    init = Init(ds_deps=[])
+    init.read_cfg()
+    return get_profile_dir(init.cfg)
+
+
 def collect_logs(tarfile, include_userdata, verbosity=0):
     """Collect all cloud-init logs and tar them up into the provided tarfile.
 
@@ -130,6 +139,13 @@ def collect_logs(tarfile, include_userdata, verbosity=0):
         else:
             _debug("directory '%s' did not exist\n" % CLOUDINIT_RUN_DIR, 1,
                    verbosity)
+        profile_dir = _get_profile_dir()  # Optional, see profiling.py
+        if os.path.isdir(profile_dir):
+            shutil.copytree(profile_dir, os.path.join(log_dir, 'profile'))
+            _debug("collected dir %s\n" % profile_dir, 1, verbosity)
+        else:
+            _debug("directory '%s' did not exist\n" % profile_dir, 2,
+                   verbosity)
         with chdir(tmp_dir):
             subp(['tar', 'czvf', tarfile, log_dir.replace(tmp_dir + '/', '')])
     sys.stderr.write("Wrote %s\n" % tarfile)
@@ -7,6 +7,7 @@
 import argparse
 from cloudinit.config import schema
 
+from . import hotplug_hook
 from . import net_convert
 from . import render
 from . import make_mime
@@ -29,6 +30,8 @@ def get_parser(parser=None):
          render.get_parser, render.handle_args),
         (make_mime.NAME, make_mime.__doc__,
          make_mime.get_parser, make_mime.handle_args),
+        (hotplug_hook.NAME, hotplug_hook.__doc__,
+         hotplug_hook.get_parser, hotplug_hook.handle_args),
     ]
     for (subcmd, helpmsg, get_parser, handler) in subcmds:
         parser = subparsers.add_parser(subcmd, help=helpmsg)
@@ -0,0 +1,237 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import os
+from collections import namedtuple
+
+from cloudinit.cmd.devel import hotplug_hook
+from cloudinit.event import EventScope, EventType
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import load_file
+
+M_PATH = 'cloudinit.cmd.devel.hotplug_hook.'
+
+NETCFG_ETH0 = {'version': 1, 'config': [
+    {'type': 'physical', 'name': 'eth0', 'mac_address': '00:00:00:00:00:01',
+     'subnets': [{'type': 'dhcp'}]}]}
+NETCFG_ETH0_ETH1 = {'version': 1, 'config': NETCFG_ETH0['config'] + [
+    {'type': 'physical', 'name': 'eth1', 'mac_address': '00:00:00:00:00:02',
+     'subnets': [{'type': 'dhcp'}]}]}
+
+MACS = {'eth0': '00:00:00:00:00:01', 'ens5': '00:00:00:00:00:02'}
+
+
+class TestEventQueue(CiTestCase):
+
+    with_logs = True
+
+    def test_parse_events_coalesces_per_device(self):
+        """Bursts for one device reduce to its last action, in order."""
+        self.assertEqual(
+            [('/devices/a/net/eth1', 'remove'),
+             ('/devices/b/net/eth2', 'add')],
+            list(hotplug_hook.parse_events(
+                'add /devices/a/net/eth1\n'
+                'add /devices/b/net/eth2\n'
+                'remove /devices/a/net/eth1\n').items()))
+
+    def test_parse_events_ignores_malformed_lines(self):
+        self.assertEqual(
+            {'/devices/net/eth1': 'add'},
+            hotplug_hook.parse_events(
+                'change /devices/net/eth0\nadd\nadd /devices/net/eth1\n'))
+        self.assertIn('Ignoring malformed hotplug event: change',
+                      self.logs.getvalue())
+
+    def test_read_events_reads_queued_events(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        os.write(write_fd, b'add /devices/net/eth1\n')
+        os.write(write_fd, b'add /devices/net/eth2\n')
+        os.close(write_fd)
+        self.assertEqual(
+            {'/devices/net/eth1': 'add', '/devices/net/eth2': 'add'},
+            hotplug_hook.read_events(read_fd, settle=0))
+
+    def test_read_events_without_events(self):
+        """An empty FIFO returns once the settle delay passed."""
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        self.assertEqual({}, hotplug_hook.read_events(read_fd, settle=0))
+
+
+class TestListenFd(CiTestCase):
+
+    def test_fd_passed_to_this_process(self):
+        with mock.patch.dict('os.environ', {
+                'LISTEN_PID': str(os.getpid()), 'LISTEN_FDS': '1'}):
+            self.assertEqual(3, hotplug_hook.listen_fd())
+
+    def test_fd_passed_to_other_process(self):
+        with mock.patch.dict('os.environ', {
+                'LISTEN_PID': str(os.getpid() + 1), 'LISTEN_FDS': '1'}):
+            self.assertIsNone(hotplug_hook.listen_fd())
+
+    def test_no_fd_passed(self):
+        with mock.patch.dict('os.environ', clear=True):
+            self.assertIsNone(hotplug_hook.listen_fd())
+
+
+class TestHandleArgs(CiTestCase):
+
+    with_logs = True
+
+    args = namedtuple('hotplugargs', 'subsystem devpath udevaction listen')
+
+    def setUp(self):
+        super(TestHandleArgs, self).setUp()
+        self.add_patch(M_PATH + 'Init', 'm_init')
+        self.add_patch(M_PATH + 'addLogHandlerCLI', 'm_log')
+        self.add_patch(M_PATH + 'handle_events', 'm_handle', return_value=0)
+
+    def test_single_event(self):
+        self.assertEqual(0, hotplug_hook.handle_args(
+            'hotplug-hook',
+            self.args('net', '/devices/net/eth1', 'add', False)))
+        self.m_handle.assert_called_once_with(
+            self.m_init.return_value, {'/devices/net/eth1': 'add'})
+
+    def test_single_event_needs_devpath_and_action(self):
+        self.assertEqual(1, hotplug_hook.handle_args(
+            'hotplug-hook',
+            self.args('net', '/devices/net/eth1', None, False)))
+        self.assertEqual(0, self.m_handle.call_count)
+
+    @mock.patch(M_PATH + 'read_events')
+    @mock.patch(M_PATH + 'listen_fd', return_value=3)
+    def test_listen_handles_events_until_none_queued(self, m_fd, m_read):
+        """Events queued while handling are handled by the same service."""
+        m_read.side_effect = [
+            {'/devices/net/eth1': 'add'}, {'/devices/net/eth2': 'add'}, {}]
+        self.m_handle.side_effect = [1, 0]
+        self.assertEqual(1, hotplug_hook.handle_args(
+            'hotplug-hook', self.args('net', None, None, True)))
+        self.assertEqual([mock.call(3)] * 3, m_read.call_args_list)
+        self.assertEqual(
+            [{'/devices/net/eth1': 'add'}, {'/devices/net/eth2': 'add'}],
+            [c[0][1] for c in self.m_handle.call_args_list])
+
+    @mock.patch(M_PATH + 'listen_fd', return_value=None)
+    def test_listen_without_socket_activation(self, m_fd):
+        self.assertEqual(1, hotplug_hook.handle_args(
+            'hotplug-hook', self.args('net', None, None, True)))
+        self.assertIn('No FIFO passed', self.logs.getvalue())
+        self.assertEqual(0, self.m_init.call_count)
+
+
+class TestHandleEvents(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestHandleEvents, self).setUp()
+        self.init = mock.Mock()
+        self.datasource = self.init.datasource
+        self.datasource.network_config = NETCFG_ETH0_ETH1
+        self.distro = self.init.distro
+        self.distro._bring_up_interfaces.return_value = True
+        self.add_patch(
+            M_PATH + 'net.get_interface_mac', 'm_mac', autospec=False,
+            side_effect=MACS.get)
+        self.add_patch(M_PATH + 'time.sleep', 'm_sleep')
+
+    def test_disabled_hotplug_refreshes_nothing(self):
+        self.init.update_event_enabled.return_value = False
+        self.assertEqual(0, hotplug_hook.handle_events(
+            self.init, {'/devices/net/ens5': 'add'}))
+        self.init.update_event_enabled.assert_called_once_with(
+            EventType.HOTPLUG, scope=EventScope.NETWORK)
+        self.assertEqual(
+            0, self.datasource.update_metadata_if_supported.call_count)
+
+    def test_add_renders_changed_config_and_brings_up_added_only(self):
+        """Only network metadata is refreshed and the new nic brought up."""
+        self.assertEqual(0, hotplug_hook.handle_net_events(
+            self.init, {'/devices/net/ens5': 'add'}))
+        self.datasource.update_metadata_if_supported.assert_called_once_with(
+            [EventType.HOTPLUG])
+        self.distro.apply_network_config_names.assert_called_once_with(
+            NETCFG_ETH0_ETH1)
+        self.distro.apply_network_config.assert_called_once_with(
+            NETCFG_ETH0_ETH1, bring_up=False)
+        self.distro._bring_up_interfaces.assert_called_once_with(['eth1'])
+        self.init._write_to_cache.assert_called_once_with()
+        self.assertEqual(0, self.m_sleep.call_count)
+
+    def test_unchanged_config_is_not_rendered(self):
+        self.distro.network_config_changed.return_value = False
+        self.assertEqual(0, hotplug_hook.handle_net_events(
+            self.init, {'/devices/net/ens5': 'add'}))
+        self.assertEqual(0, self.distro.apply_network_config.call_count)
+        self.distro._bring_up_interfaces.assert_called_once_with(['eth1'])
+
+    def test_remove_brings_nothing_up(self):
+        self.datasource.network_config = NETCFG_ETH0
+        self.assertEqual(0, hotplug_hook.handle_net_events(
+            self.init, {'/devices/net/eth1': 'remove'}))
+        self.distro.apply_network_config.assert_called_once_with(
+            NETCFG_ETH0, bring_up=False)
+        self.assertEqual(0, self.distro._bring_up_interfaces.call_count)
+
+    def test_retries_until_metadata_reflects_events(self):
+        """Metadata lagging behind the event is refreshed again."""
+        configs = iter([NETCFG_ETH0, NETCFG_ETH0_ETH1])
+
+        def update_metadata(events):
+            self.datasource.network_config = next(configs)
+            return True
+
+        self.datasource.update_metadata_if_supported.side_effect = (
+            update_metadata)
+        self.assertEqual(0, hotplug_hook.handle_net_events(
+            self.init, {'/devices/net/ens5': 'add'}))
+        self.m_sleep.assert_called_once_with(hotplug_hook.RETRY_DELAYS[0])
+        self.distro._bring_up_interfaces.assert_called_once_with(['eth1'])
+
+    def test_gives_up_when_metadata_never_reflects_events(self):
+        self.datasource.network_config = NETCFG_ETH0
+        self.assertEqual(1, hotplug_hook.handle_net_events(
+            self.init, {'/devices/net/ens5': 'add'}))
+        self.assertEqual(
+            [mock.call(delay) for delay in hotplug_hook.RETRY_DELAYS],
+            self.m_sleep.call_args_list)
+        self.assertEqual(0, self.distro.apply_network_config.call_count)
+        self.assertIn('does not reflect hotplug events', self.logs.getvalue())
+
+    def test_unsupported_datasource(self):
+        self.datasource.update_metadata_if_supported.return_value = False
+        self.assertEqual(1, hotplug_hook.handle_net_events(
+            self.init, {'/devices/net/ens5': 'add'}))
+        self.assertEqual(0, self.distro.apply_network_config.call_count)
+        self.assertIn('does not support hotplug events', self.logs.getvalue())
+
+
+class TestUdevRule(CiTestCase):
+
+    def test_rule_only_queues_events(self):
+        """The udev rule is gated on the file written by cloud-init and
+        only writes the event to the FIFO of cloud-init-hotplugd.socket."""
+        topdir = os.path.join(
+            os.path.dirname(__file__), '..', '..', '..', '..')
+        rule = load_file(os.path.join(
+            topdir, 'udev', '10-cloud-init-hook-hotplug.rules'))
+        fifo = '/run/cloud-init/%s' % hotplug_hook.HOTPLUG_FIFO_FILE
+        self.assertIn(
+            'TEST!="/run/cloud-init/%s"' % hotplug_hook.HOTPLUG_ENABLED_FILE,
+            rule)
+        self.assertIn('1<>%s' % fifo, rule)
+        self.assertNotIn('cloud-init devel', rule)
+        socket = load_file(os.path.join(
+            topdir, 'systemd', 'cloud-init-hotplugd.socket'))
+        self.assertIn('ListenFIFO=%s' % fifo, socket)
+        service = load_file(os.path.join(
+            topdir, 'systemd', 'cloud-init-hotplugd.service'))
+        self.assertIn('devel %s --subsystem=net --listen' % hotplug_hook.NAME,
+                      service)
+
+# vi: ts=4 expandtab
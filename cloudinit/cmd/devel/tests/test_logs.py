@@ -43,6 +43,8 @@ class TestCollectLogs(FilesystemMockingTestCase):
         write_file(self.tmp_path('results.json', self.run_dir), 'results')
         write_file(self.tmp_path(INSTANCE_JSON_SENSITIVE_FILE, self.run_dir),
                    'sensitive')
+        profile_dir = self.tmp_path('profile', self.new_root)
+        write_file(self.tmp_path('summary.json', profile_dir), '{}')
         output_tarfile = self.tmp_path('logs.tgz')
 
         date = datetime.utcnow().date().strftime('%Y-%m-%d')
@@ -74,7 +76,8 @@ class TestCollectLogs(FilesystemMockingTestCase):
             {'subp': {'side_effect': fake_subp},
              'sys.stderr': {'new': fake_stderr},
              'CLOUDINIT_LOGS': {'new': [log1, log2]},
-             'CLOUDINIT_RUN_DIR': {'new': self.run_dir}},
+             'CLOUDINIT_RUN_DIR': {'new': self.run_dir},
+             '_get_profile_dir': {'return_value': profile_dir}},
             logs.collect_logs, output_tarfile, include_userdata=False)
         # unpack the tarfile and check file contents
         subp(['tar', 'zxvf', output_tarfile, '-C', self.new_root])
@@ -105,8 +108,20 @@ class TestCollectLogs(FilesystemMockingTestCase):
             'results',
             load_file(
                 os.path.join(out_logdir, 'run', 'cloud-init', 'results.json')))
+        self.assertEqual(
+            '{}',
+            load_file(os.path.join(out_logdir, 'profile', 'summary.json')))
         fake_stderr.write.assert_any_call('Wrote %s\n' % output_tarfile)
 
+    @mock.patch('cloudinit.cmd.devel.logs.Init')
+    def test_profile_dir_from_system_config(self, m_init, m_getuid):
+        """The profiling dir configured in system config is collected."""
+        m_init.return_value.cfg = {'profiling': {'dir': '/srv/profile'}}
+        self.assertEqual('/srv/profile', logs._get_profile_dir())
+        m_init.return_value.cfg = {}
+        self.assertEqual(
+            '/var/log/cloud-init-profile', logs._get_profile_dir())
+
     def test_collect_logs_includes_optional_userdata(self, m_getuid):
         """collect-logs include userdata when --include-userdata is set."""
         m_getuid.return_value = 0
@@ -152,6 +167,8 @@ class TestCollectLogs(FilesystemMockingTestCase):
              'sys.stderr': {'new': fake_stderr},
              'CLOUDINIT_LOGS': {'new': [log1, log2]},
              'CLOUDINIT_RUN_DIR': {'new': self.run_dir},
+             '_get_profile_dir': {
+                 'return_value': self.tmp_path('profile', self.new_root)},
              'USER_DATA_FILE': {'new': userdata}},
             logs.collect_logs, output_tarfile, include_userdata=True)
         # unpack the tarfile and check file contents
@@ -22,7 +22,9 @@ from cloudinit import patcher
 patcher.patch()  # noqa
 
 from cloudinit import log as logging
+from cloudinit import net
 from cloudinit import netinfo
+from cloudinit import profiling
 from cloudinit import signal_handler
 from cloudinit import sources
 from cloudinit import stages
@@ -40,7 +42,9 @@ from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
 from cloudinit import atomic_helper
 
 from cloudinit.config import cc_set_hostname
+from cloudinit.config import cc_ssh
 from cloudinit import dhclient_hook
+from cloudinit.event import EventScope, EventType
 
 
 # Welcome message template
@@ -113,8 +117,8 @@ def run_module_section(mods, action_name, section):
         LOG.debug(msg)
         return []
     else:
-        LOG.debug("Ran %s modules with %s failures",
-                  len(which_ran), len(failures))
+        LOG.debug("Ran %s modules with %s failures, %s module imports avoided",
+                  len(which_ran), len(failures), mods.imports_avoided)
         return failures
 
 
@@ -240,6 +244,7 @@ def main_init(name, args):
     init = stages.Init(ds_deps=deps, reporter=args.reporter)
     # Stage 1
     init.read_cfg(extract_fns(args))
+    profiling.configure(init.cfg)
     # Stage 2
     outfmt = None
     errfmt = None
@@ -337,7 +342,8 @@ def main_init(name, args):
             util.logexc(LOG, ("No instance datasource found!"
                               " Likely bad things to come!"))
         if not args.force:
-            init.apply_network_config(bring_up=not args.local)
+            init.apply_network_config(
+                bring_up=not args.local, force=args.force_network)
             LOG.debug("[%s] Exiting without datasource", mode)
             if mode == sources.DSMODE_LOCAL:
                 return (None, [])
@@ -358,7 +364,9 @@ def main_init(name, args):
         # dhcp clients to advertize this hostname to any DDNS services
         # LP: #1746455.
         _maybe_set_hostname(init, stage='local', retry_stage='network')
-    init.apply_network_config(bring_up=bool(mode != sources.DSMODE_LOCAL))
+        _maybe_pregenerate_host_keys(init)
+    init.apply_network_config(
+        bring_up=bool(mode != sources.DSMODE_LOCAL), force=args.force_network)
 
     if mode == sources.DSMODE_LOCAL:
         if init.datasource.dsmode != mode:
@@ -396,6 +404,7 @@ def main_init(name, args):
         return (init.datasource, ["Consuming user data failed!"])
 
     apply_reporting_cfg(init.cfg)
+    _maybe_enable_hotplug(init)
 
     # Stage 8 - re-read and apply relevant cloud-config to include user-data
     mods = stages.Modules(init, extract_fns(args), reporter=args.reporter)
@@ -479,6 +488,7 @@ def main_modules(action_name, args):
     init = stages.Init(ds_deps=[], reporter=args.reporter)
     # Stage 1
     init.read_cfg(extract_fns(args))
+    profiling.configure(init.cfg)
     # Stage 2
     try:
         init.fetch(existing="trust")
@@ -529,6 +539,7 @@ def main_single(name, args):
     init = stages.Init(ds_deps=[], reporter=args.reporter)
     # Stage 1
     init.read_cfg(extract_fns(args))
+    profiling.configure(init.cfg)
     # Stage 2
     try:
         init.fetch(existing="trust")
@@ -595,6 +606,7 @@ def status_wrapper(name, args, data_d=None, link_d=None):
     status_link = os.path.join(link_d, "status.json")
     result_path = os.path.join(data_d, "result.json")
     result_link = os.path.join(link_d, "result.json")
+    timings_path = os.path.join(link_d, url_helper.REQUEST_TIMINGS_FILE)
 
     util.ensure_dirs((data_d, link_d,))
 
@@ -618,7 +630,8 @@ def status_wrapper(name, args, data_d=None, link_d=None):
 
     status = None
     if mode == 'init-local':
-        for f in (status_link, result_link, status_path, result_path):
+        for f in (status_link, result_link, status_path, result_path,
+                  timings_path):
             util.del_file(f)
     else:
         try:
@@ -668,6 +681,10 @@ def status_wrapper(name, args, data_d=None, link_d=None):
     v1['stage'] = None
 
     atomic_helper.write_json(status_path, status)
+    try:
+        url_helper.write_request_timings(timings_path, mode)
+    except Exception as e:
+        LOG.warning("Failed writing url request timings: %s", e)
 
     if mode == "modules-final":
         # write the 'finished' file
@@ -694,6 +711,42 @@ def _maybe_persist_instance_data(init):
             init.datasource.persist_instance_data()
 
 
+def _maybe_enable_hotplug(init):
+    """Let udev queue hotplug events if hotplug events are handled."""
+    from cloudinit.cmd.devel.hotplug_hook import HOTPLUG_ENABLED_FILE
+    enabled_file = os.path.join(init.paths.run_dir, HOTPLUG_ENABLED_FILE)
+    supported_events = set()
+    if init.datasource:
+        supported_events = init.datasource.supported_update_events.get(
+            EventScope.NETWORK, set())
+    if (EventType.HOTPLUG in supported_events and
+            init.update_event_enabled(
+                EventType.HOTPLUG, scope=EventScope.NETWORK)):
+        LOG.debug('Enabling hotplug hook for %s', init.datasource)
+        util.write_file(enabled_file, '')
+    else:
+        util.del_file(enabled_file)
+
+
+def _maybe_pregenerate_host_keys(init):
+    """Start generating ssh host keys for a new instance in the background.
+
+    cc_ssh moves the keys into place once it runs in the network stage.
+    """
+    cfg = init.cfg
+    if not util.get_cfg_option_bool(cfg, 'ssh_pregenerate_keys', False):
+        return
+    if not init.is_new_instance() or 'ssh_keys' in cfg:
+        return
+    keytypes = util.get_cfg_option_list(
+        cfg, 'ssh_genkeytypes', cc_ssh.GENERATE_KEY_NAMES)
+    try:
+        cc_ssh.pregenerate_host_keys(
+            keytypes, cc_ssh.pregenerated_keys_dir(init.paths.run_dir))
+    except Exception:
+        util.logexc(LOG, "Failed to start pregenerating ssh host keys")
+
+
 def _maybe_set_hostname(init, stage, retry_stage):
     """Call set-hostname if metadata, vendordata or userdata provides it.
 
@@ -751,6 +804,10 @@ def main(sysv_args=None):
     parser_init.add_argument("--local", '-l', action='store_true',
                              help="start in local mode (default: %(default)s)",
                              default=False)
+    parser_init.add_argument("--force-network", action='store_true',
+                             help=("render and bring up network config even"
+                                   " if unchanged (default: %(default)s)"),
+                             default=False)
     # This is used so that we can know which action is selected +
     # the functor to use to run this subcommand
     parser_init.set_defaults(action=('init', main_init))
@@ -886,7 +943,15 @@ def main(sysv_args=None):
     args.reporter = events.ReportEventStack(
         rname, rdesc, reporting_enabled=report_on)
 
-    with args.reporter:
+    if name in ("init", "modules", "single"):
+        # The stage's config may enable profiling once it has been read,
+        # see profiling.Profile.
+        profiling.configure({})
+
+    # Datasources and modules of a stage share one view of the network
+    # devices, see net.shared_interface_snapshot.
+    with args.reporter, profiling.Profile(rname), \
+            net.shared_interface_snapshot():
         retval = util.log_time(
             logfunc=LOG.debug, msg="cloud-init mode '%s'" % name,
             get_uptime=True, func=functor, args=(name, args))
@@ -7,9 +7,10 @@
 import argparse
 import os
 import sys
-from time import gmtime, strftime, sleep
+from time import gmtime, strftime
 
 from cloudinit.distros import uses_systemd
+from cloudinit.file_watch import FileWatcher
 from cloudinit.stages import Init
 from cloudinit.util import get_cmdline, load_file, load_json
 
@@ -22,6 +23,9 @@ STATUS_DONE = 'done'
 STATUS_ERROR = 'error'
 STATUS_DISABLED = 'disabled'
 
+# Seconds between status re-checks while waiting even without file events
+WAIT_RECHECK_INTERVAL = 5
+
 
 def get_parser(parser=None):
     """Build or extend an arg parser for status utility.
@@ -54,11 +58,15 @@ def handle_status_args(name, args):
 
     status, status_detail, time = _get_status_details(init.paths)
     if args.wait:
-        while status in (STATUS_ENABLED_NOT_RUN, STATUS_RUNNING):
-            sys.stdout.write('.')
-            sys.stdout.flush()
-            status, status_detail, time = _get_status_details(init.paths)
-            sleep(0.25)
+        watch_files = [os.path.join(init.paths.run_dir, 'status.json'),
+                       os.path.join(init.paths.run_dir, 'result.json')]
+        with FileWatcher(watch_files) as watcher:
+            while status in (STATUS_ENABLED_NOT_RUN, STATUS_RUNNING):
+                sys.stdout.write('.')
+                sys.stdout.flush()
+                watcher.wait(WAIT_RECHECK_INTERVAL)
+                status, status_detail, time = _get_status_details(
+                    init.paths)
         sys.stdout.write('\n')
     if args.long:
         print('status: {0}'.format(status))
@@ -6,14 +6,16 @@ import os
 from io import StringIO
 
 from cloudinit.cmd import main
+from cloudinit.event import EventScope, EventType
 from cloudinit import safeyaml
 from cloudinit.util import (
     ensure_dir, load_file, write_file)
 from cloudinit.tests.helpers import (
-    FilesystemMockingTestCase, wrap_and_call)
+    CiTestCase, FilesystemMockingTestCase, mock, wrap_and_call)
 
 mypaths = namedtuple('MyPaths', 'run_dir')
-myargs = namedtuple('MyArgs', 'debug files force local reporter subcommand')
+myargs = namedtuple(
+    'MyArgs', 'debug files force force_network local reporter subcommand')
 
 
 class TestMain(FilesystemMockingTestCase):
@@ -53,8 +55,8 @@ class TestMain(FilesystemMockingTestCase):
         stop_file = os.path.join(self.cloud_dir, 'data', 'no-net')  # stop file
         write_file(stop_file, '')
         cmdargs = myargs(
-            debug=False, files=None, force=False, local=False, reporter=None,
-            subcommand='init')
+            debug=False, files=None, force=False, force_network=False,
+            local=False, reporter=None, subcommand='init')
         (_item1, item2) = wrap_and_call(
             'cloudinit.cmd.main',
             {'util.close_stdin': True,
@@ -82,8 +84,8 @@ class TestMain(FilesystemMockingTestCase):
     def test_main_init_run_net_runs_modules(self):
         """Modules like write_files are run in 'net' mode."""
         cmdargs = myargs(
-            debug=False, files=None, force=False, local=False, reporter=None,
-            subcommand='init')
+            debug=False, files=None, force=False, force_network=False,
+            local=False, reporter=None, subcommand='init')
         (_item1, item2) = wrap_and_call(
             'cloudinit.cmd.main',
             {'util.close_stdin': True,
@@ -115,8 +117,8 @@ class TestMain(FilesystemMockingTestCase):
         cloud_cfg = safeyaml.dumps(self.cfg)
         write_file(self.cloud_cfg_file, cloud_cfg)
         cmdargs = myargs(
-            debug=False, files=None, force=False, local=False, reporter=None,
-            subcommand='init')
+            debug=False, files=None, force=False, force_network=False,
+            local=False, reporter=None, subcommand='init')
 
         def set_hostname(name, cfg, cloud, log, args):
             self.assertEqual('set-hostname', name)
@@ -160,4 +162,65 @@ class TestMain(FilesystemMockingTestCase):
         for log in expected_logs:
             self.assertIn(log, self.stderr.getvalue())
 
+
+class TestMaybeEnableHotplug(CiTestCase):
+
+    def setUp(self):
+        super(TestMaybeEnableHotplug, self).setUp()
+        self.init = mock.Mock()
+        self.init.paths.run_dir = self.tmp_dir()
+        self.enabled_file = os.path.join(
+            self.init.paths.run_dir, 'hotplug.enabled')
+
+    def test_enabled_when_supported_and_allowed(self):
+        self.init.datasource.supported_update_events = {
+            EventScope.NETWORK: {EventType.HOTPLUG}}
+        self.init.update_event_enabled.return_value = True
+        main._maybe_enable_hotplug(self.init)
+        self.assertTrue(os.path.exists(self.enabled_file))
+        self.init.update_event_enabled.assert_called_once_with(
+            EventType.HOTPLUG, scope=EventScope.NETWORK)
+
+    def test_disabled_when_not_supported_or_not_allowed(self):
+        self.init.update_event_enabled.return_value = True
+        self.init.datasource.supported_update_events = {
+            EventScope.NETWORK: {EventType.BOOT}}
+        write_file(self.enabled_file, '')
+        main._maybe_enable_hotplug(self.init)
+        self.assertFalse(os.path.exists(self.enabled_file))
+        self.init.datasource.supported_update_events = {
+            EventScope.NETWORK: {EventType.HOTPLUG}}
+        self.init.update_event_enabled.return_value = False
+        main._maybe_enable_hotplug(self.init)
+        self.assertFalse(os.path.exists(self.enabled_file))
+
+
+@mock.patch('cloudinit.cmd.main.cc_ssh.pregenerate_host_keys')
+class TestMaybePregenerateHostKeys(CiTestCase):
+
+    def setUp(self):
+        super(TestMaybePregenerateHostKeys, self).setUp()
+        self.init = mock.Mock()
+        self.init.paths.run_dir = '/run/cloud-init'
+        self.init.is_new_instance.return_value = True
+        self.init.cfg = {'ssh_pregenerate_keys': True,
+                         'ssh_genkeytypes': ['rsa', 'ed25519']}
+
+    def test_pregenerates_configured_types_for_new_instance(self, m_pregen):
+        main._maybe_pregenerate_host_keys(self.init)
+        m_pregen.assert_called_once_with(
+            ['rsa', 'ed25519'], '/run/cloud-init/ssh-host-keys')
+
+    def test_nothing_pregenerated_unless_needed(self, m_pregen):
+        """Disabled, known instances and configured keys skip it."""
+        self.init.cfg['ssh_pregenerate_keys'] = False
+        main._maybe_pregenerate_host_keys(self.init)
+        self.init.cfg['ssh_pregenerate_keys'] = True
+        self.init.is_new_instance.return_value = False
+        main._maybe_pregenerate_host_keys(self.init)
+        self.init.is_new_instance.return_value = True
+        self.init.cfg['ssh_keys'] = {'rsa_private': 'key'}
+        main._maybe_pregenerate_host_keys(self.init)
+        self.assertEqual(0, m_pregen.call_count)
+
 # vi: ts=4 expandtab
@@ -305,7 +305,7 @@ class TestStatus(CiTestCase):
         self.assertEqual(expected, m_stdout.getvalue())
 
     def test_status_wait_blocks_until_done(self):
-        '''Specifying wait will poll every 1/4 second until done state.'''
+        '''Specifying wait re-checks on status file changes until done.'''
         running_json = {
             'v1': {'stage': 'init',
                    'init': {'start': 124.456, 'finished': None},
@@ -315,32 +315,33 @@ class TestStatus(CiTestCase):
                    'init': {'start': 124.456, 'finished': 125.678},
                    'init-local': {'start': 123.45, 'finished': 123.46}}}
 
-        self.sleep_calls = 0
+        self.wait_calls = 0
 
-        def fake_sleep(interval):
-            self.assertEqual(0.25, interval)
-            self.sleep_calls += 1
-            if self.sleep_calls == 2:
+        def fake_wait(timeout):
+            self.assertEqual(status.WAIT_RECHECK_INTERVAL, timeout)
+            self.wait_calls += 1
+            if self.wait_calls == 2:
                 write_json(self.status_file, running_json)
-            elif self.sleep_calls == 3:
+            elif self.wait_calls == 3:
                 write_json(self.status_file, done_json)
                 result_file = self.tmp_path('result.json', self.new_root)
                 ensure_file(result_file)
+            return True
 
         cmdargs = myargs(long=False, wait=True)
         with mock.patch('sys.stdout', new_callable=StringIO) as m_stdout:
             retcode = wrap_and_call(
                 'cloudinit.cmd.status',
-                {'sleep': {'side_effect': fake_sleep},
+                {'FileWatcher.wait': {'side_effect': fake_wait},
                  '_is_cloudinit_disabled': (False, ''),
                  'Init': {'side_effect': self.init_class}},
                 status.handle_status_args, 'ignored', cmdargs)
         self.assertEqual(0, retcode)
-        self.assertEqual(4, self.sleep_calls)
-        self.assertEqual('....\nstatus: done\n', m_stdout.getvalue())
+        self.assertEqual(3, self.wait_calls)
+        self.assertEqual('...\nstatus: done\n', m_stdout.getvalue())
 
     def test_status_wait_blocks_until_error(self):
-        '''Specifying wait will poll every 1/4 second until error state.'''
+        '''Specifying wait re-checks on status file changes until error.'''
         running_json = {
             'v1': {'stage': 'init',
                    'init': {'start': 124.456, 'finished': None},
@@ -351,27 +352,28 @@ class TestStatus(CiTestCase):
                             'finished': 125.678},
                    'init-local': {'start': 123.45, 'finished': 123.46}}}
 
-        self.sleep_calls = 0
+        self.wait_calls = 0
 
-        def fake_sleep(interval):
-            self.assertEqual(0.25, interval)
-            self.sleep_calls += 1
-            if self.sleep_calls == 2:
+        def fake_wait(timeout):
+            self.assertEqual(status.WAIT_RECHECK_INTERVAL, timeout)
+            self.wait_calls += 1
+            if self.wait_calls == 2:
                 write_json(self.status_file, running_json)
-            elif self.sleep_calls == 3:
+            elif self.wait_calls == 3:
                 write_json(self.status_file, error_json)
+            return True
 
         cmdargs = myargs(long=False, wait=True)
         with mock.patch('sys.stdout', new_callable=StringIO) as m_stdout:
             retcode = wrap_and_call(
                 'cloudinit.cmd.status',
-                {'sleep': {'side_effect': fake_sleep},
+                {'FileWatcher.wait': {'side_effect': fake_wait},
                  '_is_cloudinit_disabled': (False, ''),
                  'Init': {'side_effect': self.init_class}},
                 status.handle_status_args, 'ignored', cmdargs)
         self.assertEqual(1, retcode)
-        self.assertEqual(4, self.sleep_calls)
-        self.assertEqual('....\nstatus: error\n', m_stdout.getvalue())
+        self.assertEqual(3, self.wait_calls)
+        self.assertEqual('...\nstatus: error\n', m_stdout.getvalue())
 
     def test_status_main(self):
         '''status.main can be run as a standalone script.'''
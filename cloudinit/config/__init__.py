@@ -6,8 +6,14 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
-from cloudinit.settings import (PER_INSTANCE, FREQUENCIES)
+import ast
+import importlib.util
+import re
 
+from cloudinit.settings import (
+    FREQUENCIES, PER_ALWAYS, PER_INSTANCE, PER_ONCE)
+
+from cloudinit import importer
 from cloudinit import log as logging
 
 LOG = logging.getLogger(__name__)
@@ -44,4 +50,131 @@ def fixup_module(mod, def_freq=PER_INSTANCE):
         setattr(mod, 'osfamilies', [])
     return mod
 
+
+# Module level attributes which describe when a module runs
+METADATA_ATTRS = ('frequency', 'distros', 'osfamilies')
+
+# Names which modules commonly use in their metadata declarations
+# (distros.ALL_DISTROS is 'all')
+_METADATA_NAMES = {
+    'ALL_DISTROS': 'all',
+    'PER_ALWAYS': PER_ALWAYS,
+    'PER_INSTANCE': PER_INSTANCE,
+    'PER_ONCE': PER_ONCE,
+}
+
+_METADATA_RE = re.compile(
+    r'^(%s)\s*(:[^=]*)?=' % '|'.join(METADATA_ATTRS), re.MULTILINE)
+_HANDLE_RE = re.compile(r'^def handle\(', re.MULTILINE)
+
+
+def _metadata_value(node):
+    if isinstance(node, ast.Name):
+        if node.id not in _METADATA_NAMES:
+            raise ValueError("Unknown name %s" % node.id)
+        return _METADATA_NAMES[node.id]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_metadata_value(elt) for elt in node.elts]
+    return ast.literal_eval(node)
+
+
+def read_module_metadata(source):
+    """Read module metadata from the source of a config module.
+
+    Only top-level assignments of literals (or of the well known frequency
+    and distro constants) are understood, the module is not executed.
+
+    @return: A dict of METADATA_ATTRS, with defaults as set by fixup_module
+        for absent attributes, or None if the metadata can not be determined
+        without importing the module.
+    """
+    if not _HANDLE_RE.search(source):
+        return None
+    metadata = {'frequency': PER_INSTANCE, 'distros': [], 'osfamilies': []}
+    seen = set()
+    for match in _METADATA_RE.finditer(source):
+        attr = match.group(1)
+        if attr in seen:
+            # Conditionally or repeatedly defined
+            return None
+        seen.add(attr)
+        # Grow the statement a line at a time until it parses
+        lines = source[match.start():].splitlines()
+        for end in range(1, len(lines) + 1):
+            try:
+                tree = ast.parse('\n'.join(lines[:end]))
+            except SyntaxError:
+                continue
+            break
+        else:
+            return None
+        stmt = tree.body[0]
+        value = getattr(stmt, 'value', None)
+        if value is None:
+            return None
+        try:
+            metadata[attr] = _metadata_value(value)
+        except ValueError:
+            return None
+    return metadata
+
+
+class DeferredModule(object):
+    """A config module whose metadata was read without importing it.
+
+    The module is only imported once handle is called or load is used.
+    """
+
+    def __init__(self, name, metadata):
+        self.name = name
+        self.frequency = metadata['frequency']
+        self.distros = metadata['distros']
+        self.osfamilies = metadata['osfamilies']
+        self._mod = None
+
+    def __repr__(self):
+        return "<deferred module %r>" % self.name
+
+    @property
+    def loaded(self):
+        return self._mod is not None
+
+    def load(self):
+        if self._mod is None:
+            self._mod = fixup_module(importer.import_module(self.name))
+        return self._mod
+
+    def handle(self, *args, **kwargs):
+        return self.load().handle(*args, **kwargs)
+
+
+def find_deferred_module(mod_name, search_paths):
+    """Find config module mod_name without importing it.
+
+    @return: A DeferredModule, or None when the module was not found or its
+        metadata can only be determined by importing it.
+    """
+    for path in search_paths:
+        full_name = '.'.join([p for p in (path, mod_name) if p])
+        try:
+            spec = importlib.util.find_spec(full_name)
+        except (ImportError, ValueError):
+            continue
+        if spec is None:
+            continue
+        if not spec.has_location or not spec.origin.endswith('.py'):
+            return None
+        try:
+            source = spec.loader.get_data(spec.origin).decode('utf-8')
+        except (IOError, OSError, UnicodeDecodeError):
+            return None
+        metadata = read_module_metadata(source)
+        if metadata is None:
+            return None
+        if metadata['frequency'] and metadata['frequency'] not in FREQUENCIES:
+            LOG.warning("Module %s has an unknown frequency %s",
+                        full_name, metadata['frequency'])
+        return DeferredModule(full_name, metadata)
+    return None
+
 # vi: ts=4 expandtab
@@ -11,6 +11,8 @@
 import glob
 import os
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
 from cloudinit.config.schema import (
@@ -172,6 +174,18 @@ schema = {
                         **except** for additional sources to be added
                         to ``sources.list.d``.""")
                 },
+                'prefetch_package_index': {
+                    'type': 'boolean',
+                    'default': False,
+                    'description': dedent("""\
+                        Start refreshing the package index in the
+                        background as soon as the sources are written,
+                        instead of at the end of this module. Later
+                        package operations, and modules such as
+                        ubuntu_advantage which run apt themselves, wait
+                        for that refresh, which also completes before the
+                        current stage ends. Default: ``false``.""")
+                },
                 'disable_suites': {
                     'type': 'array',
                     'items': {
@@ -375,6 +389,11 @@ schema = {
                             - ``keyserver``: alternate keyserver to pull \
                                     ``keyid`` key from.
 
+                        Keys given by ``keyid`` are fetched from their
+                        keyservers concurrently before any source is
+                        added, and a source handled by
+                        ``add-apt-repository`` is only added once.
+
                         The ``source`` key supports variable
                         replacements for the following strings:
 
@@ -401,6 +420,9 @@ APT_PROXY_FN = "/etc/apt/apt.conf.d/90cloud-init-aptproxy"
 # Default keyserver to use
 DEFAULT_KEYSERVER = "keyserver.ubuntu.com"
 
+# Upper bound of keyserver queries made at the same time
+MAX_KEY_FETCH_WORKERS = 8
+
 # Default archive mirrors
 PRIMARY_ARCH_MIRRORS = {"PRIMARY": "http://archive.ubuntu.com/ubuntu/",
                         "SECURITY": "http://security.ubuntu.com/ubuntu/"}
@@ -470,6 +492,11 @@ def apply_apt(cfg, cloud, target):
     mirrors = find_apt_mirror_info(cfg, cloud, arch=arch)
     LOG.debug("Apt Mirror info: %s", mirrors)
 
+    prefetch = util.is_true(cfg.get('prefetch_package_index', False))
+    if prefetch and target is not None:
+        LOG.debug("Not prefetching package index for target %s", target)
+        prefetch = False
+
     if util.is_false(cfg.get('preserve_sources_list', False)):
         add_mirror_keys(cfg, target)
         generate_sources_list(cfg, release, mirrors, cloud)
@@ -492,7 +519,11 @@ def apply_apt(cfg, cloud, target):
             matcher = re.compile(matchcfg).search
 
         add_apt_sources(cfg['sources'], cloud, target=target,
-                        template_params=params, aa_repo_match=matcher)
+                        template_params=params, aa_repo_match=matcher,
+                        update=not prefetch)
+
+    if prefetch:
+        cloud.distro.prefetch_package_sources()
 
 
 def debconf_set_selections(selections, target=None):
@@ -744,16 +775,44 @@ def add_apt_key(ent, target=None):
         add_apt_key_raw(ent['key'], target)
 
 
+def fetch_apt_keys(srcdict):
+    """
+    Fetch the keys of all entries in srcdict that only give a keyid.
+
+    Each distinct keyid/keyserver pair is fetched once, and up to
+    MAX_KEY_FETCH_WORKERS keyservers are queried at the same time. The
+    fetched key is stored in the 'key' of every entry asking for it.
+    """
+    wanted = OrderedDict()
+    for ent in srcdict.values():
+        if 'keyid' in ent and 'key' not in ent:
+            keyserver = ent.get('keyserver', DEFAULT_KEYSERVER)
+            wanted.setdefault((ent['keyid'], keyserver), []).append(ent)
+    if not wanted:
+        return
+
+    workers = min(MAX_KEY_FETCH_WORKERS, len(wanted))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetches = OrderedDict(
+            (keyspec, executor.submit(gpg.getkeybyid, *keyspec))
+            for keyspec in wanted)
+    for keyspec, fetch in fetches.items():
+        key = fetch.result()
+        for ent in wanted[keyspec]:
+            ent['key'] = key
+
+
 def update_packages(cloud):
     cloud.distro.update_package_sources()
 
 
 def add_apt_sources(srcdict, cloud, target=None, template_params=None,
-                    aa_repo_match=None):
+                    aa_repo_match=None, update=True):
     """
     add entries in /etc/apt/sources.list.d for each abbreviated
     sources.list entry in 'srcdict'.  When rendering template, also
-    include the values in dictionary searchList
+    include the values in dictionary searchList. The package index is
+    refreshed afterwards unless update is False.
     """
     if template_params is None:
         template_params = {}
@@ -764,6 +823,9 @@ def add_apt_sources(srcdict, cloud, target=None, template_params=None,
     if not isinstance(srcdict, dict):
         raise TypeError('unknown apt format: %s' % (srcdict))
 
+    fetch_apt_keys(srcdict)
+
+    added_repos = set()
     for filename in srcdict:
         ent = srcdict[filename]
         LOG.debug("adding source/key '%s'", ent)
@@ -784,6 +846,10 @@ def add_apt_sources(srcdict, cloud, target=None, template_params=None,
             ent['filename'] += ".list"
 
         if aa_repo_match(source):
+            if source in added_repos:
+                LOG.debug("Skipping already added repository %s", source)
+                continue
+            added_repos.add(source)
             try:
                 subp.subp(["add-apt-repository", source], target=target)
             except subp.ProcessExecutionError:
@@ -799,7 +865,8 @@ def add_apt_sources(srcdict, cloud, target=None, template_params=None,
             LOG.exception("failed write to file %s: %s", sourcefn, detail)
             raise
 
-    update_packages(cloud)
+    if update:
+        update_packages(cloud)
 
     return
 
@@ -71,6 +71,11 @@ specified using ``filesystem``.
 .. note::
     ``replace_fs`` is ignored unless ``partition`` is ``auto`` or ``any``.
 
+.. note::
+    All ``disk_setup`` entries are applied before any ``fs_setup`` entry.
+    Entries for different disks are applied concurrently, entries for the
+    same disk one after the other in the order given.
+
 **Internal name:** ``cc_disk_setup``
 
 **Module frequency:** per instance
@@ -100,6 +105,9 @@ specified using ``filesystem``.
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import util
 from cloudinit import subp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
 import os
 import shlex
@@ -117,6 +125,9 @@ WIPEFS_CMD = subp.which("wipefs")
 
 LANG_C_ENV = {'LANG': 'C'}
 
+# Disks partitioned or formatted at the same time
+MAX_DISK_WORKERS = 16
+
 LOG = logging.getLogger(__name__)
 
 
@@ -125,40 +136,104 @@ def handle(_name, cfg, cloud, log, _args):
     See doc/examples/cloud-config-disk-setup.txt for documentation on the
     format.
     """
+    settled = False
     disk_setup = cfg.get("disk_setup")
     if isinstance(disk_setup, dict):
         update_disk_setup_devices(disk_setup, cloud.device_name_to_device)
         log.debug("Partitioning disks: %s", str(disk_setup))
+        jobs = []
         for disk, definition in disk_setup.items():
             if not isinstance(definition, dict):
                 log.warning("Invalid disk definition for %s" % disk)
                 continue
-
-            try:
-                log.debug("Creating new partition table/disk")
-                util.log_time(logfunc=LOG.debug,
-                              msg="Creating partition on %s" % disk,
-                              func=mkpart, args=(disk, definition))
-            except Exception as e:
-                util.logexc(LOG, "Failed partitioning operation\n%s" % e)
+            jobs.append((parent_disk(disk),
+                         functools.partial(partition_disk, disk, definition)))
+        if jobs:
+            # settle once for all disks rather than before and after
+            # partitioning each of them
+            util.udevadm_settle()
+            run_per_disk(jobs)
+            util.udevadm_settle()
+            settled = True
 
     fs_setup = cfg.get("fs_setup")
     if isinstance(fs_setup, list):
         log.debug("setting up filesystems: %s", str(fs_setup))
         update_fs_setup_devices(fs_setup, cloud.device_name_to_device)
+        jobs = []
         for definition in fs_setup:
             if not isinstance(definition, dict):
                 log.warning("Invalid file system definition: %s" % definition)
                 continue
+            jobs.append((parent_disk(definition.get('device')),
+                         functools.partial(create_filesystem, definition)))
+        if jobs:
+            if not settled:
+                util.udevadm_settle()
+            run_per_disk(jobs)
 
-            try:
-                log.debug("Creating new filesystem.")
-                device = definition.get('device')
-                util.log_time(logfunc=LOG.debug,
-                              msg="Creating fs for %s" % device,
-                              func=mkfs, args=(definition,))
-            except Exception as e:
-                util.logexc(LOG, "Failed during filesystem operation\n%s" % e)
+
+def partition_disk(disk, definition):
+    try:
+        LOG.debug("Creating new partition table/disk")
+        util.log_time(logfunc=LOG.debug,
+                      msg="Creating partition on %s" % disk,
+                      func=mkpart, args=(disk, definition),
+                      kwargs={'settled': True})
+    except Exception as e:
+        util.logexc(LOG, "Failed partitioning operation\n%s" % e)
+
+
+def create_filesystem(definition):
+    try:
+        LOG.debug("Creating new filesystem.")
+        device = definition.get('device')
+        util.log_time(logfunc=LOG.debug,
+                      msg="Creating fs for %s" % device,
+                      func=mkfs, args=(definition,),
+                      kwargs={'settled': True})
+    except Exception as e:
+        util.logexc(LOG, "Failed during filesystem operation\n%s" % e)
+
+
+def parent_disk(device):
+    """Return the disk holding device, which may be one of its partitions.
+
+    Devices which do not exist (yet) are their own disk.
+    """
+    if not device:
+        return device
+    rpath = os.path.realpath(device)
+    syspath = "/sys/class/block/%s" % os.path.basename(rpath)
+    if os.path.exists(os.path.join(syspath, "partition")):
+        disksyspath = os.path.dirname(os.path.realpath(syspath))
+        return "/dev/%s" % os.path.basename(disksyspath)
+    return rpath
+
+
+def run_per_disk(jobs):
+    """
+    Run the jobs of different disks concurrently and the jobs of each disk
+    one after the other, in order.
+
+    Parameters:
+        jobs: list of (disk, callable) tuples. Jobs handle their own errors.
+    """
+    disks = OrderedDict()
+    for disk, job in jobs:
+        disks.setdefault(disk, []).append(job)
+
+    def run_disk(disk):
+        for job in disks[disk]:
+            job()
+
+    if len(disks) > 1:
+        workers = min(len(disks), MAX_DISK_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run_disk, disks))
+    else:
+        for disk in disks:
+            run_disk(disk)
 
 
 def update_disk_setup_devices(disk_setup, tformer):
@@ -697,8 +772,7 @@ def read_parttbl(device):
         subp.subp(probe_cmd)
     except Exception as e:
         util.logexc(LOG, "Failed reading the partition table %s" % e)
-
-    util.udevadm_settle()
+    # handle settles once all partition tables are reread
 
 
 def exec_mkpart_mbr(device, layout):
@@ -751,21 +825,27 @@ def exec_mkpart(table_type, device, layout):
     return get_dyn_func("exec_mkpart_%s", table_type, device, layout)
 
 
-def assert_and_settle_device(device):
-    """Assert that device exists and settle so it is fully recognized."""
+def assert_and_settle_device(device, settled=False):
+    """Assert that device exists and settle so it is fully recognized.
+
+    With settled, the caller has settled already and device is only
+    settled for again if it does not exist.
+    """
     if not os.path.exists(device):
         util.udevadm_settle()
         if not os.path.exists(device):
             raise RuntimeError("Device %s did not exist and was not created "
                                "with a udevadm settle." % device)
+        settled = True
 
     # Whether or not the device existed above, it is possible that udev
     # events that would populate udev database (for reading by lsdname) have
     # not yet finished. So settle again.
-    util.udevadm_settle()
+    if not settled:
+        util.udevadm_settle()
 
 
-def mkpart(device, definition):
+def mkpart(device, definition, settled=False):
     """
     Creates the partition table.
 
@@ -778,9 +858,10 @@ def mkpart(device, definition):
                 layout: the layout of the partition table
                 table_type: Which partition table to use, defaults to MBR
                 device: the device to work on.
+        settled: whether udev events were settled for already.
     """
     # ensure that we get a real device rather than a symbolic link
-    assert_and_settle_device(device)
+    assert_and_settle_device(device, settled)
     device = os.path.realpath(device)
 
     LOG.debug("Checking values for %s definition", device)
@@ -852,7 +933,7 @@ def lookup_force_flag(fs):
     return ''
 
 
-def mkfs(fs_cfg):
+def mkfs(fs_cfg, settled=False):
     """
     Create a file system on the device.
 
@@ -872,6 +953,7 @@ def mkfs(fs_cfg):
                             on the device.
 
             When 'cmd' is provided then no other parameter is required.
+        settled: whether udev events were settled for already.
     """
     label = fs_cfg.get('label')
     device = fs_cfg.get('device')
@@ -883,7 +965,7 @@ def mkfs(fs_cfg):
     overwrite = fs_cfg.get('overwrite', False)
 
     # ensure that we get a real device rather than a symbolic link
-    assert_and_settle_device(device)
+    assert_and_settle_device(device, settled)
     device = os.path.realpath(device)
 
     # This allows you to define the default ephemeral or swap
@@ -1011,5 +1093,7 @@ def mkfs(fs_cfg):
         subp.subp(fs_cmd, shell=shell)
     except Exception as e:
         raise Exception("Failed to exec of '%s':\n%s" % (fs_cmd, e)) from e
+    # the new file system and label are not in the blkid index yet
+    util.clear_blkid_index()
 
 # vi: ts=4 expandtab
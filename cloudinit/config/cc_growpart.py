@@ -40,6 +40,11 @@ it is present. However, this file can be ignored for ``cc_growpart`` by setting
 ``ignore_growroot_disabled`` to ``true``. For more information on
 ``cloud-initramfs-tools`` see: https://launchpad.net/cloud-initramfs-tools
 
+By default all partitions are resized one at a time in the order listed. Set
+``concurrent`` to ``true`` to resize partitions on different disks at the
+same time. Partitions on the same disk are always resized one after the
+other in the order listed.
+
 Growpart is enabled by default on the root partition. The default config for
 growpart is::
 
@@ -47,6 +52,7 @@ growpart is::
         mode: auto
         devices: ["/"]
         ignore_growroot_disabled: false
+        concurrent: false
 
 **Internal name:** ``cc_growpart``
 
@@ -62,12 +68,15 @@ growpart is::
             - "/"
             - "/dev/vdb1"
         ignore_growroot_disabled: <true/false>
+        concurrent: <true/false>
 """
 
 import os
 import os.path
 import re
 import stat
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from cloudinit import log as logging
 from cloudinit.settings import PER_ALWAYS
@@ -80,8 +89,12 @@ DEFAULT_CONFIG = {
     'mode': 'auto',
     'devices': ['/'],
     'ignore_growroot_disabled': False,
+    'concurrent': False,
 }
 
+# Disks whose partitions are resized at the same time
+MAX_RESIZE_WORKERS = 8
+
 
 class RESIZE(object):
     SKIPPED = "SKIPPED"
@@ -274,53 +287,70 @@ def devent2dev(devent):
     return dev
 
 
-def resize_devices(resizer, devices):
+def _resize_partition(resizer, devent, disk, ptnum, blockdev):
+    try:
+        (old, new) = resizer.resize(disk, ptnum, blockdev)
+        if old == new:
+            return (devent, RESIZE.NOCHANGE,
+                    "no change necessary (%s, %s)" % (disk, ptnum),)
+        return (devent, RESIZE.CHANGED,
+                "changed (%s, %s) from %s to %s" % (disk, ptnum, old, new),)
+    except ResizeFailedException as e:
+        return (devent, RESIZE.FAILED,
+                "failed to resize: disk=%s, ptnum=%s: %s" % (disk, ptnum, e),)
+
+
+def resize_devices(resizer, devices, concurrent=False):
     # returns a tuple of tuples containing (entry-in-devices, action, message)
-    info = []
-    for devent in devices:
+    # in the order of devices.  With concurrent, partitions of different
+    # disks are resized in parallel; those of one disk always in order.
+    info = {}
+    disks = OrderedDict()
+    for index, devent in enumerate(devices):
         try:
             blockdev = devent2dev(devent)
         except ValueError as e:
-            info.append((devent, RESIZE.SKIPPED,
-                         "unable to convert to device: %s" % e,))
+            info[index] = (devent, RESIZE.SKIPPED,
+                           "unable to convert to device: %s" % e,)
             continue
 
         try:
             statret = os.stat(blockdev)
         except OSError as e:
-            info.append((devent, RESIZE.SKIPPED,
-                         "stat of '%s' failed: %s" % (blockdev, e),))
+            info[index] = (devent, RESIZE.SKIPPED,
+                           "stat of '%s' failed: %s" % (blockdev, e),)
             continue
 
         if (not stat.S_ISBLK(statret.st_mode) and
                 not stat.S_ISCHR(statret.st_mode)):
-            info.append((devent, RESIZE.SKIPPED,
-                         "device '%s' not a block device" % blockdev,))
+            info[index] = (devent, RESIZE.SKIPPED,
+                           "device '%s' not a block device" % blockdev,)
             continue
 
         try:
             (disk, ptnum) = device_part_info(blockdev)
         except (TypeError, ValueError) as e:
-            info.append((devent, RESIZE.SKIPPED,
-                         "device_part_info(%s) failed: %s" % (blockdev, e),))
+            info[index] = (devent, RESIZE.SKIPPED,
+                           "device_part_info(%s) failed: %s" % (blockdev, e),)
             continue
 
-        try:
-            (old, new) = resizer.resize(disk, ptnum, blockdev)
-            if old == new:
-                info.append((devent, RESIZE.NOCHANGE,
-                             "no change necessary (%s, %s)" % (disk, ptnum),))
-            else:
-                info.append((devent, RESIZE.CHANGED,
-                             "changed (%s, %s) from %s to %s" %
-                             (disk, ptnum, old, new),))
+        disks.setdefault(disk, []).append((index, devent, ptnum, blockdev))
+
+    def resize_disk(disk):
+        return [(index, _resize_partition(resizer, devent, disk, ptnum,
+                                          blockdev))
+                for (index, devent, ptnum, blockdev) in disks[disk]]
 
-        except ResizeFailedException as e:
-            info.append((devent, RESIZE.FAILED,
-                         "failed to resize: disk=%s, ptnum=%s: %s" %
-                         (disk, ptnum, e),))
+    if concurrent and len(disks) > 1:
+        workers = min(len(disks), MAX_RESIZE_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(resize_disk, disks))
+    else:
+        results = [resize_disk(disk) for disk in disks]
+    for result in results:
+        info.update(result)
 
-    return info
+    return [info[index] for index in sorted(info)]
 
 
 def handle(_name, cfg, _cloud, log, _args):
@@ -358,8 +388,10 @@ def handle(_name, cfg, _cloud, log, _args):
             raise e
         return
 
+    concurrent = util.get_cfg_option_bool(mycfg, 'concurrent', False)
     resized = util.log_time(logfunc=log.debug, msg="resize_devices",
-                            func=resize_devices, args=(resizer, devices))
+                            func=resize_devices, args=(resizer, devices),
+                            kwargs={'concurrent': concurrent})
     for (entry, action, msg) in resized:
         if action == RESIZE.CHANGED:
             log.info("'%s' resized: %s" % (entry, msg))
@@ -32,7 +32,7 @@ import shutil
 from cloudinit import helpers
 from cloudinit import util
 
-from cloudinit.settings import PER_ALWAYS
+from cloudinit.settings import PER_ALWAYS, PER_INSTANCE
 
 frequency = PER_ALWAYS
 
@@ -52,6 +52,15 @@ def _migrate_canon_sems(cloud):
                     new_path = os.path.join(sem_path, canon_name + ext)
                     shutil.move(full_path, new_path)
                     am_adjusted += 1
+        sem_helper = helpers.get_semaphores(cloud.paths, sem_path)
+        if isinstance(sem_helper, helpers.JournalSemaphores):
+            for key in list(sem_helper.entries):
+                (name, ext) = os.path.splitext(key)
+                canon_name = helpers.canon_sem_name(name)
+                if canon_name != name:
+                    sem_helper.rename_entry(key, canon_name + ext)
+                    am_adjusted += 1
+            sem_helper.flush()
     return am_adjusted
 
 
@@ -66,7 +75,7 @@ def _migrate_legacy_sems(cloud, log):
     for sem_path in paths:
         if not sem_path or not os.path.exists(sem_path):
             continue
-        sem_helper = helpers.FileSemaphores(sem_path)
+        sem_helper = helpers.get_semaphores(cloud.paths, sem_path)
         for (mod_name, migrate_to) in legacy_adjust.items():
             possibles = [mod_name, helpers.canon_sem_name(mod_name)]
             old_exists = []
@@ -82,6 +91,23 @@ def _migrate_legacy_sems(cloud, log):
                               p, m)
                     with sem_helper.lock(m, freq):
                         pass
+            if isinstance(sem_helper, helpers.JournalSemaphores):
+                _migrate_legacy_entries(sem_helper, possibles, migrate_to, log)
+        sem_helper.flush()
+
+
+def _migrate_legacy_entries(sem_helper, possibles, migrate_to, log):
+    for key in list(sem_helper.entries):
+        (name, ext) = os.path.splitext(key)
+        if name not in possibles:
+            continue
+        sem_helper.remove_entry(key)
+        freq = ext[1:] or PER_INSTANCE
+        for m in migrate_to:
+            log.debug("Migrating journal entry %s => %s with the same"
+                      " frequency", key, m)
+            with sem_helper.lock(m, freq):
+                pass
 
 
 def handle(name, cfg, cloud, log, _args):
@@ -90,7 +116,7 @@ def handle(name, cfg, cloud, log, _args):
         log.debug("Skipping module named %s, migration disabled", name)
         return
     sems_moved = _migrate_canon_sems(cloud)
-    log.debug("Migrated %s semaphore files to there canonicalized names",
+    log.debug("Migrated %s semaphores to there canonicalized names",
               sems_moved)
     _migrate_legacy_sems(cloud, log)
 
@@ -65,8 +65,12 @@ swap file is created.
 from string import whitespace
 
 import logging
+import mmap
 import os
 import re
+import struct
+import time
+import uuid
 
 from cloudinit import type_utils
 from cloudinit import subp
@@ -78,6 +82,16 @@ DEVICE_NAME_RE = re.compile(DEVICE_NAME_FILTER)
 # Name matches 'server:/path'
 NETWORK_NAME_FILTER = r"^.+:.*"
 NETWORK_NAME_RE = re.compile(NETWORK_NAME_FILTER)
+
+# Layout of the first page of a swap area, see linux/swap.h
+SWAP_BOOTBITS_SIZE = 1024
+SWAP_HEADER_VERSION = 1
+SWAP_SIGNATURE = b'SWAPSPACE2'
+# The kernel refuses smaller swap areas
+SWAP_MIN_PAGES = 10
+# Zeros written at once where space can not be allocated without writing
+ZERO_CHUNK_SIZE = 8 * 2 ** 20
+
 WS = re.compile("[%s]+" % (whitespace))
 FSTAB_PATH = "/etc/fstab"
 MNT_COMMENT = "comment=cloudconfig"
@@ -237,50 +251,86 @@ def suggested_swapsize(memsize=None, maxsize=None, fsys=None):
     return size
 
 
+def _write_zeros(fd, size):
+    """Write size bytes of zeros to fd, reusing one page aligned buffer."""
+    # anonymous mappings are page aligned and zero filled
+    with mmap.mmap(-1, ZERO_CHUNK_SIZE) as chunk:
+        with memoryview(chunk) as zeros:
+            written = 0
+            while written < size:
+                written += os.write(
+                    fd, zeros[:min(ZERO_CHUNK_SIZE, size - written)])
+
+
+def _write_swap_header(fd, size):
+    """Write the header mkswap writes for a swap area of size bytes."""
+    pagesize = os.sysconf('SC_PAGE_SIZE')
+    pages = size // pagesize
+    if pages < SWAP_MIN_PAGES:
+        raise ValueError(
+            "swap area of %s bytes is smaller than %s pages of %s bytes" %
+            (size, SWAP_MIN_PAGES, pagesize))
+    header = bytearray(pagesize)
+    # version, last page, number of bad pages and uuid follow the boot bits
+    struct.pack_into('=III16s', header, SWAP_BOOTBITS_SIZE,
+                     SWAP_HEADER_VERSION, pages - 1, 0, uuid.uuid4().bytes)
+    header[-len(SWAP_SIGNATURE):] = SWAP_SIGNATURE
+    os.pwrite(fd, header, 0)
+
+
 def create_swapfile(fname: str, size: str) -> None:
     """Size is in MiB."""
 
     errmsg = "Failed to create swapfile '%s' of size %sMB via %s: %s"
+    nbytes = int(size) * 2 ** 20
 
-    def create_swap(fname, size, method):
+    def create_swap(fd, method):
         LOG.debug("Creating swapfile in '%s' on fstype '%s' using '%s'",
                   fname, fstype, method)
-
+        start = time.monotonic()
         if method == "fallocate":
-            cmd = ['fallocate', '-l', '%sM' % size, fname]
-        elif method == "dd":
-            cmd = ['dd', 'if=/dev/zero', 'of=%s' % fname, 'bs=1M',
-                   'count=%s' % size]
-
-        try:
-            subp.subp(cmd, capture=True)
-        except subp.ProcessExecutionError as e:
-            LOG.info(errmsg, fname, size, method, e)
-            util.del_file(fname)
-            raise
+            os.posix_fallocate(fd, 0, nbytes)
+        elif method == "zeros":
+            _write_zeros(fd, nbytes)
+        os.fsync(fd)
+        elapsed = max(time.monotonic() - start, 1e-6)
+        LOG.debug("Allocated %sMB for swapfile '%s' using '%s' in %.3f"
+                  " seconds (%.1f MB/s)", size, fname, method, elapsed,
+                  int(size) / elapsed)
 
     swap_dir = os.path.dirname(fname)
     util.ensure_dir(swap_dir)
 
     fstype = util.get_mount_info(swap_dir)[1]
 
+    # swapon refuses unwritten extents on these, so write the zeros
     if (fstype == "xfs" and
             util.kernel_version() < (4, 18)) or fstype == "btrfs":
-        create_swap(fname, size, "dd")
+        methods = ["zeros"]
     else:
-        try:
-            create_swap(fname, size, "fallocate")
-        except subp.ProcessExecutionError:
-            LOG.info("fallocate swap creation failed, will attempt with dd")
-            create_swap(fname, size, "dd")
+        methods = ["fallocate", "zeros"]
 
-    if os.path.exists(fname):
-        util.chmod(fname, 0o600)
+    fd = os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
     try:
-        subp.subp(['mkswap', fname])
-    except subp.ProcessExecutionError:
+        util.chmod(fname, 0o600)
+        for method in methods:
+            try:
+                create_swap(fd, method)
+                break
+            except OSError as e:
+                LOG.info(errmsg, fname, size, method, e)
+                if method == methods[-1]:
+                    raise
+                LOG.info("%s swap creation failed, will attempt with %s",
+                         method, methods[-1])
+                os.ftruncate(fd, 0)
+        _write_swap_header(fd, nbytes)
+        os.fsync(fd)
+    except Exception:
         util.del_file(fname)
         raise
+    finally:
+        os.close(fd)
 
 
 def setup_swapfile(fname, size=None, maxsize=None):
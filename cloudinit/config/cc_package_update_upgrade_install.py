@@ -18,6 +18,14 @@ be provided. Each entry in the list can be either a package name or a list with
 two entries, the first being the package name and the second being the specific
 package version to install.
 
+The package cache update and package installs go through the distro's package
+transaction, so with ``package_flush: section`` they are combined with requests
+of the other modules of the same stage into a single transaction at the end of
+the stage. With the default ``package_flush: module`` they are applied as soon
+as this module finishes, even if it failed. An upgrade always updates the
+package cache first, and when a reboot may be required, the packages are
+always installed before this module checks for it.
+
 **Internal name:** ``cc_package_update_upgrade_install``
 
 **Module frequency:** per instance
@@ -33,6 +41,7 @@ package version to install.
     package_update: <true/false>
     package_upgrade: <true/false>
     package_reboot_if_required: <true/false>
+    package_flush: <module/section>
 
     apt_update: (alias for package_update)
     apt_upgrade: (alias for package_upgrade)
@@ -72,7 +81,7 @@ def _fire_reboot(log, wait_attempts=6, initial_sleep=1, backoff=2):
                         " after %s seconds!") % (int(elapsed)))
 
 
-def handle(_name, cfg, cloud, log, _args):
+def handle(name, cfg, cloud, log, _args):
     # Handle the old style + new config names
     update = _multi_cfg_bool_get(cfg, 'apt_update', 'package_update')
     upgrade = _multi_cfg_bool_get(cfg, 'package_upgrade', 'apt_upgrade')
@@ -81,14 +90,16 @@ def handle(_name, cfg, cloud, log, _args):
     pkglist = util.get_cfg_option_list(cfg, 'packages', [])
 
     errors = []
+    transaction = cloud.distro.package_transaction
     if update or len(pkglist) or upgrade:
+        transaction.request_update(module=name)
+
+    if upgrade:
+        # Upgrade from a fresh package index
         try:
-            cloud.distro.update_package_sources()
+            transaction.flush()
         except Exception as e:
-            util.logexc(log, "Package update failed")
             errors.append(e)
-
-    if upgrade:
         try:
             cloud.distro.package_command("upgrade")
         except Exception as e:
@@ -96,11 +107,13 @@ def handle(_name, cfg, cloud, log, _args):
             errors.append(e)
 
     if len(pkglist):
-        try:
-            cloud.distro.install_packages(pkglist)
-        except Exception as e:
-            util.logexc(log, "Failed to install packages: %s", pkglist)
-            errors.append(e)
+        transaction.request_install(pkglist, module=name)
+        if reboot_if_required:
+            try:
+                transaction.flush()
+            except Exception as e:
+                util.logexc(log, "Failed to install packages: %s", pkglist)
+                errors.append(e)
 
     # TODO(smoser): handle this less violently
     # kernel and openssl (possibly some other packages)
@@ -106,6 +106,13 @@ types to use. For each host key type for which this module has been instructed
 to create a keypair, if a key of the same type is already present on the
 system (i.e. if ``ssh_deletekeys`` was false), no key will be generated.
 
+Keys of all missing types are generated concurrently. To have them ready
+earlier, set ``ssh_pregenerate_keys`` to ``true`` in the system configuration
+(it is read before user-data is available): keys are then generated in the
+background during ``init-local`` on the first boot of an instance and moved
+into place by this module. Keys which were not complete by then are
+generated by this module as usual.
+
 Supported host key types for the ``ssh_keys`` and the ``ssh_genkeytypes``
 config flags are:
 
@@ -142,6 +149,7 @@ config flags are:
             ssh-dsa-cert-v01@openssh.com AAAAIHNzaC1lZDI1NTE5LWNlcnQt ...
 
     ssh_genkeytypes: <key type>
+    ssh_pregenerate_keys: <true/false>
     disable_root: <true/false>
     disable_root_opts: <disable root options string>
     ssh_authorized_keys:
@@ -154,8 +162,12 @@ config flags are:
 """
 
 import glob
+import logging
 import os
+import shutil
 import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from cloudinit.distros import ug_util
 from cloudinit import ssh_util
@@ -165,6 +177,8 @@ from cloudinit import util
 
 GENERATE_KEY_NAMES = ['rsa', 'dsa', 'ecdsa', 'ed25519']
 KEY_FILE_TPL = '/etc/ssh/ssh_host_%s_key'
+# Directory in the run dir holding host keys generated during init-local
+PREGENERATED_KEYS_DIR = 'ssh-host-keys'
 PUBLISH_HOST_KEYS = True
 # Don't publish the dsa hostkey by default since OpenSSH recommends not using
 # it.
@@ -182,6 +196,8 @@ for k in GENERATE_KEY_NAMES:
 
 KEY_GEN_TPL = 'o=$(ssh-keygen -yf "%s") && echo "$o" root@localhost > "%s"'
 
+LOG = logging.getLogger(__name__)
+
 
 def handle(_name, cfg, cloud, log, _args):
 
@@ -226,28 +242,18 @@ def handle(_name, cfg, cloud, log, _args):
         genkeys = util.get_cfg_option_list(cfg,
                                            'ssh_genkeytypes',
                                            GENERATE_KEY_NAMES)
-        lang_c = os.environ.copy()
-        lang_c['LANG'] = 'C'
-        for keytype in genkeys:
-            keyfile = KEY_FILE_TPL % (keytype)
-            if os.path.exists(keyfile):
-                continue
-            util.ensure_dir(os.path.dirname(keyfile))
-            cmd = ['ssh-keygen', '-t', keytype, '-N', '', '-f', keyfile]
-
-            # TODO(harlowja): Is this guard needed?
-            with util.SeLinuxGuard("/etc/ssh", recursive=True):
-                try:
-                    out, err = subp.subp(cmd, capture=True, env=lang_c)
-                    sys.stdout.write(util.decode_binary(out))
-                except subp.ProcessExecutionError as e:
-                    err = util.decode_binary(e.stderr).lower()
-                    if (e.exit_code == 1 and
-                            err.lower().startswith("unknown key")):
-                        log.debug("ssh-keygen: unknown key type '%s'", keytype)
-                    else:
-                        util.logexc(log, "Failed generating key type %s to "
-                                    "file %s", keytype, keyfile)
+        missing = [keytype for keytype in genkeys
+                   if not os.path.exists(KEY_FILE_TPL % keytype)]
+        # relabel once for all keys rather than once per key
+        # TODO(harlowja): Is this guard needed?
+        with util.SeLinuxGuard("/etc/ssh", recursive=True):
+            missing = install_pregenerated_host_keys(
+                missing, pregenerated_keys_dir(cloud.paths.run_dir))
+            generated = generate_host_keys(missing)
+        for out in generated.values():
+            sys.stdout.write(util.decode_binary(out))
+
+    remove_pregenerated_host_keys(pregenerated_keys_dir(cloud.paths.run_dir))
 
     if "ssh_publish_hostkeys" in cfg:
         host_key_blacklist = util.get_cfg_option_list(
@@ -289,6 +295,100 @@ def handle(_name, cfg, cloud, log, _args):
         util.logexc(log, "Applying SSH credentials failed!")
 
 
+def _generate_host_key(keytype, keyfile, env):
+    """Run ssh-keygen for keytype and return its output, None on failure."""
+    cmd = ['ssh-keygen', '-t', keytype, '-N', '', '-f', keyfile]
+    try:
+        out, _err = subp.subp(cmd, capture=True, env=env)
+        return out
+    except subp.ProcessExecutionError as e:
+        err = util.decode_binary(e.stderr).lower()
+        if e.exit_code == 1 and err.startswith("unknown key"):
+            LOG.debug("ssh-keygen: unknown key type '%s'", keytype)
+        else:
+            util.logexc(LOG, "Failed generating key type %s to file %s",
+                        keytype, keyfile)
+    return None
+
+
+def generate_host_keys(keytypes, key_file_tpl=None):
+    """Generate host keys of all keytypes concurrently.
+
+    @param key_file_tpl: template of the private key file of a key type,
+        KEY_FILE_TPL by default.
+    @returns: OrderedDict of key type to the output of ssh-keygen for the
+        keys which were generated.
+    """
+    if key_file_tpl is None:
+        key_file_tpl = KEY_FILE_TPL
+    lang_c = os.environ.copy()
+    lang_c['LANG'] = 'C'
+    keyfiles = OrderedDict(
+        (keytype, key_file_tpl % keytype) for keytype in keytypes)
+    if not keyfiles:
+        return keyfiles
+    for keyfile in keyfiles.values():
+        util.ensure_dir(os.path.dirname(keyfile))
+    with ThreadPoolExecutor(max_workers=len(keyfiles)) as executor:
+        outs = list(executor.map(
+            lambda keytype: _generate_host_key(
+                keytype, keyfiles[keytype], lang_c),
+            keyfiles))
+    return OrderedDict(
+        (keytype, out) for keytype, out in zip(keyfiles, outs)
+        if out is not None)
+
+
+def pregenerated_keys_dir(run_dir):
+    return os.path.join(run_dir, PREGENERATED_KEYS_DIR)
+
+
+def pregenerate_host_keys(keytypes, keys_dir):
+    """Generate host keys of keytypes into keys_dir in a forked child.
+
+    Keys are generated into a temporary directory which is renamed to
+    keys_dir once all of them exist, so keys_dir only holds complete keys.
+    """
+    tmp_dir = keys_dir + '.tmp'
+    remove_pregenerated_host_keys(keys_dir)
+    util.ensure_dir(tmp_dir, mode=0o700)
+
+    def pregenerate():
+        generate_host_keys(
+            keytypes, os.path.join(tmp_dir, os.path.basename(KEY_FILE_TPL)))
+        os.rename(tmp_dir, keys_dir)
+
+    util.fork_cb(util.log_time, logfunc=LOG.debug,
+                 msg="Pregenerating ssh host keys", func=pregenerate)
+
+
+def install_pregenerated_host_keys(keytypes, keys_dir):
+    """Move pregenerated host keys of keytypes into place.
+
+    @returns: list of the keytypes which had no pregenerated key.
+    """
+    missing = []
+    for keytype in keytypes:
+        keyfile = KEY_FILE_TPL % keytype
+        pregenerated = os.path.join(keys_dir, os.path.basename(keyfile))
+        if not (os.path.exists(pregenerated) and
+                os.path.exists(pregenerated + '.pub')):
+            missing.append(keytype)
+            continue
+        util.ensure_dir(os.path.dirname(keyfile))
+        for suffix in ('', '.pub'):
+            shutil.move(pregenerated + suffix, keyfile + suffix)
+        LOG.debug("Using pregenerated host key %s", keyfile)
+    return missing
+
+
+def remove_pregenerated_host_keys(keys_dir):
+    """Remove pregenerated host keys which were not used."""
+    for path in (keys_dir, keys_dir + '.tmp'):
+        if os.path.isdir(path):
+            util.del_dir(path)
+
+
 def apply_credentials(keys, user, disable_root, disable_root_opts):
 
     keys = set(keys)
@@ -136,6 +136,8 @@ def configure_ua(token=None, enable=None):
 
 def maybe_install_ua_tools(cloud):
     """Install ubuntu-advantage-tools if not present."""
+    # ua runs apt itself, which must not race a package index prefetch
+    cloud.distro.wait_for_package_prefetch()
     if subp.which('ua'):
         return
     try:
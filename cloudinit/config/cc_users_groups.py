@@ -85,6 +85,12 @@ config keys for an entry in ``users`` are as follows:
     to already-existing users: ``plain_text_passwd``, ``hashed_passwd``,
     ``lock_passwd``, ``sudo``, ``ssh_authorized_keys``, ``ssh_redirect_user``.
 
+.. note::
+    All entries are validated before any user or group is created, so an
+    invalid entry leaves the system unchanged. Passwords of all users are
+    then set with a single ``chpasswd`` call and all sudo rules are written
+    to the sudoers file at once.
+
 **Internal name:** ``cc_users_groups``
 
 **Module frequency:** per instance
@@ -144,8 +150,7 @@ def handle(name, cfg, cloud, _log, _args):
     (users, groups) = ug_util.normalize_users_groups(cfg, cloud.distro)
     (default_user, _user_config) = ug_util.extract_default(users)
     cloud_keys = cloud.get_public_ssh_keys() or []
-    for (name, members) in groups.items():
-        cloud.distro.create_group(name, members)
+    user_configs = []
     for (user, config) in users.items():
         ssh_redirect_user = config.pop("ssh_redirect_user", False)
         if ssh_redirect_user:
@@ -169,6 +174,10 @@ def handle(name, cfg, cloud, _log, _args):
             else:
                 config['ssh_redirect_user'] = default_user
                 config['cloud_public_ssh_keys'] = cloud_keys
-        cloud.distro.create_user(user, **config)
+        user_configs.append((user, config))
+    if groups:
+        cloud.distro.create_groups(groups)
+    if user_configs:
+        cloud.distro.create_users(user_configs)
 
 # vi: ts=4 expandtab
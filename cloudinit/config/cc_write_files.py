@@ -7,13 +7,21 @@
 """Write Files: write arbitrary files"""
 
 import base64
+import binascii
 import os
+import string
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from textwrap import dedent
 
+from cloudinit import atomic_helper
 from cloudinit.config.schema import (
     get_schema_doc, validate_cloudconfig_schema)
 from cloudinit import log as logging
 from cloudinit.settings import PER_INSTANCE
+from cloudinit import temp_utils
 from cloudinit import util
 
 
@@ -23,6 +31,16 @@ DEFAULT_OWNER = "root:root"
 DEFAULT_PERMS = 0o644
 UNKNOWN_ENC = 'text/plain'
 
+# Encoded content is decoded in chunks of this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+# Upper bound of distinct paths written at the same time
+MAX_WRITE_WORKERS = 4
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+BASE64_ALPHABET = (string.ascii_letters + string.digits + '+/=').encode()
+NON_BASE64_BYTES = bytes(
+    byte for byte in range(256) if byte not in BASE64_ALPHABET)
+
 LOG = logging.getLogger(__name__)
 
 distros = ['all']
@@ -46,7 +64,10 @@ schema = {
         Parent folders in the path are created if absent.
         Content can be specified in plain text or binary. Data encoded with
         either base64 or binary gzip data can be specified and will be decoded
-        before being written. For empty file creation, content can be omitted.
+        while being written, so large payloads are never held fully decoded in
+        memory. For empty file creation, content can be omitted. Entries for
+        different paths may be written concurrently; entries for the same path
+        are written in the order given.
 
     .. note::
         if multiline data is provided, care should be taken to ensure that it
@@ -196,20 +217,70 @@ def write_files(name, files):
     if not files:
         return
 
+    # Entries for one path are written in order, distinct paths concurrently
+    by_path = OrderedDict()
     for (i, f_info) in enumerate(files):
         path = f_info.get('path')
         if not path:
             LOG.warning("No path provided to write for entry %s in module %s",
                         i + 1, name)
             continue
-        path = os.path.abspath(path)
-        extractions = canonicalize_extraction(f_info.get('encoding'))
-        contents = extract_contents(f_info.get('content', ''), extractions)
-        (u, g) = util.extract_usergroup(f_info.get('owner', DEFAULT_OWNER))
-        perms = decode_perms(f_info.get('permissions'), DEFAULT_PERMS)
-        omode = 'ab' if util.get_cfg_option_bool(f_info, 'append') else 'wb'
-        util.write_file(path, contents, omode=omode, mode=perms)
-        util.chownbyname(path, u, g)
+        by_path.setdefault(os.path.abspath(path), []).append(f_info)
+    if not by_path:
+        return
+
+    for dirname in sorted(set(os.path.dirname(p) for p in by_path)):
+        util.ensure_dir(dirname)
+
+    workers = min(MAX_WRITE_WORKERS, len(by_path))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        writes = [executor.submit(_write_path, path, f_infos)
+                  for (path, f_infos) in by_path.items()]
+    for write in writes:
+        write.result()
+
+
+def _write_path(path, f_infos):
+    for f_info in f_infos:
+        write_file(path, f_info)
+
+
+def write_file(path, f_info):
+    """Write one write_files entry, decoding encoded content as a stream.
+
+    Encoded content never exists fully decoded in memory. It is decoded into
+    a temporary file first, so ``path`` is left untouched if decoding fails.
+    """
+    extractions = canonicalize_extraction(f_info.get('encoding'))
+    contents = f_info.get('content', '')
+    (u, g) = util.extract_usergroup(f_info.get('owner', DEFAULT_OWNER))
+    perms = decode_perms(f_info.get('permissions'), DEFAULT_PERMS)
+    omode = 'ab' if util.get_cfg_option_bool(f_info, 'append') else 'wb'
+    if extractions != [UNKNOWN_ENC]:
+        _write_decoded(
+            path, decode_contents(contents, extractions), omode, perms)
+    else:
+        util.write_file(path, contents, omode=omode, mode=perms,
+                        ensure_dir_exists=False)
+    util.chownbyname(path, u, g)
+
+
+def _write_decoded(path, chunks, omode, perms):
+    if omode == 'ab':
+        # Decode fully before anything is appended to path
+        with temp_utils.ExtendedTemporaryFile(prefix='write-files-') as tf:
+            for chunk in chunks:
+                tf.write(chunk)
+            tf.flush()
+            tf.seek(0)
+            util.write_file(
+                path, iter(partial(tf.read, STREAM_CHUNK_SIZE), b''),
+                omode=omode, mode=perms, ensure_dir_exists=False)
+    else:
+        # Replace the target of a symlink, as writing in place would
+        target = os.path.realpath(path)
+        with util.SeLinuxGuard(path=target):
+            atomic_helper.write_file(target, chunks, mode=perms)
 
 
 def decode_perms(perm, default):
@@ -234,6 +305,64 @@ def decode_perms(perm, default):
         return default
 
 
+def decode_contents(contents, extraction_types):
+    """Return an iterator of decoded contents in chunks of bytes.
+
+    This decodes the same extraction_types as extract_contents while only
+    holding about STREAM_CHUNK_SIZE bytes of each stage in memory.
+    """
+    chunks = (
+        util.encode_text(contents[start:start + STREAM_CHUNK_SIZE])
+        for start in range(0, len(contents), STREAM_CHUNK_SIZE))
+    for t in extraction_types:
+        if t == 'application/x-gzip':
+            chunks = _gunzip_chunks(chunks)
+        elif t == 'application/base64':
+            chunks = _b64decode_chunks(chunks)
+    return chunks
+
+
+def _b64decode_chunks(chunks):
+    # Like base64.b64decode, characters outside the alphabet are discarded
+    pending = b''
+    for chunk in chunks:
+        pending += chunk.translate(None, NON_BASE64_BYTES)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield binascii.a2b_base64(pending[:usable])
+            pending = pending[usable:]
+    if pending:
+        yield binascii.a2b_base64(pending)
+
+
+def _gunzip_chunks(chunks):
+    decomp = zlib.decompressobj(GZIP_WBITS)
+    started = False
+    try:
+        for chunk in chunks:
+            while chunk:
+                if decomp.eof:
+                    # Another gzip member may follow, after zero padding
+                    chunk = chunk.lstrip(b'\0')
+                    if not chunk:
+                        break
+                    decomp = zlib.decompressobj(GZIP_WBITS)
+                started = True
+                data = decomp.decompress(chunk, STREAM_CHUNK_SIZE)
+                if data:
+                    yield data
+                chunk = decomp.unused_data or decomp.unconsumed_tail
+        data = decomp.flush()
+        if data:
+            yield data
+        if started and not decomp.eof:
+            raise util.DecompressionError(
+                "Compressed file ended before the end-of-stream marker was"
+                " reached")
+    except zlib.error as e:
+        raise util.DecompressionError(str(e)) from e
+
+
 def extract_contents(contents, extraction_types):
     result = contents
     for t in extraction_types:
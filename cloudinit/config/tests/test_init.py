@@ -0,0 +1,97 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.config module metadata and deferred imports"""
+
+import glob
+import os
+from unittest import mock
+
+import pytest
+
+from cloudinit import config
+from cloudinit import importer
+from cloudinit.settings import PER_ALWAYS, PER_INSTANCE, PER_ONCE
+
+MODULE_SOURCE = '''\
+"""Docstring mentioning frequency = nothing"""
+from cloudinit.settings import PER_ALWAYS
+from cloudinit.distros import ALL_DISTROS
+
+{metadata}
+
+
+def handle(name, cfg, cloud, log, args):
+    pass
+'''
+
+
+class TestReadModuleMetadata:
+
+    @pytest.mark.parametrize('metadata,expected', (
+        ('', {'frequency': PER_INSTANCE, 'distros': [], 'osfamilies': []}),
+        ('frequency = PER_ALWAYS\ndistros = [ALL_DISTROS]',
+         {'frequency': PER_ALWAYS, 'distros': ['all'], 'osfamilies': []}),
+        ("frequency = 'once'\ndistros = ['ubuntu',\n           'debian']\n"
+         "osfamilies = ('redhat',)",
+         {'frequency': PER_ONCE, 'distros': ['ubuntu', 'debian'],
+          'osfamilies': ['redhat']}),
+    ))
+    def test_reads_static_metadata(self, metadata, expected):
+        source = MODULE_SOURCE.format(metadata=metadata)
+        assert expected == config.read_module_metadata(source)
+
+    @pytest.mark.parametrize('metadata', (
+        'frequency = get_frequency()',
+        'distros = SUPPORTED_DISTROS',
+        'frequency = PER_ALWAYS\nif True:\n    pass\nfrequency = PER_ONCE',
+        'distros = [\n',
+    ))
+    def test_dynamic_metadata_returns_none(self, metadata):
+        """Metadata which needs the module to be executed is not guessed."""
+        source = MODULE_SOURCE.format(metadata=metadata)
+        assert config.read_module_metadata(source) is None
+
+    def test_module_without_handle_returns_none(self):
+        assert config.read_module_metadata('frequency = PER_ALWAYS\n') is None
+
+    def test_matches_imported_metadata_of_all_config_modules(self):
+        """Static metadata of every shipped module matches its attributes."""
+        mod_dir = os.path.dirname(config.__file__)
+        for path in glob.glob(os.path.join(mod_dir, 'cc_*.py')):
+            name = 'cloudinit.config.' + os.path.basename(path)[:-3]
+            with open(path) as stream:
+                metadata = config.read_module_metadata(stream.read())
+            mod = config.fixup_module(importer.import_module(name))
+            assert {
+                'frequency': mod.frequency,
+                'distros': list(mod.distros),
+                'osfamilies': list(mod.osfamilies)} == metadata, name
+
+
+class TestFindDeferredModule:
+
+    def test_finds_module_without_importing(self):
+        with mock.patch.object(config.importer, 'import_module') as m_import:
+            mod = config.find_deferred_module(
+                'cc_runcmd', ['', 'cloudinit.config'])
+        assert 0 == m_import.call_count
+        assert 'cloudinit.config.cc_runcmd' == mod.name
+        assert ['all'] == mod.distros
+        assert mod.loaded is False
+
+    def test_handle_imports_module(self):
+        mod = config.find_deferred_module('cc_foo', ['cloudinit.config'])
+        with mock.patch('cloudinit.config.cc_foo.handle') as m_handle:
+            mod.handle('foo', {}, None, None, [])
+        assert mod.loaded is True
+        m_handle.assert_called_once_with('foo', {}, None, None, [])
+
+    def test_missing_module_returns_none(self):
+        assert config.find_deferred_module(
+            'cc_does_not_exist', ['', 'cloudinit.config']) is None
+
+    def test_unreadable_metadata_returns_none(self):
+        with mock.patch.object(config, 'read_module_metadata',
+                               return_value=None):
+            assert config.find_deferred_module(
+                'cc_foo', ['cloudinit.config']) is None
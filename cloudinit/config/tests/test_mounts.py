@@ -1,61 +1,64 @@
 # This file is part of cloud-init. See LICENSE file for license information.
+import errno
+import os
+import struct
 from unittest import mock
 
 import pytest
 
 from cloudinit.config.cc_mounts import create_swapfile
-from cloudinit.subp import ProcessExecutionError
 
 
 M_PATH = 'cloudinit.config.cc_mounts.'
 
 
+def assert_swap_area(fname, size):
+    pagesize = os.sysconf('SC_PAGE_SIZE')
+    with open(fname, 'rb') as stream:
+        header = stream.read(pagesize)
+    assert size == os.path.getsize(fname)
+    assert b'SWAPSPACE2' == header[-10:]
+    assert (1, size // pagesize - 1) == struct.unpack_from('=II', header, 1024)
+
+
 class TestCreateSwapfile:
 
     @pytest.mark.parametrize('fstype', ('xfs', 'btrfs', 'ext4', 'other'))
     @mock.patch(M_PATH + 'util.get_mount_info')
     @mock.patch(M_PATH + 'subp.subp')
     def test_happy_path(self, m_subp, m_get_mount_info, fstype, tmpdir):
-        swap_file = tmpdir.join("swap-file")
-        fname = str(swap_file)
-
-        # Some of the calls to subp.subp should create the swap file; this
-        # roughly approximates that
-        m_subp.side_effect = lambda *args, **kwargs: swap_file.write('')
-
+        fname = str(tmpdir.join("swap-file"))
         m_get_mount_info.return_value = (mock.ANY, fstype)
 
-        create_swapfile(fname, '')
-        assert mock.call(['mkswap', fname]) in m_subp.call_args_list
+        create_swapfile(fname, '1')
+        assert_swap_area(fname, 2 ** 20)
+        assert 0 == m_subp.call_count
 
+    @mock.patch(M_PATH + "os.posix_fallocate")
     @mock.patch(M_PATH + "util.get_mount_info")
-    @mock.patch(M_PATH + "subp.subp")
-    def test_fallback_from_fallocate_to_dd(
-        self, m_subp, m_get_mount_info, caplog, tmpdir
+    def test_fallback_from_fallocate_to_zeros(
+        self, m_get_mount_info, m_fallocate, caplog, tmpdir
     ):
-        swap_file = tmpdir.join("swap-file")
-        fname = str(swap_file)
-
-        def subp_side_effect(cmd, *args, **kwargs):
-            # Mock fallocate failing, to initiate fallback
-            if cmd[0] == "fallocate":
-                raise ProcessExecutionError()
-
-        m_subp.side_effect = subp_side_effect
-        # Use ext4 so both fallocate and dd are valid swap creation methods
+        fname = str(tmpdir.join("swap-file"))
+        m_fallocate.side_effect = OSError(errno.EOPNOTSUPP, "not supported")
+        # Use ext4 so both fallocate and zeros are valid swap creation methods
         m_get_mount_info.return_value = (mock.ANY, "ext4")
 
-        create_swapfile(fname, "")
-
-        cmds = [args[0][0] for args, _kwargs in m_subp.call_args_list]
-        assert "fallocate" in cmds, "fallocate was not called"
-        assert "dd" in cmds, "fallocate failure did not fallback to dd"
-
-        assert cmds.index("dd") > cmds.index(
-            "fallocate"
-        ), "dd ran before fallocate"
+        create_swapfile(fname, "1")
 
-        assert mock.call(["mkswap", fname]) in m_subp.call_args_list
+        assert 1 == m_fallocate.call_count
+        assert_swap_area(fname, 2 ** 20)
 
-        msg = "fallocate swap creation failed, will attempt with dd"
+        msg = "fallocate swap creation failed, will attempt with zeros"
         assert msg in caplog.text
+
+    @mock.patch(M_PATH + "util.get_mount_info")
+    def test_failure_removes_swapfile(self, m_get_mount_info, tmpdir):
+        fname = str(tmpdir.join("swap-file"))
+        m_get_mount_info.return_value = (mock.ANY, "btrfs")
+
+        with mock.patch(M_PATH + "_write_zeros",
+                        side_effect=OSError(errno.ENOSPC, "no space")):
+            with pytest.raises(OSError):
+                create_swapfile(fname, "1")
+        assert not os.path.exists(fname)
@@ -1,9 +1,12 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import os.path
+import threading
 
 from cloudinit.config import cc_ssh
 from cloudinit import ssh_util
+from cloudinit import util
+from cloudinit.subp import ProcessExecutionError
 from cloudinit.tests.helpers import CiTestCase, mock
 import logging
 
@@ -403,3 +406,91 @@ class TestHandleSsh(CiTestCase):
         # Check that all expected output has been done.
         for call_ in expected_calls:
             self.assertIn(call_, m_write_file.call_args_list)
+
+
+class TestGenerateHostKeys(CiTestCase):
+
+    def setUp(self):
+        super(TestGenerateHostKeys, self).setUp()
+        self.key_file_tpl = os.path.join(self.tmp_dir(), 'ssh_host_%s_key')
+
+    @mock.patch(MODPATH + "subp.subp")
+    def test_key_types_generated_concurrently(self, m_subp):
+        """Each key type runs its own ssh-keygen at the same time."""
+        all_started = threading.Barrier(2, timeout=5)
+
+        def keygen(cmd, capture, env):
+            all_started.wait()
+            if cmd[2] == 'bogus':
+                raise ProcessExecutionError(
+                    exit_code=1, stderr='unknown key type bogus')
+            return ('%s key\n' % cmd[2], '')
+
+        m_subp.side_effect = keygen
+        generated = cc_ssh.generate_host_keys(
+            ['ed25519', 'bogus'], self.key_file_tpl)
+        self.assertEqual({'ed25519': 'ed25519 key\n'}, generated)
+        self.assertIn(
+            mock.call(['ssh-keygen', '-t', 'ed25519', '-N', '', '-f',
+                       self.key_file_tpl % 'ed25519'],
+                      capture=True, env=mock.ANY),
+            m_subp.call_args_list)
+
+    @mock.patch(MODPATH + "generate_host_keys", return_value={})
+    @mock.patch(MODPATH + "util.SeLinuxGuard")
+    @mock.patch(MODPATH + "ug_util.normalize_users_groups",
+                return_value=([], {}))
+    def test_handle_relabels_once(self, _m_nug, m_guard, m_generate):
+        cloud = self.tmp_cloud(distro='ubuntu')
+        with mock.patch(MODPATH + "KEY_FILE_TPL", self.key_file_tpl):
+            cc_ssh.handle("name", {'ssh_genkeytypes': ['rsa', 'ecdsa']},
+                          cloud, LOG, None)
+        self.assertEqual(
+            1, m_guard.call_args_list.count(
+                mock.call("/etc/ssh", recursive=True)))
+        m_generate.assert_called_once_with(['rsa', 'ecdsa'])
+
+
+class TestPregeneratedHostKeys(CiTestCase):
+
+    def setUp(self):
+        super(TestPregeneratedHostKeys, self).setUp()
+        self.keys_dir = os.path.join(self.tmp_dir(), 'ssh-host-keys')
+        self.key_file_tpl = os.path.join(self.tmp_dir(), 'ssh_host_%s_key')
+        self.add_patch(MODPATH + "KEY_FILE_TPL", 'm_tpl', autospec=False,
+                       new=self.key_file_tpl)
+
+    @mock.patch(MODPATH + "util.fork_cb")
+    @mock.patch(MODPATH + "subp.subp")
+    def test_pregenerate_then_install(self, m_subp, m_fork):
+        """Keys show up complete in keys_dir and are moved into place."""
+        def keygen(cmd, capture, env):
+            util.write_file(cmd[-1], 'private', mode=0o600)
+            util.write_file(cmd[-1] + '.pub', 'public')
+            return ('', '')
+
+        m_subp.side_effect = keygen
+        m_fork.side_effect = lambda child_cb, *args, **kwargs: child_cb(
+            *args, **kwargs)
+        cc_ssh.pregenerate_host_keys(['rsa'], self.keys_dir)
+        self.assertEqual(['ssh_host_rsa_key', 'ssh_host_rsa_key.pub'],
+                         sorted(os.listdir(self.keys_dir)))
+        self.assertFalse(os.path.exists(self.keys_dir + '.tmp'))
+
+        missing = cc_ssh.install_pregenerated_host_keys(
+            ['rsa', 'ed25519'], self.keys_dir)
+        self.assertEqual(['ed25519'], missing)
+        self.assertEqual('private', util.load_file(self.key_file_tpl % 'rsa'))
+        self.assertEqual(
+            'public', util.load_file(self.key_file_tpl % 'rsa' + '.pub'))
+        cc_ssh.remove_pregenerated_host_keys(self.keys_dir)
+        self.assertFalse(os.path.exists(self.keys_dir))
+
+    def test_incomplete_keys_are_not_installed(self):
+        """Keys of a still running pregeneration are not used."""
+        util.write_file(
+            os.path.join(self.keys_dir + '.tmp', 'ssh_host_rsa_key'), 'k')
+        self.assertEqual(
+            ['rsa'],
+            cc_ssh.install_pregenerated_host_keys(['rsa'], self.keys_dir))
+        self.assertFalse(os.path.exists(self.key_file_tpl % 'rsa'))
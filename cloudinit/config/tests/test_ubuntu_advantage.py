@@ -294,6 +294,14 @@ class TestMaybeInstallUATools(CiTestCase):
             'Some apt error')
         maybe_install_ua_tools(cloud=FakeCloud(distro))  # No RuntimeError
 
+    @mock.patch('%s.subp.which' % MPATH)
+    def test_maybe_install_ua_tools_waits_for_package_prefetch(self, m_which):
+        """ua runs apt, so a package index prefetch is waited for first."""
+        m_which.return_value = '/usr/bin/ua'  # already installed
+        distro = mock.MagicMock()
+        maybe_install_ua_tools(cloud=FakeCloud(distro))
+        distro.wait_for_package_prefetch.assert_called_once_with()
+
     @mock.patch('%s.subp.which' % MPATH)
     def test_maybe_install_ua_tools_raises_update_errors(self, m_which):
         """maybe_install_ua_tools logs and raises apt update errors."""
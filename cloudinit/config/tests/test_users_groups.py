@@ -7,8 +7,8 @@ from cloudinit.tests.helpers import CiTestCase, mock
 MODPATH = "cloudinit.config.cc_users_groups"
 
 
-@mock.patch('cloudinit.distros.ubuntu.Distro.create_group')
-@mock.patch('cloudinit.distros.ubuntu.Distro.create_user')
+@mock.patch('cloudinit.distros.ubuntu.Distro.create_groups')
+@mock.patch('cloudinit.distros.ubuntu.Distro.create_users')
 class TestHandleUsersGroups(CiTestCase):
     """Test cc_users_groups handling of config."""
 
@@ -39,15 +39,14 @@ class TestHandleUsersGroups(CiTestCase):
         cloud = self.tmp_cloud(
             distro='ubuntu', sys_cfg=sys_cfg, metadata=metadata)
         cc_users_groups.handle('modulename', cfg, cloud, None, None)
-        self.assertCountEqual(
-            m_user.call_args_list,
-            [mock.call('ubuntu', groups='lxd,sudo', lock_passwd=True,
-                       shell='/bin/bash'),
-             mock.call('me2', default=False)])
+        m_user.assert_called_once_with(
+            [('me2', {'default': False}),
+             ('ubuntu', {'groups': 'lxd,sudo', 'lock_passwd': True,
+                         'shell': '/bin/bash'})])
         m_group.assert_not_called()
 
-    @mock.patch('cloudinit.distros.freebsd.Distro.create_group')
-    @mock.patch('cloudinit.distros.freebsd.Distro.create_user')
+    @mock.patch('cloudinit.distros.freebsd.Distro.create_groups')
+    @mock.patch('cloudinit.distros.freebsd.Distro.create_users')
     def test_handle_users_in_cfg_calls_create_users_on_bsd(
             self,
             m_fbsd_user,
@@ -65,11 +64,10 @@ class TestHandleUsersGroups(CiTestCase):
         cloud = self.tmp_cloud(
             distro='freebsd', sys_cfg=sys_cfg, metadata=metadata)
         cc_users_groups.handle('modulename', cfg, cloud, None, None)
-        self.assertCountEqual(
-            m_fbsd_user.call_args_list,
-            [mock.call('freebsd', groups='wheel', lock_passwd=True,
-                       shell='/bin/tcsh'),
-             mock.call('me2', default=False)])
+        m_fbsd_user.assert_called_once_with(
+            [('me2', {'default': False}),
+             ('freebsd', {'groups': 'wheel', 'lock_passwd': True,
+                          'shell': '/bin/tcsh'})])
         m_fbsd_group.assert_not_called()
         m_linux_group.assert_not_called()
         m_linux_user.assert_not_called()
@@ -86,12 +84,11 @@ class TestHandleUsersGroups(CiTestCase):
         cloud = self.tmp_cloud(
             distro='ubuntu', sys_cfg=sys_cfg, metadata=metadata)
         cc_users_groups.handle('modulename', cfg, cloud, None, None)
-        self.assertCountEqual(
-            m_user.call_args_list,
-            [mock.call('ubuntu', groups='lxd,sudo', lock_passwd=True,
-                       shell='/bin/bash'),
-             mock.call('me2', cloud_public_ssh_keys=['key1'], default=False,
-                       ssh_redirect_user='ubuntu')])
+        m_user.assert_called_once_with(
+            [('me2', {'cloud_public_ssh_keys': ['key1'], 'default': False,
+                      'ssh_redirect_user': 'ubuntu'}),
+             ('ubuntu', {'groups': 'lxd,sudo', 'lock_passwd': True,
+                         'shell': '/bin/bash'})])
         m_group.assert_not_called()
 
     def test_users_with_ssh_redirect_user_default_str(self, m_user, m_group):
@@ -107,12 +104,11 @@ class TestHandleUsersGroups(CiTestCase):
         cloud = self.tmp_cloud(
             distro='ubuntu', sys_cfg=sys_cfg, metadata=metadata)
         cc_users_groups.handle('modulename', cfg, cloud, None, None)
-        self.assertCountEqual(
-            m_user.call_args_list,
-            [mock.call('ubuntu', groups='lxd,sudo', lock_passwd=True,
-                       shell='/bin/bash'),
-             mock.call('me2', cloud_public_ssh_keys=['key1'], default=False,
-                       ssh_redirect_user='ubuntu')])
+        m_user.assert_called_once_with(
+            [('me2', {'cloud_public_ssh_keys': ['key1'], 'default': False,
+                      'ssh_redirect_user': 'ubuntu'}),
+             ('ubuntu', {'groups': 'lxd,sudo', 'lock_passwd': True,
+                         'shell': '/bin/bash'})])
         m_group.assert_not_called()
 
     def test_users_with_ssh_redirect_user_non_default(self, m_user, m_group):
@@ -129,6 +125,7 @@ class TestHandleUsersGroups(CiTestCase):
             distro='ubuntu', sys_cfg=sys_cfg, metadata=metadata)
         with self.assertRaises(ValueError) as context_manager:
             cc_users_groups.handle('modulename', cfg, cloud, None, None)
+        m_user.assert_not_called()
         m_group.assert_not_called()
         self.assertEqual(
             'Not creating user me2. Invalid value of ssh_redirect_user:'
@@ -146,11 +143,10 @@ class TestHandleUsersGroups(CiTestCase):
         cloud = self.tmp_cloud(
             distro='ubuntu', sys_cfg=sys_cfg, metadata=metadata)
         cc_users_groups.handle('modulename', cfg, cloud, None, None)
-        self.assertCountEqual(
-            m_user.call_args_list,
-            [mock.call('ubuntu', groups='lxd,sudo', lock_passwd=True,
-                       shell='/bin/bash'),
-             mock.call('me2', default=False)])
+        m_user.assert_called_once_with(
+            [('me2', {'default': False}),
+             ('ubuntu', {'groups': 'lxd,sudo', 'lock_passwd': True,
+                         'shell': '/bin/bash'})])
         m_group.assert_not_called()
 
     def test_users_ssh_redirect_user_and_no_default(self, m_user, m_group):
@@ -163,7 +159,7 @@ class TestHandleUsersGroups(CiTestCase):
         cloud = self.tmp_cloud(
             distro='ubuntu', sys_cfg=sys_cfg, metadata=metadata)
         cc_users_groups.handle('modulename', cfg, cloud, None, None)
-        m_user.assert_called_once_with('me2', default=False)
+        m_user.assert_called_once_with([('me2', {'default': False})])
         m_group.assert_not_called()
         self.assertEqual(
             'WARNING: Ignoring ssh_redirect_user: True for me2. No'
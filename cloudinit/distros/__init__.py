@@ -10,11 +10,14 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import abc
+import hashlib
+import json
 import os
 import re
 import stat
 import string
 import urllib.parse
+from collections import OrderedDict
 from io import StringIO
 
 from cloudinit import importer
@@ -22,6 +25,7 @@ from cloudinit import log as logging
 from cloudinit import net
 from cloudinit.net import eni
 from cloudinit.net import network_state
+from cloudinit.net import renderer
 from cloudinit.net import renderers
 from cloudinit import persistence
 from cloudinit import ssh_util
@@ -32,6 +36,7 @@ from cloudinit import util
 from cloudinit.features import \
     ALLOW_EC2_MIRRORS_ON_NON_AWS_INSTANCE_TYPES
 
+from cloudinit.distros.package_transaction import PackageTransaction
 from cloudinit.distros.parsers import hosts
 from .networking import LinuxNetworking
 
@@ -62,6 +67,9 @@ PREFERRED_NTP_CLIENTS = ['chrony', 'systemd-timesyncd', 'ntp', 'ntpdate']
 # Letters/Digits/Hyphen characters, for use in domain name validation
 LDH_ASCII_CHARS = string.ascii_letters + string.digits + "-"
 
+# Hashes of the network config last applied per renderer, in the data dir
+NETWORK_CONFIG_HASHES_FILE = 'network-config-hashes.json'
+
 
 class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
 
@@ -86,6 +94,8 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
         self._cfg = cfg
         self.name = name
         self.networking = self.networking_cls()
+        self.package_transaction = PackageTransaction(self)
+        self._rendered_network_files = {}
 
     def _unpickle(self, ci_pkl_version: int) -> None:
         """Perform deserialization fixes for Distro."""
@@ -98,6 +108,10 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
             # either because it isn't present at all, or because it will be
             # missing expected instance state otherwise.
             self.networking = self.networking_cls()
+        if "package_transaction" not in self.__dict__:
+            self.package_transaction = PackageTransaction(self)
+        if "_rendered_network_files" not in self.__dict__:
+            self._rendered_network_files = {}
 
     @abc.abstractmethod
     def install_packages(self, pkglist):
@@ -111,17 +125,91 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
     def _write_network_config(self, settings):
         raise NotImplementedError()
 
-    def _supported_write_network_config(self, network_config):
+    def _select_renderer(self):
         priority = util.get_cfg_by_path(
             self._cfg, ('network', 'renderers'), None)
 
         name, render_cls = renderers.select(priority=priority)
         LOG.debug("Selected renderer '%s' from priority list: %s",
                   name, priority)
+        return name, render_cls
+
+    def _supported_write_network_config(self, network_config):
+        name, render_cls = self._select_renderer()
         renderer = render_cls(config=self.renderer_configs.get(name))
         renderer.render_network_config(network_config)
+        self._rendered_network_files = dict(renderer.rendered_files or {})
         return []
 
+    def _network_config_hash(self, netconfig):
+        """Return the renderer name and a canonical hash of netconfig.
+
+        The hash covers everything the renderer output depends on. None is
+        returned when no renderer is available or nowhere to persist hashes.
+        """
+        if not self._paths:
+            return None
+        try:
+            name, _render_cls = self._select_renderer()
+        except net.RendererNotFoundError:
+            return None
+        content = json.dumps(
+            [self.name, name, self.renderer_configs.get(name), netconfig],
+            sort_keys=True, default=str)
+        return name, hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _network_config_hashes_file(self):
+        return os.path.join(
+            self._paths.get_cpath('data'), NETWORK_CONFIG_HASHES_FILE)
+
+    def _read_network_config_hashes(self):
+        try:
+            return json.loads(util.load_file(
+                self._network_config_hashes_file(), quiet=True))
+        except (IOError, ValueError):
+            return {}
+
+    def _applied_network_config(self, netconfig):
+        """Return the record of netconfig if it is the config last applied.
+
+        Network config is compared per renderer, so that a change of
+        renderer always renders again. A config whose rendered files were
+        since removed or modified is not considered applied.
+        """
+        config_hash = self._network_config_hash(netconfig)
+        if config_hash is None:
+            return None
+        name, digest = config_hash
+        record = self._read_network_config_hashes().get(name)
+        if not isinstance(record, dict) or record.get('config') != digest:
+            return None
+        for path, file_digest in record.get('files', {}).items():
+            if renderer.file_digest(path) != file_digest:
+                LOG.debug("Rendered network config file %s has changed",
+                          path)
+                return None
+        return record
+
+    def network_config_changed(self, netconfig):
+        """Return whether netconfig differs from the one last rendered."""
+        return self._applied_network_config(netconfig) is None
+
+    def network_config_brought_up(self, netconfig):
+        """Return whether netconfig was rendered and brought up."""
+        record = self._applied_network_config(netconfig)
+        return bool(record and record.get('brought_up'))
+
+    def _record_network_config(self, netconfig, **record):
+        config_hash = self._network_config_hash(netconfig)
+        if config_hash is None:
+            return
+        name, digest = config_hash
+        hashes = self._read_network_config_hashes()
+        hashes[name] = dict(record, config=digest)
+        util.write_file(
+            self._network_config_hashes_file(),
+            json.dumps(hashes, sort_keys=True), mode=0o600)
+
     def _find_tz_file(self, tz):
         tz_file = os.path.join(self.tz_zone_dir, str(tz))
         if not os.path.isfile(tz_file):
@@ -152,6 +240,21 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
     def update_package_sources(self):
         raise NotImplementedError()
 
+    def prefetch_package_sources(self):
+        """Start refreshing the package index in the background.
+
+        Distros whose ``update_package_sources`` can join an in-flight
+        refresh override this; elsewhere it does nothing.
+        """
+        LOG.debug("Package index prefetch is not supported on %s", self.name)
+
+    def wait_for_package_prefetch(self):
+        """Wait for a prefetch_package_sources refresh to finish.
+
+        Callers running the package manager outside of this class, which
+        would conflict with the package manager's locks, wait first.
+        """
+
     def get_primary_arch(self):
         arch = os.uname()[4]
         if arch in ("i386", "i486", "i586", "i686"):
@@ -206,17 +309,35 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
         # apply network config netconfig
         # This method is preferred to apply_network which only takes
         # a much less complete network config format (interfaces(5)).
+        self._rendered_network_files = {}
         try:
             dev_names = self._write_network_config(netconfig)
         except NotImplementedError:
             # backwards compat until all distros have apply_network_config
             return self._apply_network_from_network_config(
                 netconfig, bring_up=bring_up)
-
         # Now try to bring them up
+        result = False
         if bring_up:
-            return self._bring_up_interfaces(dev_names)
-        return False
+            result = self._bring_up_interfaces(dev_names)
+        self._record_network_config(
+            netconfig, files=self._rendered_network_files,
+            devices=list(dev_names or []), brought_up=bool(result))
+        return result
+
+    def bring_up_network_config(self, netconfig):
+        """Bring up netconfig as rendered earlier, without rendering it.
+
+        This completes an earlier apply_network_config made without
+        bring_up.
+        """
+        record = self._applied_network_config(netconfig) or {}
+        dev_names = record.get('devices', [])
+        result = self._bring_up_interfaces(dev_names)
+        self._record_network_config(
+            netconfig, files=record.get('files', {}), devices=dev_names,
+            brought_up=bool(result))
+        return result
 
     def apply_network_config_names(self, netconfig):
         net.apply_network_config_names(netconfig)
@@ -592,6 +713,58 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
         if 'sudo' in kwargs and kwargs['sudo'] is not False:
             self.write_sudo_rules(name, kwargs['sudo'])
 
+        self._setup_user_ssh_keys(name, kwargs)
+        return True
+
+    def create_users(self, users):
+        """
+        Creates or partially updates all ``users`` in the system.
+
+        ``users`` is a list of ``(name, kwargs)`` pairs processed as by
+        ``create_user``, except that every entry is validated before the
+        first user is added and the per-user steps are batched: passwords
+        are set with one ``chpasswd`` call per kind and all sudo rules are
+        written to the sudoers file at once.
+        """
+        sudo_content = []
+        for name, kwargs in users:
+            if 'snapuser' in kwargs:
+                continue
+            groups = kwargs.get('groups')
+            if groups and not isinstance(groups, (str, list, tuple)):
+                raise TypeError(
+                    "Not creating user %s. Invalid type %r for groups" %
+                    (name, type_utils.obj_name(groups)))
+            if 'sudo' in kwargs and kwargs['sudo'] is not False:
+                sudo_content.append(
+                    self._sudo_rules_content(name, kwargs['sudo']))
+
+        plain_passwds = []
+        hashed_passwds = []
+        added = []
+        for name, kwargs in users:
+            if 'snapuser' in kwargs:
+                self.add_snap_user(name, **kwargs)
+                continue
+            self.add_user(name, **kwargs)
+            added.append((name, kwargs))
+            if kwargs.get('plain_text_passwd'):
+                plain_passwds.append((name, kwargs['plain_text_passwd']))
+            if kwargs.get('hashed_passwd'):
+                hashed_passwds.append((name, kwargs['hashed_passwd']))
+
+        self.set_passwds(plain_passwds)
+        self.set_passwds(hashed_passwds, hashed=True)
+        for name, kwargs in added:
+            if kwargs.get('lock_passwd', True):
+                self.lock_passwd(name)
+        if sudo_content:
+            self._write_sudo_content(''.join(sudo_content))
+        for name, kwargs in added:
+            self._setup_user_ssh_keys(name, kwargs)
+
+    def _setup_user_ssh_keys(self, name, kwargs):
+        """Process ``ssh_authorized_keys`` and ``ssh_redirect_user``."""
         # Import SSH keys
         if 'ssh_authorized_keys' in kwargs:
             # Try to handle this in a smart manner.
@@ -623,7 +796,6 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
                 disable_option = disable_option.replace('$DISABLE_USER', name)
                 ssh_util.setup_user_keys(
                     set(cloud_keys), name, options=disable_option)
-        return True
 
     def lock_passwd(self, name):
         """
@@ -669,6 +841,22 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
 
         return True
 
+    def set_passwds(self, passwds, hashed=False):
+        """Set the passwords of all ``(user, passwd)`` pairs at once."""
+        if not passwds:
+            return
+        pass_string = ''.join('%s:%s\n' % pair for pair in passwds)
+        users = ', '.join(user for (user, _passwd) in passwds)
+        cmd = ['chpasswd']
+        if hashed:
+            cmd.append('-e')
+
+        try:
+            subp.subp(cmd, pass_string, logstring="chpasswd for %s" % users)
+        except Exception as e:
+            util.logexc(LOG, "Failed to set passwords for %s", users)
+            raise e
+
     def ensure_sudo_dir(self, path, sudo_base='/etc/sudoers'):
         # Ensure the dir is included and that
         # it actually exists as a directory
@@ -711,9 +899,10 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
         util.ensure_dir(path, 0o750)
 
     def write_sudo_rules(self, user, rules, sudo_file=None):
-        if not sudo_file:
-            sudo_file = self.ci_sudoers_fn
+        self._write_sudo_content(
+            self._sudo_rules_content(user, rules), sudo_file)
 
+    def _sudo_rules_content(self, user, rules):
         lines = [
             '',
             "# User rules for %s" % user,
@@ -728,6 +917,11 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
             raise TypeError(msg % (type_utils.obj_name(rules)))
         content = "\n".join(lines)
         content += "\n"  # trailing newline
+        return content
+
+    def _write_sudo_content(self, content, sudo_file=None):
+        if not sudo_file:
+            sudo_file = self.ci_sudoers_fn
 
         self.ensure_sudo_dir(os.path.dirname(sudo_file))
         if not os.path.exists(sudo_file):
@@ -775,6 +969,28 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
                 subp.subp(['usermod', '-a', '-G', name, member])
                 LOG.info("Added user '%s' to group '%s'", member, name)
 
+    def create_groups(self, groups):
+        """
+        Create all ``groups`` and add their members in a single pass.
+
+        ``groups`` maps group names to member lists as for ``create_group``.
+        Each existing member is added to all of its groups with one
+        ``usermod`` call.
+        """
+        memberships = OrderedDict()
+        for name, members in groups.items():
+            self.create_group(name)
+            for member in members or []:
+                if not util.is_user(member):
+                    LOG.warning("Unable to add group member '%s' to group '%s'"
+                                "; user does not exist.", member, name)
+                    continue
+                memberships.setdefault(member, []).append(name)
+
+        for member, names in memberships.items():
+            subp.subp(['usermod', '-a', '-G', ','.join(names), member])
+            LOG.info("Added user '%s' to groups %s", member, names)
+
     def shutdown_command(self, *, mode, delay, message):
         # called from cc_power_state_change.load_power_state
         command = ["shutdown", self.shutdown_options_map[mode]]
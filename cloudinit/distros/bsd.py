@@ -76,6 +76,15 @@ class BSD(distros.Distro):
                 util.logexc(LOG, "Failed to add user '%s' to group '%s'",
                             member, name)
 
+    def create_groups(self, groups):
+        for name, members in groups.items():
+            self.create_group(name, members)
+
+    def set_passwds(self, passwds, hashed=False):
+        # There is no batch tool like chpasswd, set them one by one.
+        for user, passwd in passwds:
+            self.set_passwd(user, passwd, hashed=hashed)
+
     def generate_fallback_config(self):
         nconf = {'config': [], 'version': 1}
         for mac, name in net.get_interfaces_by_mac().items():
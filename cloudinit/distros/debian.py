@@ -9,6 +9,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import os
+import threading
 
 from cloudinit import distros
 from cloudinit import helpers
@@ -30,6 +31,12 @@ APT_GET_WRAPPER = {
     'enabled': 'auto',
 }
 
+# Serializes the apt-get runs of this process, including a prefetch. Other
+# apt users must wait_for_package_prefetch, as the prefetch holds apt's locks
+APT_LOCK = threading.Lock()
+# Thread refreshing the package index in the background, if any
+_PREFETCH = None
+
 NETWORK_FILE_HEADER = """\
 # This file is generated from information provided by the datasource.  Changes
 # to it will not persist across an instance reboot.  To disable cloud-init's
@@ -196,12 +203,43 @@ class Distro(distros.Distro):
         cmd.extend(pkglist)
 
         # Allow the output of this to flow outwards (ie not be captured)
-        util.log_time(logfunc=LOG.debug,
-                      msg="apt-%s [%s]" % (command, ' '.join(cmd)),
-                      func=subp.subp,
-                      args=(cmd,), kwargs={'env': e, 'capture': False})
+        with APT_LOCK:
+            util.log_time(logfunc=LOG.debug,
+                          msg="apt-%s [%s]" % (command, ' '.join(cmd)),
+                          func=subp.subp,
+                          args=(cmd,), kwargs={'env': e, 'capture': False})
+
+    def prefetch_package_sources(self):
+        """Refresh the package index in a background thread.
+
+        ``update_package_sources`` waits for this refresh instead of
+        starting another one, and runs it again if the prefetch failed.
+        """
+        global _PREFETCH
+        if _PREFETCH is not None:
+            return
+        LOG.debug("Refreshing package index in the background")
+        _PREFETCH = threading.Thread(
+            target=self._prefetch_package_sources, name='apt-prefetch')
+        _PREFETCH.start()
+
+    def _prefetch_package_sources(self):
+        try:
+            self._runner.run("update-sources", self.package_command,
+                             ["update"], freq=PER_INSTANCE,
+                             clear_on_fail=True)
+        except Exception:
+            util.logexc(LOG, "Background package index refresh failed")
+
+    def wait_for_package_prefetch(self):
+        global _PREFETCH
+        if _PREFETCH is not None:
+            LOG.debug("Waiting for background package index refresh")
+            _PREFETCH.join()
+            _PREFETCH = None
 
     def update_package_sources(self):
+        self.wait_for_package_prefetch()
         self._runner.run("update-sources", self.package_command,
                          ["update"], freq=PER_INSTANCE)
 
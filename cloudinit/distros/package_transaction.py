@@ -0,0 +1,126 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Coalesce package operations requested by config modules."""
+
+from collections import OrderedDict
+
+from cloudinit import log as logging
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
+
+# Flush pending requests after every config module or once per module section
+FLUSH_MODULE = 'module'
+FLUSH_SECTION = 'section'
+FLUSH_POINTS = (FLUSH_MODULE, FLUSH_SECTION)
+
+
+class PackageTransactionError(Exception):
+    """Pending package operations failed for one or more modules.
+
+    ``failures`` maps each requesting module to the exception raised while
+    installing its packages on their own.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(
+            "Package installation failed for %s" % ', '.join(
+                str(module) for module in failures))
+
+
+class PackageTransaction:
+    """Record package requests from modules and apply them together.
+
+    Requests are only recorded until ``flush`` is called; ``flush`` then
+    refreshes the package index if any request asked for it and installs
+    all requested packages with a single ``distro.install_packages`` call.
+    If that combined transaction fails, each module's packages are retried
+    on their own so that failures are attributed to the modules that asked
+    for them. Packages installed once are not installed again.
+    """
+
+    def __init__(self, distro):
+        self._distro = distro
+        self._pending = OrderedDict()
+        self._update = []
+        self._installed = set()
+
+    @property
+    def pending(self):
+        """Whether any request is waiting to be flushed."""
+        return bool(self._pending or self._update)
+
+    def request_update(self, module=None):
+        """Refresh the package index before the next installation."""
+        if module not in self._update:
+            self._update.append(module)
+
+    def request_install(self, pkglist, module=None):
+        """Install ``pkglist`` with the next flush.
+
+        ``pkglist`` accepts the same forms as ``distro.install_packages``:
+        a package name, a ``(name, version)`` pair or a list of those.
+        """
+        if isinstance(pkglist, (str, tuple)):
+            pkglist = [pkglist]
+        requested = self._pending.setdefault(module, [])
+        for pkg in pkglist:
+            if isinstance(pkg, list):
+                pkg = tuple(pkg)
+            if pkg not in self._installed and pkg not in requested:
+                requested.append(pkg)
+        if not requested:
+            del self._pending[module]
+
+    def flush(self):
+        """Apply all pending requests as one package transaction.
+
+        @raises PackageTransactionError: naming the modules whose packages
+            could not be installed.
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        update, self._update = self._update, []
+        failures = OrderedDict()
+        if update:
+            try:
+                self._distro.update_package_sources()
+            except Exception as e:
+                util.logexc(LOG, "Package index refresh failed")
+                for module in update:
+                    failures[module] = e
+        combined = []
+        for pkglist in pending.values():
+            combined.extend(pkg for pkg in pkglist if pkg not in combined)
+        if combined:
+            if len(pending) > 1:
+                LOG.debug("Installing packages requested by %s in one"
+                          " transaction", ', '.join(map(str, pending)))
+            try:
+                self._distro.install_packages(combined)
+                self._installed.update(combined)
+            except Exception as e:
+                if len(pending) == 1:
+                    module, pkglist = next(iter(pending.items()))
+                    util.logexc(LOG, "Failed to install packages %s for %s",
+                                pkglist, module)
+                    failures[module] = e
+                else:
+                    LOG.warning("Combined package transaction failed,"
+                                " retrying each module's packages")
+                    self._attribute(pending, failures)
+        if failures:
+            raise PackageTransactionError(failures)
+
+    def _attribute(self, pending, failures):
+        """Install each module's packages on their own, recording errors."""
+        for module, pkglist in pending.items():
+            try:
+                self._distro.install_packages(pkglist)
+                self._installed.update(pkglist)
+            except Exception as e:
+                util.logexc(LOG, "Failed to install packages %s for %s",
+                            pkglist, module)
+                failures[module] = e
+
+# vi: ts=4 expandtab
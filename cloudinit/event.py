@@ -22,13 +22,13 @@ class EventScope(Enum):
 class EventType(Enum):
     """Event types which can generate maintenance requests for cloud-init."""
     # Cloud-init should grow support for the follow event types:
-    # HOTPLUG
     # METADATA_CHANGE
     # USER_REQUEST
 
     BOOT = "boot"
     BOOT_NEW_INSTANCE = "boot-new-instance"
     BOOT_LEGACY = "boot-legacy"
+    HOTPLUG = "hotplug"
 
     def __str__(self):  # pylint: disable=invalid-str-returned
         return self.value
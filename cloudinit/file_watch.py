@@ -0,0 +1,216 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Wait for files to change using inotify, falling back to polling.
+
+A FileWatcher watches the directories containing a set of target paths
+(following symlinks, and the nearest existing ancestor of directories which
+do not exist yet) so waiters wake up as soon as a target is created, changed,
+renamed or removed instead of polling on a fixed interval. When inotify is
+unavailable (non-Linux platforms, exhausted watch limits) waits degrade to
+sleeping for the polling interval.
+"""
+
+import ctypes
+import errno
+import os
+import select
+import struct
+import time
+
+from cloudinit import log as logging
+
+LOG = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR)
+# Events on the watched directory itself rather than on an entry in it
+SELF_EVENTS = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+_EVENT_FMT = 'iIII'
+_EVENT_SIZE = struct.calcsize(_EVENT_FMT)
+_READ_SIZE = 64 * (_EVENT_SIZE + 256)
+
+_LIBC = None
+
+
+def _get_libc():
+    """Return libc if it provides inotify, else None."""
+    global _LIBC
+    if _LIBC is None:
+        _LIBC = False
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if hasattr(libc, 'inotify_init1'):
+                _LIBC = libc
+        except OSError:
+            pass
+    return _LIBC or None
+
+
+def _watch_points(path):
+    """Return (directory, entry name) pairs to watch for changes of path."""
+    points = []
+    paths = [os.path.abspath(path)]
+    if os.path.islink(paths[0]):
+        paths.append(os.path.realpath(paths[0]))
+    for cur in paths:
+        parent, name = os.path.split(cur)
+        while parent != os.path.dirname(parent) and not os.path.isdir(parent):
+            parent, name = os.path.split(parent)
+        points.append((parent, name))
+    return points
+
+
+class FileWatcher(object):
+    """Context manager waiting for changes to any of the target paths.
+
+    @param targets: List of file paths to watch. They, and their parent
+        directories, do not need to exist.
+    @param naplen: Seconds to sleep per wait when inotify is unavailable.
+    """
+
+    def __init__(self, targets, naplen=0.25):
+        self.targets = list(targets)
+        self.naplen = naplen
+        self._fd = None
+        self._names = {}
+
+    def __enter__(self):
+        libc = _get_libc()
+        if libc:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                LOG.debug("inotify unavailable, polling for %s: %s",
+                          self.targets, os.strerror(ctypes.get_errno()))
+            else:
+                self._fd = fd
+                if not self._arm():
+                    self.close()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def inotify(self):
+        """Whether waits are driven by inotify events."""
+        return self._fd is not None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._names = {}
+
+    def _arm(self):
+        """Add watches for all targets. Return False if any failed."""
+        libc = _get_libc()
+        for target in self.targets:
+            for (directory, name) in _watch_points(target):
+                wd = libc.inotify_add_watch(
+                    self._fd, directory.encode(), WATCH_MASK)
+                if wd < 0:
+                    err = ctypes.get_errno()
+                    if err == errno.ENOENT:
+                        # Removed under us, the next wait re-arms
+                        continue
+                    LOG.debug("Failed adding inotify watch on %s: %s,"
+                              " polling instead", directory,
+                              os.strerror(err))
+                    return False
+                self._names.setdefault(wd, set()).add(name)
+        return True
+
+    def _read_events(self):
+        """Drain pending events, returning True if any concerned a target."""
+        relevant = False
+        while True:
+            try:
+                buf = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset + _EVENT_SIZE <= len(buf):
+                wd, mask, _cookie, length = struct.unpack_from(
+                    _EVENT_FMT, buf, offset)
+                name = buf[offset + _EVENT_SIZE:offset + _EVENT_SIZE + length]
+                name = name.rstrip(b'\0').decode(errors='replace')
+                offset += _EVENT_SIZE + length
+                if mask & SELF_EVENTS:
+                    self._names.pop(wd, None)
+                    relevant = True
+                elif name in self._names.get(wd, ()):
+                    relevant = True
+        return relevant
+
+    def wait(self, timeout=None):
+        """Wait for a target to change, for at most timeout seconds.
+
+        Without inotify, sleep for naplen (bounded by timeout) and return
+        True as a change can not be ruled out.
+
+        @return: True if a target may have changed, False on timeout.
+        """
+        if not self.inotify:
+            naplen = self.naplen
+            if timeout is not None:
+                naplen = min(naplen, timeout)
+            time.sleep(naplen)
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return False
+            if self._read_events():
+                # Directories may have appeared or been replaced
+                if not self._arm():
+                    self.close()
+                return True
+
+
+def wait_for(predicate, targets, timeout, naplen=0.25):
+    """Wait until predicate() is truthy, re-checking when targets change.
+
+    @param predicate: Callable without arguments.
+    @param targets: List of paths whose changes may affect predicate.
+    @param timeout: Maximum seconds to wait, or None to wait forever.
+    @param naplen: Polling interval when inotify is unavailable.
+
+    @return: The last value returned by predicate.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # Watches are added before the first check so no change is missed
+    with FileWatcher(targets, naplen=naplen) as watcher:
+        while True:
+            result = predicate()
+            if result:
+                return result
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return result
+            watcher.wait(remaining)
+
+# vi: ts=4 expandtab
@@ -11,6 +11,7 @@
 from time import time
 
 import contextlib
+import json
 import os
 from configparser import NoSectionError, NoOptionError, RawConfigParser
 from io import StringIO
@@ -18,6 +19,7 @@ from io import StringIO
 from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
                                 CFG_ENV_NAME)
 
+from cloudinit import atomic_helper
 from cloudinit import log as logging
 from cloudinit import type_utils
 from cloudinit import persistence
@@ -51,6 +53,9 @@ class DummySemaphores(object):
     def clear_all(self):
         pass
 
+    def flush(self):
+        pass
+
 
 class FileLock(object):
     def __init__(self, fn):
@@ -95,6 +100,9 @@ class FileSemaphores(object):
             util.logexc(LOG, "Failed deleting semaphore directory %s",
                         self.sem_path)
 
+    def flush(self):
+        """Make recorded semaphores durable, a no-op for files."""
+
     def _acquire(self, name, freq):
         # Check again if its been already gotten
         if self.has_run(name, freq):
@@ -142,6 +150,211 @@ class FileSemaphores(object):
             return os.path.join(sem_path, "%s.%s" % (name, freq))
 
 
+class JournalLock(object):
+    def __init__(self, journal, key):
+        self.journal = journal
+        self.key = key
+
+    def __str__(self):
+        return "<%s using %r in journal %r>" % (
+            type_utils.obj_name(self), self.key, self.journal)
+
+
+class JournalSemaphores(FileSemaphores):
+    """Semaphores kept as entries of a single append-only journal.
+
+    The journal in sem_path holds one JSON encoded [key, value] pair per
+    line, where a null value removes the key. It is read once, on first use,
+    and the in-memory entries are used from then on. Each lock or clear
+    appends one line using a file descriptor kept open until flush(), which
+    fsyncs all appends at once. Entry keys are the file names FileSemaphores
+    would use, so semaphore files which exist when the journal is first
+    created are imported into it.
+    """
+
+    journal_name = '.journal'
+    # Rewrite journals with more superseded lines than this on load
+    max_stale_lines = 64
+
+    def __init__(self, sem_path):
+        super(JournalSemaphores, self).__init__(sem_path)
+        self.journal = os.path.join(sem_path, self.journal_name)
+        self._entries = None
+        self._fd = None
+        self._dirty = False
+
+    def _key(self, name, freq):
+        return os.path.basename(self._get_path(name, freq))
+
+    def _read_journal(self):
+        try:
+            content = util.load_file(self.journal)
+        except (IOError, OSError):
+            entries = self._import_sem_files()
+            if entries:
+                self._write_journal(entries)
+            return entries
+        entries = {}
+        lines = content.splitlines()
+        for line in lines:
+            try:
+                key, value = json.loads(line)
+            except (TypeError, ValueError):
+                LOG.warning("Ignoring corrupt line in semaphore journal %s",
+                            self.journal)
+                continue
+            if value is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = value
+        # Also rewrite a journal ending in a partial line so that appends
+        # do not end up on that line.
+        if (len(lines) - len(entries) > self.max_stale_lines or
+                content and not content.endswith('\n')):
+            self._write_journal(entries)
+        return entries
+
+    def _write_journal(self, entries):
+        """Atomically replace the journal with one line per entry."""
+        content = ''.join(
+            json.dumps([key, entries[key]]) + '\n' for key in sorted(entries))
+        try:
+            atomic_helper.write_file(self.journal, content, omode='w')
+        except (IOError, OSError):
+            util.logexc(LOG, "Failed writing semaphore journal %s",
+                        self.journal)
+
+    def _import_sem_files(self):
+        entries = {}
+        try:
+            fnames = os.listdir(self.sem_path)
+        except (IOError, OSError):
+            return entries
+        for fname in fnames:
+            sem_file = os.path.join(self.sem_path, fname)
+            if fname == self.journal_name or not os.path.isfile(sem_file):
+                continue
+            try:
+                entries[fname] = util.load_file(sem_file).strip()
+            except (IOError, OSError):
+                entries[fname] = ''
+        if entries:
+            LOG.debug("Imported %s semaphore files into journal %s",
+                      len(entries), self.journal)
+        return entries
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._read_journal()
+        return self._entries
+
+    def _append(self, changes):
+        """Append (key, value) changes to the journal and the entries."""
+        if self._fd is None:
+            util.ensure_dir(self.sem_path)
+            self._fd = os.open(
+                self.journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT |
+                os.O_CLOEXEC, 0o644)
+        os.write(self._fd, ''.join(
+            json.dumps([key, value]) + '\n'
+            for (key, value) in changes).encode())
+        self._dirty = True
+        for (key, value) in changes:
+            if value is None:
+                self.entries.pop(key, None)
+            else:
+                self.entries[key] = value
+
+    def flush(self):
+        """Make appended entries durable and close the journal."""
+        if self._fd is None:
+            return
+        try:
+            if self._dirty:
+                os.fsync(self._fd)
+        except (IOError, OSError):
+            util.logexc(LOG, "Failed syncing semaphore journal %s",
+                        self.journal)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._dirty = False
+
+    def rename_entry(self, key, new_key):
+        """Move the entry of key to new_key."""
+        self._append([(new_key, self.entries[key]), (key, None)])
+
+    def remove_entry(self, key):
+        self._append([(key, None)])
+
+    def _acquire(self, name, freq):
+        if self.has_run(name, freq):
+            return None
+        key = self._key(name, freq)
+        try:
+            self._append([(key, "%s: %s" % (os.getpid(), time()))])
+        except (IOError, OSError):
+            util.logexc(LOG, "Failed writing semaphore journal %s",
+                        self.journal)
+            return None
+        return JournalLock(self.journal, key)
+
+    def clear(self, name, freq):
+        name = canon_sem_name(name)
+        try:
+            self._append([(self._key(name, freq), None)])
+            # Remove any sem file left over from before the journal existed
+            util.del_file(self._get_path(name, freq))
+        except (IOError, OSError):
+            util.logexc(LOG, "Failed clearing semaphore %s in %s",
+                        name, self.journal)
+            return False
+        return True
+
+    def clear_all(self):
+        self.flush()
+        super(JournalSemaphores, self).clear_all()
+        self._entries = None
+
+    def has_run(self, name, freq):
+        if not freq or freq == PER_ALWAYS:
+            return False
+
+        cname = canon_sem_name(name)
+        if self._key(cname, freq) in self.entries:
+            return True
+
+        if cname != name and self._key(name, freq) in self.entries:
+            LOG.warning("%s has run without canonicalized name [%s].\n"
+                        "likely the migrator has not yet run. "
+                        "It will run next boot.\n"
+                        "run manually with: cloud-init single --name=migrator",
+                        name, cname)
+            return True
+
+        return False
+
+
+SEMAPHORE_BACKENDS = {
+    'file': FileSemaphores,
+    'journal': JournalSemaphores,
+}
+
+
+def get_semaphores(paths, sem_path):
+    """Return semaphores for sem_path using the backend configured in paths.
+
+    The backend is selected by 'semaphore_backend' in system_info/paths
+    config and defaults to 'file'.
+    """
+    backend = paths.cfgs.get('semaphore_backend') or 'file'
+    if backend not in SEMAPHORE_BACKENDS:
+        LOG.warning("Unknown semaphore_backend '%s', using 'file'", backend)
+        backend = 'file'
+    return SEMAPHORE_BACKENDS[backend](sem_path)
+
+
 class Runners(object):
     def __init__(self, paths):
         self.paths = paths
@@ -163,7 +376,7 @@ class Runners(object):
         if not sem_path:
             return None
         if sem_path not in self.sems:
-            self.sems[sem_path] = FileSemaphores(sem_path)
+            self.sems[sem_path] = get_semaphores(self.paths, sem_path)
         return self.sems[sem_path]
 
     def run(self, name, functor, args, freq=None, clear_on_fail=False):
@@ -186,6 +399,11 @@ class Runners(object):
                     results = functor(*args)
                 return (True, results)
 
+    def flush(self):
+        """Make the semaphores recorded by run() durable."""
+        for sem in self.sems.values():
+            sem.flush()
+
 
 class ConfigMerger(object):
     def __init__(self, paths=None, datasource=None,
@@ -5,12 +5,17 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import collections
+import contextlib
 import errno
 import functools
 import ipaddress
+import itertools
 import logging
 import os
 import re
+import socket
+from collections import OrderedDict
 
 from cloudinit import subp
 from cloudinit import util
@@ -418,52 +423,53 @@ def find_fallback_nic_on_linux(blacklist_drivers=None):
     if not blacklist_drivers:
         blacklist_drivers = []
 
+    snapshot = get_interface_snapshot()
     if 'net.ifnames=0' in util.get_cmdline():
         LOG.debug('Stable ifnames disabled by net.ifnames=0 in /proc/cmdline')
     else:
-        unstable = [device for device in get_devicelist()
-                    if device != 'lo' and not is_renamed(device)]
+        unstable = [info.name for info in snapshot
+                    if info.name != 'lo' and not info.is_renamed]
         if len(unstable):
             LOG.debug('Found unstable nic names: %s; calling udevadm settle',
                       unstable)
             msg = 'Waiting for udev events to settle'
             util.log_time(LOG.debug, msg, func=util.udevadm_settle)
+            # udev may have renamed devices
+            invalidate_interface_snapshot()
+            snapshot = get_interface_snapshot()
 
     # get list of interfaces that could have connections
     invalid_interfaces = set(['lo'])
-    potential_interfaces = set([device for device in get_devicelist()
-                                if device_driver(device) not in
-                                blacklist_drivers])
+    potential_interfaces = set([info.name for info in snapshot
+                                if info.driver not in blacklist_drivers])
     potential_interfaces = potential_interfaces.difference(invalid_interfaces)
     # sort into interfaces with carrier, interfaces which could have carrier,
     # and ignore interfaces that are definitely disconnected
     connected = []
     possibly_connected = []
     for interface in potential_interfaces:
+        info = snapshot.get(interface)
         if interface.startswith("veth"):
             continue
-        if is_bridge(interface):
+        if info.is_bridge:
             # skip any bridges
             continue
-        if is_bond(interface):
+        if info.is_bond:
             # skip any bonds
             continue
-        if is_netfailover(interface):
+        if info.is_netfailover:
             # ignore netfailover primary/standby interfaces
             continue
-        carrier = read_sys_net_int(interface, 'carrier')
-        if carrier:
+        if info.carrier:
             connected.append(interface)
             continue
         # check if nic is dormant or down, as this may make a nick appear to
         # not have a carrier even though it could acquire one when brought
         # online by dhclient
-        dormant = read_sys_net_int(interface, 'dormant')
-        if dormant:
+        if info.dormant:
             possibly_connected.append(interface)
             continue
-        operstate = read_sys_net_safe(interface, 'operstate')
-        if operstate in ['dormant', 'down', 'lowerlayerdown', 'unknown']:
+        if info.operstate in ['dormant', 'down', 'lowerlayerdown', 'unknown']:
             possibly_connected.append(interface)
             continue
 
@@ -483,7 +489,7 @@ def find_fallback_nic_on_linux(blacklist_drivers=None):
 
     # pick the first that has a mac-address
     for name in names:
-        if read_sys_net_safe(name, 'address'):
+        if snapshot.get(name).address:
             return name
     return None
 
@@ -616,26 +622,21 @@ def _get_current_rename_info(check_downable=True):
          }}
     """
     cur_info = {}
-    for (name, mac, driver, device_id) in get_interfaces():
+    with shared_interface_snapshot():
+        interfaces = get_interfaces()
+        snapshot = get_interface_snapshot()
+    for (name, mac, driver, device_id) in interfaces:
         cur_info[name] = {
             'downable': None,
             'device_id': device_id,
             'driver': driver,
             'mac': mac.lower(),
             'name': name,
-            'up': is_up(name),
+            'up': snapshot.get(name).is_up,
         }
 
     if check_downable:
-        nmatch = re.compile(r"[0-9]+:\s+(\w+)[@:]")
-        ipv6, _err = subp.subp(['ip', '-6', 'addr', 'show', 'permanent',
-                                'scope', 'global'], capture=True)
-        ipv4, _err = subp.subp(['ip', '-4', 'addr', 'show'], capture=True)
-
-        nics_with_addresses = set()
-        for bytes_out in (ipv6, ipv4):
-            nics_with_addresses.update(nmatch.findall(bytes_out))
-
+        nics_with_addresses = _get_nics_with_addresses()
         for d in cur_info.values():
             d['downable'] = (d['up'] is False or
                              d['name'] not in nics_with_addresses)
@@ -643,6 +644,39 @@ def _get_current_rename_info(check_downable=True):
     return cur_info
 
 
+def _get_nics_with_addresses():
+    """Return names of devices with IPv4 or permanent global IPv6 addresses.
+
+    Addresses are read over netlink on Linux, falling back to ip.
+    """
+    if util.is_Linux():
+        # Imported here as cloudinit.sources imports this module
+        from cloudinit.sources.helpers import netlink
+        try:
+            names = dict(
+                (link.index, link.name) for link in netlink.get_links())
+            return set(
+                names[addr.index] for addr in netlink.get_addresses()
+                if addr.index in names and (
+                    addr.family == socket.AF_INET or (
+                        addr.scope == netlink.RT_SCOPE_UNIVERSE and
+                        addr.flags & netlink.IFA_F_PERMANENT)))
+        except (netlink.NetlinkCreateSocketError,
+                netlink.NetlinkDumpError) as e:
+            LOG.debug("Reading addresses from netlink failed, using ip: %s",
+                      e)
+
+    nmatch = re.compile(r"[0-9]+:\s+(\w+)[@:]")
+    ipv6, _err = subp.subp(['ip', '-6', 'addr', 'show', 'permanent',
+                            'scope', 'global'], capture=True)
+    ipv4, _err = subp.subp(['ip', '-4', 'addr', 'show'], capture=True)
+
+    nics_with_addresses = set()
+    for bytes_out in (ipv6, ipv4):
+        nics_with_addresses.update(nmatch.findall(bytes_out))
+    return nics_with_addresses
+
+
 def _rename_interfaces(renames, strict_present=True, strict_busy=True,
                        current_info=None):
 
@@ -653,33 +687,46 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
     if current_info is None:
         current_info = _get_current_rename_info()
 
+    ops, errors = _plan_renames(renames, current_info, strict_present,
+                                strict_busy)
+
+    if len(ops) == 0:
+        if len(errors):
+            LOG.debug("unable to do any work for renaming of %s", renames)
+        else:
+            LOG.debug("no work necessary for renaming of %s", renames)
+    else:
+        LOG.debug("achieving renaming of %s with ops %s", renames, ops)
+        errors.extend(_perform_rename_ops(ops))
+        invalidate_interface_snapshot()
+
+    if len(errors):
+        raise Exception('\n'.join(errors))
+
+
+def _plan_renames(renames, current_info, strict_present=True,
+                  strict_busy=True):
+    """Return the ops renaming interfaces per renames, and planning errors.
+
+    The renames form a mapping of current to new names. Chains are ordered
+    so that each name is free when it is taken, and only cycles, such as
+    swapped names, and interfaces holding a requested name without being
+    renamed themselves go through a temporary name. Interfaces are only
+    brought down when they are renamed, and are brought back up once all
+    renames are done.
+
+    @return: (ops, errors) where ops is a list of (op, mac, new_name, params)
+        tuples with op being one of 'down', 'rename' and 'up'.
+    """
     cur_info = {}
+    by_mac = {}
     for name, data in current_info.items():
         cur = data.copy()
         if cur.get('mac'):
             cur['mac'] = cur['mac'].lower()
         cur['name'] = name
         cur_info[name] = cur
-
-    def update_byname(bymac):
-        return dict((data['name'], data)
-                    for data in cur_info.values())
-
-    def rename(cur, new):
-        subp.subp(["ip", "link", "set", cur, "name", new], capture=True)
-
-    def down(name):
-        subp.subp(["ip", "link", "set", name, "down"], capture=True)
-
-    def up(name):
-        subp.subp(["ip", "link", "set", name, "up"], capture=True)
-
-    ops = []
-    errors = []
-    ups = []
-    cur_byname = update_byname(cur_info)
-    tmpname_fmt = "cirename%d"
-    tmpi = -1
+        by_mac.setdefault(cur['mac'], []).append(cur)
 
     def entry_match(data, mac, driver, device_id):
         """match if set and in data"""
@@ -696,7 +743,7 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
         return False
 
     def find_entry(mac, driver, device_id):
-        match = [data for data in cur_info.values()
+        match = [data for data in by_mac.get(mac, [])
                  if entry_match(data, mac, driver, device_id)]
         if len(match):
             if len(match) > 1:
@@ -708,87 +755,156 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
 
         return None
 
+    errors = []
+    # current name -> (mac, new name) of the interfaces to rename
+    moves = OrderedDict()
+    targets = {}
     for mac, new_name, driver, device_id in renames:
         if mac:
             mac = mac.lower()
-        cur_ops = []
         cur = find_entry(mac, driver, device_id)
-        if not cur:
+        if not cur or not cur.get('name'):
             if strict_present:
                 errors.append(
                     "[nic not present] Cannot rename mac=%s to %s"
                     ", not available." % (mac, new_name))
             continue
 
-        cur_name = cur.get('name')
+        cur_name = cur['name']
         if cur_name == new_name:
             # nothing to do
             continue
 
-        if not cur_name:
-            if strict_present:
-                errors.append(
-                    "[nic not present] Cannot rename mac=%s to %s"
-                    ", not available." % (mac, new_name))
+        if cur['up'] and not cur['downable']:
+            if strict_busy:
+                errors.append("[busy] Error renaming mac=%s from %s to %s" %
+                              (mac, cur_name, new_name))
             continue
 
-        if cur['up']:
-            msg = "[busy] Error renaming mac=%s from %s to %s"
-            if not cur['downable']:
+        if new_name in targets:
+            errors.append(
+                "[duplicate] Cannot rename mac=%s to %s, already the new name"
+                " of mac=%s" % (mac, new_name, targets[new_name]))
+            continue
+        targets[new_name] = mac
+        moves[cur_name] = (mac, new_name)
+
+    # Interfaces holding a requested name without being renamed make way
+    # under a temporary name, when they can be brought down.
+    tmpname_fmt = "cirename%d"
+    tmp_names = (tmpname_fmt % i for i in itertools.count())
+
+    def new_tmp_name():
+        for tmp_name in tmp_names:
+            if tmp_name not in cur_info and tmp_name not in targets:
+                return tmp_name
+
+    evicted = True
+    while evicted:
+        evicted = False
+        for cur_name, (mac, new_name) in list(moves.items()):
+            target = cur_info.get(new_name)
+            if target is None or new_name in moves:
+                continue
+            if target['up'] and not target['downable']:
                 if strict_busy:
-                    errors.append(msg % (mac, cur_name, new_name))
+                    errors.append(
+                        "[busy-target] Error renaming mac=%s from %s to %s." %
+                        (mac, cur_name, new_name))
+                del moves[cur_name]
+                # Interfaces blocked on cur_name now need to evict it
+                evicted = True
                 continue
-            cur['up'] = False
-            cur_ops.append(("down", mac, new_name, (cur_name,)))
-            ups.append(("up", mac, new_name, (new_name,)))
-
-        if new_name in cur_byname:
-            target = cur_byname[new_name]
-            if target['up']:
-                msg = "[busy-target] Error renaming mac=%s from %s to %s."
-                if not target['downable']:
-                    if strict_busy:
-                        errors.append(msg % (mac, cur_name, new_name))
-                    continue
-                else:
-                    cur_ops.append(("down", mac, new_name, (new_name,)))
-
-            tmp_name = None
-            while tmp_name is None or tmp_name in cur_byname:
-                tmpi += 1
-                tmp_name = tmpname_fmt % tmpi
-
-            cur_ops.append(("rename", mac, new_name, (new_name, tmp_name)))
-            target['name'] = tmp_name
-            cur_byname = update_byname(cur_info)
-            if target['up']:
-                ups.append(("up", mac, new_name, (tmp_name,)))
-
-        cur_ops.append(("rename", mac, new_name, (cur['name'], new_name)))
+            moves[new_name] = (mac, new_tmp_name())
+
+    # Order the renames so that each one takes a free name
+    taken = set(cur_info)
+    waiting = dict((new_name, cur_name)
+                   for cur_name, (_mac, new_name) in moves.items())
+    ready = collections.deque(
+        cur_name for cur_name, (_mac, new_name) in moves.items()
+        if new_name not in taken)
+    ops = []
+    ups = []
+    downed = set()
+    pending = dict(moves)
+    while pending:
+        if ready:
+            cur_name = ready.popleft()
+            mac, new_name = pending.pop(cur_name)
+        else:
+            # Only cycles are left, move one of their members aside
+            cur_name = next(iter(pending))
+            mac, new_name = pending.pop(cur_name)
+            tmp_name = new_tmp_name()
+            pending[tmp_name] = (mac, new_name)
+            waiting[new_name] = tmp_name
+            new_name = tmp_name
+        cur = cur_info[cur_name]
+        if cur['up'] and cur_name not in downed:
+            ops.append(("down", mac, new_name, (cur_name,)))
+            ups.append(cur)
+        downed.add(new_name)
+        ops.append(("rename", mac, new_name, (cur_name, new_name)))
+        cur_info[new_name] = cur_info.pop(cur_name)
         cur['name'] = new_name
-        cur_byname = update_byname(cur_info)
-        ops += cur_ops
+        taken.discard(cur_name)
+        taken.add(new_name)
+        if cur_name in waiting and waiting[cur_name] in pending:
+            ready.append(waiting.pop(cur_name))
 
-    opmap = {'rename': rename, 'down': down, 'up': up}
+    for cur in ups:
+        ops.append(("up", cur['mac'], cur['name'], (cur['name'],)))
+    return ops, errors
 
-    if len(ops) + len(ups) == 0:
-        if len(errors):
-            LOG.debug("unable to do any work for renaming of %s", renames)
-        else:
-            LOG.debug("no work necessary for renaming of %s", renames)
-    else:
-        LOG.debug("achieving renaming of %s with ops %s", renames, ops + ups)
 
-        for op, mac, new_name, params in ops + ups:
-            try:
-                opmap.get(op)(*params)
-            except Exception as e:
+def _perform_rename_ops(ops):
+    """Perform rename ops in a single rtnetlink batch, or with ip commands.
+
+    @return: A list of error messages for the failed ops.
+    """
+    from cloudinit.sources.helpers import netlink
+
+    errors = []
+    try:
+        indexes = {}
+        requests = []
+        for op, _mac, _new_name, params in ops:
+            name = params[0]
+            if name not in indexes:
+                indexes[name] = socket.if_nametoindex(name)
+            if op == 'rename':
+                indexes[params[1]] = indexes.pop(name)
+                requests.append(
+                    netlink.rename_request(indexes[params[1]], params[1]))
+            else:
+                requests.append(
+                    netlink.link_request(indexes[name], op == 'up'))
+        results = netlink.send_rtnetlink_requests(requests)
+    except (netlink.NetlinkCreateSocketError, OSError) as e:
+        LOG.debug("Renaming interfaces with ip, netlink unavailable: %s", e)
+    except netlink.NetlinkRequestError as e:
+        return ["[unknown] Error performing renames: %s" % e]
+    else:
+        for (op, mac, new_name, params), error in zip(ops, results):
+            if error:
                 errors.append(
                     "[unknown] Error performing %s%s for %s, %s: %s" %
-                    (op, params, mac, new_name, e))
+                    (op, params, mac, new_name, os.strerror(error)))
+        return errors
 
-    if len(errors):
-        raise Exception('\n'.join(errors))
+    for op, mac, new_name, params in ops:
+        try:
+            if op == 'rename':
+                subp.subp(["ip", "link", "set", params[0], "name", params[1]],
+                          capture=True)
+            else:
+                subp.subp(["ip", "link", "set", params[0], op], capture=True)
+        except Exception as e:
+            errors.append(
+                "[unknown] Error performing %s%s for %s, %s: %s" %
+                (op, params, mac, new_name, e))
+    return errors
 
 
 def get_interface_mac(ifname):
@@ -893,8 +1009,10 @@ def get_interfaces_by_mac_on_linux(blacklist_drivers=None) -> dict:
 
     Bridges and any devices that have a 'stolen' mac are excluded."""
     ret = {}
-    for name, mac, _driver, _devid in get_interfaces(
-            blacklist_drivers=blacklist_drivers):
+    with shared_interface_snapshot():
+        interfaces = get_interfaces(blacklist_drivers=blacklist_drivers)
+        snapshot = get_interface_snapshot()
+    for name, mac, _driver, _devid in interfaces:
         if mac in ret:
             raise RuntimeError(
                 "duplicate mac found! both '%s' and '%s' have mac '%s'" %
@@ -902,7 +1020,7 @@ def get_interfaces_by_mac_on_linux(blacklist_drivers=None) -> dict:
         ret[mac] = name
         # Try to get an Infiniband hardware address (in 6 byte Ethernet format)
         # for the interface.
-        ib_mac = get_ib_interface_hwaddr(name, True)
+        ib_mac = snapshot.get(name).ib_ethernet_hwaddr
         if ib_mac:
             if ib_mac in ret:
                 raise RuntimeError(
@@ -912,6 +1030,158 @@ def get_interfaces_by_mac_on_linux(blacklist_drivers=None) -> dict:
     return ret
 
 
+class InterfaceInfo(object):
+    """Facts about one device in /sys/class/net, each read once when needed.
+
+    Attributes are read lazily through the module level helpers, so a
+    snapshot only costs the reads its callers need.
+    """
+
+    __slots__ = ('name', '_values')
+
+    def __init__(self, name):
+        self.name = name
+        self._values = {}
+
+    def _read(self, key, func, *args):
+        if key not in self._values:
+            self._values[key] = func(self.name, *args)
+        return self._values[key]
+
+    @property
+    def mac(self):
+        return self._read('mac', get_interface_mac)
+
+    @property
+    def address(self):
+        return self._read('address', read_sys_net_safe, 'address')
+
+    @property
+    def has_own_mac(self):
+        return self._read('has_own_mac', interface_has_own_mac)
+
+    @property
+    def is_bridge(self):
+        return self._read('is_bridge', is_bridge)
+
+    @property
+    def is_vlan(self):
+        return self._read('is_vlan', is_vlan)
+
+    @property
+    def is_bond(self):
+        return self._read('is_bond', is_bond)
+
+    @property
+    def has_master(self):
+        return self._read('master', get_master) is not None
+
+    @property
+    def master_is_bridge_or_bond(self):
+        return self._read('master_is_bridge_or_bond', master_is_bridge_or_bond)
+
+    @property
+    def master_is_openvswitch(self):
+        return self._read('master_is_openvswitch', master_is_openvswitch)
+
+    @property
+    def driver(self):
+        return self._read('driver', device_driver)
+
+    @property
+    def is_netfailover(self):
+        return self._read('is_netfailover', is_netfailover)
+
+    @property
+    def device_id(self):
+        return self._read('device_id', device_devid)
+
+    @property
+    def is_renamed(self):
+        return self._read('is_renamed', is_renamed)
+
+    @property
+    def is_up(self):
+        return self._read('is_up', is_up)
+
+    @property
+    def carrier(self):
+        return self._read('carrier', read_sys_net_int, 'carrier')
+
+    @property
+    def dormant(self):
+        return self._read('dormant', read_sys_net_int, 'dormant')
+
+    @property
+    def operstate(self):
+        return self._read('operstate', read_sys_net_safe, 'operstate')
+
+    @property
+    def ib_hwaddr(self):
+        return self._read('ib_hwaddr', get_ib_interface_hwaddr, False)
+
+    @property
+    def ib_ethernet_hwaddr(self):
+        return self._read('ib_ethernet_hwaddr', get_ib_interface_hwaddr, True)
+
+
+class InterfaceSnapshot(object):
+    """InterfaceInfo of every device listed in one scan of /sys/class/net.
+
+    Use get_interface_snapshot() to obtain the snapshot shared within a
+    shared_interface_snapshot() block.
+    """
+
+    def __init__(self, devices):
+        self.devices = OrderedDict((info.name, info) for info in devices)
+
+    @classmethod
+    def scan(cls):
+        return cls([InterfaceInfo(name) for name in get_devicelist()])
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __contains__(self, name):
+        return name in self.devices
+
+    def get(self, name):
+        return self.devices.get(name)
+
+
+_SHARED_SNAPSHOT = {'depth': 0, 'snapshot': None}
+
+
+@contextlib.contextmanager
+def shared_interface_snapshot():
+    """Share one InterfaceSnapshot between callers within this block.
+
+    Code changing devices within the block must call
+    invalidate_interface_snapshot() afterwards.
+    """
+    _SHARED_SNAPSHOT['depth'] += 1
+    try:
+        yield
+    finally:
+        _SHARED_SNAPSHOT['depth'] -= 1
+        if not _SHARED_SNAPSHOT['depth']:
+            _SHARED_SNAPSHOT['snapshot'] = None
+
+
+def get_interface_snapshot():
+    """Return the shared InterfaceSnapshot, or a fresh one if not sharing."""
+    if not _SHARED_SNAPSHOT['depth']:
+        return InterfaceSnapshot.scan()
+    if _SHARED_SNAPSHOT['snapshot'] is None:
+        _SHARED_SNAPSHOT['snapshot'] = InterfaceSnapshot.scan()
+    return _SHARED_SNAPSHOT['snapshot']
+
+
+def invalidate_interface_snapshot():
+    """Drop the shared InterfaceSnapshot after devices changed."""
+    _SHARED_SNAPSHOT['snapshot'] = None
+
+
 def get_interfaces(blacklist_drivers=None) -> list:
     """Return list of interface tuples (name, mac, driver, device_id)
 
@@ -919,38 +1189,36 @@ def get_interfaces(blacklist_drivers=None) -> list:
     ret = []
     if blacklist_drivers is None:
         blacklist_drivers = []
-    devs = get_devicelist()
     # 16 somewhat arbitrarily chosen.  Normally a mac is 6 '00:' tokens.
     zero_mac = ':'.join(('00',) * 16)
-    for name in devs:
-        if not interface_has_own_mac(name):
+    for info in get_interface_snapshot():
+        if not info.has_own_mac:
             continue
-        if is_bridge(name):
+        if info.is_bridge:
             continue
-        if is_vlan(name):
+        if info.is_vlan:
             continue
-        if is_bond(name):
+        if info.is_bond:
             continue
-        if get_master(name) is not None:
-            if (not master_is_bridge_or_bond(name) and
-                    not master_is_openvswitch(name)):
+        if info.has_master:
+            if (not info.master_is_bridge_or_bond and
+                    not info.master_is_openvswitch):
                 continue
-        if is_netfailover(name):
+        if info.is_netfailover:
             continue
-        mac = get_interface_mac(name)
+        mac = info.mac
         # some devices may not have a mac (tun0)
         if not mac:
             continue
         # skip nics that have no mac (00:00....)
-        if name != 'lo' and mac == zero_mac[:len(mac)]:
+        if info.name != 'lo' and mac == zero_mac[:len(mac)]:
             continue
-        if is_openvswitch_internal_interface(name):
+        if is_openvswitch_internal_interface(info.name):
             continue
         # skip nics that have drivers blacklisted
-        driver = device_driver(name)
-        if driver in blacklist_drivers:
+        if info.driver in blacklist_drivers:
             continue
-        ret.append((name, mac, driver, device_devid(name)))
+        ret.append((info.name, mac, info.driver, info.device_id))
     return ret
 
 
@@ -958,8 +1226,11 @@ def get_ib_hwaddrs_by_interface():
     """Build a dictionary mapping Infiniband interface names to their hardware
     address."""
     ret = {}
-    for name, _, _, _ in get_interfaces():
-        ib_mac = get_ib_interface_hwaddr(name, False)
+    with shared_interface_snapshot():
+        interfaces = get_interfaces()
+        snapshot = get_interface_snapshot()
+    for name, _, _, _ in interfaces:
+        ib_mac = snapshot.get(name).ib_hwaddr
         if ib_mac:
             if ib_mac in ret:
                 raise RuntimeError(
@@ -1027,6 +1298,8 @@ class EphemeralIPv4Network(object):
     If unconnected, bring up the interface with valid ip, prefix and broadcast.
     If router is provided setup a default route for that interface. Upon
     context exit, clean up the interface leaving no configuration behind.
+    Changes are made over rtnetlink, batching all routes in one request, or
+    with ip commands where rtnetlink is unavailable.
     """
 
     def __init__(self, interface, ip, prefix_or_mask, broadcast, router=None,
@@ -1061,9 +1334,14 @@ class EphemeralIPv4Network(object):
         self.router = router
         self.static_routes = static_routes
         self.cleanup_cmds = []  # List of commands to run to cleanup state.
+        # rtnetlink requests to run to cleanup state when not using commands
+        self.cleanup_requests = []
+        self.ifindex = None  # Set when configuring through rtnetlink
 
     def __enter__(self):
         """Perform ephemeral network setup if interface is not connected."""
+        from cloudinit.sources.helpers import netlink
+
         if self.connectivity_url:
             if has_url_connectivity(self.connectivity_url):
                 LOG.debug(
@@ -1071,8 +1349,33 @@ class EphemeralIPv4Network(object):
                     ' to %s', self.connectivity_url)
                 return
 
-        self._bringup_device()
+        try:
+            self.ifindex = socket.if_nametoindex(self.interface)
+            self._bringup_device_netlink()
+        except (netlink.NetlinkCreateSocketError, OSError) as e:
+            # Nothing was set up yet. Missing devices are left for the ip
+            # commands to report as before.
+            LOG.debug('Using ip commands for ephemeral network setup: %s', e)
+            self.ifindex = None
+            self._bringup_device()
+
+        try:
+            self._bringup_routes()
+        except Exception:
+            if self.cleanup_requests:
+                self._teardown_netlink()
+            raise
+        invalidate_interface_snapshot()
+
+    def __exit__(self, excp_type, excp_value, excp_traceback):
+        """Teardown anything we set up."""
+        if self.cleanup_requests:
+            self._teardown_netlink()
+        for cmd in self.cleanup_cmds:
+            subp.subp(cmd, capture=True)
+        invalidate_interface_snapshot()
 
+    def _bringup_routes(self):
         # rfc3442 requires us to ignore the router config *if* classless static
         # routes are provided.
         #
@@ -1089,10 +1392,60 @@ class EphemeralIPv4Network(object):
         elif self.router:
             self._bringup_router()
 
-    def __exit__(self, excp_type, excp_value, excp_traceback):
-        """Teardown anything we set up."""
-        for cmd in self.cleanup_cmds:
-            subp.subp(cmd, capture=True)
+    def _check_netlink_errors(self, descriptions, errors):
+        """Raise NetlinkRequestError naming the failed requests, if any."""
+        from cloudinit.sources.helpers import netlink
+
+        failures = ['%s: %s' % (description, os.strerror(error))
+                    for (description, error) in zip(descriptions, errors)
+                    if error]
+        if failures:
+            raise netlink.NetlinkRequestError(
+                'Ephemeral network setup on {0} failed: {1}'.format(
+                    self.interface, '; '.join(failures)))
+
+    def _teardown_netlink(self):
+        """Send all queued cleanup requests in one batch."""
+        from cloudinit.sources.helpers import netlink
+
+        requests = self.cleanup_requests
+        self.cleanup_requests = []
+        errors = netlink.send_rtnetlink_requests(requests)
+        self._check_netlink_errors(
+            ['cleanup request %d' % i for i in range(len(requests))], errors)
+
+    def _bringup_device_netlink(self):
+        """Configure the address and bring up the device over rtnetlink."""
+        from cloudinit.sources.helpers import netlink
+
+        LOG.debug(
+            'Attempting setup of ephemeral network on %s with %s/%s brd %s',
+            self.interface, self.ip, self.prefix, self.broadcast)
+        add_addr = netlink.address_request(
+            netlink.RTM_NEWADDR, self.ifindex, self.ip, self.prefix,
+            self.broadcast)
+        error = netlink.send_rtnetlink_requests([add_addr])[0]
+        if error == errno.EEXIST:
+            LOG.debug(
+                'Skip ephemeral network setup, %s already has address %s',
+                self.interface, self.ip)
+            return
+        elif error:
+            raise netlink.NetlinkRequestError(
+                'Failed adding address {0}/{1} to {2}: {3}'.format(
+                    self.ip, self.prefix, self.interface,
+                    os.strerror(error)))
+        # Address creation success, queue cleanup and bring up device
+        self.cleanup_requests.append(netlink.link_request(self.ifindex, False))
+        self.cleanup_requests.append(netlink.address_request(
+            netlink.RTM_DELADDR, self.ifindex, self.ip, self.prefix))
+        errors = netlink.send_rtnetlink_requests(
+            [netlink.link_request(self.ifindex, True)])
+        try:
+            self._check_netlink_errors(['link up'], errors)
+        except netlink.NetlinkRequestError:
+            self._teardown_netlink()
+            raise
 
     def _delete_address(self, address, prefix):
         """Perform the ip command to remove the specified address."""
@@ -1133,6 +1486,8 @@ class EphemeralIPv4Network(object):
     def _bringup_static_routes(self):
         # static_routes = [("169.254.169.254/32", "130.56.248.255"),
         #                  ("0.0.0.0/0", "130.56.240.1")]
+        if self.ifindex is not None:
+            return self._bringup_static_routes_netlink()
         for net_address, gateway in self.static_routes:
             via_arg = []
             if gateway != "0.0.0.0":
@@ -1144,8 +1499,57 @@ class EphemeralIPv4Network(object):
                 0, ['ip', '-4', 'route', 'del', net_address] + via_arg +
                    ['dev', self.interface])
 
+    def _bringup_static_routes_netlink(self):
+        """Add all static routes with a single batch of rtnetlink requests."""
+        routes = []
+        for net_address, gateway in self.static_routes:
+            dst, _, dst_len = net_address.partition('/')
+            if gateway == "0.0.0.0":
+                gateway = None
+            routes.append((dst, int(dst_len or 32), gateway, None))
+        self._add_routes_netlink(
+            routes, ['route %s via %s' % route for route in
+                     self.static_routes])
+
+    def _add_routes_netlink(self, routes, descriptions):
+        """Add (dst, dst_len, gateway, prefsrc) routes in one batch.
+
+        Cleanup is queued for each route which was added, even if others
+        failed.
+        """
+        from cloudinit.sources.helpers import netlink
+
+        errors = netlink.send_rtnetlink_requests([
+            netlink.route_request(netlink.RTM_NEWROUTE, self.ifindex, *route)
+            for route in routes])
+        for route, error in zip(routes, errors):
+            if not error:
+                self.cleanup_requests.insert(0, netlink.route_request(
+                    netlink.RTM_DELROUTE, self.ifindex, *route))
+        self._check_netlink_errors(descriptions, errors)
+
+    def _bringup_router_netlink(self):
+        """Add the router routes with a single batch of rtnetlink requests."""
+        from cloudinit.sources.helpers import netlink
+
+        # Check if a default route exists and exit if it does
+        for route in netlink.get_routes(socket.AF_INET):
+            if (route.table == netlink.RT_TABLE_MAIN and not route.dst_len and
+                    route.type == netlink.RTN_UNICAST):
+                LOG.debug(
+                    'Skip ephemeral route setup. %s already has default'
+                    ' route: default via %s', self.interface, route.gateway)
+                return
+        routes = [(self.router, 32, None, self.ip),
+                  ('0.0.0.0', 0, self.router, None)]
+        self._add_routes_netlink(
+            routes, ['route %s src %s' % (self.router, self.ip),
+                     'default route via %s' % self.router])
+
     def _bringup_router(self):
         """Perform the ip commands to fully setup the router if needed."""
+        if self.ifindex is not None:
+            return self._bringup_router_netlink()
         # Check if a default route exists and exit if it does
         out, _ = subp.subp(['ip', 'route', 'show', '0.0.0.0/0'], capture=True)
         if 'default' in out:
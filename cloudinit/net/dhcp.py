@@ -9,12 +9,14 @@ import logging
 import os
 import re
 import signal
+import socket
 import time
 from io import StringIO
 
 from cloudinit.net import (
     EphemeralIPv4Network, find_fallback_nic, get_devicelist,
-    has_url_connectivity)
+    get_interface_mac, has_url_connectivity, invalidate_interface_snapshot)
+from cloudinit.net import dhcp_client as builtin_client
 from cloudinit.net.network_state import mask_and_ipv4_to_bcast_addr as bcip
 from cloudinit import temp_utils
 from cloudinit import subp
@@ -24,6 +26,10 @@ LOG = logging.getLogger(__name__)
 
 NETWORKD_LEASES_DIR = '/run/systemd/netif/leases'
 
+# Values of the dhcp_client option of datasources doing ephemeral DHCP
+DHCP_CLIENT_DHCLIENT = 'dhclient'
+DHCP_CLIENT_BUILTIN = 'builtin'
+
 
 class InvalidDHCPLeaseFileError(Exception):
     """Raised when parsing an empty or invalid dhcp.leases file.
@@ -38,12 +44,14 @@ class NoDHCPLeaseError(Exception):
 
 
 class EphemeralDHCPv4(object):
-    def __init__(self, iface=None, connectivity_url=None, dhcp_log_func=None):
+    def __init__(self, iface=None, connectivity_url=None, dhcp_log_func=None,
+                 dhcp_client=None):
         self.iface = iface
         self._ephipv4 = None
         self.lease = None
         self.dhcp_log_func = dhcp_log_func
         self.connectivity_url = connectivity_url
+        self.dhcp_client = dhcp_client
 
     def __enter__(self):
         """Setup sandboxed dhcp context, unless connectivity_url can already be
@@ -81,9 +89,12 @@ class EphemeralDHCPv4(object):
             return self.lease
         try:
             leases = maybe_perform_dhcp_discovery(
-                self.iface, self.dhcp_log_func)
+                self.iface, self.dhcp_log_func, self.dhcp_client)
         except InvalidDHCPLeaseFileError as e:
             raise NoDHCPLeaseError() from e
+        finally:
+            # dhclient brought the interface up
+            invalidate_interface_snapshot()
         if not leases:
             raise NoDHCPLeaseError()
         self.lease = leases[-1]
@@ -131,7 +142,8 @@ class EphemeralDHCPv4(object):
                 result[internal_mapping] = self.lease.get(different_names)
 
 
-def maybe_perform_dhcp_discovery(nic=None, dhcp_log_func=None):
+def maybe_perform_dhcp_discovery(nic=None, dhcp_log_func=None,
+                                 dhcp_client=None):
     """Perform dhcp discovery if nic valid and dhclient command exists.
 
     If the nic is invalid or undiscoverable or dhclient command is not found,
@@ -140,6 +152,9 @@ def maybe_perform_dhcp_discovery(nic=None, dhcp_log_func=None):
     @param nic: Name of the network interface we want to run dhclient on.
     @param dhcp_log_func: A callable accepting the dhclient output and error
         streams.
+    @param dhcp_client: Optionally DHCP_CLIENT_BUILTIN to use the builtin
+        client instead of dhclient. dhclient is still used should the builtin
+        client be unable to run on nic.
     @return: A list of dicts representing dhcp options for each lease obtained
         from the dhclient discovery if run, otherwise an empty list is
         returned.
@@ -153,6 +168,13 @@ def maybe_perform_dhcp_discovery(nic=None, dhcp_log_func=None):
         LOG.debug(
             'Skip dhcp_discovery: nic %s not found in get_devicelist.', nic)
         return []
+    if dhcp_client == DHCP_CLIENT_BUILTIN:
+        try:
+            return builtin_dhcp_discovery(nic)
+        except builtin_client.DHCPClientError as e:
+            LOG.warning('Using dhclient, builtin dhcp client failed: %s', e)
+    elif dhcp_client not in (None, DHCP_CLIENT_DHCLIENT):
+        LOG.warning('Unknown dhcp_client %r, using dhclient', dhcp_client)
     dhclient_path = subp.which('dhclient')
     if not dhclient_path:
         LOG.debug('Skip dhclient configuration: No dhclient command found.')
@@ -195,6 +217,40 @@ def parse_dhcp_lease_file(lease_file):
     return dhcp_leases
 
 
+def _link_up(interface):
+    """Bring up interface over rtnetlink, or with ip when unavailable."""
+    from cloudinit.sources.helpers import netlink
+
+    try:
+        index = socket.if_nametoindex(interface)
+        error = netlink.send_rtnetlink_requests(
+            [netlink.link_request(index, True)])[0]
+    except (netlink.NetlinkCreateSocketError, OSError):
+        subp.subp(['ip', 'link', 'set', 'dev', interface, 'up'], capture=True)
+        return
+    if error:
+        raise builtin_client.DHCPClientError(
+            'Cannot bring up {0}: {1}'.format(interface, os.strerror(error)))
+
+
+def builtin_dhcp_discovery(interface):
+    """Obtain a lease with the builtin dhcp client.
+
+    @param interface: Name of the network interface to discover on.
+    @return: A list with the lease dict, in the same form as
+        parse_dhcp_lease_file returns, or an empty list.
+    @raises: DHCPClientError if the builtin client can not run on interface.
+    """
+    mac = get_interface_mac(interface)
+    if not mac or len(mac.split(':')) != 6:
+        raise builtin_client.DHCPClientError(
+            'Unsupported hardware address {0!r} on {1}'.format(
+                mac, interface))
+    # Like dhclient, the interface needs to be up to send discovery packets
+    _link_up(interface)
+    return builtin_client.dhcp_discovery(interface, mac)
+
+
 def dhcp_discovery(dhclient_cmd_path, interface, cleandir, dhcp_log_func=None):
     """Run dhclient on the interface without scripts or filesystem artifacts.
 
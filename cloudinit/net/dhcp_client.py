@@ -0,0 +1,326 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Minimal in-process DHCPv4 client for ephemeral leases.
+
+The client performs a single DISCOVER/OFFER/REQUEST/ACK exchange on a packet
+socket, so it works before the interface has any address, and returns the
+lease in the same form as dhcp.parse_dhcp_lease_file reads dhclient leases.
+It never applies the lease itself, see dhcp.EphemeralDHCPv4 for that.
+"""
+
+import itertools
+import logging
+import random
+import select
+import socket
+import struct
+import time
+
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
+
+ETH_P_IP = 0x0800
+CLIENT_PORT = 68
+SERVER_PORT = 67
+
+BOOTREQUEST = 1
+BOOTREPLY = 2
+BROADCAST_FLAG = 0x8000
+MAGIC_COOKIE = b'\x63\x82\x53\x63'
+# op, htype, hlen, hops, xid, secs, flags, ciaddr, yiaddr, siaddr, giaddr,
+# chaddr, sname, file
+BOOTP_FMT = '!BBBBIHH4s4s4s4s16s64s128s'
+BOOTP_SIZE = struct.calcsize(BOOTP_FMT)
+# Some servers ignore requests shorter than a BOOTP packet
+BOOTP_MIN_SIZE = 300
+
+DHCPDISCOVER = 1
+DHCPOFFER = 2
+DHCPREQUEST = 3
+DHCPACK = 5
+DHCPNAK = 6
+
+OPT_PAD = 0
+OPT_REQUESTED_IP = 50
+OPT_MESSAGE_TYPE = 53
+OPT_SERVER_ID = 54
+OPT_PARAMETER_REQUEST_LIST = 55
+OPT_END = 255
+
+# Option codes requested from servers, 245 is the Azure wireserver endpoint
+PARAMETER_REQUEST_LIST = (1, 3, 6, 12, 15, 26, 28, 42, 51, 54, 58, 59, 121,
+                          245)
+
+# dhclient lease file names and value formats of the known options. Other
+# options are reported as unknown-<code> with colon separated hex bytes.
+OPTION_FORMATS = {
+    1: ('subnet-mask', 'ip'),
+    3: ('routers', 'ips'),
+    6: ('domain-name-servers', 'ips'),
+    12: ('host-name', 'text'),
+    15: ('domain-name', 'text'),
+    26: ('interface-mtu', 'H'),
+    28: ('broadcast-address', 'ip'),
+    42: ('ntp-servers', 'ips'),
+    51: ('dhcp-lease-time', 'I'),
+    53: ('dhcp-message-type', 'B'),
+    54: ('dhcp-server-identifier', 'ip'),
+    58: ('dhcp-renewal-time', 'I'),
+    59: ('dhcp-rebinding-time', 'I'),
+    121: ('rfc3442-classless-static-routes', 'bytes'),
+}
+
+# Seconds to wait for a reply before each retransmission, the last delay is
+# repeated until the timeout expires.
+RETRANSMIT_SCHEDULE = (1, 2, 4, 8)
+DHCP_TIMEOUT = 60
+
+
+class DHCPClientError(RuntimeError):
+    """Raised when a DHCP exchange can not be performed."""
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def build_ip_packet(payload, src='0.0.0.0', dst='255.255.255.255'):
+    """Wrap a DHCP payload into IPv4 and UDP headers."""
+    src = socket.inet_aton(src)
+    dst = socket.inet_aton(dst)
+    udp_length = 8 + len(payload)
+    pseudo_header = struct.pack('!4s4sBBH', src, dst, 0, socket.IPPROTO_UDP,
+                                udp_length)
+    udp = struct.pack('!HHHH', CLIENT_PORT, SERVER_PORT, udp_length, 0)
+    udp_checksum = _checksum(pseudo_header + udp + payload) or 0xffff
+    udp = udp[:6] + struct.pack('!H', udp_checksum)
+    ip_header = struct.pack('!BBHHHBBH4s4s', 0x45, 0x10, 20 + udp_length,
+                            0, 0, 64, socket.IPPROTO_UDP, 0, src, dst)
+    ip_header = (ip_header[:10] + struct.pack('!H', _checksum(ip_header)) +
+                 ip_header[12:])
+    return ip_header + udp + payload
+
+
+def build_dhcp_message(msg_type, xid, mac, secs=0, requested_ip=None,
+                       server_id=None):
+    """Return a broadcast BOOTREQUEST of the given DHCP message type."""
+    chaddr = bytes.fromhex(mac.replace(':', ''))
+    message = struct.pack(
+        BOOTP_FMT, BOOTREQUEST, 1, len(chaddr), 0, xid, min(secs, 0xffff),
+        BROADCAST_FLAG, b'\0' * 4, b'\0' * 4, b'\0' * 4, b'\0' * 4, chaddr,
+        b'', b'')
+    options = [(OPT_MESSAGE_TYPE, bytes([msg_type])),
+               (OPT_PARAMETER_REQUEST_LIST, bytes(PARAMETER_REQUEST_LIST))]
+    if requested_ip:
+        options.append((OPT_REQUESTED_IP, socket.inet_aton(requested_ip)))
+    if server_id:
+        options.append((OPT_SERVER_ID, socket.inet_aton(server_id)))
+    message += MAGIC_COOKIE
+    for code, value in options:
+        message += bytes([code, len(value)]) + value
+    message += bytes([OPT_END])
+    return message.ljust(BOOTP_MIN_SIZE, b'\0')
+
+
+def parse_options(data):
+    """Parse DHCP options into a dict of raw values keyed by option code.
+
+    Options which appear several times are concatenated as per RFC 3396.
+    """
+    options = {}
+    offset = 0
+    while offset < len(data):
+        code = data[offset]
+        if code == OPT_END:
+            break
+        if code == OPT_PAD:
+            offset += 1
+            continue
+        if offset + 2 > len(data):
+            break
+        length = data[offset + 1]
+        options[code] = options.get(code, b'') + data[
+            offset + 2:offset + 2 + length]
+        offset += 2 + length
+    return options
+
+
+def parse_reply(packet, xid, mac):
+    """Return (message type, yiaddr, options) of a matching DHCP reply.
+
+    @param packet: An IPv4 packet as read from the packet socket.
+    @return: None unless packet is a BOOTREPLY for our xid and mac.
+    """
+    if len(packet) < 20 or packet[0] >> 4 != 4:
+        return None
+    ihl = (packet[0] & 0xf) * 4
+    if packet[9] != socket.IPPROTO_UDP or len(packet) < ihl + 8:
+        return None
+    _sport, dport, udp_length = struct.unpack_from('!HHH', packet, ihl)
+    if dport != CLIENT_PORT:
+        return None
+    payload = packet[ihl + 8:ihl + udp_length]
+    if len(payload) < BOOTP_SIZE + len(MAGIC_COOKIE):
+        return None
+    (op, _htype, hlen, _hops, reply_xid, _secs, _flags, _ciaddr, yiaddr,
+     _siaddr, _giaddr, chaddr, _sname, _file) = struct.unpack_from(
+        BOOTP_FMT, payload)
+    if (op != BOOTREPLY or reply_xid != xid or
+            chaddr[:hlen] != bytes.fromhex(mac.replace(':', ''))):
+        return None
+    if payload[BOOTP_SIZE:BOOTP_SIZE + 4] != MAGIC_COOKIE:
+        return None
+    options = parse_options(payload[BOOTP_SIZE + 4:])
+    msg_type = options.get(OPT_MESSAGE_TYPE, b'\0')[0]
+    return msg_type, socket.inet_ntoa(yiaddr), options
+
+
+def _format_option(fmt, value):
+    if fmt == 'ip':
+        return socket.inet_ntoa(value[:4])
+    if fmt == 'ips':
+        return ','.join(socket.inet_ntoa(value[i:i + 4])
+                        for i in range(0, len(value) - 3, 4))
+    if fmt == 'text':
+        return util.decode_binary(value.rstrip(b'\0'), 'utf-8')
+    if fmt == 'bytes':
+        return ','.join(str(b) for b in value)
+    return str(struct.unpack('!' + fmt, value)[0])
+
+
+def _format_time(timestamp):
+    # dhclient's "<weekday> <yyyy/mm/dd> <hh:mm:ss>" in UTC
+    return time.strftime('%w %Y/%m/%d %H:%M:%S', time.gmtime(timestamp))
+
+
+def lease_from_reply(interface, yiaddr, options, now=None):
+    """Return the lease dict dhclient would write for an ACK."""
+    lease = {'interface': interface, 'fixed-address': yiaddr}
+    for code, value in sorted(options.items()):
+        if code in OPTION_FORMATS:
+            name, fmt = OPTION_FORMATS[code]
+            try:
+                lease[name] = _format_option(fmt, value)
+            except (struct.error, OSError, ValueError):
+                LOG.debug('Ignoring malformed DHCP option %s', code)
+        else:
+            lease['unknown-%d' % code] = ':'.join('%x' % b for b in value)
+    if now is None:
+        now = time.time()
+    lease_time = options.get(51)
+    if lease_time and len(lease_time) == 4:
+        seconds = struct.unpack('!I', lease_time)[0]
+        if seconds != 0xffffffff:
+            lease['renew'] = _format_time(now + seconds // 2)
+            lease['rebind'] = _format_time(now + seconds * 7 // 8)
+            lease['expire'] = _format_time(now + seconds)
+    return lease
+
+
+def _open_socket(interface):
+    try:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM,
+                             socket.htons(ETH_P_IP))
+    except (AttributeError, OSError) as e:
+        # AttributeError: AF_PACKET only exists on Linux
+        raise DHCPClientError(
+            'Cannot open packet socket for DHCP: %s' % e) from e
+    try:
+        sock.bind((interface, ETH_P_IP))
+    except OSError as e:
+        sock.close()
+        raise DHCPClientError(
+            'Cannot bind packet socket to %s: %s' % (interface, e)) from e
+    return sock
+
+
+def _exchange(sock, interface, send, xid, mac, expected, deadline,
+              schedule):
+    """Send a message until a reply of an expected type arrives.
+
+    @param send: Callable returning the IPv4 packet to (re)send.
+    @return: (message type, yiaddr, options) of the reply or None on timeout.
+    """
+    for attempt in itertools.count():
+        now = time.monotonic()
+        if now >= deadline:
+            return None
+        sock.sendto(send(), (interface, ETH_P_IP, 0, 0, b'\xff' * 6))
+        delay = schedule[min(attempt, len(schedule) - 1)]
+        wait_until = min(deadline, now + delay)
+        while True:
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([sock], [], [], remaining)
+            if not ready:
+                break
+            reply = parse_reply(sock.recv(4096), xid, mac)
+            if reply and reply[0] in expected:
+                return reply
+    return None
+
+
+def dhcp_discovery(interface, mac, timeout=DHCP_TIMEOUT,
+                   schedule=RETRANSMIT_SCHEDULE):
+    """Obtain a DHCPv4 lease for interface without configuring it.
+
+    @param interface: Name of the network interface, which must be up.
+    @param mac: The hardware address of interface.
+    @param timeout: Seconds after which to give up.
+    @param schedule: Seconds to wait before each retransmission.
+    @return: A list with the lease dict or an empty list on timeout.
+    @raises: DHCPClientError if the packet socket can not be used.
+    """
+    LOG.debug('Performing a builtin dhcp discovery on %s', interface)
+    start = time.monotonic()
+    deadline = start + timeout
+    xid = random.getrandbits(32)
+    sock = _open_socket(interface)
+
+    def message(msg_type, **kwargs):
+        def build():
+            secs = int(time.monotonic() - start)
+            return build_ip_packet(build_dhcp_message(
+                msg_type, xid, mac, secs, **kwargs))
+        return build
+
+    with sock:
+        try:
+            while time.monotonic() < deadline:
+                offer = _exchange(sock, interface, message(DHCPDISCOVER), xid,
+                                  mac, (DHCPOFFER,), deadline, schedule)
+                if not offer:
+                    break
+                _msg_type, offered_ip, offer_options = offer
+                server_id = offer_options.get(OPT_SERVER_ID)
+                if server_id:
+                    server_id = socket.inet_ntoa(server_id[:4])
+                reply = _exchange(
+                    sock, interface,
+                    message(DHCPREQUEST, requested_ip=offered_ip,
+                            server_id=server_id),
+                    xid, mac, (DHCPACK, DHCPNAK), deadline, schedule)
+                if not reply:
+                    break
+                msg_type, yiaddr, options = reply
+                if msg_type == DHCPACK:
+                    LOG.debug('Received dhcp ack for %s on %s', yiaddr,
+                              interface)
+                    return [lease_from_reply(interface, yiaddr, options)]
+                LOG.debug('Received dhcp nak on %s, restarting discovery',
+                          interface)
+        except OSError as e:
+            raise DHCPClientError(
+                'DHCP exchange on %s failed: %s' % (interface, e)) from e
+    LOG.warning('No dhcp lease received on %s after %s seconds', interface,
+                timeout)
+    return []
+
+# vi: ts=4 expandtab
@@ -155,9 +155,8 @@ def _extract_addresses(config, entry, ifname, features=None):
         entry.update({'accept-ra': util.is_true(config.get('accept-ra'))})
 
 
-def _extract_bond_slaves_by_name(interfaces, entry, bond_master):
-    bond_slave_names = sorted([name for (name, cfg) in interfaces.items()
-                               if cfg.get('bond-master', None) == bond_master])
+def _extract_bond_slaves_by_name(network_state, entry, bond_master):
+    bond_slave_names = network_state.get_bond_slaves(bond_master)
     if len(bond_slave_names) > 0:
         entry.update({'interfaces': bond_slave_names})
 
@@ -229,7 +228,7 @@ class Renderer(renderer.Renderer):
 
         if not header.endswith("\n"):
             header += "\n"
-        util.write_file(fpnplan, header + content)
+        self._write_file(fpnplan, header + content)
 
         if self.clean_default:
             _clean_default(target=target)
@@ -272,8 +271,6 @@ class Renderer(renderer.Renderer):
         vlans = {}
         content = []
 
-        interfaces = network_state._network_state.get('interfaces', [])
-
         nameservers = network_state.dns_nameservers
         searchdomains = network_state.dns_searchdomains
 
@@ -321,7 +318,7 @@ class Renderer(renderer.Renderer):
                     bond['macaddress'] = ifcfg.get('mac_address').lower()
                 slave_interfaces = ifcfg.get('bond-slaves')
                 if slave_interfaces == 'none':
-                    _extract_bond_slaves_by_name(interfaces, bond, ifname)
+                    _extract_bond_slaves_by_name(network_state, bond, ifname)
                 _extract_addresses(ifcfg, bond, ifname, self.features)
                 bonds.update({ifname: bond})
 
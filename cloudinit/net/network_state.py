@@ -153,6 +153,7 @@ class NetworkState(object):
         self._version = version
         self.use_ipv6 = network_state.get('use_ipv6', False)
         self._has_default_route = None
+        self._bond_slaves = None
 
     @property
     def config(self):
@@ -191,6 +192,23 @@ class NetworkState(object):
                 if filter_func(iface):
                     yield iface
 
+    def get_bond_slaves(self, bond_master):
+        """Return the sorted names of the interfaces enslaved to bond_master.
+
+        Slaves of all bonds are indexed on first use so that rendering many
+        bonds does not rescan every interface for each of them.
+        """
+        if self._bond_slaves is None:
+            self._bond_slaves = {}
+            for iface in self.iter_interfaces():
+                master = iface.get('bond-master')
+                if master is not None:
+                    self._bond_slaves.setdefault(master, []).append(
+                        iface['name'])
+            for slaves in self._bond_slaves.values():
+                slaves.sort()
+        return list(self._bond_slaves.get(bond_master, []))
+
     def iter_routes(self, filter_func=None):
         for route in self._network_state.get('routes', []):
             if filter_func is not None:
@@ -386,7 +404,6 @@ class NetworkStateInterpreter(metaclass=CommandHandlerMeta):
             'wakeonlan': wakeonlan,
         })
         self._network_state['interfaces'].update({command.get('name'): iface})
-        self.dump_network_state()
 
     @ensure_command_keys(['name', 'vlan_id', 'vlan_link'])
     def handle_vlan(self, command):
@@ -6,10 +6,17 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import abc
+import hashlib
 import io
+import os
+import stat
 
 from .network_state import parse_net_config_data
 from .udev import generate_udev_rule
+from cloudinit import log as logging
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
 
 
 def filter_by_type(match_type):
@@ -27,8 +34,50 @@ def filter_by_attr(match_name):
 filter_by_physical = filter_by_type('physical')
 
 
+def content_digest(content, mode):
+    """Return a digest of file content and permission bits."""
+    digest = hashlib.sha256(util.encode_text(content))
+    digest.update(b'%o' % mode)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """Return content_digest of the file at path, or None if unreadable."""
+    try:
+        with open(path, 'rb') as stream:
+            content = stream.read()
+        return content_digest(content, stat.S_IMODE(os.stat(path).st_mode))
+    except OSError:
+        return None
+
+
+def write_file_if_changed(path, content, mode=0o644):
+    """Write content to path unless path already has content and mode.
+
+    Leaving unchanged files alone preserves their timestamps for the
+    services watching them.
+
+    @return: True when path was written.
+    """
+    if file_digest(path) == content_digest(content, mode):
+        LOG.debug('Not writing unchanged %s', path)
+        return False
+    util.write_file(path, content, mode)
+    return True
+
+
 class Renderer(object):
 
+    # content_digest of each file written by the last render, by path
+    rendered_files = None
+
+    def _write_file(self, path, content, mode=0o644):
+        """Write a rendered file if changed and record its digest."""
+        if self.rendered_files is None:
+            self.rendered_files = {}
+        self.rendered_files[path] = content_digest(content, mode)
+        return write_file_if_changed(path, content, mode)
+
     @staticmethod
     def _render_persistent_net(network_state):
         """Given state, emit udev rules to map mac to ifname."""
@@ -51,6 +100,7 @@ class Renderer(object):
 
     def render_network_config(self, network_config, templates=None,
                               target=None):
+        self.rendered_files = {}
         return self.render_network_state(
             network_state=parse_net_config_data(network_config),
             templates=templates, target=target)
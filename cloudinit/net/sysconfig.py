@@ -671,7 +671,6 @@ class Renderer(renderer.Renderer):
     @classmethod
     def _render_bond_interfaces(cls, network_state, iface_contents, flavor):
         bond_filter = renderer.filter_by_type('bond')
-        slave_filter = renderer.filter_by_attr('bond-master')
         for iface in network_state.iter_interfaces(bond_filter):
             iface_name = iface['name']
             iface_cfg = iface_contents[iface_name]
@@ -702,13 +701,7 @@ class Renderer(renderer.Renderer):
                 iface_cfg, route_cfg, iface_subnets, flavor
             )
 
-            # iter_interfaces on network-state is not sorted to produce
-            # consistent numbers we need to sort.
-            bond_slaves = sorted(
-                [slave_iface['name'] for slave_iface in
-                 network_state.iter_interfaces(slave_filter)
-                 if slave_iface['bond-master'] == iface_name])
-
+            bond_slaves = network_state.get_bond_slaves(iface_name)
             for index, bond_slave in enumerate(bond_slaves):
                 if flavor == 'suse':
                     slavestr = 'BONDING_SLAVE_%s' % index
@@ -912,24 +905,27 @@ class Renderer(renderer.Renderer):
         for path, data in self._render_sysconfig(base_sysconf_dir,
                                                  network_state, self.flavor,
                                                  templates=templates).items():
-            util.write_file(path, data, file_mode)
+            self._write_file(path, data, file_mode)
         if self.dns_path:
             dns_path = subp.target_path(target, self.dns_path)
             resolv_content = self._render_dns(network_state,
                                               existing_dns_path=dns_path)
             if resolv_content:
-                util.write_file(dns_path, resolv_content, file_mode)
+                self._write_file(
+                    dns_path, resolv_content, file_mode)
         if self.networkmanager_conf_path:
             nm_conf_path = subp.target_path(target,
                                             self.networkmanager_conf_path)
             nm_conf_content = self._render_networkmanager_conf(network_state,
                                                                templates)
             if nm_conf_content:
-                util.write_file(nm_conf_path, nm_conf_content, file_mode)
+                self._write_file(
+                    nm_conf_path, nm_conf_content, file_mode)
         if self.netrules_path:
             netrules_content = self._render_persistent_net(network_state)
             netrules_path = subp.target_path(target, self.netrules_path)
-            util.write_file(netrules_path, netrules_content, file_mode)
+            self._write_file(
+                netrules_path, netrules_content, file_mode)
         if available_nm(target=target):
             enable_ifcfg_rh(subp.target_path(target, path=NM_CFG_FILE))
 
@@ -941,8 +937,8 @@ class Renderer(renderer.Renderer):
             if network_state.use_ipv6:
                 netcfg.append('NETWORKING_IPV6=yes')
                 netcfg.append('IPV6_AUTOCONF=no')
-            util.write_file(sysconfig_path,
-                            "\n".join(netcfg) + "\n", file_mode)
+            self._write_file(
+                sysconfig_path, "\n".join(netcfg) + "\n", file_mode)
 
 
 def _supported_vlan_names(rdev, vid):
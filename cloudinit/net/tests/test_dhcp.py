@@ -9,7 +9,8 @@ import cloudinit.net as net
 from cloudinit.net.dhcp import (
     InvalidDHCPLeaseFileError, maybe_perform_dhcp_discovery,
     parse_dhcp_lease_file, dhcp_discovery, networkd_load_leases,
-    parse_static_routes)
+    parse_static_routes, builtin_dhcp_discovery)
+from cloudinit.net.dhcp_client import DHCPClientError
 from cloudinit.util import ensure_file, write_file
 from cloudinit.tests.helpers import (
     CiTestCase, HttprettyTestCase, mock, populate_dir, wrap_and_call)
@@ -309,6 +310,61 @@ class TestDHCPDiscoveryClean(CiTestCase):
         self.assertEqual('eth9', call[0][1])
         self.assertIn('/var/tmp/cloud-init/cloud-init-dhcp-', call[0][2])
 
+    @mock.patch('cloudinit.net.dhcp.subp.which')
+    @mock.patch('cloudinit.net.dhcp.builtin_dhcp_discovery')
+    @mock.patch('cloudinit.net.dhcp.find_fallback_nic')
+    def test_builtin_client_selected(self, m_fback, m_builtin, m_which):
+        """dhcp_client builtin obtains the lease without dhclient."""
+        m_fback.return_value = 'eth9'
+        m_builtin.return_value = [{'fixed-address': '192.168.2.2'}]
+        self.assertEqual(
+            [{'fixed-address': '192.168.2.2'}],
+            maybe_perform_dhcp_discovery(dhcp_client='builtin'))
+        m_builtin.assert_called_once_with('eth9')
+        self.assertEqual(0, m_which.call_count)
+
+    @mock.patch('cloudinit.net.dhcp.dhcp_discovery')
+    @mock.patch('cloudinit.net.dhcp.subp.which')
+    @mock.patch('cloudinit.net.dhcp.builtin_dhcp_discovery')
+    @mock.patch('cloudinit.net.dhcp.find_fallback_nic')
+    def test_builtin_client_falls_back_to_dhclient(
+            self, m_fback, m_builtin, m_which, m_dhcp):
+        """dhclient is run when the builtin client can not run on the nic."""
+        m_fback.return_value = 'eth9'
+        m_builtin.side_effect = DHCPClientError('Operation not permitted')
+        m_which.return_value = '/sbin/dhclient'
+        m_dhcp.return_value = [{'fixed-address': '192.168.2.2'}]
+        self.assertEqual(
+            [{'fixed-address': '192.168.2.2'}],
+            maybe_perform_dhcp_discovery(dhcp_client='builtin'))
+        self.assertIn(
+            'WARNING: Using dhclient, builtin dhcp client failed: Operation'
+            ' not permitted', self.logs.getvalue())
+
+    @mock.patch('cloudinit.net.dhcp.builtin_client.dhcp_discovery')
+    @mock.patch('cloudinit.net.dhcp.subp.subp')
+    @mock.patch('cloudinit.net.dhcp.socket.if_nametoindex')
+    @mock.patch('cloudinit.net.dhcp.get_interface_mac')
+    def test_builtin_dhcp_discovery_brings_up_link(
+            self, m_mac, m_index, m_subp, m_discovery):
+        """The link is brought up, with ip when netlink is unavailable."""
+        m_mac.return_value = '00:16:3e:de:51:a6'
+        m_index.return_value = 2
+        m_discovery.return_value = [{'fixed-address': '192.168.2.2'}]
+        self.assertEqual(
+            [{'fixed-address': '192.168.2.2'}],
+            builtin_dhcp_discovery('eth9'))
+        m_subp.assert_called_once_with(
+            ['ip', 'link', 'set', 'dev', 'eth9', 'up'], capture=True)
+        m_discovery.assert_called_once_with('eth9', '00:16:3e:de:51:a6')
+
+    @mock.patch('cloudinit.net.dhcp.get_interface_mac')
+    def test_builtin_dhcp_discovery_needs_ethernet(self, m_mac):
+        """Interfaces without an ethernet address are unsupported."""
+        m_mac.return_value = '00:00:00:00:fe:80:00:00:00:00:00:00:00:15'
+        with self.assertRaises(DHCPClientError):
+            builtin_dhcp_discovery('ib0')
+
     @mock.patch('time.sleep', mock.MagicMock())
     @mock.patch('cloudinit.net.dhcp.os.kill')
     @mock.patch('cloudinit.net.dhcp.subp.subp')
@@ -0,0 +1,213 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import socket
+import struct
+
+from cloudinit.net import dhcp_client
+from cloudinit.net.dhcp import parse_static_routes
+from cloudinit.sources.helpers.azure import OpenSSLManager, WALinuxAgentShim
+from cloudinit.tests.helpers import CiTestCase, mock
+
+MAC = '00:16:3e:de:51:a6'
+XID = 0x1234abcd
+
+
+def _reply(msg_type, yiaddr='10.0.0.5', xid=XID, mac=MAC, options=None,
+           dport=dhcp_client.CLIENT_PORT):
+    """Return an IPv4 packet holding a DHCP reply from a server."""
+    chaddr = bytes.fromhex(mac.replace(':', ''))
+    payload = struct.pack(
+        dhcp_client.BOOTP_FMT, dhcp_client.BOOTREPLY, 1, 6, 0, xid, 0, 0,
+        b'\0' * 4, socket.inet_aton(yiaddr), b'\0' * 4, b'\0' * 4, chaddr,
+        b'', b'')
+    payload += dhcp_client.MAGIC_COOKIE + bytes([53, 1, msg_type])
+    for code, value in (options or []):
+        payload += bytes([code, len(value)]) + value
+    payload += b'\xff'
+    udp = struct.pack('!HHHH', 67, dport, 8 + len(payload), 0)
+    ip_header = struct.pack(
+        '!BBHHHBBH4s4s', 0x45, 0, 28 + len(payload), 0, 0, 64, 17, 0,
+        socket.inet_aton('10.0.0.1'), socket.inet_aton('255.255.255.255'))
+    return ip_header + udp + payload
+
+
+AZURE_OPTIONS = [
+    (1, socket.inet_aton('255.255.255.0')),
+    (3, socket.inet_aton('10.0.0.1')),
+    (6, socket.inet_aton('168.63.129.16') + socket.inet_aton('8.8.8.8')),
+    (15, b'internal.cloudapp.net'),
+    (51, struct.pack('!I', 0xffffffff)),
+    (54, socket.inet_aton('168.63.129.16')),
+    (121, bytes([0, 10, 0, 0, 1, 32, 168, 63, 129, 16, 10, 0, 0, 1])),
+    (245, socket.inet_aton('168.63.129.16')),
+]
+
+
+class TestMessages(CiTestCase):
+
+    def test_discover_message(self):
+        """Requests are broadcast BOOTREQUESTs padded to BOOTP size."""
+        message = dhcp_client.build_dhcp_message(
+            dhcp_client.DHCPREQUEST, XID, MAC, requested_ip='10.0.0.5',
+            server_id='10.0.0.1')
+        self.assertEqual(dhcp_client.BOOTP_MIN_SIZE, len(message))
+        fields = struct.unpack_from(dhcp_client.BOOTP_FMT, message)
+        self.assertEqual((1, 1, 6, 0, XID, 0, 0x8000), fields[:7])
+        self.assertEqual(bytes.fromhex('00163ede51a6'), fields[11][:6])
+        options = dhcp_client.parse_options(
+            message[dhcp_client.BOOTP_SIZE + 4:])
+        self.assertEqual(b'\x03', options[53])
+        self.assertEqual(socket.inet_aton('10.0.0.5'), options[50])
+        self.assertEqual(socket.inet_aton('10.0.0.1'), options[54])
+        self.assertIn(245, options[55])
+        self.assertIn(121, options[55])
+
+    def test_ip_packet_checksums(self):
+        """IPv4 and UDP checksums of sent packets verify."""
+        payload = b'x' * 301
+        packet = dhcp_client.build_ip_packet(payload)
+        self.assertEqual(0, dhcp_client._checksum(packet[:20]))
+        pseudo_header = struct.pack(
+            '!4s4sBBH', b'\0' * 4, b'\xff' * 4, 0, 17, 8 + len(payload))
+        self.assertEqual(
+            0, dhcp_client._checksum(pseudo_header + packet[20:]))
+        self.assertEqual((68, 67), struct.unpack_from('!HH', packet, 20))
+
+    def test_parse_options_concatenates_split_options(self):
+        """Long options split over several instances are joined."""
+        self.assertEqual(
+            {121: b'\x00\x0a\x00', 1: b'\xff'},
+            dhcp_client.parse_options(
+                b'\x00\x79\x02\x00\x0a\x01\x01\xff\x79\x01\x00\xff\x03'))
+
+    def test_parse_reply_ignores_other_packets(self):
+        """Replies for other clients or transactions are ignored."""
+        self.assertEqual(
+            (dhcp_client.DHCPOFFER, '10.0.0.5', {53: b'\x02'}),
+            dhcp_client.parse_reply(
+                _reply(dhcp_client.DHCPOFFER), XID, MAC))
+        for packet in (_reply(dhcp_client.DHCPOFFER, xid=1),
+                       _reply(dhcp_client.DHCPOFFER, mac='00:11:22:33:44:55'),
+                       _reply(dhcp_client.DHCPOFFER, dport=53),
+                       b'\x60' + b'\0' * 60):
+            self.assertIsNone(dhcp_client.parse_reply(packet, XID, MAC))
+
+
+class TestLeaseFromReply(CiTestCase):
+
+    def test_lease_matches_dhclient_lease_file_format(self):
+        """Leases use dhclient's option names and value formats."""
+        options = dict(AZURE_OPTIONS)
+        options[51] = struct.pack('!I', 3600)
+        options[53] = b'\x05'
+        self.assertEqual({
+            'interface': 'eth0',
+            'fixed-address': '10.0.0.5',
+            'subnet-mask': '255.255.255.0',
+            'routers': '10.0.0.1',
+            'domain-name-servers': '168.63.129.16,8.8.8.8',
+            'domain-name': 'internal.cloudapp.net',
+            'dhcp-lease-time': '3600',
+            'dhcp-message-type': '5',
+            'dhcp-server-identifier': '168.63.129.16',
+            'rfc3442-classless-static-routes':
+                '0,10,0,0,1,32,168,63,129,16,10,0,0,1',
+            'unknown-245': 'a8:3f:81:10',
+            'renew': '4 1970/01/01 00:30:00',
+            'rebind': '4 1970/01/01 00:52:30',
+            'expire': '4 1970/01/01 01:00:00',
+        }, dhcp_client.lease_from_reply('eth0', '10.0.0.5', options, now=0))
+
+    def test_lease_values_are_usable_by_consumers(self):
+        """Azure's option 245 and RFC3442 routes parse as from dhclient."""
+        lease = dhcp_client.lease_from_reply(
+            'eth0', '10.0.0.5', dict(AZURE_OPTIONS))
+        with mock.patch.object(OpenSSLManager, 'generate_certificate'):
+            self.assertEqual(
+                '168.63.129.16',
+                WALinuxAgentShim.get_ip_from_lease_value(
+                    lease['unknown-245']))
+        self.assertEqual(
+            [('0.0.0.0/0', '10.0.0.1'), ('168.63.129.16/32', '10.0.0.1')],
+            parse_static_routes(lease['rfc3442-classless-static-routes']))
+        self.assertNotIn('expire', lease)  # infinite lease
+
+
+@mock.patch('cloudinit.net.dhcp_client.random.getrandbits',
+            return_value=XID)
+@mock.patch('cloudinit.net.dhcp_client.select.select')
+@mock.patch('cloudinit.net.dhcp_client.socket.socket')
+class TestDHCPDiscovery(CiTestCase):
+
+    with_logs = True
+
+    def _sent_types(self, m_sock):
+        types = []
+        for call in m_sock.sendto.call_args_list:
+            packet, address = call[0]
+            self.assertEqual(('eth0', 0x0800, 0, 0, b'\xff' * 6), address)
+            options = dhcp_client.parse_options(
+                packet[28 + dhcp_client.BOOTP_SIZE + 4:])
+            types.append(options[53][0])
+        return types
+
+    def test_discover_offer_request_ack(self, m_socket, m_select, _m_xid):
+        """A lease is returned after the four way exchange."""
+        m_sock = m_socket.return_value
+        m_select.return_value = ([m_sock], [], [])
+        m_sock.recv.side_effect = [
+            _reply(dhcp_client.DHCPOFFER, xid=1),
+            _reply(dhcp_client.DHCPOFFER,
+                   options=[(54, socket.inet_aton('10.0.0.1'))]),
+            _reply(dhcp_client.DHCPACK, options=AZURE_OPTIONS)]
+        leases = dhcp_client.dhcp_discovery('eth0', MAC)
+        self.assertEqual(1, len(leases))
+        self.assertEqual('10.0.0.5', leases[0]['fixed-address'])
+        self.assertEqual('a8:3f:81:10', leases[0]['unknown-245'])
+        m_sock.bind.assert_called_once_with(('eth0', 0x0800))
+        self.assertEqual([dhcp_client.DHCPDISCOVER, dhcp_client.DHCPREQUEST],
+                         self._sent_types(m_sock))
+        request = m_sock.sendto.call_args[0][0]
+        options = dhcp_client.parse_options(
+            request[28 + dhcp_client.BOOTP_SIZE + 4:])
+        self.assertEqual(socket.inet_aton('10.0.0.5'), options[50])
+        self.assertEqual(socket.inet_aton('10.0.0.1'), options[54])
+
+    def test_nak_restarts_discovery(self, m_socket, m_select, _m_xid):
+        m_sock = m_socket.return_value
+        m_select.return_value = ([m_sock], [], [])
+        m_sock.recv.side_effect = [
+            _reply(dhcp_client.DHCPOFFER), _reply(dhcp_client.DHCPNAK),
+            _reply(dhcp_client.DHCPOFFER), _reply(dhcp_client.DHCPACK)]
+        self.assertEqual(
+            '10.0.0.5',
+            dhcp_client.dhcp_discovery('eth0', MAC)[0]['fixed-address'])
+        self.assertEqual(
+            [dhcp_client.DHCPDISCOVER, dhcp_client.DHCPREQUEST,
+             dhcp_client.DHCPDISCOVER, dhcp_client.DHCPREQUEST],
+            self._sent_types(m_sock))
+
+    def test_retransmits_until_timeout(self, m_socket, m_select, _m_xid):
+        """Discovery is resent per schedule and gives up on timeout."""
+        m_sock = m_socket.return_value
+        m_select.return_value = ([], [], [])
+        with mock.patch('cloudinit.net.dhcp_client.time.monotonic',
+                        side_effect=[float(i) for i in range(100)]):
+            self.assertEqual([], dhcp_client.dhcp_discovery(
+                'eth0', MAC, timeout=20, schedule=(2, 4)))
+        self.assertTrue(m_sock.sendto.call_count > 2)
+        self.assertEqual(
+            {dhcp_client.DHCPDISCOVER}, set(self._sent_types(m_sock)))
+        self.assertIn('No dhcp lease received on eth0 after 20 seconds',
+                      self.logs.getvalue())
+
+    def test_socket_errors_raise(self, m_socket, m_select, _m_xid):
+        m_socket.side_effect = PermissionError(1, 'Operation not permitted')
+        with self.assertRaises(dhcp_client.DHCPClientError):
+            dhcp_client.dhcp_discovery('eth0', MAC)
+        m_socket.side_effect = None
+        m_socket.return_value.sendto.side_effect = OSError(100, 'Down')
+        with self.assertRaises(dhcp_client.DHCPClientError):
+            dhcp_client.dhcp_discovery('eth0', MAC)
+
+# vi: ts=4 expandtab
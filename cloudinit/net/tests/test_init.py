@@ -4,6 +4,7 @@ import copy
 import errno
 import ipaddress
 import os
+import socket
 import textwrap
 from unittest import mock
 
@@ -13,6 +14,7 @@ import requests
 
 import cloudinit.net as net
 from cloudinit import safeyaml as yaml
+from cloudinit.sources.helpers import netlink
 from cloudinit.tests.helpers import CiTestCase, HttprettyTestCase
 from cloudinit.subp import ProcessExecutionError
 from cloudinit.util import ensure_file, write_file
@@ -391,6 +393,69 @@ class TestGetDeviceList(CiTestCase):
         self.assertCountEqual(['eth0', 'eth1'], net.get_devicelist())
 
 
+class TestInterfaceSnapshot(CiTestCase):
+
+    def setUp(self):
+        super(TestInterfaceSnapshot, self).setUp()
+        self.sysdir = self.tmp_dir() + '/'
+        self.add_patch('cloudinit.net.get_sys_class_path', 'm_sys_path',
+                       return_value=self.sysdir)
+        write_file(os.path.join(self.sysdir, 'eth0', 'address'),
+                   'aa:bb:cc:dd:ee:ff')
+        write_file(os.path.join(self.sysdir, 'eth0', 'operstate'), 'up')
+
+    def test_attributes_are_read_once_on_first_use(self):
+        """InterfaceInfo only reads attributes when they are accessed."""
+        snapshot = net.InterfaceSnapshot.scan()
+        self.assertIn('eth0', snapshot)
+        with mock.patch('cloudinit.net.read_sys_net_safe',
+                        return_value='up') as m_read:
+            info = snapshot.get('eth0')
+            self.assertEqual(0, m_read.call_count)
+            self.assertEqual('up', info.operstate)
+            self.assertEqual('up', info.operstate)
+        m_read.assert_called_once_with('eth0', 'operstate')
+
+    def test_snapshot_is_fresh_outside_shared_block(self):
+        """Without a shared block every caller scans /sys/class/net."""
+        self.assertIsNot(
+            net.get_interface_snapshot(), net.get_interface_snapshot())
+
+    def test_snapshot_is_shared_within_block(self):
+        """Nested shared blocks reuse one snapshot until the outermost ends."""
+        with net.shared_interface_snapshot():
+            snapshot = net.get_interface_snapshot()
+            with net.shared_interface_snapshot():
+                self.assertIs(snapshot, net.get_interface_snapshot())
+            self.assertIs(snapshot, net.get_interface_snapshot())
+        with net.shared_interface_snapshot():
+            self.assertIsNot(snapshot, net.get_interface_snapshot())
+
+    def test_invalidate_rescans_new_devices(self):
+        """Devices added after invalidation are seen by the next caller."""
+        with net.shared_interface_snapshot():
+            self.assertEqual(['eth0'], [
+                info.name for info in net.get_interface_snapshot()])
+            write_file(os.path.join(self.sysdir, 'eth1', 'operstate'), 'up')
+            self.assertNotIn('eth1', net.get_interface_snapshot())
+            net.invalidate_interface_snapshot()
+            self.assertIn('eth1', net.get_interface_snapshot())
+
+    @mock.patch('cloudinit.net.subp.subp')
+    def test_ephemeral_ipv4_network_invalidates_snapshot(self, m_subp):
+        """EphemeralIPv4Network drops the snapshot on setup and teardown."""
+        m_subp.return_value = ('', '')
+        with net.shared_interface_snapshot():
+            snapshot = net.get_interface_snapshot()
+            with net.EphemeralIPv4Network(
+                    interface='eth0', ip='192.168.2.2',
+                    prefix_or_mask='255.255.255.0',
+                    broadcast='192.168.2.255'):
+                inside = net.get_interface_snapshot()
+                self.assertIsNot(snapshot, inside)
+            self.assertIsNot(inside, net.get_interface_snapshot())
+
+
 @mock.patch(
     "cloudinit.net.is_openvswitch_internal_interface",
     mock.Mock(return_value=False),
@@ -750,6 +815,125 @@ class TestEphemeralIPV4Network(CiTestCase):
         m_subp.assert_has_calls(expected_setup_calls + expected_teardown_calls)
 
 
+@mock.patch('cloudinit.net.subp.subp')
+class TestEphemeralIPV4NetworkNetlink(CiTestCase):
+
+    with_logs = True
+    params = {
+        'interface': 'eth0', 'ip': '192.168.2.2',
+        'prefix_or_mask': '255.255.255.0', 'broadcast': '192.168.2.255',
+        'router': '192.168.2.1'}
+
+    def setUp(self):
+        super(TestEphemeralIPV4NetworkNetlink, self).setUp()
+        self.add_patch('cloudinit.net.socket.if_nametoindex', 'm_index',
+                       return_value=2)
+        self.add_patch('cloudinit.sources.helpers.netlink.get_routes',
+                       'm_routes', return_value=[])
+        self.errors = {}
+        self.batches = []
+
+        def send(requests):
+            self.batches.append(requests)
+            return [self.errors.get(request, 0) for request in requests]
+
+        # Overrides the conftest fixture disabling netlink requests
+        self.add_patch(
+            'cloudinit.sources.helpers.netlink.send_rtnetlink_requests',
+            'm_send', autospec=False, side_effect=send)
+
+    def test_static_routes_are_added_in_one_batch(self, m_subp):
+        """All static routes go in one request, cleanup in another."""
+        params = dict(self.params, static_routes=[
+            ('192.168.2.1/32', '0.0.0.0'), ('0.0.0.0/0', '192.168.2.1')])
+        with net.EphemeralIPv4Network(**params):
+            self.assertEqual(
+                [[netlink.address_request(
+                    netlink.RTM_NEWADDR, 2, '192.168.2.2', 24,
+                    '192.168.2.255')],
+                 [netlink.link_request(2, True)],
+                 [netlink.route_request(
+                     netlink.RTM_NEWROUTE, 2, '192.168.2.1', 32),
+                  netlink.route_request(
+                      netlink.RTM_NEWROUTE, 2, '0.0.0.0', 0, '192.168.2.1')]],
+                self.batches)
+        self.assertEqual(
+            [netlink.route_request(
+                netlink.RTM_DELROUTE, 2, '0.0.0.0', 0, '192.168.2.1'),
+             netlink.route_request(
+                 netlink.RTM_DELROUTE, 2, '192.168.2.1', 32),
+             netlink.link_request(2, False),
+             netlink.address_request(
+                 netlink.RTM_DELADDR, 2, '192.168.2.2', 24)],
+            self.batches[-1])
+        self.assertEqual(4, len(self.batches))
+        self.assertEqual(0, m_subp.call_count)
+
+    def test_router_routes_use_source_address(self, m_subp):
+        with net.EphemeralIPv4Network(**self.params):
+            self.assertEqual(
+                [netlink.route_request(
+                    netlink.RTM_NEWROUTE, 2, '192.168.2.1', 32,
+                    prefsrc='192.168.2.2'),
+                 netlink.route_request(
+                     netlink.RTM_NEWROUTE, 2, '0.0.0.0', 0, '192.168.2.1')],
+                self.batches[-1])
+        self.assertEqual(0, m_subp.call_count)
+
+    def test_existing_default_route_is_kept(self, m_subp):
+        self.m_routes.return_value = [netlink.Route(
+            socket.AF_INET, netlink.RT_TABLE_MAIN, netlink.RTN_UNICAST, None,
+            0, '192.168.2.254', 2, None, False)]
+        with net.EphemeralIPv4Network(**self.params):
+            self.assertEqual(2, len(self.batches))
+        self.assertIn(
+            'Skip ephemeral route setup. eth0 already has default route:'
+            ' default via 192.168.2.254', self.logs.getvalue())
+
+    def test_existing_address_is_left_alone(self, m_subp):
+        """Nothing is brought up or cleaned up if the address exists."""
+        self.errors[netlink.address_request(
+            netlink.RTM_NEWADDR, 2, '192.168.2.2', 24,
+            '192.168.2.255')] = errno.EEXIST
+        with net.EphemeralIPv4Network(**dict(self.params, router=None)):
+            pass
+        self.assertEqual(1, len(self.batches))
+        self.assertIn(
+            'Skip ephemeral network setup, eth0 already has address',
+            self.logs.getvalue())
+
+    def test_failed_route_rolls_back(self, m_subp):
+        """Routes which were added and the address are removed on errors."""
+        self.errors[netlink.route_request(
+            netlink.RTM_NEWROUTE, 2, '0.0.0.0', 0, '192.168.2.1')] = (
+            errno.ENETUNREACH)
+        with self.assertRaises(netlink.NetlinkRequestError) as ctx_mgr:
+            with net.EphemeralIPv4Network(**self.params):
+                pass
+        self.assertIn('default route via 192.168.2.1: Network is unreachable',
+                      str(ctx_mgr.exception))
+        self.assertEqual(
+            [netlink.route_request(
+                netlink.RTM_DELROUTE, 2, '192.168.2.1', 32,
+                prefsrc='192.168.2.2'),
+             netlink.link_request(2, False),
+             netlink.address_request(
+                 netlink.RTM_DELADDR, 2, '192.168.2.2', 24)],
+            self.batches[-1])
+
+    def test_ip_commands_without_netlink(self, m_subp):
+        """ip commands are used when no netlink socket can be created."""
+        self.m_send.side_effect = netlink.NetlinkCreateSocketError('nope')
+        m_subp.return_value = ('', '')
+        with net.EphemeralIPv4Network(**dict(self.params, router=None)):
+            pass
+        self.assertEqual(
+            ['ip', '-family', 'inet', 'addr', 'add', '192.168.2.2/24',
+             'broadcast', '192.168.2.255', 'dev', 'eth0'],
+            m_subp.call_args_list[0][0][0])
+        self.assertEqual(1, self.m_send.call_count)
+
+
 class TestApplyNetworkCfgNames(CiTestCase):
     V1_CONFIG = textwrap.dedent("""\
         version: 1
@@ -55,4 +55,28 @@ class TestNetworkStateParseConfigV2(CiTestCase):
         self.assertEqual(ncfg, nsi.as_dict()['config'])
 
 
+class TestNetworkStateLookups(CiTestCase):
+
+    config = {'version': 1, 'config': [
+        {'type': 'physical', 'name': 'eth2'},
+        {'type': 'bond', 'name': 'bond1', 'bond_interfaces': ['eth2'],
+         'params': {}},
+        {'type': 'bond', 'name': 'bond0', 'bond_interfaces': ['eth1', 'eth0'],
+         'params': {}},
+    ]}
+
+    def test_get_bond_slaves(self):
+        """Bond slaves are returned sorted by name for each bond."""
+        state = network_state.parse_net_config_data(self.config)
+        self.assertEqual(['eth0', 'eth1'], state.get_bond_slaves('bond0'))
+        self.assertEqual(['eth2'], state.get_bond_slaves('bond1'))
+        self.assertEqual([], state.get_bond_slaves('eth0'))
+
+    @mock.patch(netstate_path + '.safeyaml.dumps')
+    def test_parse_does_not_dump_state_per_command(self, m_dumps):
+        """Parsing valid commands does not serialize the whole state."""
+        network_state.parse_net_config_data(self.config)
+        self.assertEqual(0, m_dumps.call_count)
+
+
 # vi: ts=4 expandtab
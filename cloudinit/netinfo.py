@@ -10,6 +10,7 @@
 
 from copy import copy, deepcopy
 import re
+import socket
 
 from cloudinit import log as logging
 from cloudinit.net.network_state import net_prefix_to_ipv4_mask
@@ -92,6 +93,46 @@ def _netdev_info_iproute(ipaddr_out):
     return devs
 
 
+def _netdev_info_netlink():
+    """
+    Get network device dicts from rtnetlink link and address dumps.
+
+    @returns: A dict of device info keyed by network device name, like
+              _netdev_info_iproute.
+    @raise: NetlinkCreateSocketError or NetlinkDumpError if netlink is
+            unavailable.
+    """
+    from cloudinit.sources.helpers import netlink
+    devs = {}
+    names = {}
+    for link in netlink.get_links():
+        dev_name = link.name.lower()
+        names[link.index] = dev_name
+        devs[dev_name] = {
+            'ipv4': [], 'ipv6': [], 'hwaddr': '',
+            'up': bool(link.flags & netlink.IFF_UP and
+                       link.flags & netlink.IFF_LOWER_UP),
+        }
+        if link.type == netlink.ARPHRD_ETHER:
+            devs[dev_name]['hwaddr'] = link.address
+    for addr in netlink.get_addresses():
+        if addr.index not in names:
+            continue
+        dev = devs[names[addr.index]]
+        scope = netlink.RT_SCOPE_NAMES.get(addr.scope, str(addr.scope))
+        if addr.family == socket.AF_INET:
+            dev['ipv4'].append({
+                'ip': addr.local or addr.address,
+                'bcast': addr.broadcast or '',
+                'mask': net_prefix_to_ipv4_mask(addr.prefixlen),
+                'scope': scope})
+        else:
+            dev['ipv6'].append({
+                'ip': '%s/%s' % (addr.address, addr.prefixlen),
+                'scope6': scope})
+    return devs
+
+
 def _netdev_info_ifconfig_netbsd(ifconfig_data):
     # fields that need to be returned in devs for each dev
     devs = {}
@@ -195,9 +236,26 @@ def _netdev_info_ifconfig(ifconfig_data):
     return devs
 
 
+def _read_netlink(func):
+    """Return func(), or None if netlink is unavailable."""
+    # Imported here so importing netinfo does not import cloudinit.sources
+    from cloudinit.sources.helpers import netlink
+    if not util.is_Linux():
+        return None
+    try:
+        return func()
+    except (netlink.NetlinkCreateSocketError,
+            netlink.NetlinkDumpError) as e:
+        LOG.debug("Reading from netlink failed, using commands: %s", e)
+        return None
+
+
 def netdev_info(empty=""):
     devs = {}
-    if util.is_NetBSD():
+    netlink_devs = _read_netlink(_netdev_info_netlink)
+    if netlink_devs is not None:
+        devs = netlink_devs
+    elif util.is_NetBSD():
         (ifcfg_out, _err) = subp.subp(["ifconfig", "-a"], rcs=[0, 1])
         devs = _netdev_info_ifconfig_netbsd(ifcfg_out)
     elif subp.which('ip'):
@@ -319,6 +377,63 @@ def _netdev_route_info_iproute(iproute_data):
     return routes
 
 
+def _netdev_route_info_netlink():
+    """
+    Get network route dicts from rtnetlink route dumps.
+
+    Like 'ip -o route list' and 'ip -6 route list table all' only unicast
+    IPv4 routes of the main table and unicast IPv6 routes of all tables are
+    included.
+
+    @returns: A dict containing ipv4 and ipv6 route entries as lists, like
+              _netdev_route_info_iproute.
+    @raise: NetlinkCreateSocketError or NetlinkDumpError if netlink is
+            unavailable.
+    """
+    from cloudinit.sources.helpers import netlink
+    names = dict((link.index, link.name) for link in netlink.get_links())
+    routes = {}
+    routes['ipv4'] = []
+    routes['ipv6'] = []
+    for route in netlink.get_routes(socket.AF_INET):
+        if (route.table != netlink.RT_TABLE_MAIN or
+                route.type != netlink.RTN_UNICAST):
+            continue
+        entry = {
+            'destination': route.dst or '0.0.0.0',
+            'gateway': route.gateway or '0.0.0.0',
+            'genmask': net_prefix_to_ipv4_mask(route.dst_len),
+            'iface': names.get(route.oif, ''),
+            'metric': '' if route.priority is None else str(route.priority)}
+        flags = ['U']
+        if route.gateway:
+            flags.append('G')
+        if route.dst_len == 32:
+            flags.append('H')
+        entry['flags'] = ''.join(flags)
+        routes['ipv4'].append(entry)
+    for route in netlink.get_routes(socket.AF_INET6):
+        if route.type != netlink.RTN_UNICAST:
+            continue
+        if not route.dst_len:
+            destination = '::/0'
+        elif route.dst_len == 128:
+            destination = route.dst
+        else:
+            destination = '%s/%s' % (route.dst, route.dst_len)
+        entry = {
+            'destination': destination,
+            'gateway': route.gateway or '::',
+            'flags': 'UG' if route.gateway else 'U',
+            'iface': names.get(route.oif, '')}
+        if route.priority is not None:
+            entry['metric'] = str(route.priority)
+        if route.expires:
+            entry['flags'] += 'e'
+        routes['ipv6'].append(entry)
+    return routes
+
+
 def _netdev_route_info_netstat(route_data):
     routes = {}
     routes['ipv4'] = []
@@ -394,7 +509,10 @@ def _netdev_route_info_netstat(route_data):
 
 def route_info():
     routes = {}
-    if subp.which('ip'):
+    netlink_routes = _read_netlink(_netdev_route_info_netlink)
+    if netlink_routes is not None:
+        routes = netlink_routes
+    elif subp.which('ip'):
         # Try iproute first of all
         (iproute_out, _err) = subp.subp(["ip", "-o", "route", "list"])
         routes = _netdev_route_info_iproute(iproute_out)
@@ -0,0 +1,186 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Optional cProfile instrumentation of cloud-init stages and modules.
+
+Profiling is off by default. It is enabled either by adding
+``cloud-init.profile`` to the kernel command line or through config::
+
+  profiling:
+    enabled: true
+    dir: /var/log/cloud-init-profile
+
+Stages only know their config once they have read it, so a unit entered
+while profiling is disabled starts profiling as soon as configure() enables
+it.
+
+When enabled, each profiled unit (a stage such as ``init-local``, a
+datasource ``_get_data`` call or a config module ``handle``) writes a
+``<unit>.pstats`` file to the profile dir and its timings are merged into
+``summary.json`` there. Units nest: while an inner unit runs, the enclosing
+unit's profiler is paused so each ``.pstats`` file only accounts for work
+which is not already covered by a more specific unit.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+import re
+import time
+
+from cloudinit import atomic_helper
+from cloudinit import log as logging
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
+
+CMDLINE_KEY = 'cloud-init.profile'
+DEFAULT_PROFILE_DIR = '/var/log/cloud-init-profile'
+SUMMARY_FILE = 'summary.json'
+
+# Number of most expensive functions recorded per unit in SUMMARY_FILE
+SUMMARY_TOP_FUNCS = 10
+
+_CONFIG = {'enabled': False, 'dir': DEFAULT_PROFILE_DIR}
+_ACTIVE = []
+# Units entered while profiling was disabled, outermost first
+_PENDING = []
+
+
+def _get_profiling_cfg(cfg):
+    if cfg and isinstance(cfg.get('profiling'), dict):
+        return cfg['profiling']
+    return {}
+
+
+def get_profile_dir(cfg=None):
+    """Return the profile dir configured in cfg or the default one."""
+    return _get_profiling_cfg(cfg).get('dir') or DEFAULT_PROFILE_DIR
+
+
+def configure(cfg=None, cmdline=None):
+    """Enable or disable profiling based on config and kernel cmdline.
+
+    @param cfg: Optional system config dict which may contain a 'profiling'
+        key with 'enabled' and 'dir' sub-keys.
+    @param cmdline: Optional kernel command line string. Defaults to the
+        running kernel's command line.
+
+    @return: Boolean, whether profiling is now enabled.
+    """
+    if cmdline is None:
+        cmdline = util.get_cmdline()
+    prof_cfg = _get_profiling_cfg(cfg)
+    enabled = util.is_true(prof_cfg.get('enabled', False))
+    if CMDLINE_KEY in cmdline.split():
+        enabled = True
+    _CONFIG['enabled'] = enabled
+    _CONFIG['dir'] = get_profile_dir(cfg)
+    if enabled:
+        LOG.debug("Profiling enabled, writing profiles to %s", _CONFIG['dir'])
+        while _PENDING:
+            _PENDING.pop(0).start()
+    return enabled
+
+
+def is_enabled():
+    return _CONFIG['enabled']
+
+
+def _unit_filename(unit):
+    """Return a filesystem-safe base filename for unit."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', unit)
+
+
+def _summarize(profiler, wall_time):
+    stats = pstats.Stats(profiler)
+    funcs = []
+    for func, (_cc, ncalls, tottime, cumtime, _callers) in stats.stats.items():
+        funcs.append({
+            'function': pstats.func_std_string(func),
+            'ncalls': ncalls,
+            'tottime': round(tottime, 6),
+            'cumtime': round(cumtime, 6)})
+    funcs.sort(key=lambda f: f['tottime'], reverse=True)
+    return {
+        'wall_time': round(wall_time, 6),
+        'profiled_time': round(stats.total_tt, 6),
+        'total_calls': stats.total_calls,
+        'top_functions': funcs[:SUMMARY_TOP_FUNCS]}
+
+
+def _write_results(unit, profiler, wall_time):
+    profile_dir = _CONFIG['dir']
+    util.ensure_dir(profile_dir, mode=0o700)
+    profiler.dump_stats(
+        os.path.join(profile_dir, _unit_filename(unit) + '.pstats'))
+    summary_file = os.path.join(profile_dir, SUMMARY_FILE)
+    try:
+        summary = json.loads(util.load_file(summary_file))
+    except (IOError, OSError, ValueError):
+        summary = {}
+    summary[unit] = _summarize(profiler, wall_time)
+    atomic_helper.write_json(summary_file, summary, mode=0o600)
+
+
+class Profile(object):
+    """Context manager profiling the enclosed block as a named unit.
+
+    This is a no-op unless profiling is enabled, either on entry or later on
+    while the block runs.
+    """
+
+    def __init__(self, unit):
+        self.unit = unit
+        self._profiler = None
+        self._start = None
+
+    def __enter__(self):
+        if is_enabled():
+            self.start()
+        else:
+            _PENDING.append(self)
+        return self
+
+    def start(self):
+        if _ACTIVE:
+            _ACTIVE[-1].disable()
+        self._profiler = cProfile.Profile()
+        _ACTIVE.append(self._profiler)
+        self._start = time.time()
+        self._profiler.enable()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self in _PENDING:
+            _PENDING.remove(self)
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        wall_time = time.time() - self._start
+        _ACTIVE.pop()
+        try:
+            _write_results(self.unit, self._profiler, wall_time)
+        except Exception as e:
+            LOG.warning("Failed writing profile for %s: %s", self.unit, e)
+        finally:
+            self._profiler = None
+            if _ACTIVE:
+                _ACTIVE[-1].enable()
+
+
+def profiled(unit, func):
+    """Return a callable which runs func inside a Profile for unit.
+
+    When profiling is disabled func is returned unchanged.
+    """
+    if not is_enabled():
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with Profile(unit):
+            return func(*args, **kwargs)
+    return wrapper
+
+# vi: ts=4 expandtab
@@ -10,6 +10,7 @@ They can be published to registered handlers with report_event.
 """
 import base64
 import os.path
+import threading
 import time
 
 from . import instantiated_handler_registry, available_handlers
@@ -19,6 +20,9 @@ START_EVENT_TYPE = 'start'
 
 DEFAULT_EVENT_ORIGIN = 'cloudinit'
 
+# ReportEventStacks entered in the current thread, innermost last
+_ACTIVE = threading.local()
+
 
 class _nameset(set):
     def __getattr__(self, name):
@@ -135,6 +139,16 @@ def report_start_event(event_name, event_description):
     return report_event(event)
 
 
+def current_event_stack():
+    """Return the innermost ReportEventStack entered in this thread.
+
+    This lets code which is not handed a parent, such as url_helper,
+    report events nested in the operation which called it.
+    """
+    stacks = getattr(_ACTIVE, 'stacks', None)
+    return stacks[-1] if stacks else None
+
+
 class ReportEventStack(object):
     """Context Manager for using :py:func:`report_event`
 
@@ -203,6 +217,9 @@ class ReportEventStack(object):
             report_start_event(self.fullname, self.description)
         if self.parent:
             self.parent.children[self.name] = (None, None)
+        if not hasattr(_ACTIVE, 'stacks'):
+            _ACTIVE.stacks = []
+        _ACTIVE.stacks.append(self)
         return self
 
     def _childrens_finish_info(self):
@@ -239,6 +256,9 @@ class ReportEventStack(object):
         return self._childrens_finish_info()
 
     def __exit__(self, exc_type, exc_value, traceback):
+        stacks = getattr(_ACTIVE, 'stacks', [])
+        if stacks and stacks[-1] is self:
+            stacks.pop()
         (result, msg) = self._finish_info(exc_value)
         if self.parent:
             self.parent.children[self.name] = (result, msg)
@@ -0,0 +1,436 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Read ISO9660 and FAT seed images without mounting them.
+
+Datasources look for their seed on small ISO9660 and FAT file systems and
+mount every candidate device to read a few files. The readers here walk
+those file systems directly from the block device so that the files can be
+extracted once into a private directory shared by all datasources of the
+process. Devices holding other or unusual file systems raise
+UnsupportedImageError and callers fall back to mounting them.
+"""
+
+import atexit
+import hashlib
+import os
+import shutil
+import stat
+import struct
+
+from cloudinit import log as logging
+from cloudinit import temp_utils
+
+LOG = logging.getLogger(__name__)
+
+ISO9660 = 'iso9660'
+VFAT = 'vfat'
+SUPPORTED_TYPES = (ISO9660, VFAT)
+
+# Seed images are small, larger file systems are better mounted
+MAX_CONTENT_SIZE = 64 * 1024 * 1024
+# Leading bytes of a device hashed to notice replaced media
+SIGNATURE_SIZE = 64 * 1024
+
+ISO_SECTOR_SIZE = 2048
+ISO_FIRST_DESCRIPTOR = 16
+ISO_MAX_DESCRIPTORS = 64
+ISO_DIR_FLAG = 0x02
+ISO_ASSOCIATED_FLAG = 0x04
+ISO_MULTI_EXTENT_FLAG = 0x80
+JOLIET_ESCAPES = (b'%/@', b'%/C', b'%/E')
+
+FAT_DIR_ENTRY_SIZE = 32
+FAT_ATTR_LFN = 0x0F
+FAT_ATTR_VOLUME_ID = 0x08
+FAT_ATTR_DIRECTORY = 0x10
+FAT_LOWER_BASE = 0x08
+FAT_LOWER_EXT = 0x10
+
+# device realpath: (signature, extracted directory)
+_EXTRACTED = {}
+
+
+class UnsupportedImageError(Exception):
+    """The device does not hold a seed image readable in-process."""
+
+
+def _check_name(name):
+    if not name or name in ('.', '..') or '/' in name or '\0' in name:
+        raise UnsupportedImageError('Invalid file name %r' % name)
+    return name
+
+
+class ISO9660Image(object):
+    """Walk an ISO9660 file system, preferring Rock Ridge and Joliet names
+    as Linux does."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.block_size = ISO_SECTOR_SIZE
+        self.susp_skip = None
+        self.joliet = False
+        pvd = svd = None
+        for index in range(ISO_MAX_DESCRIPTORS):
+            desc = self._read(
+                (ISO_FIRST_DESCRIPTOR + index) * ISO_SECTOR_SIZE,
+                ISO_SECTOR_SIZE)
+            if desc[1:6] != b'CD001':
+                break
+            if desc[0] == 255:
+                break
+            if desc[0] == 1 and pvd is None:
+                pvd = desc
+            elif desc[0] == 2 and svd is None and any(
+                    esc in desc[88:120] for esc in JOLIET_ESCAPES):
+                svd = desc
+        if pvd is None:
+            raise UnsupportedImageError('No ISO9660 primary volume descriptor')
+        self.block_size = struct.unpack_from('<H', pvd, 128)[0]
+        if self.block_size not in (512, 1024, 2048):
+            raise UnsupportedImageError(
+                'Unsupported ISO9660 block size %d' % self.block_size)
+        root = self._parse_record(pvd[156:190])
+        dot = next(self._records(root), None)
+        if dot and dot['system_use'][:2] == b'SP':
+            self.susp_skip = dot['system_use'][6]
+        if self.susp_skip is None and svd is not None:
+            self.joliet = True
+            root = self._parse_record(svd[156:190])
+        self.root = root
+
+    def _read(self, offset, length):
+        self.stream.seek(offset)
+        data = self.stream.read(length)
+        if len(data) != length:
+            raise UnsupportedImageError('Short read at offset %d' % offset)
+        return data
+
+    @staticmethod
+    def _parse_record(data):
+        name_len = data[32]
+        system_use = 33 + name_len + (1 - name_len % 2)
+        return {
+            'extent': struct.unpack_from('<I', data, 2)[0],
+            'size': struct.unpack_from('<I', data, 10)[0],
+            'flags': data[25],
+            'name': data[33:33 + name_len],
+            'system_use': data[system_use:data[0]],
+        }
+
+    def _records(self, directory):
+        data = self._read(directory['extent'] * self.block_size,
+                          directory['size'])
+        pos = 0
+        while pos < len(data):
+            length = data[pos]
+            if length == 0:
+                # records do not cross sectors, the rest is padding
+                pos = (pos // ISO_SECTOR_SIZE + 1) * ISO_SECTOR_SIZE
+                continue
+            if length < 34 or pos + length > len(data):
+                raise UnsupportedImageError('Corrupt ISO9660 directory')
+            yield self._parse_record(data[pos:pos + length])
+            pos += length
+
+    def _susp_entries(self, system_use):
+        areas = [system_use[self.susp_skip:]]
+        while areas:
+            area = areas.pop()
+            pos = 0
+            while pos + 4 <= len(area):
+                sig, length = area[pos:pos + 2], area[pos + 2]
+                if length < 4:
+                    break
+                entry = area[pos:pos + length]
+                if sig == b'ST':
+                    break
+                if sig == b'CE':
+                    block, offset, ce_len = struct.unpack_from(
+                        '<I4xI4xI', entry, 4)
+                    areas.append(self._read(
+                        block * self.block_size + offset, ce_len))
+                else:
+                    yield sig, entry
+                pos += length
+
+    def _name(self, record):
+        if self.susp_skip is not None:
+            parts = []
+            for sig, entry in self._susp_entries(record['system_use']):
+                if sig in (b'RE', b'CL'):
+                    # relocated deep directories
+                    raise UnsupportedImageError(
+                        'Relocated Rock Ridge directories')
+                if sig == b'SL':
+                    raise UnsupportedImageError('Rock Ridge symbolic links')
+                if sig == b'PX' and stat.S_IFMT(
+                        struct.unpack_from('<I', entry, 4)[0]) not in (
+                            stat.S_IFREG, stat.S_IFDIR):
+                    # symlinks, devices, fifos and sockets, which mounting
+                    # reproduces
+                    raise UnsupportedImageError(
+                        'Rock Ridge symbolic links and special files')
+                if sig == b'NM' and not entry[4] & 0x6:
+                    parts.append(entry[5:])
+            if parts:
+                return b''.join(parts).decode('utf-8', 'replace')
+        if self.joliet:
+            name = record['name'].decode('utf-16-be', 'replace')
+            return name.split(';')[0]
+        name = record['name'].decode('ascii', 'replace')
+        return name.split(';')[0].rstrip('.').lower()
+
+    def walk(self, directory=None, prefix=''):
+        """Yield (path, is_dir, size, reader) for every entry."""
+        for record in self._records(directory or self.root):
+            if record['name'] in (b'\0', b'\1'):
+                continue
+            if record['flags'] & ISO_ASSOCIATED_FLAG:
+                continue
+            if record['flags'] & ISO_MULTI_EXTENT_FLAG:
+                raise UnsupportedImageError('Multi extent ISO9660 files')
+            path = prefix + _check_name(self._name(record))
+            if record['flags'] & ISO_DIR_FLAG:
+                yield path, True, 0, None
+                for entry in self.walk(record, path + '/'):
+                    yield entry
+            else:
+                offset = record['extent'] * self.block_size
+                yield path, False, record['size'], (
+                    lambda offset=offset, size=record['size']:
+                    self._read(offset, size))
+
+
+class FATImage(object):
+    """Walk a FAT12, FAT16 or FAT32 file system with VFAT long names."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        boot = self._read(0, 512)
+        if boot[510:512] != b'\x55\xaa':
+            raise UnsupportedImageError('No FAT boot sector signature')
+        (self.sector_size, self.cluster_sectors, reserved, fats,
+         root_entries, total16, _media, fat_sectors16) = struct.unpack_from(
+            '<HBHBHHBH', boot, 11)
+        total32, fat_sectors32 = struct.unpack_from('<II', boot, 32)
+        if (self.sector_size not in (512, 1024, 2048, 4096) or
+                self.cluster_sectors not in (1, 2, 4, 8, 16, 32, 64, 128) or
+                not fats or not reserved):
+            raise UnsupportedImageError('Invalid FAT boot sector')
+        fat_sectors = fat_sectors16 or fat_sectors32
+        total = total16 or total32
+        root_sectors = -(-root_entries * FAT_DIR_ENTRY_SIZE //
+                         self.sector_size)
+        self.fat_offset = reserved * self.sector_size
+        self.root_offset = (reserved + fats * fat_sectors) * self.sector_size
+        self.root_size = root_sectors * self.sector_size
+        self.data_sector = reserved + fats * fat_sectors + root_sectors
+        if not fat_sectors or total <= self.data_sector:
+            raise UnsupportedImageError('Invalid FAT geometry')
+        self.clusters = (total - self.data_sector) // self.cluster_sectors
+        if self.clusters < 4085:
+            self.fat_bits = 12
+        elif self.clusters < 65525:
+            self.fat_bits = 16
+        else:
+            self.fat_bits = 32
+        self.root_cluster = None
+        if self.fat_bits == 32:
+            self.root_cluster = struct.unpack_from('<I', boot, 44)[0]
+        self.fat = self._read(self.fat_offset, fat_sectors * self.sector_size)
+
+    def _read(self, offset, length):
+        self.stream.seek(offset)
+        data = self.stream.read(length)
+        if len(data) != length:
+            raise UnsupportedImageError('Short read at offset %d' % offset)
+        return data
+
+    def _next_cluster(self, cluster):
+        if self.fat_bits == 12:
+            value = struct.unpack_from('<H', self.fat, cluster * 3 // 2)[0]
+            return value >> 4 if cluster & 1 else value & 0xFFF
+        if self.fat_bits == 16:
+            return struct.unpack_from('<H', self.fat, cluster * 2)[0]
+        return struct.unpack_from('<I', self.fat, cluster * 4)[0] & 0x0FFFFFFF
+
+    def _chain(self, cluster):
+        end = {12: 0xFF8, 16: 0xFFF8, 32: 0x0FFFFFF8}[self.fat_bits]
+        chain = []
+        while 2 <= cluster < end:
+            if cluster >= self.clusters + 2 or len(chain) > self.clusters:
+                raise UnsupportedImageError('Corrupt FAT cluster chain')
+            chain.append(cluster)
+            cluster = self._next_cluster(cluster)
+        return chain
+
+    def _read_chain(self, cluster, size=None):
+        cluster_size = self.cluster_sectors * self.sector_size
+        data = b''.join(
+            self._read((self.data_sector + (c - 2) * self.cluster_sectors) *
+                       self.sector_size, cluster_size)
+            for c in self._chain(cluster))
+        if size is not None:
+            if len(data) < size:
+                raise UnsupportedImageError('FAT file shorter than its size')
+            data = data[:size]
+        return data
+
+    @staticmethod
+    def _short_name(entry):
+        base = entry[0:8].rstrip(b' ').decode('ascii', 'replace')
+        ext = entry[8:11].rstrip(b' ').decode('ascii', 'replace')
+        if entry[12] & FAT_LOWER_BASE:
+            base = base.lower()
+        if entry[12] & FAT_LOWER_EXT:
+            ext = ext.lower()
+        if base.startswith('\x05'):
+            base = '\xe5' + base[1:]
+        return base + '.' + ext if ext else base
+
+    def _entries(self, data):
+        long_parts = {}
+        for pos in range(0, len(data) - FAT_DIR_ENTRY_SIZE + 1,
+                         FAT_DIR_ENTRY_SIZE):
+            entry = data[pos:pos + FAT_DIR_ENTRY_SIZE]
+            if entry[0] == 0:
+                return
+            if entry[0] == 0xE5:
+                long_parts = {}
+                continue
+            attr = entry[11]
+            if attr == FAT_ATTR_LFN:
+                if entry[0] & 0x40:
+                    long_parts = {}
+                long_parts[entry[0] & 0x1F] = (
+                    entry[13], entry[1:11] + entry[14:26] + entry[28:32])
+                continue
+            name = None
+            if long_parts:
+                checksum = 0
+                for byte in entry[0:11]:
+                    checksum = (((checksum & 1) << 7) + (checksum >> 1) +
+                                byte) & 0xFF
+                if all(part[0] == checksum for part in long_parts.values()):
+                    raw = b''.join(long_parts[seq][1]
+                                   for seq in sorted(long_parts))
+                    name = raw.decode('utf-16-le', 'replace')
+                    name = name.split('\0')[0]
+                long_parts = {}
+            if attr & FAT_ATTR_VOLUME_ID:
+                continue
+            if name is None:
+                name = self._short_name(entry)
+            if name in ('.', '..'):
+                continue
+            cluster = struct.unpack_from('<H', entry, 26)[0]
+            if self.fat_bits == 32:
+                cluster |= struct.unpack_from('<H', entry, 20)[0] << 16
+            size = struct.unpack_from('<I', entry, 28)[0]
+            yield _check_name(name), bool(attr & FAT_ATTR_DIRECTORY), (
+                cluster, size)
+
+    def walk(self, cluster=None, prefix=''):
+        """Yield (path, is_dir, size, reader) for every entry."""
+        if cluster is None and self.root_cluster is None:
+            data = self._read(self.root_offset, self.root_size)
+        else:
+            data = self._read_chain(cluster or self.root_cluster)
+        for name, is_dir, (first, size) in self._entries(data):
+            path = prefix + name
+            if is_dir:
+                yield path, True, 0, None
+                for entry in self.walk(first, path + '/'):
+                    yield entry
+            else:
+                yield path, False, size, (
+                    lambda first=first, size=size:
+                    self._read_chain(first, size) if size else b'')
+
+
+def open_image(stream, fstypes=SUPPORTED_TYPES):
+    """Return a reader for the seed image in stream.
+
+    @param fstypes: file system types the image may have.
+    @raises UnsupportedImageError: if the image has none of fstypes.
+    """
+    errors = []
+    for fstype, image_cls in ((ISO9660, ISO9660Image), (VFAT, FATImage)):
+        if fstype not in fstypes:
+            continue
+        try:
+            return image_cls(stream)
+        except UnsupportedImageError as e:
+            errors.append('%s: %s' % (fstype, e))
+        except (struct.error, IndexError) as e:
+            errors.append('%s: corrupt image: %s' % (fstype, e))
+    raise UnsupportedImageError('; '.join(errors) or 'no supported type')
+
+
+def extract_image(stream, target, fstypes=SUPPORTED_TYPES):
+    """Extract the files of the seed image in stream below target."""
+    image = open_image(stream, fstypes)
+    entries = []
+    total = 0
+    try:
+        for path, is_dir, size, reader in image.walk():
+            total += size
+            if total > MAX_CONTENT_SIZE:
+                raise UnsupportedImageError(
+                    'Content larger than %d bytes' % MAX_CONTENT_SIZE)
+            entries.append((path, is_dir, reader))
+        for path, is_dir, reader in entries:
+            dest = os.path.join(target, path)
+            if is_dir:
+                os.makedirs(dest, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as stream_out:
+                stream_out.write(reader())
+    except (struct.error, IndexError) as e:
+        raise UnsupportedImageError('Corrupt image: %s' % e) from e
+
+
+def _cleanup():
+    for _signature, directory in _EXTRACTED.values():
+        shutil.rmtree(directory, ignore_errors=True)
+    _EXTRACTED.clear()
+
+
+def extracted_dir(device, fstypes=SUPPORTED_TYPES):
+    """Return a private directory holding the files of the seed image on
+    device.
+
+    Files are extracted once per process and device. Extracted files are
+    reused while the leading bytes of the device are unchanged, so that
+    replaced media are read again.
+
+    @raises UnsupportedImageError: if the device can not be read in-process
+        and should be mounted instead.
+    """
+    realpath = os.path.realpath(device)
+    try:
+        with open(realpath, 'rb') as stream:
+            signature = hashlib.sha256(stream.read(SIGNATURE_SIZE)).digest()
+            cached = _EXTRACTED.get(realpath)
+            if cached and cached[0] == signature:
+                return cached[1]
+            if cached:
+                shutil.rmtree(cached[1], ignore_errors=True)
+                del _EXTRACTED[realpath]
+            if not _EXTRACTED:
+                atexit.register(_cleanup)
+            target = temp_utils.mkdtemp(prefix='seed-image-')
+            try:
+                extract_image(stream, target, fstypes)
+            except BaseException:
+                shutil.rmtree(target, ignore_errors=True)
+                raise
+    except OSError as e:
+        raise UnsupportedImageError(
+            'Failed reading %s: %s' % (device, e)) from e
+    LOG.debug('Extracted seed image on %s to %s', device, target)
+    _EXTRACTED[realpath] = (signature, target)
+    return target
+
+# vi: ts=4 expandtab
@@ -12,6 +12,7 @@ from functools import partial
 import os
 import os.path
 import re
+from time import monotonic
 from time import time
 from time import sleep
 from xml.dom import minidom
@@ -20,6 +21,7 @@ from enum import Enum
 import requests
 
 from cloudinit import dmi
+from cloudinit import helpers
 from cloudinit import log as logging
 from cloudinit import net
 from cloudinit.event import EventScope, EventType
@@ -32,6 +34,7 @@ from cloudinit import subp
 from cloudinit.url_helper import UrlError, readurl, retry_on_url_exc
 from cloudinit import util
 from cloudinit.reporting import events
+from cloudinit.settings import PER_INSTANCE
 
 from cloudinit.sources.helpers.azure import (
     DEFAULT_REPORT_FAILURE_USER_VISIBLE_MESSAGE,
@@ -81,6 +84,8 @@ AGENT_SEED_DIR = '/var/lib/waagent'
 # In the event where the IMDS primary server is not
 # available, it takes 1s to fallback to the secondary one
 IMDS_TIMEOUT_IN_SECONDS = 2
+# Seconds to wait for a rebound nic to come up before rebinding it again
+LINK_UP_TIMEOUT_IN_SECONDS = 1
 IMDS_URL = "http://169.254.169.254/metadata"
 IMDS_VER_MIN = "2019-06-01"
 IMDS_VER_WANT = "2021-01-01"
@@ -273,6 +278,7 @@ BUILTIN_DS_CONFIG = {
     'disk_aliases': {'ephemeral0': RESOURCE_DISK_PATH},
     'dhclient_lease_file': LEASE_FILE,
     'apply_network_config': True,  # Use IMDS published network configuration
+    'dhcp_client': 'dhclient',  # Or 'builtin', see cloudinit.net.dhcp
 }
 # RELEASE_BLOCKER: Xenial and earlier apply_network_config default is False
 
@@ -295,6 +301,16 @@ DEF_EPHEMERAL_LABEL = 'Temporary Storage'
 DEF_PASSWD_REDACTION = 'REDACTED'
 
 
+@contextlib.contextmanager
+def timed_phase(timings, name):
+    """Append the name and duration in seconds of the block to timings."""
+    start = monotonic()
+    try:
+        yield
+    finally:
+        timings.append((name, monotonic() - start))
+
+
 def get_hostname(hostname_command='hostname'):
     if not isinstance(hostname_command, (list, tuple)):
         hostname_command = (hostname_command,)
@@ -589,7 +605,8 @@ class DataSourceAzure(sources.DataSource):
             else:
                 try:
                     with EphemeralDHCPv4WithReporting(
-                            azure_ds_reporter) as lease:
+                            azure_ds_reporter,
+                            dhcp_client=self.ds_cfg['dhcp_client']) as lease:
                         self._report_ready(lease=lease)
                 except Exception as e:
                     report_diagnostic_event(
@@ -878,7 +895,9 @@ class DataSourceAzure(sources.DataSource):
            hot-attached, we can attempt to bring it up by forcing the hv_netvsc
            drivers to query the link state by unbinding and then binding the
            device. This function attempts infinitely until the link is up,
-           because we cannot proceed further until we have a stable link."""
+           because we cannot proceed further until we have a stable link.
+           Between attempts we wait on netlink for the link to come up, so
+           we proceed as soon as it does."""
 
         if self.distro.networking.try_set_link_up(ifname):
             report_diagnostic_event("The link %s is already up." % ifname,
@@ -887,34 +906,51 @@ class DataSourceAzure(sources.DataSource):
 
         LOG.info("Attempting to bring %s up", ifname)
 
+        # Listen before rebinding so that no link up event is missed
+        nl_sock = None
+        try:
+            nl_sock = netlink.create_bound_netlink_socket()
+        except netlink.NetlinkCreateSocketError as e:
+            report_diagnostic_event(
+                "Sleeping between attempts to bring %s up: %s" % (ifname, e),
+                logger_func=LOG.warning)
+
         attempts = 0
-        while True:
+        try:
+            while True:
 
-            LOG.info("Unbinding and binding the interface %s", ifname)
-            devicename = net.read_sys_net(ifname,
-                                          'device/device_id').strip('{}')
-            util.write_file('/sys/bus/vmbus/drivers/hv_netvsc/unbind',
-                            devicename)
-            util.write_file('/sys/bus/vmbus/drivers/hv_netvsc/bind',
-                            devicename)
-
-            attempts = attempts + 1
-            if self.distro.networking.try_set_link_up(ifname):
-                msg = "The link %s is up after %s attempts" % (ifname,
-                                                               attempts)
-                report_diagnostic_event(msg, logger_func=LOG.info)
-                return
-
-            sleep_duration = 1
-            msg = ("Link is not up after %d attempts with %d seconds sleep "
-                   "between attempts." % (attempts, sleep_duration))
-
-            if attempts % 10 == 0:
-                report_diagnostic_event(msg, logger_func=LOG.info)
-            else:
-                LOG.info(msg)
+                LOG.info("Unbinding and binding the interface %s", ifname)
+                devicename = net.read_sys_net(ifname,
+                                              'device/device_id').strip('{}')
+                util.write_file('/sys/bus/vmbus/drivers/hv_netvsc/unbind',
+                                devicename)
+                util.write_file('/sys/bus/vmbus/drivers/hv_netvsc/bind',
+                                devicename)
+
+                attempts = attempts + 1
+                if self.distro.networking.try_set_link_up(ifname) or (
+                        nl_sock and netlink.wait_for_link_up_event(
+                            nl_sock, ifname, LINK_UP_TIMEOUT_IN_SECONDS) and
+                        self.distro.networking.try_set_link_up(ifname)):
+                    msg = "The link %s is up after %s attempts" % (ifname,
+                                                                   attempts)
+                    report_diagnostic_event(msg, logger_func=LOG.info)
+                    return
+
+                msg = ("Link is not up after %d attempts with %d seconds "
+                       "wait between attempts." %
+                       (attempts, LINK_UP_TIMEOUT_IN_SECONDS))
+
+                if attempts % 10 == 0:
+                    report_diagnostic_event(msg, logger_func=LOG.info)
+                else:
+                    LOG.info(msg)
 
-            sleep(sleep_duration)
+                if not nl_sock:
+                    sleep(LINK_UP_TIMEOUT_IN_SECONDS)
+        finally:
+            if nl_sock:
+                nl_sock.close()
 
     @azure_ds_telemetry_reporter
     def _create_report_ready_marker(self):
@@ -940,7 +976,9 @@ class DataSourceAzure(sources.DataSource):
             report_diagnostic_event("Reporting ready before nic detach",
                                     logger_func=LOG.info)
             try:
-                with EphemeralDHCPv4WithReporting(azure_ds_reporter) as lease:
+                with EphemeralDHCPv4WithReporting(
+                        azure_ds_reporter,
+                        dhcp_client=self.ds_cfg['dhcp_client']) as lease:
                     self._report_ready(lease=lease)
             except Exception as e:
                 report_diagnostic_event("Exception reporting ready during "
@@ -981,7 +1019,8 @@ class DataSourceAzure(sources.DataSource):
                     parent=azure_ds_reporter):
                 dhcp_ctx = EphemeralDHCPv4(
                     iface=ifname,
-                    dhcp_log_func=dhcp_log_cb)
+                    dhcp_log_func=dhcp_log_cb,
+                    dhcp_client=self.ds_cfg['dhcp_client'])
                 dhcp_ctx.obtain_lease()
         except Exception as e:
             report_diagnostic_event("Giving up. Failed to obtain dhcp lease "
@@ -1026,13 +1065,18 @@ class DataSourceAzure(sources.DataSource):
         # primary nic is being attached first helps here. Otherwise each nic
         # could add several seconds of delay.
         try:
-            imds_md = self.get_imds_data_with_api_fallback(
-                ifname,
-                0,
-                metadata_type.network,
-                network_metadata_exc_cb,
-                True
-            )
+            with events.ReportEventStack(
+                    name="obtain-network-metadata",
+                    description=("obtain network metadata from IMDS using "
+                                 "%s" % ifname),
+                    parent=azure_ds_reporter):
+                imds_md = self.get_imds_data_with_api_fallback(
+                    ifname,
+                    0,
+                    metadata_type.network,
+                    network_metadata_exc_cb,
+                    True
+                )
         except Exception as e:
             LOG.warning(
                 "Failed to get network metadata using nic %s. Attempt to "
@@ -1094,7 +1138,11 @@ class DataSourceAzure(sources.DataSource):
 
                 # Attempt to bring the interface's operating state to
                 # UP in case it is not already.
-                self.wait_for_link_up(ifname)
+                with events.ReportEventStack(
+                        name="wait-for-link-up",
+                        description="wait for %s to be up" % ifname,
+                        parent=azure_ds_reporter):
+                    self.wait_for_link_up(ifname)
 
                 # If primary nic is not found, check if this is it. The
                 # platform will attach the primary nic first so we
@@ -1123,6 +1171,7 @@ class DataSourceAzure(sources.DataSource):
         """
 
         nl_sock = None
+        timings = []
         try:
             nl_sock = netlink.create_bound_netlink_socket()
 
@@ -1132,14 +1181,16 @@ class DataSourceAzure(sources.DataSource):
             # Report ready if the marker file is not already present.
             # The nic of the preprovisioned vm gets hot-detached as soon as
             # we report ready. So no need to save the dhcp context.
-            self._report_ready_if_needed()
+            with timed_phase(timings, 'report-ready'):
+                self._report_ready_if_needed()
 
             has_nic_been_detached = bool(
                 os.path.isfile(REPROVISION_NIC_DETACHED_MARKER_FILE))
 
             if not has_nic_been_detached:
                 LOG.info("NIC has not been detached yet.")
-                self._wait_for_nic_detach(nl_sock)
+                with timed_phase(timings, 'nic-detach'):
+                    self._wait_for_nic_detach(nl_sock)
 
             # If we know that the preprovisioned nic has been detached, and we
             # still have a fallback nic, then it means the VM must have
@@ -1147,7 +1198,8 @@ class DataSourceAzure(sources.DataSource):
             # already been attached by the Azure platform. So there is no need
             # to wait for nics to be hot-attached.
             if not self.fallback_interface:
-                self._wait_for_hot_attached_nics(nl_sock)
+                with timed_phase(timings, 'nic-attach'):
+                    self._wait_for_hot_attached_nics(nl_sock)
             else:
                 report_diagnostic_event("Skipping waiting for nic attach "
                                         "because we already have a fallback "
@@ -1161,6 +1213,11 @@ class DataSourceAzure(sources.DataSource):
         finally:
             if nl_sock:
                 nl_sock.close()
+            if timings:
+                report_diagnostic_event(
+                    "Time spent waiting for nics: %s" % ', '.join(
+                        '%s %.3fs' % timing for timing in timings),
+                    logger_func=LOG.info)
 
     @azure_ds_telemetry_reporter
     def _poll_imds(self):
@@ -1234,7 +1291,8 @@ class DataSourceAzure(sources.DataSource):
                             description="obtain dhcp lease",
                             parent=azure_ds_reporter):
                         self._ephemeral_dhcp_ctx = EphemeralDHCPv4(
-                            dhcp_log_func=dhcp_log_cb)
+                            dhcp_log_func=dhcp_log_cb,
+                            dhcp_client=self.ds_cfg['dhcp_client'])
                         lease = self._ephemeral_dhcp_ctx.obtain_lease()
 
                 if vnet_switched:
@@ -1337,7 +1395,9 @@ class DataSourceAzure(sources.DataSource):
             report_diagnostic_event(
                 'Using new ephemeral dhcp to report failure to Azure',
                 logger_func=LOG.debug)
-            with EphemeralDHCPv4WithReporting(azure_ds_reporter) as lease:
+            with EphemeralDHCPv4WithReporting(
+                    azure_ds_reporter,
+                    dhcp_client=self.ds_cfg['dhcp_client']) as lease:
                 report_failure_to_fabric(
                     dhcp_opts=lease[unknown_245_key],
                     description=description)
@@ -1489,7 +1549,8 @@ class DataSourceAzure(sources.DataSource):
     @azure_ds_telemetry_reporter
     def activate(self, cfg, is_new_instance):
         try:
-            address_ephemeral_resize(is_new_instance=is_new_instance,
+            address_ephemeral_resize(self.paths,
+                                     is_new_instance=is_new_instance,
                                      preserve_ntfs=self.ds_cfg.get(
                                          DS_CFG_KEY_PRESERVE_NTFS, False))
         finally:
@@ -1674,7 +1735,7 @@ def can_dev_be_reformatted(devpath, preserve_ntfs):
 
 
 @azure_ds_telemetry_reporter
-def address_ephemeral_resize(devpath=RESOURCE_DISK_PATH,
+def address_ephemeral_resize(paths, devpath=RESOURCE_DISK_PATH,
                              is_new_instance=False, preserve_ntfs=False):
     if not os.path.exists(devpath):
         report_diagnostic_event(
@@ -1697,18 +1758,18 @@ def address_ephemeral_resize(devpath=RESOURCE_DISK_PATH,
     if not result:
         return
 
+    sempath = paths.get_ipath_cur('sem')
+    sems = helpers.get_semaphores(paths, sempath)
     for mod in ['disk_setup', 'mounts']:
-        sempath = '/var/lib/cloud/instance/sem/config_' + mod
-        bmsg = 'Marker "%s" for module "%s"' % (sempath, mod)
-        if os.path.exists(sempath):
-            try:
-                os.unlink(sempath)
-                LOG.debug('%s removed.', bmsg)
-            except Exception as e:
-                # python3 throws FileNotFoundError, python2 throws OSError
-                LOG.warning('%s: remove failed! (%s)', bmsg, e)
-        else:
+        name = 'config_' + mod
+        bmsg = 'Marker "%s" in "%s" for module "%s"' % (name, sempath, mod)
+        if not sems.has_run(name, PER_INSTANCE):
             LOG.debug('%s did not exist.', bmsg)
+        elif sems.clear(name, PER_INSTANCE):
+            LOG.debug('%s removed.', bmsg)
+        else:
+            LOG.warning('%s: remove failed!', bmsg)
+    sems.flush()
     return
 
 
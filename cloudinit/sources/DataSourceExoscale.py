@@ -52,9 +52,10 @@ class DataSourceExoscale(sources.DataSource):
         # TODO(Create util functions for overriding merged sys_cfg module freq)
         mod = 'set_passwords'
         sem_path = self.paths.get_ipath_cur('sem')
-        sem_helper = helpers.FileSemaphores(sem_path)
+        sem_helper = helpers.get_semaphores(self.paths, sem_path)
         if sem_helper.clear('config_' + mod, None):
             LOG.debug('Overriding module set-passwords with frequency always')
+        sem_helper.flush()
 
     def wait_for_metadata_service(self):
         """Wait for the metadata service to be reachable."""
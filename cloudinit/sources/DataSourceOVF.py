@@ -11,10 +11,10 @@
 import base64
 import os
 import re
-import time
 from xml.dom import minidom
 
 from cloudinit import dmi
+from cloudinit import file_watch
 from cloudinit import log as logging
 from cloudinit import safeyaml
 from cloudinit import sources
@@ -439,15 +439,15 @@ def get_max_wait_from_cfg(cfg):
 
 def wait_for_imc_cfg_file(filename, maxwait=180, naplen=5,
                           dirpath="/var/run/vmware-imc"):
-    waited = 0
-
-    while waited < maxwait:
-        fileFullPath = os.path.join(dirpath, filename)
-        if os.path.isfile(fileFullPath):
-            return fileFullPath
-        LOG.debug("Waiting for VMware Customization Config File")
-        time.sleep(naplen)
-        waited += naplen
+    fileFullPath = os.path.join(dirpath, filename)
+    if os.path.isfile(fileFullPath):
+        return fileFullPath
+    LOG.debug("Waiting for VMware Customization Config File")
+    # Woken as soon as the file appears, naplen only applies without inotify
+    if file_watch.wait_for(
+            lambda: os.path.isfile(fileFullPath), [fileFullPath], maxwait,
+            naplen=naplen):
+        return fileFullPath
     return None
 
 
@@ -19,6 +19,7 @@ from cloudinit import dmi
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import net
+from cloudinit import profiling
 from cloudinit import type_utils
 from cloudinit import user_data as ud
 from cloudinit import util
@@ -301,7 +302,8 @@ class DataSource(CloudInitPickleMixin, metaclass=abc.ABCMeta):
         Minimally, the datasource should return a boolean True on success.
         """
         self._dirty_cache = True
-        return_value = self._get_data()
+        return_value = profiling.profiled(
+            'datasource-%s' % type_utils.obj_name(self), self._get_data)()
         if not return_value:
             return return_value
         self.persist_instance_data()
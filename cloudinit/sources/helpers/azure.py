@@ -1094,10 +1094,10 @@ def dhcp_log_cb(out, err):
 
 
 class EphemeralDHCPv4WithReporting:
-    def __init__(self, reporter, nic=None):
+    def __init__(self, reporter, nic=None, dhcp_client=None):
         self.reporter = reporter
         self.ephemeralDHCPv4 = EphemeralDHCPv4(
-            iface=nic, dhcp_log_func=dhcp_log_cb)
+            iface=nic, dhcp_log_func=dhcp_log_cb, dhcp_client=dhcp_client)
 
     def __enter__(self):
         with events.ReportEventStack(
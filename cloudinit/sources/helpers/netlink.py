@@ -10,6 +10,7 @@ import os
 import select
 import socket
 import struct
+import time
 
 LOG = logging.getLogger(__name__)
 
@@ -22,22 +23,73 @@ RTM_NEWLINK = 16
 RTM_DELLINK = 17
 RTM_GETLINK = 18
 RTM_SETLINK = 19
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
 MAX_SIZE = 65535
 RTA_DATA_OFFSET = 32
 MSG_TYPE_OFFSET = 16
 SELECT_TIMEOUT = 60
 
+DUMP_TIMEOUT = 5
+
 NLMSGHDR_FMT = "IHHII"
 IFINFOMSG_FMT = "BHiII"
+IFADDRMSG_FMT = "BBBBI"
+RTMSG_FMT = "BBBBBBBBI"
+RTATTR_FMT = "HH"
+RTA_CACHEINFO_FMT = "IIiIIIII"
 NLMSGHDR_SIZE = struct.calcsize(NLMSGHDR_FMT)
 IFINFOMSG_SIZE = struct.calcsize(IFINFOMSG_FMT)
+IFADDRMSG_SIZE = struct.calcsize(IFADDRMSG_FMT)
+RTMSG_SIZE = struct.calcsize(RTMSG_FMT)
 RTATTR_START_OFFSET = NLMSGHDR_SIZE + IFINFOMSG_SIZE
 RTA_DATA_START_OFFSET = 4
 PAD_ALIGNMENT = 4
 
+IFLA_ADDRESS = 1
 IFLA_IFNAME = 3
 IFLA_OPERSTATE = 16
 
+# http://man7.org/linux/man-pages/man7/rtnetlink.7.html
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+IFA_FLAGS = 8
+IFA_F_PERMANENT = 0x80
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_PREFSRC = 7
+RTA_CACHEINFO = 12
+RTA_TABLE = 15
+RT_TABLE_MAIN = 254
+RTN_UNICAST = 1
+RTPROT_BOOT = 3
+
+# Scope names as printed by iproute2
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_NOWHERE = 255
+RT_SCOPE_NAMES = {
+    RT_SCOPE_UNIVERSE: 'global', 200: 'site', RT_SCOPE_LINK: 'link',
+    254: 'host', RT_SCOPE_NOWHERE: 'nowhere'}
+
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+ARPHRD_ETHER = 1
+
 # https://www.kernel.org/doc/Documentation/networking/operstates.txt
 OPER_UNKNOWN = 0
 OPER_NOTPRESENT = 1
@@ -51,17 +103,34 @@ RTAAttr = namedtuple('RTAAttr', ['length', 'rta_type', 'data'])
 InterfaceOperstate = namedtuple('InterfaceOperstate', ['ifname', 'operstate'])
 NetlinkHeader = namedtuple('NetlinkHeader', ['length', 'type', 'flags', 'seq',
                                              'pid'])
+Link = namedtuple('Link', ['index', 'name', 'flags', 'type', 'address'])
+Address = namedtuple('Address', ['family', 'index', 'prefixlen', 'flags',
+                                 'scope', 'address', 'local', 'broadcast',
+                                 'label'])
+Route = namedtuple('Route', ['family', 'table', 'type', 'dst', 'dst_len',
+                             'gateway', 'oif', 'priority', 'expires'])
+NetlinkRequest = namedtuple('NetlinkRequest', ['type', 'flags', 'payload'])
 
 
 class NetlinkCreateSocketError(RuntimeError):
     '''Raised if netlink socket fails during create or bind.'''
 
 
+class NetlinkDumpError(RuntimeError):
+    '''Raised if a netlink dump request fails or returns an error.'''
+
+
+class NetlinkRequestError(RuntimeError):
+    '''Raised if netlink requests can not be sent or acknowledged.'''
+
+
 def create_bound_netlink_socket():
     '''Creates netlink socket and bind on netlink group to catch interface
     down/up events. The socket will bound only on RTMGRP_LINK (which only
     includes RTM_NEWLINK/RTM_DELLINK/RTM_GETLINK events). The socket is set to
-    non-blocking mode since we're only receiving messages.
+    non-blocking mode since we're only receiving messages. The kernel assigns
+    the port id so that several sockets may listen at once, each receiving
+    every event.
 
     :returns: netlink socket in non-blocking mode
     :raises: NetlinkCreateSocketError
@@ -70,7 +139,7 @@ def create_bound_netlink_socket():
         netlink_socket = socket.socket(socket.AF_NETLINK,
                                        socket.SOCK_RAW,
                                        socket.NETLINK_ROUTE)
-        netlink_socket.bind((os.getpid(), RTMGRP_LINK))
+        netlink_socket.bind((0, RTMGRP_LINK))
         netlink_socket.setblocking(0)
     except socket.error as e:
         msg = "Exception during netlink socket create: %s" % e
@@ -263,11 +332,29 @@ def wait_for_media_disconnect_connect(netlink_socket, ifname):
                           should_continue_cb)
 
 
+def wait_for_link_up_event(netlink_socket, ifname, timeout):
+    '''Block until the operational state of an interface becomes up.
+
+    :param: netlink_socket: netlink_socket to receive events.
+    :param: ifname: Interface name to lookout for netlink events.
+    :param: timeout: Seconds to wait at most.
+    :returns: True if the interface came up within timeout, False otherwise.
+    '''
+    LOG.debug("Wait up to %s seconds for %s to come up", timeout, ifname)
+    return read_netlink_messages(netlink_socket,
+                                 ifname,
+                                 [RTM_NEWLINK],
+                                 [OPER_UP],
+                                 lambda iname, carrier, prevCarrier: False,
+                                 timeout=timeout)
+
+
 def read_netlink_messages(netlink_socket,
                           ifname_filter,
                           rtm_types,
                           operstates,
-                          should_continue_callback):
+                          should_continue_callback,
+                          timeout=None):
     ''' Reads from the netlink socket until the condition specified by
     the continuation callback is met.
 
@@ -276,14 +363,24 @@ def read_netlink_messages(netlink_socket,
     :param: rtm_types: Type of netlink events to listen for.
     :param: operstates: Operational states to listen.
     :param: should_continue_callback: Specifies when to stop listening.
+    :param: timeout: if not None, seconds after which to stop listening.
+    :returns: True when the callback stopped listening, False on timeout.
     '''
     if netlink_socket is None:
         raise RuntimeError("Netlink socket is none")
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
     data = bytes()
     carrier = OPER_UP
     prevCarrier = OPER_UP
     while True:
-        recv_data = read_netlink_socket(netlink_socket, SELECT_TIMEOUT)
+        select_timeout = SELECT_TIMEOUT
+        if deadline is not None:
+            select_timeout = deadline - time.monotonic()
+            if select_timeout <= 0:
+                return False
+        recv_data = read_netlink_socket(netlink_socket, select_timeout)
         if recv_data is None:
             continue
         LOG.debug('read %d bytes from socket', len(recv_data))
@@ -323,7 +420,291 @@ def read_netlink_messages(netlink_socket,
             if not should_continue_callback(interface_state.ifname,
                                             carrier,
                                             prevCarrier):
-                return
+                return True
         data = data[offset:]
 
+
+def unpack_rta_attrs(data, offset):
+    '''Unpack all rta attributes following a message specific header.
+
+    :param: data: a single netlink message, without the netlink header
+    :param: offset: offset of the first attribute in data
+    :returns: dict of attribute data keyed by attribute type. Later
+              attributes of the same type replace earlier ones.
+    '''
+    attrs = {}
+    while offset + RTA_DATA_START_OFFSET <= len(data):
+        length, rta_type = struct.unpack_from(RTATTR_FMT, data, offset)
+        if length < RTA_DATA_START_OFFSET:
+            break
+        attrs[rta_type] = data[offset + RTA_DATA_START_OFFSET:offset + length]
+        offset += (length + PAD_ALIGNMENT - 1) & ~(PAD_ALIGNMENT - 1)
+    return attrs
+
+
+def _create_rtnetlink_socket():
+    try:
+        return socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                             socket.NETLINK_ROUTE)
+    except (AttributeError, socket.error) as e:
+        # AttributeError: AF_NETLINK only exists on Linux
+        msg = "Exception during netlink socket create: %s" % e
+        raise NetlinkCreateSocketError(msg) from e
+
+
+def dump_rtnetlink(msg_type, header):
+    '''Send a rtnetlink dump request and collect all replies.
+
+    :param: msg_type: RTM_GET* request type
+    :param: header: packed message specific header (ifinfomsg, ifaddrmsg or
+            rtmsg) selecting what to dump
+    :returns: list of (message type, message) tuples where message excludes
+              the netlink header
+    :raises: NetlinkCreateSocketError if the socket can not be created
+    :raises: NetlinkDumpError if the request fails or times out
+    '''
+    netlink_socket = _create_rtnetlink_socket()
+    seq = 1
+    request = struct.pack(NLMSGHDR_FMT, NLMSGHDR_SIZE + len(header), msg_type,
+                          NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + header
+    messages = []
+    with netlink_socket:
+        try:
+            netlink_socket.settimeout(DUMP_TIMEOUT)
+            netlink_socket.sendto(request, (0, 0))
+            while True:
+                data = netlink_socket.recv(MAX_SIZE)
+                if not data:
+                    raise NetlinkDumpError("netlink dump ended early")
+                offset = 0
+                while offset + NLMSGHDR_SIZE <= len(data):
+                    nlheader = NetlinkHeader(*struct.unpack_from(
+                        NLMSGHDR_FMT, data, offset))
+                    if nlheader.length < NLMSGHDR_SIZE:
+                        raise NetlinkDumpError(
+                            "Invalid netlink message length %d" %
+                            nlheader.length)
+                    msg = data[offset + NLMSGHDR_SIZE:offset + nlheader.length]
+                    offset += ((nlheader.length + PAD_ALIGNMENT - 1) &
+                               ~(PAD_ALIGNMENT - 1))
+                    if nlheader.seq != seq:
+                        continue
+                    if nlheader.type == NLMSG_DONE:
+                        return messages
+                    if nlheader.type == NLMSG_ERROR:
+                        error = struct.unpack_from("i", msg)[0]
+                        if error:
+                            raise NetlinkDumpError(
+                                "netlink dump failed: %s" %
+                                os.strerror(-error))
+                        continue
+                    messages.append((nlheader.type, msg))
+        except (socket.error, struct.error) as e:
+            raise NetlinkDumpError("netlink dump failed: %s" % e) from e
+
+
+def _ntop(family, attrs, attr):
+    if attr not in attrs:
+        return None
+    return socket.inet_ntop(family, attrs[attr])
+
+
+def get_links():
+    '''Dump all network links.
+
+    :returns: list of Link, hardware addresses as colon separated hex
+    '''
+    links = []
+    header = struct.pack(IFINFOMSG_FMT, socket.AF_UNSPEC, 0, 0, 0, 0)
+    for msg_type, msg in dump_rtnetlink(RTM_GETLINK, header):
+        if msg_type != RTM_NEWLINK:
+            continue
+        _family, link_type, index, flags, _change = struct.unpack_from(
+            IFINFOMSG_FMT, msg)
+        attrs = unpack_rta_attrs(msg, IFINFOMSG_SIZE)
+        name = util.decode_binary(attrs.get(IFLA_IFNAME, b''), 'utf-8')
+        address = ':'.join('%02x' % b for b in attrs.get(IFLA_ADDRESS, b''))
+        links.append(
+            Link(index, name.strip('\0'), flags, link_type, address))
+    return links
+
+
+def get_addresses(family=socket.AF_UNSPEC):
+    '''Dump all addresses of the given family.
+
+    :returns: list of Address, ip addresses in their text form
+    '''
+    addresses = []
+    header = struct.pack(IFADDRMSG_FMT, family, 0, 0, 0, 0)
+    for msg_type, msg in dump_rtnetlink(RTM_GETADDR, header):
+        if msg_type != RTM_NEWADDR:
+            continue
+        addr_family, prefixlen, flags, scope, index = struct.unpack_from(
+            IFADDRMSG_FMT, msg)
+        if addr_family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+        attrs = unpack_rta_attrs(msg, IFADDRMSG_SIZE)
+        if IFA_FLAGS in attrs:
+            # 32 bit flags superseding the 8 bit ones of the header
+            flags = struct.unpack("I", attrs[IFA_FLAGS])[0]
+        label = attrs.get(IFA_LABEL)
+        if label is not None:
+            label = util.decode_binary(label, 'utf-8').strip('\0')
+        addresses.append(Address(
+            addr_family, index, prefixlen, flags, scope,
+            _ntop(addr_family, attrs, IFA_ADDRESS),
+            _ntop(addr_family, attrs, IFA_LOCAL),
+            _ntop(addr_family, attrs, IFA_BROADCAST), label))
+    return addresses
+
+
+def get_routes(family):
+    '''Dump the routes of all tables for family (AF_INET or AF_INET6).
+
+    :returns: list of Route. dst is None for default routes and expires is
+              True for routes which expire.
+    '''
+    routes = []
+    header = struct.pack(RTMSG_FMT, family, 0, 0, 0, 0, 0, 0, 0, 0)
+    for msg_type, msg in dump_rtnetlink(RTM_GETROUTE, header):
+        if msg_type != RTM_NEWROUTE:
+            continue
+        (route_family, dst_len, _src_len, _tos, table, _protocol, _scope,
+         route_type, _flags) = struct.unpack_from(RTMSG_FMT, msg)
+        attrs = unpack_rta_attrs(msg, RTMSG_SIZE)
+        if RTA_TABLE in attrs:
+            table = struct.unpack("I", attrs[RTA_TABLE])[0]
+        oif = priority = None
+        if RTA_OIF in attrs:
+            oif = struct.unpack("I", attrs[RTA_OIF])[0]
+        if RTA_PRIORITY in attrs:
+            priority = struct.unpack("I", attrs[RTA_PRIORITY])[0]
+        expires = False
+        if len(attrs.get(RTA_CACHEINFO, b'')) >= struct.calcsize(
+                RTA_CACHEINFO_FMT):
+            expires = bool(struct.unpack_from(
+                RTA_CACHEINFO_FMT, attrs[RTA_CACHEINFO])[2])
+        routes.append(Route(
+            route_family, table, route_type,
+            _ntop(route_family, attrs, RTA_DST), dst_len,
+            _ntop(route_family, attrs, RTA_GATEWAY), oif, priority, expires))
+    return routes
+
+
+def pack_rta_attr(rta_type, data):
+    '''Pack a single, padded, rta attribute.'''
+    length = RTA_DATA_START_OFFSET + len(data)
+    padding = -length % PAD_ALIGNMENT
+    return struct.pack(RTATTR_FMT, length, rta_type) + data + b'\0' * padding
+
+
+def send_rtnetlink_requests(requests):
+    '''Send rtnetlink requests in a single datagram and wait for their acks.
+
+    The kernel handles the requests in order and keeps going when one of
+    them fails.
+
+    :param: requests: list of NetlinkRequest
+    :returns: list of errno values, 0 for successful requests, in the order
+              of requests
+    :raises: NetlinkCreateSocketError if the socket can not be created
+    :raises: NetlinkRequestError if sending or reading the acks fails
+    '''
+    if not requests:
+        return []
+    netlink_socket = _create_rtnetlink_socket()
+    data = b''
+    for seq, request in enumerate(requests, 1):
+        data += struct.pack(
+            NLMSGHDR_FMT, NLMSGHDR_SIZE + len(request.payload), request.type,
+            request.flags | NLM_F_REQUEST | NLM_F_ACK, seq, 0)
+        data += request.payload
+    errors = [None] * len(requests)
+    with netlink_socket:
+        try:
+            netlink_socket.settimeout(DUMP_TIMEOUT)
+            netlink_socket.sendto(data, (0, 0))
+            while None in errors:
+                data = netlink_socket.recv(MAX_SIZE)
+                if not data:
+                    raise NetlinkRequestError("netlink socket closed early")
+                offset = 0
+                while offset + NLMSGHDR_SIZE <= len(data):
+                    nlheader = NetlinkHeader(*struct.unpack_from(
+                        NLMSGHDR_FMT, data, offset))
+                    if nlheader.length < NLMSGHDR_SIZE:
+                        raise NetlinkRequestError(
+                            "Invalid netlink message length %d" %
+                            nlheader.length)
+                    if (nlheader.type == NLMSG_ERROR and
+                            0 < nlheader.seq <= len(requests)):
+                        errors[nlheader.seq - 1] = -struct.unpack_from(
+                            "i", data, offset + NLMSGHDR_SIZE)[0]
+                    offset += ((nlheader.length + PAD_ALIGNMENT - 1) &
+                               ~(PAD_ALIGNMENT - 1))
+        except (socket.error, struct.error) as e:
+            raise NetlinkRequestError(
+                "netlink request failed: %s" % e) from e
+    return errors
+
+
+def address_request(msg_type, index, address, prefixlen, broadcast=None):
+    '''Return a NetlinkRequest adding or deleting an IPv4 address.
+
+    :param: msg_type: RTM_NEWADDR or RTM_DELADDR
+    '''
+    flags = NLM_F_CREATE | NLM_F_EXCL if msg_type == RTM_NEWADDR else 0
+    payload = struct.pack(IFADDRMSG_FMT, socket.AF_INET, prefixlen, 0,
+                          RT_SCOPE_UNIVERSE, index)
+    packed = socket.inet_aton(address)
+    payload += pack_rta_attr(IFA_LOCAL, packed)
+    payload += pack_rta_attr(IFA_ADDRESS, packed)
+    if broadcast:
+        payload += pack_rta_attr(IFA_BROADCAST, socket.inet_aton(broadcast))
+    return NetlinkRequest(msg_type, flags, payload)
+
+
+def link_request(index, up):
+    '''Return a NetlinkRequest setting the link with index up or down.'''
+    payload = struct.pack(IFINFOMSG_FMT, socket.AF_UNSPEC, 0, index,
+                          IFF_UP if up else 0, IFF_UP)
+    return NetlinkRequest(RTM_NEWLINK, 0, payload)
+
+
+def rename_request(index, name):
+    '''Return a NetlinkRequest renaming the link with index to name.'''
+    payload = struct.pack(IFINFOMSG_FMT, socket.AF_UNSPEC, 0, index, 0, 0)
+    payload += pack_rta_attr(IFLA_IFNAME, name.encode('utf-8') + b'\0')
+    return NetlinkRequest(RTM_NEWLINK, 0, payload)
+
+
+def route_request(msg_type, index, dst, dst_len, gateway=None,
+                  prefsrc=None):
+    '''Return a NetlinkRequest adding or deleting an IPv4 route.
+
+    Routes without gateway are link scoped, as with "ip route add".
+
+    :param: msg_type: RTM_NEWROUTE or RTM_DELROUTE
+    :param: dst: destination network address, ignored when dst_len is 0
+    '''
+    if msg_type == RTM_NEWROUTE:
+        flags = NLM_F_CREATE | NLM_F_EXCL
+        protocol = RTPROT_BOOT
+        scope = RT_SCOPE_UNIVERSE if gateway else RT_SCOPE_LINK
+        route_type = RTN_UNICAST
+    else:
+        # Like iproute2, match routes of any protocol, scope and type
+        flags = protocol = route_type = 0
+        scope = RT_SCOPE_NOWHERE
+    payload = struct.pack(RTMSG_FMT, socket.AF_INET, dst_len, 0, 0,
+                          RT_TABLE_MAIN, protocol, scope, route_type, 0)
+    if dst_len:
+        payload += pack_rta_attr(RTA_DST, socket.inet_aton(dst))
+    if gateway:
+        payload += pack_rta_attr(RTA_GATEWAY, socket.inet_aton(gateway))
+    if prefsrc:
+        payload += pack_rta_attr(RTA_PREFSRC, socket.inet_aton(prefsrc))
+    payload += pack_rta_attr(RTA_OIF, struct.pack("I", index))
+    return NetlinkRequest(msg_type, flags, payload)
+
 # vi: ts=4 expandtab
@@ -7,12 +7,18 @@ import socket
 import struct
 import codecs
 from cloudinit.sources.helpers.netlink import (
-    NetlinkCreateSocketError, create_bound_netlink_socket, read_netlink_socket,
+    NetlinkCreateSocketError, NetlinkDumpError, NetlinkRequestError,
+    address_request, create_bound_netlink_socket, get_addresses, get_links,
+    get_routes, link_request, rename_request, route_request,
+    read_netlink_socket, send_rtnetlink_requests,
     read_rta_oper_state, unpack_rta_attr, wait_for_media_disconnect_connect,
-    wait_for_nic_attach_event, wait_for_nic_detach_event,
-    OPER_DOWN, OPER_UP, OPER_DORMANT, OPER_LOWERLAYERDOWN, OPER_NOTPRESENT,
-    OPER_TESTING, OPER_UNKNOWN, RTATTR_START_OFFSET, RTM_NEWLINK, RTM_DELLINK,
-    RTM_SETLINK, RTM_GETLINK, MAX_SIZE)
+    wait_for_link_up_event, wait_for_nic_attach_event,
+    wait_for_nic_detach_event, Address, Link,
+    Route, OPER_DOWN, OPER_UP, OPER_DORMANT, OPER_LOWERLAYERDOWN,
+    OPER_NOTPRESENT, OPER_TESTING, OPER_UNKNOWN, RTATTR_START_OFFSET,
+    RTM_NEWLINK, RTM_DELLINK, RTM_SETLINK, RTM_GETLINK, RTM_NEWADDR,
+    RTM_NEWROUTE, RTM_DELROUTE, MAX_SIZE, NLMSG_DONE, NLMSG_ERROR, IFF_UP,
+    IFA_F_PERMANENT)
 
 
 def int_to_bytes(i):
@@ -36,6 +42,12 @@ class TestCreateBoundNetlinkSocket(CiTestCase):
             'Exception during netlink socket create: Fake socket failure',
             str(ctx_mgr.exception))
 
+    @mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
+    def test_kernel_assigns_port_id(self, m_socket):
+        '''Several sockets may be bound at once to receive link events.'''
+        create_bound_netlink_socket()
+        m_socket.return_value.bind.assert_called_once_with((0, 1))
+
 
 class TestReadNetlinkSocket(CiTestCase):
 
@@ -202,6 +214,26 @@ class TestNicAttachDetach(CiTestCase):
         self.assertEqual(m_read_netlink_socket.call_count, 1)
         self.assertEqual(ifname, ifread)
 
+    def test_link_up_event(self, m_read_netlink_socket, m_socket):
+        '''Only the interface of interest coming up ends the wait.'''
+        m_read_netlink_socket.side_effect = [
+            self._media_switch_data("eth1", RTM_NEWLINK, OPER_UP),
+            self._media_switch_data("eth0", RTM_NEWLINK, OPER_DOWN),
+            self._media_switch_data("eth0", RTM_NEWLINK, OPER_UP)]
+        self.assertTrue(wait_for_link_up_event(m_socket, "eth0", 1))
+        self.assertEqual(m_read_netlink_socket.call_count, 3)
+
+    @mock.patch('cloudinit.sources.helpers.netlink.time.monotonic')
+    def test_link_up_event_times_out(self, m_monotonic, m_read_netlink_socket,
+                                     m_socket):
+        '''Reads wait for the remaining time only and stop at the deadline.'''
+        m_monotonic.side_effect = [10, 10, 10.75, 11]
+        m_read_netlink_socket.return_value = None
+        self.assertFalse(wait_for_link_up_event(m_socket, "eth0", 1))
+        self.assertEqual(
+            [mock.call(m_socket, 1), mock.call(m_socket, 0.25)],
+            m_read_netlink_socket.call_args_list)
+
 
 @mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
 @mock.patch('cloudinit.sources.helpers.netlink.read_netlink_socket')
@@ -478,3 +510,198 @@ class TestWaitForMediaDisconnectConnect(CiTestCase):
         m_read_netlink_socket.side_effect = [data1, data2]
         wait_for_media_disconnect_connect(m_socket, ifname)
         self.assertEqual(m_read_netlink_socket.call_count, 2)
+
+
+def rtattr(rta_type, data):
+    '''Pack a 4-byte aligned rtattr'''
+    attr = struct.pack("HH", 4 + len(data), rta_type) + data
+    return attr + b'\0' * (-len(attr) % 4)
+
+
+def nlmsg(msg_type, payload, seq=1):
+    '''Pack a netlink message'''
+    return struct.pack("IHHII", 16 + len(payload), msg_type, 2, seq, 0) + (
+        payload)
+
+
+DONE = nlmsg(NLMSG_DONE, struct.pack("i", 0))
+
+
+@mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
+class TestDumpRtnetlink(CiTestCase):
+
+    def _replies(self, m_socket, *replies):
+        m_sock = m_socket.return_value
+        m_sock.recv.side_effect = list(replies)
+        return m_sock
+
+    def test_get_links(self, m_socket):
+        '''get_links parses names, flags and hardware addresses'''
+        link = struct.pack("BHiII", 0, 1, 2, IFF_UP, 0) + rtattr(
+            3, b"eth0\0") + rtattr(1, b"\x00\x16\x3e\xde\x51\xa6")
+        m_sock = self._replies(m_socket, nlmsg(RTM_NEWLINK, link), DONE)
+        self.assertEqual(
+            [Link(2, 'eth0', IFF_UP, 1, '00:16:3e:de:51:a6')], get_links())
+        request = m_sock.sendto.call_args[0][0]
+        self.assertEqual(
+            (32, RTM_GETLINK, 0x301), struct.unpack_from("IHH", request))
+
+    def test_get_addresses(self, m_socket):
+        '''get_addresses returns text addresses, ignoring other seqs'''
+        addr4 = struct.pack("BBBBI", socket.AF_INET, 24, IFA_F_PERMANENT, 0,
+                            2) + (
+            rtattr(1, socket.inet_aton('10.0.0.5')) +
+            rtattr(2, socket.inet_aton('10.0.0.5')) +
+            rtattr(4, socket.inet_aton('10.0.0.255')) +
+            rtattr(3, b"eth0\0"))
+        addr6 = struct.pack("BBBBI", socket.AF_INET6, 64, 0, 253, 2) + (
+            rtattr(1, socket.inet_pton(socket.AF_INET6, 'fe80::1')) +
+            rtattr(8, struct.pack("I", IFA_F_PERMANENT | 0x100)))
+        self._replies(
+            m_socket,
+            nlmsg(RTM_NEWADDR, addr4) + nlmsg(RTM_NEWADDR, addr6, seq=7),
+            nlmsg(RTM_NEWADDR, addr6) + DONE)
+        self.assertEqual(
+            [Address(socket.AF_INET, 2, 24, IFA_F_PERMANENT, 0, '10.0.0.5',
+                     '10.0.0.5', '10.0.0.255', 'eth0'),
+             Address(socket.AF_INET6, 2, 64, IFA_F_PERMANENT | 0x100, 253,
+                     'fe80::1', None, None, None)],
+            get_addresses())
+
+    def test_get_routes(self, m_socket):
+        '''get_routes reads destination, gateway, device and metric'''
+        default = struct.pack(
+            "BBBBBBBBI", socket.AF_INET, 0, 0, 0, 254, 4, 0, 1, 0) + (
+            rtattr(5, socket.inet_aton('10.0.0.1')) +
+            rtattr(4, struct.pack("I", 2)) +
+            rtattr(6, struct.pack("I", 100)))
+        subnet = struct.pack(
+            "BBBBBBBBI", socket.AF_INET, 24, 0, 0, 254, 2, 253, 1, 0) + (
+            rtattr(1, socket.inet_aton('10.0.0.0')) +
+            rtattr(4, struct.pack("I", 2)) +
+            rtattr(12, struct.pack("IIiIIIII", 0, 0, 300, 0, 0, 0, 0, 0)))
+        self._replies(
+            m_socket,
+            nlmsg(RTM_NEWROUTE, default) + nlmsg(RTM_NEWROUTE, subnet) + DONE)
+        self.assertEqual(
+            [Route(socket.AF_INET, 254, 1, None, 0, '10.0.0.1', 2, 100,
+                   False),
+             Route(socket.AF_INET, 254, 1, '10.0.0.0', 24, None, 2, None,
+                   True)],
+            get_routes(socket.AF_INET))
+
+    def test_error_reply_raises(self, m_socket):
+        '''A NLMSG_ERROR reply raises NetlinkDumpError'''
+        self._replies(m_socket, nlmsg(NLMSG_ERROR, struct.pack("i", -1)))
+        with self.assertRaises(NetlinkDumpError) as context_manager:
+            get_links()
+        self.assertIn(
+            'Operation not permitted', str(context_manager.exception))
+
+    def test_timeout_raises(self, m_socket):
+        '''A socket timeout raises NetlinkDumpError'''
+        self._replies(m_socket, socket.timeout('timed out'))
+        with self.assertRaises(NetlinkDumpError):
+            get_links()
+
+    def test_socket_error_on_create(self, m_socket):
+        '''Failing to create the socket raises NetlinkCreateSocketError'''
+        m_socket.side_effect = socket.error("Fake socket failure")
+        with self.assertRaises(NetlinkCreateSocketError):
+            get_links()
+
+
+def ack(seq, error=0):
+    '''Pack the NLMSG_ERROR reply acknowledging request seq'''
+    return nlmsg(NLMSG_ERROR, struct.pack("i", error) + b'\0' * 16, seq=seq)
+
+
+@mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
+class TestSendRtnetlinkRequests(CiTestCase):
+    '''Tests of the real send_rtnetlink_requests, imported before the
+    autouse conftest fixture replaces it in the netlink module.'''
+
+    def test_requests_are_sent_in_one_datagram(self, m_socket):
+        '''All requests are sent at once and their errnos returned'''
+        m_sock = m_socket.return_value
+        m_sock.recv.side_effect = [ack(1) + ack(2, -17), ack(3)]
+        requests = [
+            link_request(2, True),
+            route_request(RTM_NEWROUTE, 2, '10.0.0.0', 24),
+            route_request(RTM_NEWROUTE, 2, '0.0.0.0', 0, '10.0.0.1')]
+        self.assertEqual([0, 17, 0], send_rtnetlink_requests(requests))
+        self.assertEqual(1, m_sock.sendto.call_count)
+        data = m_sock.sendto.call_args[0][0]
+        offset = 0
+        for seq, request in enumerate(requests, 1):
+            length, msg_type, flags, msg_seq, _pid = struct.unpack_from(
+                "IHHII", data, offset)
+            self.assertEqual(
+                (request.type, request.flags | 0x5, seq),
+                (msg_type, flags, msg_seq))
+            self.assertEqual(request.payload,
+                             data[offset + 16:offset + length])
+            offset += length
+        self.assertEqual(len(data), offset)
+
+    def test_no_requests_opens_no_socket(self, m_socket):
+        self.assertEqual([], send_rtnetlink_requests([]))
+        self.assertEqual(0, m_socket.call_count)
+
+    def test_timeout_raises(self, m_socket):
+        '''Missing acks raise NetlinkRequestError'''
+        m_socket.return_value.recv.side_effect = [
+            ack(1), socket.timeout('timed out')]
+        with self.assertRaises(NetlinkRequestError):
+            send_rtnetlink_requests(
+                [link_request(2, True), link_request(3, True)])
+
+    def test_socket_error_on_create(self, m_socket):
+        m_socket.side_effect = socket.error("Fake socket failure")
+        with self.assertRaises(NetlinkCreateSocketError):
+            send_rtnetlink_requests([link_request(2, True)])
+
+
+class TestRequestBuilders(CiTestCase):
+
+    def test_address_request(self):
+        '''Addresses are created exclusively with local and broadcast'''
+        request = address_request(RTM_NEWADDR, 2, '10.0.0.5', 24,
+                                  '10.0.0.255')
+        self.assertEqual((RTM_NEWADDR, 0x600), request[:2])
+        self.assertEqual(
+            struct.pack("BBBBI", socket.AF_INET, 24, 0, 0, 2) +
+            rtattr(2, socket.inet_aton('10.0.0.5')) +
+            rtattr(1, socket.inet_aton('10.0.0.5')) +
+            rtattr(4, socket.inet_aton('10.0.0.255')),
+            request.payload)
+
+    def test_link_request(self):
+        self.assertEqual(
+            struct.pack("BHiII", 0, 0, 3, 0, IFF_UP),
+            link_request(3, False).payload)
+
+    def test_rename_request(self):
+        self.assertEqual(
+            struct.pack("BHiII", 0, 0, 3, 0, 0) + rtattr(3, b'eth10\0'),
+            rename_request(3, 'eth10').payload)
+
+    def test_route_requests(self):
+        '''Routes without gateway are link scoped, deletes match any'''
+        request = route_request(RTM_NEWROUTE, 2, '169.254.169.254', 32,
+                                prefsrc='10.0.0.5')
+        self.assertEqual(
+            struct.pack("BBBBBBBBI", socket.AF_INET, 32, 0, 0, 254, 3, 253,
+                        1, 0) +
+            rtattr(1, socket.inet_aton('169.254.169.254')) +
+            rtattr(7, socket.inet_aton('10.0.0.5')) +
+            rtattr(4, struct.pack("I", 2)),
+            request.payload)
+        request = route_request(RTM_DELROUTE, 2, '0.0.0.0', 0, '10.0.0.1')
+        self.assertEqual(0, request.flags)
+        self.assertEqual(
+            struct.pack("BBBBBBBBI", socket.AF_INET, 0, 0, 0, 254, 0, 255,
+                        0, 0) +
+            rtattr(5, socket.inet_aton('10.0.0.1')) +
+            rtattr(4, struct.pack("I", 2)),
+            request.payload)
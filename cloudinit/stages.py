@@ -33,11 +33,13 @@ from cloudinit.sources import NetworkConfigSource
 from cloudinit import cloud
 from cloudinit import config
 from cloudinit import distros
+from cloudinit.distros import package_transaction
 from cloudinit import helpers
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import net
 from cloudinit.net import cmdline
+from cloudinit import profiling
 from cloudinit.reporting import events
 from cloudinit import sources
 from cloudinit import type_utils
@@ -764,7 +766,8 @@ class Init(object):
 
     def _get_per_boot_network_semaphore(self):
         return namedtuple('Semaphore', 'semaphore args')(
-            helpers.FileSemaphores(self.paths.get_runpath('sem')),
+            helpers.get_semaphores(
+                self.paths, self.paths.get_runpath('sem')),
             ('apply_network_config', PER_ONCE)
         )
 
@@ -772,11 +775,13 @@ class Init(object):
         sem = self._get_per_boot_network_semaphore()
         return sem.semaphore.has_run(*sem.args)
 
-    def apply_network_config(self, bring_up):
+    def apply_network_config(self, bring_up, force=False):
         """Apply the network config.
 
         Find the config, determine whether to apply it, apply it via
-        the distro, and optionally bring it up
+        the distro, and optionally bring it up. Config identical to the
+        one last applied is neither rendered nor brought up again unless
+        force is set.
         """
         netcfg, src = self._find_networking_config()
         if netcfg is None:
@@ -814,13 +819,28 @@ class Init(object):
         # apply renames from config
         self._apply_netcfg_names(netcfg)
 
-        # rendering config
-        LOG.info("Applying network configuration from %s bringup=%s: %s",
-                 src, bring_up, netcfg)
+        render = force or self.distro.network_config_changed(netcfg)
+        if not render and (
+                not bring_up or self.distro.network_config_brought_up(netcfg)):
+            with events.ReportEventStack(
+                    name="skip-network-config",
+                    description="network config from %s is unchanged,"
+                    " skipped rendering and bring up" % src,
+                    parent=self.reporter) as myrep:
+                LOG.info(myrep.description)
+            return
 
         sem = self._get_per_boot_network_semaphore()
         try:
             with sem.semaphore.lock(*sem.args):
+                if not render:
+                    # Rendered earlier without bring up, e.g. by init-local
+                    LOG.info("Bringing up unchanged network configuration"
+                             " from %s without rendering it", src)
+                    return self.distro.bring_up_network_config(netcfg)
+                # rendering config
+                LOG.info("Applying network configuration from %s"
+                         " bringup=%s: %s", src, bring_up, netcfg)
                 return self.distro.apply_network_config(
                     netcfg, bring_up=bring_up)
         except net.RendererNotFoundError as e:
@@ -832,6 +852,10 @@ class Init(object):
                         "networking may not be configured properly.",
                         self.distro)
             return
+        finally:
+            sem.semaphore.flush()
+            # Devices may have been brought up or reconfigured
+            net.invalidate_interface_snapshot()
 
 
 class Modules(object):
@@ -840,6 +864,8 @@ class Modules(object):
         self.cfg_files = cfg_files
         # Created on first use
         self._cached_cfg = None
+        # Number of modules not imported because they did not run
+        self.imports_avoided = 0
         if reporter is None:
             reporter = events.ReportEventStack(
                 name="module-reporter", description="module-desc",
@@ -920,22 +946,38 @@ class Modules(object):
                              " has an unknown frequency %s"), raw_name, freq)
                 # Reset it so when ran it will get set to a known value
                 freq = None
-            mod_locs, looked_locs = importer.find_module(
-                mod_name, ['', type_utils.obj_name(config)], ['handle'])
-            if not mod_locs:
-                LOG.warning("Could not find module named %s (searched %s)",
-                            mod_name, looked_locs)
-                continue
-            mod = config.fixup_module(importer.import_module(mod_locs[0]))
+            search_paths = ['', type_utils.obj_name(config)]
+            # Avoid importing modules which may not run when their metadata
+            # can be read from source; they get imported on first use.
+            mod = config.find_deferred_module(mod_name, search_paths)
+            if mod is None:
+                mod_locs, looked_locs = importer.find_module(
+                    mod_name, search_paths, ['handle'])
+                if not mod_locs:
+                    LOG.warning("Could not find module named %s (searched %s)",
+                                mod_name, looked_locs)
+                    continue
+                mod = config.fixup_module(importer.import_module(mod_locs[0]))
             mostly_mods.append([mod, raw_name, freq, run_args])
         return mostly_mods
 
+    def _count_imports_avoided(self, mostly_mods):
+        return len([mod for (mod, _name, _freq, _args) in mostly_mods
+                    if isinstance(mod, config.DeferredModule)
+                    and not mod.loaded])
+
     def _run_modules(self, mostly_mods):
         cc = self.init.cloudify()
         # Return which ones ran
         # and which ones failed + the exception of why it failed
         failures = []
         which_ran = []
+        transaction = cc.distro.package_transaction
+        flush = self.cfg.get('package_flush', package_transaction.FLUSH_MODULE)
+        if flush not in package_transaction.FLUSH_POINTS:
+            LOG.warning("Invalid package_flush '%s', expected one of %s",
+                        flush, package_transaction.FLUSH_POINTS)
+            flush = package_transaction.FLUSH_MODULE
         for (mod, name, freq, args) in mostly_mods:
             try:
                 # Try the modules frequency, otherwise fallback to a known one
@@ -962,16 +1004,34 @@ class Modules(object):
                     name=run_name, description=desc, parent=self.reporter)
 
                 with myrep:
-                    ran, _r = cc.run(run_name, mod.handle, func_args,
-                                     freq=freq)
+                    handle = profiling.profiled(run_name, mod.handle)
+                    ran, _r = cc.run(run_name, handle, func_args, freq=freq)
                     if ran:
                         myrep.message = "%s ran successfully" % run_name
                     else:
                         myrep.message = "%s previously ran" % run_name
 
+            except package_transaction.PackageTransactionError as e:
+                util.logexc(LOG, "Running module %s (%s) failed", name, mod)
+                failures.extend(e.failures.items())
             except Exception as e:
                 util.logexc(LOG, "Running module %s (%s) failed", name, mod)
                 failures.append((name, e))
+            # Also apply requests of a module that failed afterwards
+            if (flush == package_transaction.FLUSH_MODULE and
+                    transaction.pending):
+                try:
+                    transaction.flush()
+                except package_transaction.PackageTransactionError as e:
+                    failures.extend(e.failures.items())
+        if transaction.pending:
+            try:
+                transaction.flush()
+            except package_transaction.PackageTransactionError as e:
+                failures.extend(e.failures.items())
+        # Do not leave a package index prefetch to later stages
+        cc.distro.wait_for_package_prefetch()
+        cc.flush_semaphores()
         return (which_ran, failures)
 
     def run_single(self, mod_name, args=None, freq=None):
@@ -1022,7 +1082,11 @@ class Modules(object):
         if forced:
             LOG.info("running unverified_modules: '%s'", ', '.join(forced))
 
-        return self._run_modules(active_mods)
+        ran_mods = self._run_modules(active_mods)
+        self.imports_avoided = self._count_imports_avoided(mostly_mods)
+        LOG.debug("Avoided importing %s of %s modules in '%s'",
+                  self.imports_avoided, len(mostly_mods), section_name)
+        return ran_mods
 
 
 def read_runtime_config():
@@ -18,6 +18,7 @@ from unittest.util import strclass
 
 from cloudinit.config.schema import (
     SchemaValidationError, validate_cloudconfig_schema)
+from cloudinit import atomic_helper
 from cloudinit import cloud
 from cloudinit import distros
 from cloudinit import helpers as ch
@@ -272,6 +273,7 @@ class FilesystemMockingTestCase(ResourceUsingTestCase):
                    ('del_file', 1),
                    ('sym_link', -1),
                    ('copy', -1)],
+            atomic_helper: [('write_file', 1)],
         }
         for (mod, funcs) in patch_funcs.items():
             for (f, am) in funcs:
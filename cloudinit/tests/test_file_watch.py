@@ -0,0 +1,103 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.file_watch"""
+
+import os
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from cloudinit import file_watch
+
+
+def _later(func, delay=0.05):
+    timer = threading.Timer(delay, func)
+    timer.start()
+    return timer
+
+
+@pytest.fixture
+def no_inotify():
+    with mock.patch.object(file_watch, '_get_libc', return_value=None):
+        yield
+
+
+class TestWatchPoints:
+
+    def test_missing_directories_watch_nearest_ancestor(self, tmpdir):
+        target = tmpdir.join('a', 'b', 'file').strpath
+        assert [(tmpdir.strpath, 'a')] == file_watch._watch_points(target)
+
+    def test_symlinks_watch_link_and_target_dirs(self, tmpdir):
+        real = tmpdir.mkdir('data').join('status.json')
+        link = tmpdir.mkdir('run').join('status.json')
+        link.mksymlinkto(real)
+        assert [
+            (tmpdir.join('run').strpath, 'status.json'),
+            (tmpdir.join('data').strpath, 'status.json'),
+        ] == file_watch._watch_points(link.strpath)
+
+
+@pytest.mark.skipif(
+    not file_watch._get_libc(), reason='inotify is unavailable')
+class TestFileWatcherInotify:
+
+    def test_wakes_on_creation_in_missing_directory(self, tmpdir):
+        """Directories created after arming are watched as they appear."""
+        target = tmpdir.join('sub', 'file')
+        with file_watch.FileWatcher([target.strpath]) as watcher:
+            assert watcher.inotify
+            timer = _later(lambda: tmpdir.mkdir('sub'))
+            assert watcher.wait(5)
+            timer.join()
+            timer = _later(target.ensure)
+            assert watcher.wait(5)
+            timer.join()
+        assert target.exists()
+
+    def test_unrelated_files_do_not_wake(self, tmpdir):
+        target = tmpdir.join('file').strpath
+        with file_watch.FileWatcher([target]) as watcher:
+            tmpdir.join('other').write('')
+            assert watcher.wait(0.1) is False
+
+    def test_wait_for_returns_on_event_not_timeout(self, tmpdir):
+        target = tmpdir.join('file').strpath
+        timer = _later(lambda: open(target, 'w').close())
+        start = time.time()
+        assert file_watch.wait_for(
+            lambda: os.path.exists(target), [target], 30, naplen=30)
+        timer.join()
+        assert time.time() - start < 10
+
+
+class TestFileWatcherPolling:
+
+    def test_falls_back_to_sleeping(self, tmpdir, no_inotify):
+        with mock.patch.object(file_watch.time, 'sleep') as m_sleep:
+            with file_watch.FileWatcher(
+                    [tmpdir.join('file').strpath], naplen=2) as watcher:
+                assert not watcher.inotify
+                assert watcher.wait(1)
+                assert watcher.wait()
+        assert [mock.call(1), mock.call(2)] == m_sleep.call_args_list
+
+    def test_failed_watch_falls_back_to_polling(self, tmpdir):
+        libc = mock.Mock()
+        libc.inotify_init1.return_value = os.open(os.devnull, os.O_RDONLY)
+        libc.inotify_add_watch.return_value = -1
+        with mock.patch.object(file_watch, '_get_libc', return_value=libc):
+            with file_watch.FileWatcher(
+                    [tmpdir.join('file').strpath]) as watcher:
+                assert not watcher.inotify
+
+    def test_wait_for_times_out(self, tmpdir, no_inotify):
+        calls = []
+        with mock.patch.object(file_watch.time, 'sleep'):
+            with mock.patch.object(file_watch.time, 'monotonic',
+                                   side_effect=[0, 0, 1, 2]):
+                assert not file_watch.wait_for(
+                    lambda: calls.append(1), [tmpdir.strpath], 1.5)
+        assert 3 == len(calls)
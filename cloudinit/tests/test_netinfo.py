@@ -2,9 +2,12 @@
 
 """Tests netinfo module functions and classes."""
 
+import socket
 from copy import copy
 
-from cloudinit.netinfo import netdev_info, netdev_pformat, route_pformat
+from cloudinit.netinfo import (
+    _netdev_info_iproute, netdev_info, netdev_pformat, route_pformat)
+from cloudinit.sources.helpers import netlink
 from cloudinit.tests.helpers import CiTestCase, mock, readResource
 
 
@@ -27,6 +30,12 @@ class TestNetInfo(CiTestCase):
     maxDiff = None
     with_logs = True
 
+    def setUp(self):
+        super(TestNetInfo, self).setUp()
+        # Exercise the command output parsers used without netlink
+        self.add_patch('cloudinit.netinfo._read_netlink', 'm_netlink',
+                       return_value=None)
+
     @mock.patch('cloudinit.netinfo.subp.which')
     @mock.patch('cloudinit.netinfo.subp.subp')
     def test_netdev_old_nettools_pformat(self, m_subp, m_which):
@@ -178,4 +187,105 @@ class TestNetInfo(CiTestCase):
             self.logs.getvalue())
         m_subp.assert_not_called()
 
+
+SAMPLE_LINKS = [
+    netlink.Link(1, 'lo', netlink.IFF_UP | netlink.IFF_LOWER_UP, 772,
+                 '00:00:00:00:00:00'),
+    netlink.Link(2, 'enp0s25', netlink.IFF_UP | netlink.IFF_LOWER_UP,
+                 netlink.ARPHRD_ETHER, '50:7b:9d:2c:af:91'),
+    netlink.Link(3, 'wlp3s0', netlink.IFF_UP, netlink.ARPHRD_ETHER,
+                 '50:7b:9d:2c:af:92'),
+]
+
+
+def _addr(family, index, address, prefixlen, scope, broadcast=None):
+    local = address if family == socket.AF_INET else None
+    return netlink.Address(family, index, prefixlen, netlink.IFA_F_PERMANENT,
+                           scope, address, local, broadcast, None)
+
+
+def _route(family, dst, dst_len, oif, gateway=None, priority=None,
+           table=netlink.RT_TABLE_MAIN, route_type=netlink.RTN_UNICAST,
+           expires=False):
+    return netlink.Route(family, table, route_type, dst, dst_len, gateway,
+                         oif, priority, expires)
+
+
+# The netlink equivalent of the sample ip addr and ip route outputs
+SAMPLE_ADDRESSES = [
+    _addr(socket.AF_INET, 1, '127.0.0.1', 8, 254),
+    _addr(socket.AF_INET, 2, '192.168.2.18', 24, 0, '192.168.2.255'),
+    _addr(socket.AF_INET6, 1, '::1', 128, 254),
+    _addr(socket.AF_INET6, 2, 'fe80::7777:2222:1111:eeee', 64, 0),
+    _addr(socket.AF_INET6, 2, 'fe80::8107:2b92:867e:f8a6', 64, 253),
+]
+SAMPLE_ROUTES = {
+    socket.AF_INET: [
+        _route(socket.AF_INET, None, 0, 2, '192.168.2.1', 100),
+        _route(socket.AF_INET, None, 0, 3, '192.168.2.1', 150),
+        _route(socket.AF_INET, '192.168.2.0', 24, 2, priority=100),
+        _route(socket.AF_INET, '127.0.0.1', 32, 1, table=255,
+               route_type=2),
+    ],
+    socket.AF_INET6: [
+        _route(socket.AF_INET6, '2a00:abcd:82ae:cd33::657', 128, 2,
+               priority=256, expires=True),
+        _route(socket.AF_INET6, '2a00:abcd:82ae:cd33::', 64, 2,
+               priority=100),
+        _route(socket.AF_INET6, '2a00:abcd:82ae:cd33::', 56, 2,
+               'fe80::32ee:54de:cd43:b4e1', 100),
+        _route(socket.AF_INET6, 'fd81:123f:654::657', 128, 2, priority=256),
+        _route(socket.AF_INET6, 'fd81:123f:654::', 64, 2, priority=100),
+        _route(socket.AF_INET6, 'fd81:123f:654::', 48, 2,
+               'fe80::32ee:54de:cd43:b4e1', 100),
+        _route(socket.AF_INET6, 'fe80::abcd:ef12:bc34:da21', 128, 2,
+               priority=100),
+        _route(socket.AF_INET6, 'fe80::', 64, 2, priority=256),
+        _route(socket.AF_INET6, None, 0, 2, 'fe80::32ee:54de:cd43:b4e1',
+               100),
+        _route(socket.AF_INET6, '::1', 128, 1, priority=0, table=255,
+               route_type=2),
+    ],
+}
+
+
+@mock.patch('cloudinit.netinfo.util.is_Linux', return_value=True)
+@mock.patch('cloudinit.netinfo.subp.subp')
+@mock.patch('cloudinit.sources.helpers.netlink.get_routes',
+            side_effect=SAMPLE_ROUTES.get)
+@mock.patch('cloudinit.sources.helpers.netlink.get_addresses',
+            return_value=SAMPLE_ADDRESSES)
+@mock.patch('cloudinit.sources.helpers.netlink.get_links',
+            return_value=SAMPLE_LINKS)
+class TestNetInfoNetlink(CiTestCase):
+
+    maxDiff = None
+
+    def test_netdev_info_matches_iproute(self, *_mocks):
+        """netdev_info from netlink matches parsing ip addr show."""
+        m_subp = _mocks[3]
+        expected = _netdev_info_iproute(SAMPLE_IPADDRSHOW_OUT)
+        expected['wlp3s0'] = {
+            'ipv4': [], 'ipv6': [], 'hwaddr': '50:7b:9d:2c:af:92',
+            'up': False}
+        self.assertEqual(expected, netdev_info())
+        m_subp.assert_not_called()
+
+    def test_route_pformat_matches_iproute(self, *_mocks):
+        """route_pformat from netlink matches rendering ip route list."""
+        m_subp = _mocks[3]
+        self.assertEqual(ROUTE_FORMATTED_OUT, route_pformat())
+        m_subp.assert_not_called()
+
+    def test_netlink_failure_falls_back_to_commands(self, m_links, *_mocks):
+        """Commands are used when netlink dumps fail."""
+        m_subp = _mocks[2]
+        m_links.side_effect = netlink.NetlinkCreateSocketError('denied')
+        m_subp.return_value = (SAMPLE_IPADDRSHOW_OUT, '')
+        with mock.patch('cloudinit.netinfo.subp.which',
+                        side_effect=lambda x: x if x == 'ip' else None):
+            devs = netdev_info()
+        self.assertEqual(['enp0s25', 'lo'], sorted(devs))
+        m_subp.assert_called_once_with(['ip', 'addr', 'show'])
+
 # vi: ts=4 expandtab
@@ -0,0 +1,129 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.profiling"""
+
+import json
+import os
+import pstats
+
+import pytest
+
+from cloudinit import profiling
+
+
+@pytest.fixture
+def profile_dir(tmpdir):
+    """Enable profiling into a temporary dir, restoring defaults after."""
+    profile_dir = tmpdir.join('profile').strpath
+    profiling.configure(
+        {'profiling': {'enabled': True, 'dir': profile_dir}}, cmdline='')
+    yield profile_dir
+    profiling.configure({}, cmdline='')
+
+
+def _busy():
+    return sum(i for i in range(1000))
+
+
+class TestConfigure:
+
+    @pytest.mark.parametrize('cfg,cmdline,expected', (
+        ({}, '', False),
+        (None, 'ro quiet', False),
+        ({'profiling': {'enabled': False}}, '', False),
+        ({'profiling': {'enabled': True}}, '', True),
+        ({'profiling': {'enabled': 'yes'}}, '', True),
+        ({'profiling': 'invalid'}, '', False),
+        ({}, 'ro cloud-init.profile quiet', True),
+        ({'profiling': {'enabled': False}}, 'cloud-init.profile', True),
+        ({}, 'cloud-init.profiler', False),
+    ))
+    def test_configure_from_cfg_and_cmdline(self, cfg, cmdline, expected):
+        """Profiling is enabled by config or by the cmdline key."""
+        try:
+            assert expected is profiling.configure(cfg, cmdline=cmdline)
+            assert expected is profiling.is_enabled()
+        finally:
+            profiling.configure({}, cmdline='')
+
+    def test_configure_default_dir(self):
+        profiling.configure({'profiling': {'enabled': True}}, cmdline='')
+        try:
+            assert profiling.DEFAULT_PROFILE_DIR == profiling._CONFIG['dir']
+        finally:
+            profiling.configure({}, cmdline='')
+
+
+class TestProfile:
+
+    def test_disabled_is_noop(self, tmpdir):
+        """No files are written and profiled returns func unchanged."""
+        profiling.configure({}, cmdline='')
+        with profiling.Profile('init-local'):
+            _busy()
+        assert [] == tmpdir.listdir()
+        assert _busy is profiling.profiled('unit', _busy)
+
+    def test_writes_pstats_and_summary(self, profile_dir):
+        with profiling.Profile('single/cc_ssh'):
+            _busy()
+        pstats_file = os.path.join(profile_dir, 'single_cc_ssh.pstats')
+        assert _busy.__name__ in str(pstats.Stats(pstats_file).stats)
+        with open(os.path.join(profile_dir, profiling.SUMMARY_FILE)) as f:
+            summary = json.load(f)
+        assert ['single/cc_ssh'] == list(summary.keys())
+        unit = summary['single/cc_ssh']
+        assert unit['total_calls'] > 0
+        assert len(unit['top_functions']) <= profiling.SUMMARY_TOP_FUNCS
+
+    def test_nested_units_are_exclusive(self, profile_dir):
+        """Work done in a nested unit is not accounted to the outer unit."""
+        with profiling.Profile('outer'):
+            profiling.profiled('inner', _busy)()
+        outer = pstats.Stats(os.path.join(profile_dir, 'outer.pstats'))
+        inner = pstats.Stats(os.path.join(profile_dir, 'inner.pstats'))
+        assert '_busy' not in str(outer.stats)
+        assert '_busy' in str(inner.stats)
+        with open(os.path.join(profile_dir, profiling.SUMMARY_FILE)) as f:
+            assert ['inner', 'outer'] == sorted(json.load(f).keys())
+
+    def test_profiled_returns_result_and_raises(self, profile_dir):
+        assert _busy() == profiling.profiled('unit', _busy)()
+
+        def fail():
+            raise RuntimeError('broken')
+
+        with pytest.raises(RuntimeError):
+            profiling.profiled('failing', fail)()
+        assert os.path.exists(os.path.join(profile_dir, 'failing.pstats'))
+        assert [] == profiling._ACTIVE
+
+    def test_unit_starts_when_enabled_later(self, tmpdir):
+        """A unit entered while disabled is profiled once configured."""
+        profile_dir = tmpdir.join('profile').strpath
+        profiling.configure({}, cmdline='')
+        try:
+            with profiling.Profile('init-network'):
+                profiling.configure(
+                    {'profiling': {'enabled': True, 'dir': profile_dir}},
+                    cmdline='')
+                _busy()
+        finally:
+            profiling.configure({}, cmdline='')
+        stats = pstats.Stats(os.path.join(profile_dir, 'init-network.pstats'))
+        assert '_busy' in str(stats.stats)
+        assert [] == profiling._PENDING
+
+    def test_disabled_unit_is_not_left_pending(self):
+        profiling.configure({}, cmdline='')
+        with profiling.Profile('init-local'):
+            pass
+        assert [] == profiling._PENDING
+
+    def test_write_failure_is_logged(self, profile_dir, caplog):
+        """Failing to write results never breaks the profiled unit."""
+        with open(profile_dir, 'w') as f:
+            f.write('not a dir')
+        with profiling.Profile('unit'):
+            _busy()
+        assert 'Failed writing profile for unit' in caplog.text
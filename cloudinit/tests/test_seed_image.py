@@ -0,0 +1,350 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.seed_image"""
+
+import io
+import os
+import struct
+
+from cloudinit import seed_image
+from cloudinit import util
+from cloudinit.tests.helpers import CiTestCase, mock, readResource
+
+SEED_TREE = {
+    'openstack': {'latest': {'meta_data.json': b'{"uuid": "1"}',
+                             'user_data': b'#cloud-config\n'}},
+    'README': b'seed',
+}
+
+SEED_FILES = {
+    'openstack/latest/meta_data.json': b'{"uuid": "1"}',
+    'openstack/latest/user_data': b'#cloud-config\n',
+    'README': b'seed',
+}
+
+FIXTURE_FILES = {
+    'meta-data': b'instance-id: iid-fixture\n',
+    'user-data': b'#cloud-config\nhostname: fixture\n',
+    'openstack/latest/meta_data.json': b'{"uuid": "fixture"}',
+}
+
+ISO_SP_ENTRY = b'SP\x07\x01\xbe\xef\x00'
+
+
+def _iso_record(name, extent, size, is_dir, system_use=b''):
+    pad = 1 - len(name) % 2
+    length = 33 + len(name) + pad + len(system_use)
+    length += length % 2
+    record = bytearray(length)
+    record[0] = length
+    struct.pack_into('<I', record, 2, extent)
+    struct.pack_into('>I', record, 6, extent)
+    struct.pack_into('<I', record, 10, size)
+    struct.pack_into('>I', record, 14, size)
+    record[25] = 0x02 if is_dir else 0
+    struct.pack_into('<H', record, 28, 1)
+    struct.pack_into('>H', record, 30, 1)
+    record[32] = len(name)
+    record[33:33 + len(name)] = name
+    start = 33 + len(name) + pad
+    record[start:start + len(system_use)] = system_use
+    return bytes(record)
+
+
+def build_iso(tree, rock_ridge=False, joliet=False):
+    """Return an ISO9660 image holding tree with the requested names."""
+    blobs = {}
+    next_lba = [19]
+
+    def alloc(size):
+        lba = next_lba[0]
+        next_lba[0] += max(1, -(-size // 2048))
+        return lba
+
+    def iso_name(name, is_dir, names):
+        if names == 'joliet':
+            return name.encode('utf-16-be') + (b'' if is_dir else b'\0;\0001')
+        name = name.upper().replace('.', '_', name.count('.') - 1)
+        return name.encode() + (b'' if is_dir else b';1')
+
+    def layout(subtree, names, parent=None):
+        lba = alloc(2048)
+        sp = ISO_SP_ENTRY if names == 'rr' and parent is None else b''
+        records = [_iso_record(b'\0', lba, 2048, True, sp),
+                   _iso_record(b'\1', parent or lba, 2048, True)]
+        for name, content in sorted(subtree.items()):
+            is_dir = isinstance(content, dict)
+            if is_dir:
+                extent, size = layout(content, names, lba), 2048
+            else:
+                extent, size = alloc(len(content)), len(content)
+                blobs[extent] = content
+            system_use = b''
+            if names == 'rr':
+                system_use = (b'NM' + bytes([5 + len(name), 1, 0]) +
+                              name.encode())
+            records.append(_iso_record(
+                iso_name(name, is_dir, names), extent, size, is_dir,
+                system_use))
+        blobs[lba] = b''.join(records)
+        return lba
+
+    def descriptor(kind, root):
+        desc = bytearray(2048)
+        desc[0] = kind
+        desc[1:7] = b'CD001\x01'
+        if kind == 2:
+            desc[88:91] = b'%/E'
+        struct.pack_into('<H', desc, 128, 2048)
+        struct.pack_into('>H', desc, 130, 2048)
+        if root is not None:
+            desc[156:190] = _iso_record(b'\0', root, 2048, True)
+        return bytes(desc)
+
+    blobs[16] = descriptor(1, layout(tree, 'rr' if rock_ridge else 'iso'))
+    if joliet:
+        blobs[17] = descriptor(2, layout(tree, 'joliet'))
+    else:
+        blobs[17] = descriptor(2, None)[:88] + bytes(2048 - 88)
+    blobs[18] = b'\xffCD001\x01' + bytes(2041)
+    image = bytearray(next_lba[0] * 2048)
+    for lba, blob in blobs.items():
+        image[lba * 2048:lba * 2048 + len(blob)] = blob
+    return bytes(image)
+
+
+def _lfn_checksum(short):
+    checksum = 0
+    for byte in short:
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + byte) & 0xFF
+    return checksum
+
+
+def _fat_entries(name, short, attr, cluster, size):
+    entry = bytearray(32)
+    entry[0:11] = short
+    entry[11] = attr
+    struct.pack_into('<HI', entry, 26, cluster, size)
+    base, _, ext = name.partition('.')
+    if b'~' not in short and name in ('.', '..', name.upper()):
+        return bytes(entry)
+    if b'~' not in short and name == name.lower():
+        entry[12] = 0x08 | (0x10 if ext else 0)
+        return bytes(entry)
+    chars = name.encode('utf-16-le') + b'\0\0'
+    chars += b'\xff' * (-len(chars) % 26)
+    parts = [chars[i:i + 26] for i in range(0, len(chars), 26)]
+    checksum = _lfn_checksum(short)
+    entries = []
+    for seq, part in enumerate(parts, 1):
+        lfn = bytearray(32)
+        lfn[0] = seq | (0x40 if seq == len(parts) else 0)
+        lfn[1:11] = part[0:10]
+        lfn[11] = 0x0F
+        lfn[13] = checksum
+        lfn[14:26] = part[10:22]
+        lfn[28:32] = part[22:26]
+        entries.insert(0, bytes(lfn))
+    return b''.join(entries) + bytes(entry)
+
+
+def build_fat(tree):
+    """Return a FAT12 image of 512 byte clusters holding tree."""
+    total = 128
+    data_sector = 3
+    image = bytearray(total * 512)
+    struct.pack_into('<HBHBHHBH', image, 11, 512, 1, 1, 1, 16, total, 0xF8, 1)
+    image[510:512] = b'\x55\xaa'
+    fat = bytearray(512)
+    next_cluster = [2]
+
+    def set_fat(cluster, value):
+        offset = cluster * 3 // 2
+        current = struct.unpack_from('<H', fat, offset)[0]
+        if cluster & 1:
+            current = (current & 0x000F) | (value << 4)
+        else:
+            current = (current & 0xF000) | value
+        struct.pack_into('<H', fat, offset, current)
+
+    def store(content):
+        chain = list(range(next_cluster[0],
+                           next_cluster[0] + max(1, -(-len(content) // 512))))
+        next_cluster[0] += len(chain)
+        for cluster, following in zip(chain, chain[1:] + [0xFFF]):
+            set_fat(cluster, following)
+            offset = (data_sector + cluster - 2) * 512
+            chunk = content[(cluster - chain[0]) * 512:][:512]
+            image[offset:offset + len(chunk)] = chunk
+        return chain[0]
+
+    def directory(subtree, cluster=0, parent=0):
+        entries = []
+        if cluster:
+            entries.append(_fat_entries('.', b'.          ', 0x10, cluster, 0))
+            entries.append(_fat_entries('..', b'..         ', 0x10, parent, 0))
+        for index, (name, content) in enumerate(sorted(subtree.items())):
+            base, _, ext = name.partition('.')
+            short = b'%-8s%-3s' % (
+                base.upper().encode()[:8], ext.upper().encode()[:3])
+            if len(base) > 8 or len(ext) > 3 or not base.isalnum():
+                short = b'%-8s%-3s' % (
+                    base.upper().encode()[:6] + b'~%d' % (index + 1),
+                    ext.upper().encode()[:3])
+            if isinstance(content, dict):
+                sub = next_cluster[0]
+                next_cluster[0] += 1
+                set_fat(sub, 0xFFF)
+                entries.append(_fat_entries(name, short, 0x10, sub, 0))
+                data = directory(content, sub, cluster)
+                offset = (data_sector + sub - 2) * 512
+                image[offset:offset + len(data)] = data
+            else:
+                entries.append(_fat_entries(
+                    name, short, 0x20, store(content), len(content)))
+        return b''.join(entries)
+
+    root = directory(tree)
+    image[1024:1024 + len(root)] = root
+    image[512:1024] = fat
+    return bytes(image)
+
+
+class _ExtractTestCase(CiTestCase):
+
+    def extract(self, image):
+        target = self.tmp_dir()
+        seed_image.extract_image(io.BytesIO(image), target)
+        found = {}
+        for root, _dirs, files in os.walk(target):
+            for name in files:
+                path = os.path.join(root, name)
+                found[os.path.relpath(path, target)] = util.load_file(
+                    path, decode=False)
+        return found
+
+
+class TestISO9660Image(_ExtractTestCase):
+
+    def test_plain_names_are_lowercased_as_linux_does(self):
+        """Without extensions, names are lowercased and versions dropped."""
+        self.assertEqual(
+            {'openstack/latest/meta_data.json': b'{"uuid": "1"}',
+             'openstack/latest/user_data': b'#cloud-config\n',
+             'readme': b'seed'},
+            self.extract(build_iso(SEED_TREE)))
+
+    def test_rock_ridge_names(self):
+        self.assertEqual(
+            SEED_FILES, self.extract(build_iso(SEED_TREE, rock_ridge=True)))
+
+    def test_joliet_names(self):
+        self.assertEqual(
+            SEED_FILES, self.extract(build_iso(SEED_TREE, joliet=True)))
+
+    def test_rock_ridge_preferred_over_joliet(self):
+        self.assertEqual(SEED_FILES, self.extract(
+            build_iso(SEED_TREE, rock_ridge=True, joliet=True)))
+
+    def test_file_spanning_sectors(self):
+        content = bytes(range(256)) * 20
+        self.assertEqual(
+            {'user-data': content},
+            self.extract(build_iso({'user-data': content}, rock_ridge=True)))
+
+    def test_unsafe_name_is_unsupported(self):
+        image = build_iso({'..': b'escape'}, rock_ridge=True)
+        with self.assertRaises(seed_image.UnsupportedImageError):
+            self.extract(image)
+
+
+class TestFATImage(_ExtractTestCase):
+
+    def test_long_and_short_names(self):
+        """VFAT long names and lowercase short names are read."""
+        self.assertEqual(SEED_FILES, self.extract(build_fat(SEED_TREE)))
+
+    def test_file_spanning_clusters(self):
+        content = bytes(range(256)) * 9
+        self.assertEqual(
+            {'meta-data': content},
+            self.extract(build_fat({'meta-data': content})))
+
+    def test_fstypes_limit_readers(self):
+        with self.assertRaises(seed_image.UnsupportedImageError):
+            seed_image.extract_image(
+                io.BytesIO(build_fat(SEED_TREE)), self.tmp_dir(),
+                fstypes=[seed_image.ISO9660])
+
+    def test_garbage_is_unsupported(self):
+        with self.assertRaises(seed_image.UnsupportedImageError):
+            self.extract(b'\x01' * 65536)
+
+
+class TestFixtureImages(_ExtractTestCase):
+    """Images made by other tools than the builders above."""
+
+    def fixture(self, name):
+        return util.decomp_gzip(
+            readResource('seed_images/%s.gz' % name, 'rb'), quiet=False,
+            decode=False)
+
+    def test_rock_ridge_and_joliet_iso(self):
+        self.assertEqual(
+            FIXTURE_FILES, self.extract(self.fixture('cidata-rr-joliet.iso')))
+
+    def test_rock_ridge_symlink_is_unsupported(self):
+        """Symlinks are left to mount rather than read as empty files."""
+        with self.assertRaises(seed_image.UnsupportedImageError):
+            self.extract(self.fixture('cidata-symlink.iso'))
+
+    def test_fat12(self):
+        self.assertEqual(
+            dict(FIXTURE_FILES, README=b'seed'),
+            self.extract(self.fixture('cidata.vfat')))
+
+
+class TestExtractedDir(CiTestCase):
+
+    def setUp(self):
+        super(TestExtractedDir, self).setUp()
+        self.add_patch('cloudinit.seed_image._EXTRACTED', 'm_extracted',
+                       autospec=False, new={})
+        self.addCleanup(seed_image._cleanup)
+        self.add_patch('cloudinit.seed_image.atexit.register', 'm_register')
+        self.device = self.tmp_path('sr0')
+
+    def test_extracted_once_per_device(self):
+        """Repeated reads of an unchanged device share the extraction."""
+        util.write_file(self.device, build_iso(SEED_TREE, joliet=True),
+                        omode='wb')
+        target = seed_image.extracted_dir(self.device)
+        self.assertEqual(b'seed', util.load_file(
+            os.path.join(target, 'README'), decode=False))
+        with mock.patch('cloudinit.seed_image.extract_image') as m_extract:
+            self.assertEqual(target, seed_image.extracted_dir(self.device))
+        self.assertEqual(0, m_extract.call_count)
+        self.m_register.assert_called_once_with(seed_image._cleanup)
+
+    def test_replaced_media_is_extracted_again(self):
+        util.write_file(self.device, build_iso(SEED_TREE, joliet=True),
+                        omode='wb')
+        first = seed_image.extracted_dir(self.device)
+        util.write_file(self.device, build_fat({'meta-data': b'new'}),
+                        omode='wb')
+        second = seed_image.extracted_dir(self.device)
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(['meta-data'], os.listdir(second))
+
+    def test_oversized_content_is_unsupported(self):
+        util.write_file(self.device, build_fat(SEED_TREE), omode='wb')
+        with mock.patch('cloudinit.seed_image.MAX_CONTENT_SIZE', 10):
+            with self.assertRaises(seed_image.UnsupportedImageError):
+                seed_image.extracted_dir(self.device)
+        self.assertEqual({}, self.m_extracted)
+
+    def test_missing_device_is_unsupported(self):
+        with self.assertRaises(seed_image.UnsupportedImageError):
+            seed_image.extracted_dir(self.tmp_path('missing'))
+
+# vi: ts=4 expandtab
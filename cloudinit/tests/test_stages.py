@@ -8,6 +8,7 @@ import pytest
 
 from cloudinit import stages
 from cloudinit import sources
+from cloudinit.distros.package_transaction import PackageTransaction
 from cloudinit.sources import NetworkConfigSource
 
 from cloudinit.event import EventScope, EventType
@@ -298,6 +299,67 @@ class TestInit(CiTestCase):
         self.init.distro.apply_network_config.assert_called_with(
             net_cfg, bring_up=True)
 
+    @mock.patch('cloudinit.net.get_interfaces_by_mac')
+    @mock.patch('cloudinit.distros.ubuntu.Distro')
+    def test_apply_network_skipped_when_unchanged(self, m_ubuntu, m_macs):
+        """Unchanged network config is neither rendered nor brought up."""
+        net_cfg = {
+            'version': 1, 'config': [
+                {'subnets': [{'type': 'dhcp'}], 'type': 'physical',
+                 'name': 'eth9', 'mac_address': '42:42:42:42:42:42'}]}
+
+        def fake_network_config():
+            return net_cfg, NetworkConfigSource.fallback
+
+        m_macs.return_value = {'42:42:42:42:42:42': 'eth9'}
+        self.init._find_networking_config = fake_network_config
+        self.init.distro.network_config_changed.return_value = False
+        self.init.reporter.reporting_enabled = True
+
+        with mock.patch.object(stages.events, 'report_start_event') as m_rep:
+            self.init.apply_network_config(True)
+        self.init.distro.network_config_changed.assert_called_with(net_cfg)
+        self.init.distro.apply_network_config_names.assert_called_with(net_cfg)
+        self.assertEqual(0, self.init.distro.apply_network_config.call_count)
+        self.assertIn(
+            'network config from fallback is unchanged, skipped rendering and'
+            ' bring up', self.logs.getvalue())
+        self.assertEqual(
+            [mock.call(
+                'init-reporter/skip-network-config',
+                'network config from fallback is unchanged, skipped rendering'
+                ' and bring up')],
+            m_rep.call_args_list)
+
+        self.init.apply_network_config(True, force=True)
+        self.init.distro.apply_network_config.assert_called_with(
+            net_cfg, bring_up=True)
+
+    @mock.patch('cloudinit.net.get_interfaces_by_mac')
+    @mock.patch('cloudinit.distros.ubuntu.Distro')
+    def test_apply_network_brings_up_unchanged_config(self, m_ubuntu, m_macs):
+        """Unchanged config rendered without bring up is only brought up."""
+        net_cfg = {
+            'version': 1, 'config': [
+                {'subnets': [{'type': 'dhcp'}], 'type': 'physical',
+                 'name': 'eth9', 'mac_address': '42:42:42:42:42:42'}]}
+
+        def fake_network_config():
+            return net_cfg, NetworkConfigSource.fallback
+
+        m_macs.return_value = {'42:42:42:42:42:42': 'eth9'}
+        self.init._find_networking_config = fake_network_config
+        self.init.distro.network_config_changed.return_value = False
+        self.init.distro.network_config_brought_up.return_value = False
+
+        self.init.apply_network_config(False)
+        self.assertEqual(
+            0, self.init.distro.bring_up_network_config.call_count)
+        self.init.apply_network_config(True)
+        self.init.distro.bring_up_network_config.assert_called_once_with(
+            net_cfg)
+        self.assertEqual(0, self.init.distro.apply_network_config.call_count)
+
     @mock.patch('cloudinit.distros.ubuntu.Distro')
     def test_apply_network_on_same_instance_id(self, m_ubuntu):
         """Only call distro.apply_network_config_names on same instance id."""
@@ -475,4 +537,75 @@ class TestInit_InitializeFilesystem:
 
         assert mode == stat.S_IMODE(log_file.stat().mode)
 
+
+class TestModulesPackageFlush(CiTestCase):
+
+    def setUp(self):
+        super(TestModulesPackageFlush, self).setUp()
+        self.distro = mock.Mock()
+        self.transaction = PackageTransaction(self.distro)
+        cloud = mock.Mock()
+        cloud.distro.package_transaction = self.transaction
+        cloud.run.side_effect = (
+            lambda _name, functor, args, freq: (True, functor(*args)))
+        init = mock.Mock()
+        init.cloudify.return_value = cloud
+        self.modules = stages.Modules(init)
+
+    def _mod(self, pkglist):
+        mod = mock.Mock(frequency='always')
+        mod.handle.side_effect = (
+            lambda name, _cfg, cloud, _log, _args:
+                cloud.distro.package_transaction.request_install(
+                    pkglist, module=name))
+        return mod
+
+    def _run(self, package_flush):
+        self.modules._cached_cfg = {'package_flush': package_flush}
+        return self.modules._run_modules([
+            (self._mod(['pkg1']), 'mod1', None, []),
+            (self._mod(['broken']), 'mod2', None, []),
+            (self._mod(['pkg2']), 'mod3', None, [])])
+
+    def test_section_flush_installs_once_and_attributes_failures(self):
+        """With package_flush: section, modules share one transaction."""
+        def install_packages(pkglist):
+            if 'broken' in pkglist:
+                raise RuntimeError('no such package')
+        self.distro.install_packages.side_effect = install_packages
+
+        which_ran, failures = self._run('section')
+        self.assertEqual(['mod1', 'mod2', 'mod3'], which_ran)
+        self.assertEqual(['mod2'], [name for (name, _e) in failures])
+        self.assertEqual(
+            mock.call(['pkg1', 'broken', 'pkg2']),
+            self.distro.install_packages.call_args_list[0])
+
+    def test_module_flush_installs_after_each_module(self):
+        _which_ran, failures = self._run('module')
+        self.assertEqual([], failures)
+        self.assertEqual(
+            [mock.call(['pkg1']), mock.call(['broken']), mock.call(['pkg2'])],
+            self.distro.install_packages.call_args_list)
+
+    def test_module_flush_installs_requests_of_failed_module(self):
+        """Requests queued before a module failed are applied right away."""
+        def failing_handle(name, _cfg, cloud, _log, _args):
+            cloud.distro.package_transaction.request_install(
+                ['pkg1'], module=name)
+            raise RuntimeError('upgrade failed')
+
+        later = mock.Mock(frequency='always')
+        later.handle.side_effect = (
+            lambda *_args: self.assertEqual(
+                [mock.call(['pkg1'])],
+                self.distro.install_packages.call_args_list))
+        self.modules._cached_cfg = {'package_flush': 'module'}
+        _which_ran, failures = self.modules._run_modules([
+            (mock.Mock(frequency='always', handle=failing_handle), 'mod1',
+             None, []),
+            (later, 'mod2', None, [])])
+        self.assertEqual(['mod1'], [name for (name, _e) in failures])
+        self.assertEqual(1, later.handle.call_count)
+
 # vi: ts=4 expandtab
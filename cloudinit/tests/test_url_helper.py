@@ -4,8 +4,10 @@ from cloudinit.url_helper import (
     NOT_FOUND, UrlError, REDACTED, oauth_headers, read_file_or_url,
     retry_on_url_exc)
 from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+from cloudinit import url_helper
 from cloudinit import util
 from cloudinit import version
+from cloudinit.reporting import events
 
 import httpretty
 import logging
@@ -175,4 +177,97 @@ class TestRetryOnUrlExc(CiTestCase):
         myerror = UrlError(cause=requests.Timeout('something timed out'))
         self.assertTrue(retry_on_url_exc(msg='', exc=myerror))
 
+
+class TestRequestTimings(CiTestCase):
+
+    def setUp(self):
+        super(TestRequestTimings, self).setUp()
+        url_helper.reset_request_timings()
+        self.addCleanup(url_helper.reset_request_timings)
+
+    @httpretty.activate
+    def test_readurl_records_successful_request(self):
+        url = 'http://hostname/path'
+        httpretty.register_uri(httpretty.GET, url, 'data')
+        url_helper.readurl(url + '?token=secret')
+        timings = url_helper.get_request_timings()
+        self.assertEqual(1, timings['totals']['requests'])
+        record = timings['requests'][-1]
+        self.assertEqual(url, record['url'])
+        self.assertEqual(
+            ('readurl', 'GET', 200, 4, 1, False),
+            (record['name'], record['method'], record['status'],
+             record['bytes'], record['attempts'], record['failed']))
+        for phase in url_helper.TIMING_PHASES:
+            self.assertGreaterEqual(record[phase], 0)
+        self.assertGreaterEqual(record['total'], record['ttfb'])
+
+    @httpretty.activate
+    @mock.patch(M_PATH + 'time.sleep')
+    def test_readurl_records_retries_and_sleep_time(self, m_sleep):
+        url = 'http://hostname/path'
+        httpretty.register_uri(httpretty.GET, url, status=500)
+        with self.assertRaises(UrlError):
+            url_helper.readurl(url, retries=2, sec_between=1.5)
+        record = url_helper.get_request_timings()['requests'][-1]
+        self.assertEqual(
+            (3, 3.0, 500, True),
+            (record['attempts'], record['sleep'], record['status'],
+             record['failed']))
+        self.assertEqual(1, url_helper.get_request_timings()['totals'][
+            'failed'])
+
+    @httpretty.activate
+    def test_readurl_reports_events_nested_in_current_stack(self):
+        url = 'http://hostname/path'
+        httpretty.register_uri(httpretty.GET, url, 'data')
+        with mock.patch.object(events, 'report_event') as m_report:
+            url_helper.readurl(url)
+            self.assertEqual(0, m_report.call_count)
+            with events.ReportEventStack('stage', 'desc') as stack:
+                url_helper.readurl(url + '?token=secret')
+        self.assertEqual({}, stack.children)
+        reported = [c[0][0] for c in m_report.call_args_list]
+        self.assertEqual(
+            [('start', 'stage'), ('start', 'stage/readurl'),
+             ('finish', 'stage/readurl'), ('finish', 'stage')],
+            [(e.event_type, e.name) for e in reported])
+        self.assertEqual('GET ' + url, reported[1].description)
+        self.assertIn('status 200, 4b, 1 attempts', reported[2].description)
+        self.assertNotIn('secret', reported[2].description)
+
+    @httpretty.activate
+    @mock.patch(M_PATH + 'time.sleep')
+    def test_wait_for_url_counts_readurl_attempts_once(self, m_sleep):
+        """readurl calls made by wait_for_url add to its single record."""
+        url = 'http://hostname/path'
+        httpretty.register_uri(httpretty.GET, url, responses=[
+            httpretty.Response('', status=500),
+            httpretty.Response('', status=500),
+            httpretty.Response('up')])
+        self.assertEqual(
+            (url, b'up'), url_helper.wait_for_url([url], max_wait=10))
+        timings = url_helper.get_request_timings()
+        self.assertEqual(1, len(timings['requests']))
+        record = timings['requests'][-1]
+        self.assertEqual(
+            ('wait_for_url', 3, 200, 2, 2.0, False),
+            (record['name'], record['attempts'], record['status'],
+             record['bytes'], record['sleep'], record['failed']))
+        totals = timings['totals']
+        self.assertEqual(
+            (1, 3, 0, 2, 2.0),
+            (totals['requests'], totals['attempts'], totals['failed'],
+             totals['bytes'], totals['sleep']))
+        for phase in ('connect', 'tls', 'ttfb', 'total'):
+            self.assertEqual(record[phase], totals[phase])
+
+    def test_write_request_timings_merges_stages(self):
+        path = self.tmp_path('url-timings.json')
+        url_helper.write_request_timings(path, 'init-local')
+        url_helper.write_request_timings(path, 'init')
+        timings = util.load_json(util.load_file(path))
+        self.assertEqual(['init', 'init-local'], sorted(timings))
+        self.assertEqual(0, timings['init']['totals']['requests'])
+
 # vi: ts=4 expandtab
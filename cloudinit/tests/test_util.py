@@ -9,6 +9,7 @@ import platform
 import pytest
 
 import cloudinit.util as util
+from cloudinit import seed_image
 from cloudinit import subp
 
 from cloudinit.tests.helpers import CiTestCase, mock
@@ -332,16 +333,42 @@ class TestBlkid(CiTestCase):
     }
 
     blkid_out = dedent("""\
-        /dev/loop0: TYPE="squashfs"
-        /dev/loop1: TYPE="squashfs"
-        /dev/loop2: TYPE="squashfs"
-        /dev/loop3: TYPE="squashfs"
-        /dev/sda1: UUID="{id01}" TYPE="vfat" PARTUUID="{id02}"
-        /dev/sda2: UUID="{id03}" TYPE="ext4" PARTUUID="{id04}"
-        /dev/sda3: UUID="{id05}" TYPE="ext4" PARTUUID="{id06}"
-        /dev/sda4: LABEL="default" UUID="{id07}" UUID_SUB="{id08}" """
-                       """TYPE="zfs_member" PARTUUID="{id09}"
-        /dev/loop4: TYPE="squashfs"
+        DEVNAME=/dev/loop0
+        TYPE=squashfs
+
+        DEVNAME=/dev/loop1
+        TYPE=squashfs
+
+        DEVNAME=/dev/loop2
+        TYPE=squashfs
+
+        DEVNAME=/dev/loop3
+        TYPE=squashfs
+
+        DEVNAME=/dev/sda1
+        UUID={id01}
+        TYPE=vfat
+        PARTUUID={id02}
+
+        DEVNAME=/dev/sda2
+        UUID={id03}
+        TYPE=ext4
+        PARTUUID={id04}
+
+        DEVNAME=/dev/sda3
+        UUID={id05}
+        TYPE=ext4
+        PARTUUID={id06}
+
+        DEVNAME=/dev/sda4
+        LABEL=default
+        UUID={id07}
+        UUID_SUB={id08}
+        TYPE=zfs_member
+        PARTUUID={id09}
+
+        DEVNAME=/dev/loop4
+        TYPE=squashfs
       """)
 
     maxDiff = None
@@ -374,7 +401,7 @@ class TestBlkid(CiTestCase):
         m_subp.return_value = (
             self.blkid_out.format(**self.ids), "")
         self.assertEqual(self._get_expected(), util.blkid())
-        m_subp.assert_called_with(["blkid", "-o", "full"], capture=True,
+        m_subp.assert_called_with(["blkid", "-o", "export"], rcs=[0, 2],
                                   decode="replace")
 
     @mock.patch("cloudinit.subp.subp")
@@ -384,7 +411,20 @@ class TestBlkid(CiTestCase):
             self.blkid_out.format(**self.ids), "")
         self.assertEqual(self._get_expected(),
                          util.blkid(disable_cache=True))
-        m_subp.assert_called_with(["blkid", "-o", "full", "-c", "/dev/null"],
+        m_subp.assert_called_with(
+            ["blkid", "-o", "export", "-c", "/dev/null"], rcs=[0, 2],
+            decode="replace")
+
+    @mock.patch("cloudinit.subp.subp")
+    def test_blkid_devs_queries_devices(self, m_subp):
+        """Devices given are queried with blkid directly."""
+        m_subp.return_value = (
+            '/dev/sda1: UUID="{id01}" TYPE="vfat"\n'.format(**self.ids), "")
+        self.assertEqual(
+            {"/dev/sda1": {"DEVNAME": "/dev/sda1", "TYPE": "vfat",
+                           "UUID": self.ids["id01"]}},
+            util.blkid(devs=["/dev/sda1"]))
+        m_subp.assert_called_with(["blkid", "-o", "full", "/dev/sda1"],
                                   capture=True, decode="replace")
 
 
@@ -873,6 +913,76 @@ class TestMountCb:
             mock.call(mock.ANY, mock.sentinel.data)
         ] == callback.call_args_list
 
+    @pytest.mark.parametrize(
+        "fstype,mtype", [("vfat", ["vfat", "iso9660"]), ("iso9660", None)])
+    @mock.patch("cloudinit.util.is_Linux", return_value=True)
+    @mock.patch("cloudinit.util.mounts", return_value={})
+    @mock.patch("cloudinit.util.blkid_index")
+    @mock.patch("cloudinit.util.subp.subp")
+    @mock.patch("cloudinit.util.seed_image.extracted_dir")
+    def test_seed_image_read_without_mounting(
+        self, m_extracted_dir, m_subp, m_blkid_index, _m_mounts, _m_is_linux,
+        fstype, mtype
+    ):
+        """ISO9660 and FAT seed images are read in-process."""
+        m_blkid_index.return_value = {"/dev/sr0": {"TYPE": fstype}}
+        m_extracted_dir.return_value = "/run/cloud-init/tmp/seed-image-x"
+        callback = mock.Mock()
+        util.mount_cb("/dev/sr0", callback, mtype=mtype)
+
+        assert [
+            mock.call("/dev/sr0", [fstype])
+        ] == m_extracted_dir.call_args_list
+        assert [
+            mock.call("/run/cloud-init/tmp/seed-image-x/")
+        ] == callback.call_args_list
+        assert 0 == m_subp.call_count
+
+    @pytest.mark.parametrize(
+        "fstype,mtype", [
+            ("ntfs", "ntfs"),
+            ("udf", "auto"),
+            ("udf", "iso9660"),
+            ("iso9660", "vfat"),
+            (None, "auto"),
+        ])
+    @mock.patch("cloudinit.util.is_Linux", return_value=True)
+    @mock.patch("cloudinit.util.mounts", return_value={})
+    @mock.patch("cloudinit.util.blkid_index")
+    @mock.patch("cloudinit.util.subp.subp")
+    @mock.patch("cloudinit.util.seed_image.extracted_dir")
+    def test_other_filesystems_are_mounted(
+        self, m_extracted_dir, m_subp, m_blkid_index, _m_mounts, _m_is_linux,
+        fstype, mtype
+    ):
+        """Devices blkid does not report as iso9660 or vfat are mounted.
+
+        A UDF bridge disc also has an ISO9660 descriptor, but blkid and
+        mount -t auto treat it as udf.
+        """
+        m_blkid_index.return_value = {"/dev/sr0": {"TYPE": fstype}}
+        util.mount_cb("/dev/sr0", mock.Mock(), mtype=mtype)
+
+        assert 0 == m_extracted_dir.call_count
+        assert ["mount", "-o", "ro", "-t", mtype, "/dev/sr0"] == (
+            m_subp.call_args_list[0][0][0][:-1])
+
+    @mock.patch("cloudinit.util.is_Linux", return_value=True)
+    @mock.patch("cloudinit.util.mounts", return_value={})
+    @mock.patch("cloudinit.util.blkid_index")
+    @mock.patch("cloudinit.util.subp.subp")
+    @mock.patch("cloudinit.util.seed_image.extracted_dir")
+    def test_unreadable_seed_image_is_mounted(
+        self, m_extracted_dir, m_subp, m_blkid_index, _m_mounts, _m_is_linux
+    ):
+        m_blkid_index.return_value = {"/dev/sr0": {"TYPE": "iso9660"}}
+        m_extracted_dir.side_effect = seed_image.UnsupportedImageError("x")
+        util.mount_cb("/dev/sr0", mock.Mock())
+
+        assert 1 == m_extracted_dir.call_count
+        assert ["mount", "-o", "ro", "-t", "auto", "/dev/sr0"] == (
+            m_subp.call_args_list[0][0][0][:-1])
+
 
 @mock.patch("cloudinit.util.write_file")
 class TestEnsureFile:
@@ -8,20 +8,31 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import collections
 import copy
+import datetime
+import inspect
 import json
 import os
+import threading
 import time
 from email.utils import parsedate
 from errno import ENOENT
-from functools import partial
+from functools import partial, wraps
 from http.client import NOT_FOUND
 from itertools import count
 from urllib.parse import urlparse, urlunparse, quote
 
 import requests
 from requests import exceptions
-
+# Imported via requests.packages for the reasons given in DataSourceScaleway
+# pylint: disable=E0401
+from requests.packages.urllib3.connection import (
+    HTTPConnection, HTTPSConnection)
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool, HTTPSConnectionPool)
+
+from cloudinit import atomic_helper
 from cloudinit import log as logging
 from cloudinit import version
 
@@ -33,6 +44,10 @@ SSL_ENABLED = False
 CONFIG_ENABLED = False  # This was added in 0.7 (but taken out in >=1.0)
 _REQ_VER = None
 REDACTED = 'REDACTED'
+REQUEST_TIMINGS_FILE = 'url-timings.json'
+# Most recent requests kept for REQUEST_TIMINGS_FILE, totals cover all
+MAX_TIMED_REQUESTS = 200
+TIMING_PHASES = ('connect', 'tls', 'ttfb', 'total', 'sleep')
 try:
     from distutils.version import LooseVersion
     import pkg_resources
@@ -170,6 +185,255 @@ class UrlError(IOError):
         self.url = url
 
 
+def _new_timings():
+    return {
+        'requests': collections.deque(maxlen=MAX_TIMED_REQUESTS),
+        'totals': dict(
+            [(phase, 0.0) for phase in TIMING_PHASES],
+            requests=0, attempts=0, failed=0, bytes=0),
+    }
+
+
+_TIMINGS = _new_timings()
+# The RequestTimer of the request this thread makes, and the request record
+# its connections account their time to
+_CURRENT = threading.local()
+
+
+def _add_phase_time(phase, seconds):
+    record = getattr(_CURRENT, 'record', None)
+    if record is not None:
+        record[phase] += seconds
+
+
+class _TimedConnectionMixin(object):
+    """Account time spent connecting (including name resolution)."""
+
+    def _new_conn(self):
+        start = time.monotonic()
+        try:
+            return super(_TimedConnectionMixin, self)._new_conn()
+        finally:
+            _add_phase_time('connect', time.monotonic() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+
+    def connect(self):
+        """Account TLS setup as connect() time not spent in _new_conn."""
+        record = getattr(_CURRENT, 'record', None)
+        connect_before = record['connect'] if record else 0
+        start = time.monotonic()
+        try:
+            super(_TimedHTTPSConnection, self).connect()
+        finally:
+            if record:
+                record['tls'] += (time.monotonic() - start -
+                                  (record['connect'] - connect_before))
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimingAdapter(requests.adapters.HTTPAdapter):
+    """Adapter for requests recording connect and TLS setup times."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimingAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+def _public_url(url):
+    """Return url without query or fragment, which may carry secrets."""
+    parsed = urlparse(url)
+    return urlunparse(parsed._replace(query='', fragment=''))
+
+
+class RequestTimer(object):
+    """Context manager timing a url request and its retries.
+
+    Timings are accumulated for get_request_timings() and reported as
+    start and finish events nested in the current ReportEventStack, so
+    'cloud-init analyze' attributes network time to the calling stage.
+
+    Phases, in seconds, summed over all attempts:
+      - connect: name resolution and TCP connection setup
+      - tls: TLS handshake
+      - ttfb: time from sending a request until response headers arrived,
+        including connect and tls
+      - sleep: time slept between retries
+      - total: wall time of the whole operation
+    """
+
+    def __init__(self, name, url, method='GET'):
+        self.name = name
+        if isinstance(url, (list, tuple)):
+            url = ' '.join(_public_url(u) for u in url)
+        else:
+            url = _public_url(url)
+        self.record = dict(
+            [(phase, 0.0) for phase in TIMING_PHASES],
+            name=name, url=url, method=method, attempts=0, status=None,
+            bytes=0)
+        # Set True for failures which are not raised
+        self.failed = False
+        self._event_name = None
+        self._start = None
+        self._outer = None
+
+    def __enter__(self):
+        # Imported here as reporting handlers import this module
+        from cloudinit.reporting import events
+
+        self._start = time.monotonic()
+        parent = events.current_event_stack()
+        # Requests made to publish events, such as by the webhook handler,
+        # are not reported as that would recurse endlessly
+        if (parent and parent.reporting_enabled and
+                not getattr(_CURRENT, 'publishing', False)):
+            self._event_name = '/'.join((parent.fullname, self.name))
+            self._publish(
+                events.report_start_event, self._event_name,
+                '%s %s' % (self.record['method'], self.record['url']))
+        self._outer = getattr(_CURRENT, 'timer', None)
+        _CURRENT.timer = self
+        return self
+
+    @staticmethod
+    def _publish(report_func, *args):
+        _CURRENT.publishing = True
+        try:
+            report_func(*args)
+        finally:
+            _CURRENT.publishing = False
+
+    def attempt(self):
+        """Return a context manager covering a single request attempt."""
+        self.record['attempts'] += 1
+        return _CurrentRecord(self.record)
+
+    def response(self, response):
+        """Record a requests.Response of the last attempt."""
+        self.record['status'] = response.status_code
+        self.record['bytes'] += len(response.content)
+        if isinstance(response.elapsed, datetime.timedelta):
+            self.record['ttfb'] += response.elapsed.total_seconds()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        self.record['sleep'] += seconds
+
+    def describe(self):
+        record = self.record
+        return (
+            '%s %s: status %s, %sb, %s attempts, connect %.3fs, tls %.3fs,'
+            ' ttfb %.3fs, slept %.3fs, total %.3fs' % (
+                record['method'], record['url'], record['status'],
+                record['bytes'], record['attempts'], record['connect'],
+                record['tls'], record['ttfb'], record['sleep'],
+                record['total']))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _CURRENT.timer = self._outer
+        record = self.record
+        record['total'] = time.monotonic() - self._start
+        record['failed'] = self.failed or exc_value is not None
+        record['finished'] = time.time()
+        _TIMINGS['requests'].append(record)
+        totals = _TIMINGS['totals']
+        totals['requests'] += 1
+        totals['failed'] += int(record['failed'])
+        for key in TIMING_PHASES + ('attempts', 'bytes'):
+            totals[key] += record[key]
+        if self._event_name:
+            from cloudinit.reporting import events
+
+            result = events.status.SUCCESS
+            if record['failed']:
+                result = events.status.FAIL
+            self._publish(events.report_finish_event, self._event_name,
+                          self.describe(), result)
+
+
+class _CurrentRecord(object):
+    """Make connections opened in this thread account time to record."""
+
+    def __init__(self, record):
+        self.record = record
+
+    def __enter__(self):
+        _CURRENT.record = self.record
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _CURRENT.record = None
+
+
+def _timed_request(name):
+    """Run the decorated request function in a RequestTimer called name.
+
+    The function's first argument is the url, or list of urls, requested
+    and the timer is available to it as _CURRENT.timer. Calls made while
+    this thread already times a request, such as the readurl calls of
+    wait_for_url, add their attempts to that request's record instead of
+    being counted as requests of their own.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_CURRENT, 'timer', None) is not None:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs).arguments
+            method = bound.get('request_method')
+            if not method:
+                method = 'POST' if bound.get('data') else 'GET'
+            urls = bound.get('url', bound.get('urls'))
+            with RequestTimer(name, urls, method):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_request_timings():
+    """Return timings of url requests made by this process.
+
+    @return: Dict with 'totals' over all requests and a 'requests' list with
+        the most recent MAX_TIMED_REQUESTS request records.
+    """
+    return {'totals': dict(_TIMINGS['totals']),
+            'requests': list(_TIMINGS['requests'])}
+
+
+def reset_request_timings():
+    global _TIMINGS
+    _TIMINGS = _new_timings()
+
+
+def write_request_timings(path, stage):
+    """Merge this process' request timings into path keyed by stage."""
+    try:
+        with open(path) as stream:
+            summary = json.load(stream)
+    except (IOError, OSError, ValueError):
+        summary = {}
+    summary[stage] = get_request_timings()
+    atomic_helper.write_json(path, summary)
+
+
 def _get_ssl_args(url, ssl_details):
     ssl_args = {}
     scheme = urlparse(url).scheme
@@ -190,6 +454,7 @@ def _get_ssl_args(url, ssl_details):
     return ssl_args
 
 
+@_timed_request('readurl')
 def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
             headers=None, headers_cb=None, headers_redact=None,
             ssl_details=None, check_status=True, allow_redirects=True,
@@ -271,6 +536,7 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     if sec_between is None:
         sec_between = -1
 
+    timer = _CURRENT.timer
     excps = []
     # Handle retrying ourselves since the built-in support
     # doesn't handle sleeping between tries...
@@ -298,9 +564,12 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
 
             if session is None:
                 session = requests.Session()
+                session.mount('http://', TimingAdapter())
+                session.mount('https://', TimingAdapter())
 
-            with session as sess:
+            with session as sess, timer.attempt():
                 r = sess.request(**req_args)
+            timer.response(r)
 
             if check_status:
                 r.raise_for_status()
@@ -314,6 +583,7 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
             if (isinstance(e, (exceptions.HTTPError)) and
                hasattr(e, 'response') and  # This appeared in v 0.10.8
                hasattr(e.response, 'status_code')):
+                timer.record['status'] = e.response.status_code
                 excps.append(UrlError(e, code=e.response.status_code,
                                       headers=e.response.headers,
                                       url=url))
@@ -335,12 +605,13 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
                     LOG.debug(
                         "Please wait %s seconds while we wait to try again",
                         sec_between)
-                time.sleep(sec_between)
+                timer.sleep(sec_between)
     if excps:
         raise excps[-1]
     return None  # Should throw before this...
 
 
+@_timed_request('wait_for_url')
 def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
                  headers_cb=None, headers_redact=None, sleep_time=1,
                  exception_cb=None, sleep_time_cb=None, request_method=None):
@@ -392,6 +663,7 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
             return False
         return ((max_wait <= 0) or (time.time() - start_time > max_wait))
 
+    timer = _CURRENT.timer
     loop_n = 0
     response = None
     while True:
@@ -457,8 +729,11 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
         loop_n = loop_n + 1
         LOG.debug("Please wait %s seconds while we wait to try again",
                   sleep_time)
-        time.sleep(sleep_time)
+        timer.sleep(sleep_time)
 
+    timer.failed = True
+    LOG.debug("Giving up on %s after %.3f seconds, %.3f of them sleeping",
+              urls, time.time() - start_time, timer.record['sleep'])
     return False, None
 
 
@@ -36,12 +36,14 @@ from errno import ENOENT
 from functools import lru_cache
 from urllib import parse
 
+from cloudinit import file_watch
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import subp
 from cloudinit import (
     mergers,
     safeyaml,
+    seed_image,
     temp_utils,
     type_utils,
     url_helper,
@@ -50,6 +52,8 @@ from cloudinit import (
 from cloudinit.settings import CFG_BUILTIN
 
 _DNS_REDIRECT_IP = None
+# (block device names, {device path: tags}) from the last blkid run
+_BLKID_INDEX = None
 LOG = logging.getLogger(__name__)
 
 # Helps cleanup filenames to ensure they aren't FS incompatible
@@ -1245,6 +1249,13 @@ def find_devs_with(criteria=None, oformat='device',
         return find_devs_with_dragonflybsd(criteria, oformat,
                                            tag, no_cache, path)
 
+    if oformat == 'device' and not tag and not path:
+        index = blkid_index(no_cache=no_cache)
+        if not criteria:
+            return list(index)
+        name, _, value = criteria.partition('=')
+        return [dev for dev, tags in index.items() if tags.get(name) == value]
+
     blk_id_cmd = ['blkid']
     options = []
     if criteria:
@@ -1288,6 +1299,69 @@ def find_devs_with(criteria=None, oformat='device',
     return entries
 
 
+def _block_device_names():
+    try:
+        return frozenset(os.listdir('/sys/class/block'))
+    except OSError:
+        return None
+
+
+def _unescape_blkid_value(value):
+    return re.sub(r'\\(.)', r'\1', value)
+
+
+def blkid_index(no_cache=False):
+    """Get all device tags details from a single blkid run.
+
+    The index is kept for the life of the process so that repeated
+    find_devs_with and blkid queries do not run blkid again. It is rebuilt
+    when block devices were added or removed since, when no_cache is set and
+    after clear_blkid_index.
+
+    @param no_cache: Bool, set True to rebuild the index from a clean blkid
+        cache.
+
+    @return: Dict of device path to a dict of its tags, in blkid order.
+    """
+    global _BLKID_INDEX
+    names = _block_device_names()
+    if (not no_cache and _BLKID_INDEX is not None and names is not None and
+            _BLKID_INDEX[0] == names):
+        return _BLKID_INDEX[1]
+
+    cmd = ['blkid', '-o', 'export']
+    if no_cache:
+        cmd.extend(['-c', '/dev/null'])
+    # See man blkid for why 2 is added
+    try:
+        (out, _err) = subp.subp(cmd, rcs=[0, 2], decode="replace")
+    except subp.ProcessExecutionError as e:
+        if e.errno == ENOENT:
+            # blkid not found...
+            out = ""
+        else:
+            raise
+    index = {}
+    tags = {}
+    # Devices are blocks of NAME=value lines separated by empty lines
+    for line in out.splitlines() + ['']:
+        name, sep, value = line.strip().partition('=')
+        if sep:
+            tags[name] = _unescape_blkid_value(value)
+        elif tags:
+            if tags.get('DEVNAME'):
+                index[tags['DEVNAME']] = tags
+            tags = {}
+    _BLKID_INDEX = (names, index)
+    return index
+
+
+def clear_blkid_index():
+    """Forget the blkid index, e.g. after creating file systems."""
+    global _BLKID_INDEX
+    _BLKID_INDEX = None
+
+
 def blkid(devs=None, disable_cache=False):
     """Get all device tags details from blkid.
 
@@ -1297,9 +1371,9 @@ def blkid(devs=None, disable_cache=False):
     @return: Dict of key value pairs of info for the device.
     """
     if devs is None:
-        devs = []
-    else:
-        devs = list(devs)
+        return dict((dev, dict(tags)) for dev, tags in
+                    blkid_index(no_cache=disable_cache).items())
+    devs = list(devs)
 
     cmd = ['blkid', '-o', 'full']
     if disable_cache:
@@ -1672,6 +1746,32 @@ def mounts():
     return mounted
 
 
+def _read_seed_image(device, mtypes):
+    """Return a directory holding the files of device read in-process.
+
+    ISO9660 and FAT seed images are read without mounting them, which also
+    works where mounting is not permitted. Only devices which blkid reports
+    as one of those types are read, so that e.g. UDF bridge discs are still
+    mounted as udf. Return None if the device has to be mounted.
+    """
+    if not is_Linux():
+        return None
+    fstype = blkid_index().get(os.path.realpath(device), {}).get('TYPE')
+    if fstype not in seed_image.SUPPORTED_TYPES:
+        return None
+    if fstype == seed_image.VFAT:
+        accepted = ('auto', 'vfat', 'msdos')
+    else:
+        accepted = ('auto', fstype)
+    if not any(mtype in accepted for mtype in mtypes):
+        return None
+    try:
+        return seed_image.extracted_dir(device, [fstype])
+    except seed_image.UnsupportedImageError as e:
+        LOG.debug("Mounting %s, not readable in-process: %s", device, e)
+        return None
+
+
 def mount_cb(device, callback, data=None, mtype=None,
              update_env_for_mount=None):
     """
@@ -1716,6 +1816,8 @@ def mount_cb(device, callback, data=None, mtype=None,
         if os.path.realpath(device) in mounted:
             mountpoint = mounted[os.path.realpath(device)]['mountpoint']
         else:
+            mountpoint = _read_seed_image(device, mtypes)
+        if not mountpoint:
             failure_reason = None
             for mtype in mtypes:
                 mountpoint = None
@@ -1875,7 +1977,8 @@ def write_file(
     Restores the SELinux context if possible.
 
     @param filename: The full path of the file to write.
-    @param content: The content to write to the file.
+    @param content: The content to write to the file, or an iterable of
+                    content chunks which are written one at a time.
     @param mode: The filesystem mode to set on the file.
     @param omode: The open mode used when opening the file (w, wb, a, etc.)
     @param preserve_mode: If True and `filename` exists, preserve `filename`s
@@ -1895,20 +1998,27 @@ def write_file(
     if ensure_dir_exists:
         ensure_dir(os.path.dirname(filename))
     if 'b' in omode.lower():
-        content = encode_text(content)
+        convert = encode_text
         write_type = 'bytes'
     else:
-        content = decode_binary(content)
+        convert = decode_binary
         write_type = 'characters'
+    if isinstance(content, (str, bytes)):
+        chunks = [convert(content)]
+        size = len(chunks[0])
+    else:
+        chunks = (convert(chunk) for chunk in content)
+        size = 'streamed'
     try:
         mode_r = "%o" % mode
     except TypeError:
         mode_r = "%r" % mode
     LOG.debug("Writing to %s - %s: [%s] %s %s",
-              filename, omode, mode_r, len(content), write_type)
+              filename, omode, mode_r, size, write_type)
     with SeLinuxGuard(path=filename):
         with open(filename, omode) as fh:
-            fh.write(content)
+            for chunk in chunks:
+                fh.write(chunk)
             fh.flush()
     chmod(filename, mode)
 
@@ -2608,21 +2718,28 @@ def load_shell_content(content, add_empty=False, empty_val=None):
 
 
 def wait_for_files(flist, maxwait, naplen=.5, log_pre=""):
+    """Wait up to maxwait seconds for all files in flist to exist.
+
+    Waits are woken by inotify when available and otherwise poll every
+    naplen seconds.
+
+    @return: Set of files still missing, empty if all appeared.
+    """
     need = set(flist)
-    waited = 0
-    while True:
-        need -= set([f for f in need if os.path.exists(f)])
-        if len(need) == 0:
-            LOG.debug("%sAll files appeared after %s seconds: %s",
-                      log_pre, waited, flist)
-            return []
-        if waited == 0:
-            LOG.debug("%sWaiting up to %s seconds for the following files: %s",
-                      log_pre, maxwait, flist)
-        if waited + naplen > maxwait:
-            break
-        time.sleep(naplen)
-        waited += naplen
+    start = time.time()
+
+    def _all_exist():
+        need.difference_update([f for f in need if os.path.exists(f)])
+        return not need
+
+    if not _all_exist():
+        LOG.debug("%sWaiting up to %s seconds for the following files: %s",
+                  log_pre, maxwait, flist)
+        file_watch.wait_for(_all_exist, flist, maxwait, naplen=naplen)
+    if not need:
+        LOG.debug("%sAll files appeared after %.3f seconds: %s",
+                  log_pre, time.time() - start, flist)
+        return []
 
     LOG.debug("%sStill missing files after %s seconds: %s",
               log_pre, maxwait, need)
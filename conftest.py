@@ -157,6 +157,44 @@ def disable_subp_usage(request, fixture_utils):
         yield
 
 
+@pytest.yield_fixture(autouse=True)
+def disable_netlink_requests():
+    """
+    Across all (pytest) tests, ensure that no rtnetlink requests are sent.
+
+    Such requests would change the network configuration of the host running
+    the tests. Code sending them falls back to ip commands, see
+    ``net.EphemeralIPv4Network``, so tests relying on ``subp.subp`` mocks
+    keep working. Tests of the rtnetlink code paths patch
+    ``send_rtnetlink_requests`` themselves.
+    """
+    from cloudinit.sources.helpers import netlink
+
+    with mock.patch(
+        "cloudinit.sources.helpers.netlink.send_rtnetlink_requests",
+        side_effect=netlink.NetlinkCreateSocketError(
+            "rtnetlink requests are disabled in unit tests"
+        ),
+    ):
+        yield
+
+
+@pytest.yield_fixture(autouse=True)
+def clear_blkid_index():
+    """
+    Across all (pytest) tests, start without a blkid index.
+
+    ``util.blkid_index`` keeps blkid output for the life of the process, so
+    an index built from one test's ``subp.subp`` mock would otherwise answer
+    ``util.find_devs_with`` queries of later tests.
+    """
+    from cloudinit import util
+
+    util.clear_blkid_index()
+    yield
+    util.clear_blkid_index()
+
+
 @pytest.fixture(scope="session")
 def fixture_utils():
     """Return a namespace containing fixture utility functions.
@@ -128,6 +128,7 @@ INITSYS_FILES = {
     'systemd': [render_tmpl(f)
                 for f in (glob('systemd/*.tmpl') +
                           glob('systemd/*.service') +
+                          glob('systemd/*.socket') +
                           glob('systemd/*.target'))
                 if (is_f(f) and not is_generator(f))],
     'systemd.generators': [
@@ -31,6 +31,27 @@ class TestAtomicHelper(CiTestCase):
         atomic_helper.write_file(path, contents, mode=0o400)
         self.check_file(path, contents, perms=0o400)
 
+    def test_chunks(self):
+        """write_file writes an iterable of chunks."""
+        path = self.tmp_path("test_chunks")
+        atomic_helper.write_file(path, iter([b"Hey ", b"there\n"]))
+        self.check_file(path, b"Hey there\n")
+
+    def test_failed_chunks_keep_existing_file(self):
+        """An error while producing chunks leaves filename untouched."""
+        path = self.tmp_path("test_failed_chunks")
+        atomic_helper.write_file(path, b"original\n")
+
+        def chunks():
+            yield b"partial"
+            raise ValueError("bad chunk")
+
+        with self.assertRaises(ValueError):
+            atomic_helper.write_file(path, chunks())
+        self.check_file(path, b"original\n")
+        self.assertEqual(["test_failed_chunks"],
+                         os.listdir(os.path.dirname(path)))
+
     def test_write_json(self):
         """write_json output is readable json."""
         path = self.tmp_path("test_write_json")
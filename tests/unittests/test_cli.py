@@ -20,6 +20,9 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         super(TestCLI, self).setUp()
         self.stderr = io.StringIO()
         self.patchStdoutAndStderr(stderr=self.stderr)
+        # Reading the kernel cmdline to configure profiling runs subp
+        self.add_patch('cloudinit.cmd.main.util.get_cmdline', 'm_cmdline',
+                       return_value='')
 
     def _call_main(self, sysv_args=None):
         if not sysv_args:
@@ -98,6 +101,10 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         self.assertFalse(
             os.path.exists(self.tmp_path('result.json', link_d)),
             'unexpected result.json link found')
+        timings = load_json(load_file(self.tmp_path('url-timings.json',
+                                                    link_d)))
+        self.assertEqual(['init-local'], list(timings.keys()))
+        self.assertIn('totals', timings['init-local'])
 
     def test_no_arguments_shows_usage(self):
         exit_code = self._call_main()
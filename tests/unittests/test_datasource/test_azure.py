@@ -2497,6 +2497,28 @@ class TestCanDevBeReformatted(CiTestCase):
                       "(datasource.Azure.never_destroy_ntfs)", msg)
 
 
+class TestAddressEphemeralResize(CiTestCase):
+
+    def test_clears_module_semaphores_with_configured_backend(self):
+        """disk_setup and mounts semaphores are cleared in the journal."""
+        tmp = self.tmp_dir()
+        paths = helpers.Paths(
+            {'cloud_dir': tmp, 'semaphore_backend': 'journal'})
+        sem_path = paths.get_ipath_cur('sem')
+        sems = helpers.get_semaphores(paths, sem_path)
+        for name in ('config_disk_setup', 'config_mounts', 'config_other'):
+            with sems.lock(name, 'once-per-instance'):
+                pass
+        sems.flush()
+        dsaz.address_ephemeral_resize(
+            paths, devpath=tmp, is_new_instance=True)
+        sems = helpers.get_semaphores(paths, sem_path)
+        self.assertEqual(
+            [False, False, True],
+            [sems.has_run(name, 'once-per-instance') for name in (
+                'config_disk_setup', 'config_mounts', 'config_other')])
+
+
 class TestClearCachedData(CiTestCase):
 
     def test_clear_cached_attrs_clears_imds(self):
@@ -2873,6 +2895,8 @@ class TestPreprovisioningHotAttachNics(CiTestCase):
         dsa.wait_for_link_up("eth0")
         self.assertEqual(1, m_is_link_up.call_count)
 
+    @mock.patch('cloudinit.sources.helpers.netlink.'
+                'create_bound_netlink_socket', mock.MagicMock())
     @mock.patch(MOCKPATH + 'util.write_file')
     @mock.patch('cloudinit.net.read_sys_net')
     @mock.patch('cloudinit.distros.networking.LinuxNetworking.try_set_link_up')
@@ -2901,6 +2925,68 @@ class TestPreprovisioningHotAttachNics(CiTestCase):
         self.assertEqual(1, m_read_sys_net.call_count)
         self.assertEqual(2, m_writefile.call_count)
 
+    @mock.patch(MOCKPATH + 'sleep')
+    @mock.patch('cloudinit.sources.helpers.netlink.wait_for_link_up_event')
+    @mock.patch('cloudinit.sources.helpers.netlink.'
+                'create_bound_netlink_socket')
+    @mock.patch(MOCKPATH + 'util.write_file', mock.MagicMock())
+    @mock.patch('cloudinit.net.read_sys_net', mock.MagicMock())
+    @mock.patch('cloudinit.distros.networking.LinuxNetworking.try_set_link_up')
+    def test_wait_for_link_up_waits_on_netlink_between_attempts(
+            self, m_is_link_up, m_socket, m_link_up_event, m_sleep):
+        """The link is checked again as soon as netlink reports it up
+           instead of after a fixed sleep."""
+        distro_cls = distros.fetch('ubuntu')
+        distro = distro_cls('ubuntu', {}, self.paths)
+        dsa = dsaz.DataSourceAzure({}, distro=distro, paths=self.paths)
+        m_is_link_up.side_effect = [False, False, False, True]
+        m_link_up_event.side_effect = [False, True]
+
+        dsa.wait_for_link_up("eth0")
+        self.assertEqual(4, m_is_link_up.call_count)
+        self.assertEqual(
+            [mock.call(m_socket.return_value, "eth0",
+                       dsaz.LINK_UP_TIMEOUT_IN_SECONDS)] * 2,
+            m_link_up_event.call_args_list)
+        self.assertEqual(0, m_sleep.call_count)
+        m_socket.return_value.close.assert_called_once_with()
+
+    @mock.patch(MOCKPATH + 'sleep')
+    @mock.patch('cloudinit.sources.helpers.netlink.'
+                'create_bound_netlink_socket')
+    @mock.patch(MOCKPATH + 'util.write_file', mock.MagicMock())
+    @mock.patch('cloudinit.net.read_sys_net', mock.MagicMock())
+    @mock.patch('cloudinit.distros.networking.LinuxNetworking.try_set_link_up')
+    def test_wait_for_link_up_sleeps_without_netlink(
+            self, m_is_link_up, m_socket, m_sleep):
+        """Without a netlink socket, sleep between attempts."""
+        distro_cls = distros.fetch('ubuntu')
+        distro = distro_cls('ubuntu', {}, self.paths)
+        dsa = dsaz.DataSourceAzure({}, distro=distro, paths=self.paths)
+        m_socket.side_effect = netlink.NetlinkCreateSocketError
+        m_is_link_up.side_effect = [False, False, True]
+
+        dsa.wait_for_link_up("eth0")
+        m_sleep.assert_called_once_with(dsaz.LINK_UP_TIMEOUT_IN_SECONDS)
+
+    @mock.patch(MOCKPATH + 'report_diagnostic_event')
+    @mock.patch('os.path.isfile', mock.MagicMock(return_value=True))
+    @mock.patch(MOCKPATH + 'DataSourceAzure.fallback_interface',
+                mock.MagicMock())
+    @mock.patch(MOCKPATH + 'DataSourceAzure._report_ready_if_needed')
+    @mock.patch('cloudinit.sources.helpers.netlink.'
+                'create_bound_netlink_socket', mock.MagicMock())
+    def test_wait_for_all_nics_ready_reports_phase_timings(
+            self, m_report_ready, m_diagnostic):
+        """The time spent in each phase is reported."""
+        dsa = dsaz.DataSourceAzure({}, distro=None, paths=self.paths)
+        with mock.patch(MOCKPATH + 'monotonic', side_effect=[1.0, 1.25]):
+            dsa._wait_for_all_nics_ready()
+        self.assertEqual(1, m_report_ready.call_count)
+        m_diagnostic.assert_called_with(
+            'Time spent waiting for nics: report-ready 0.250s',
+            logger_func=dsaz.LOG.info)
+
     @mock.patch('cloudinit.sources.helpers.netlink.'
                 'create_bound_netlink_socket')
     def test_wait_for_all_nics_ready_raises_if_socket_fails(self, m_socket):
@@ -77,6 +77,20 @@ class TestDatasourceExoscale(HttprettyTestCase):
         ds.activate(None, None)
         self.assertFalse(os.path.exists(sem_file))
 
+    def test_activate_clears_set_passwords_journal_semaphore(self):
+        """The semaphore is cleared through the configured backend."""
+        path = helpers.Paths(
+            {'cloud_dir': self.tmp, 'semaphore_backend': 'journal'})
+        sem_dir = self.tmp_path('instance/sem', dir=self.tmp)
+        sems = helpers.get_semaphores(path, sem_dir)
+        with sems.lock('config_set_passwords', 'once-per-instance'):
+            pass
+        sems.flush()
+        ds = DataSourceExoscale({}, None, path)
+        ds.activate(None, None)
+        self.assertFalse(helpers.get_semaphores(path, sem_dir).has_run(
+            'config_set_passwords', 'once-per-instance'))
+
     def test_get_data(self):
         """The datasource conforms to expected behavior when supplied
         full test data."""
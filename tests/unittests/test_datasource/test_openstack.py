@@ -307,7 +307,7 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
         self.assertEqual(VENDOR_DATA, ds_os_local.vendordata_pure)
         self.assertEqual(VENDOR_DATA2, ds_os_local.vendordata2_pure)
         self.assertIsNone(ds_os_local.vendordata_raw)
-        m_dhcp.assert_called_with('eth9', None)
+        m_dhcp.assert_called_with('eth9', None, None)
 
     def test_bad_datasource_meta(self):
         os_files = copy.deepcopy(OS_FILES)
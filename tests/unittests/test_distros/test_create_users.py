@@ -1,9 +1,11 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import os
 import re
 
 from cloudinit import distros
 from cloudinit import ssh_util
+from cloudinit import util
 from cloudinit.tests.helpers import (CiTestCase, mock)
 
 
@@ -268,4 +270,70 @@ class TestCreateUser(CiTestCase):
         with self.assertRaises(RuntimeError):
             self.dist.lock_passwd("bob")
 
+
+@mock.patch("cloudinit.distros.util.system_is_snappy", return_value=False)
+@mock.patch("cloudinit.distros.subp.which", return_value='/usr/bin/passwd')
+@mock.patch("cloudinit.distros.subp.subp")
+class TestCreateUsers(CiTestCase):
+
+    def setUp(self):
+        super(TestCreateUsers, self).setUp()
+        self.dist = MyBaseDistro()
+        self.dist.ci_sudoers_fn = self.tmp_path('90-cloud-init-users')
+        self.add_patch(
+            'cloudinit.distros.Distro.ensure_sudo_dir', 'm_sudo_dir')
+
+    def test_passwords_and_sudo_rules_are_batched(self, m_subp, *_mocks):
+        """All passwords go to one chpasswd per kind, sudo rules at once."""
+        self.dist.create_users([
+            ('user1', {'plain_text_passwd': 'pw1', 'sudo': 'ALL=(ALL) ALL'}),
+            ('user2', {'hashed_passwd': '$6$h2', 'lock_passwd': False}),
+            ('user3', {'plain_text_passwd': 'pw3',
+                       'sudo': ['ALL=(ALL) NOPASSWD:ALL']})])
+        self.assertEqual(
+            [mock.call(['useradd', 'user1', '-m'],
+                       logstring=['useradd', 'user1', '-m']),
+             mock.call(['useradd', 'user2', '-m'],
+                       logstring=['useradd', 'user2', '-m']),
+             mock.call(['useradd', 'user3', '-m'],
+                       logstring=['useradd', 'user3', '-m']),
+             mock.call(['chpasswd'], 'user1:pw1\nuser3:pw3\n',
+                       logstring='chpasswd for user1, user3'),
+             mock.call(['chpasswd', '-e'], 'user2:$6$h2\n',
+                       logstring='chpasswd for user2'),
+             mock.call(['passwd', '-l', 'user1']),
+             mock.call(['passwd', '-l', 'user3'])],
+            m_subp.call_args_list)
+        self.m_sudo_dir.assert_called_once_with(
+            self.dist, os.path.dirname(self.dist.ci_sudoers_fn))
+        content = util.load_file(self.dist.ci_sudoers_fn)
+        self.assertIn(
+            '\n# User rules for user1\nuser1 ALL=(ALL) ALL\n'
+            '\n# User rules for user3\nuser3 ALL=(ALL) NOPASSWD:ALL\n',
+            content)
+
+    def test_invalid_entry_creates_no_user(self, m_subp, *_mocks):
+        """An invalid entry is reported before any user is created."""
+        with self.assertRaises(TypeError):
+            self.dist.create_users([
+                ('user1', {}), ('user2', {'sudo': {'bad': 'rule'}})])
+        m_subp.assert_not_called()
+        self.m_sudo_dir.assert_not_called()
+
+    @mock.patch("cloudinit.distros.util.is_user", return_value=True)
+    @mock.patch("cloudinit.distros.util.is_group", return_value=False)
+    def test_create_groups_adds_each_member_once(
+            self, m_is_group, m_is_user, m_subp, *_mocks):
+        """Members of several groups are added with one usermod call."""
+        self.dist.create_groups(
+            {'group1': ['user1', 'user2'], 'group2': ['user1'],
+             'group3': None})
+        self.assertEqual(
+            [mock.call(['groupadd', 'group1']),
+             mock.call(['groupadd', 'group2']),
+             mock.call(['groupadd', 'group3']),
+             mock.call(['usermod', '-a', '-G', 'group1,group2', 'user1']),
+             mock.call(['usermod', '-a', '-G', 'group1', 'user2'])],
+            m_subp.call_args_list)
+
 # vi: ts=4 expandtab
@@ -1,8 +1,14 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import threading
+
 from cloudinit import distros
+from cloudinit import helpers
+from cloudinit import subp
 from cloudinit import util
-from cloudinit.tests.helpers import (FilesystemMockingTestCase, mock)
+from cloudinit.distros import debian
+from cloudinit.tests.helpers import (
+    CiTestCase, FilesystemMockingTestCase, mock)
 
 
 @mock.patch("cloudinit.distros.debian.subp.subp")
@@ -98,3 +104,57 @@ class TestDebianApplyLocale(FilesystemMockingTestCase):
             m_subp.assert_not_called()
         self.assertEqual(
             'Failed to provide locale value.', str(ctext_m.exception))
+
+
+@mock.patch("cloudinit.distros.debian.subp.subp")
+class TestDebianPackagePrefetch(CiTestCase):
+
+    def setUp(self):
+        super(TestDebianPackagePrefetch, self).setUp()
+        datasource = mock.Mock()
+        datasource.get_instance_id.return_value = 'iid-prefetch'
+        paths = helpers.Paths({'cloud_dir': self.tmp_dir()}, ds=datasource)
+        cls = distros.fetch("debian")
+        self.distro = cls("debian", {}, paths)
+        self.addCleanup(setattr, debian, '_PREFETCH', None)
+
+    def _apt_calls(self, m_subp):
+        return [args[0][-1] for (args, _kwargs) in m_subp.call_args_list]
+
+    def test_update_joins_inflight_prefetch(self, m_subp):
+        """A refresh in flight is waited for instead of run again."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def fake_subp(cmd, **_kwargs):
+            if cmd[-1] == 'update':
+                started.set()
+                self.assertTrue(release.wait(5))
+            return ('', '')
+        m_subp.side_effect = fake_subp
+
+        self.distro.prefetch_package_sources()
+        self.assertTrue(started.wait(5))
+        release.set()
+        self.distro.install_packages(['pkg1'])
+        self.assertEqual(['update', 'pkg1'], self._apt_calls(m_subp))
+        self.assertIsNone(debian._PREFETCH)
+
+    def test_wait_for_package_prefetch(self, m_subp):
+        """Other apt users can wait for the refresh without running one."""
+        release = threading.Event()
+        m_subp.side_effect = lambda *_a, **_k: (release.wait(5), '')
+        self.distro.prefetch_package_sources()
+        prefetch = debian._PREFETCH
+        release.set()
+        self.distro.wait_for_package_prefetch()
+        self.assertFalse(prefetch.is_alive())
+        self.assertIsNone(debian._PREFETCH)
+        self.assertEqual(['update'], self._apt_calls(m_subp))
+
+    def test_failed_prefetch_is_retried(self, m_subp):
+        m_subp.side_effect = [subp.ProcessExecutionError('no network'),
+                              ('', '')]
+        self.distro.prefetch_package_sources()
+        self.distro.update_package_sources()
+        self.assertEqual(['update', 'update'], self._apt_calls(m_subp))
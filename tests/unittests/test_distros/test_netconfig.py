@@ -384,6 +384,63 @@ class TestNetCfgDistroUbuntuEni(TestNetCfgDistroBase):
                                    V1_NET_CFG_IPV6,
                                    expected_cfgs=expected_cfgs.copy())
 
+    def test_network_config_changed_per_renderer(self):
+        """Applied network config is recorded per renderer."""
+        tmpd = None
+        with mock.patch('cloudinit.net.eni.available', return_value=True):
+            with self.reRooted(tmpd) as tmpd:
+                self.assertTrue(self.distro.network_config_changed(V1_NET_CFG))
+                self.distro.apply_network_config(V1_NET_CFG, False)
+                self.assertFalse(
+                    self.distro.network_config_changed(V1_NET_CFG))
+                self.assertTrue(
+                    self.distro.network_config_changed(V1_NET_CFG_IPV6))
+                with mock.patch('cloudinit.net.netplan.available',
+                                return_value=True):
+                    self.distro = self._get_distro(
+                        'ubuntu', renderers=['netplan'])
+                    self.assertTrue(
+                        self.distro.network_config_changed(V1_NET_CFG))
+        self.assertEqual(
+            ['eni'],
+            list(util.load_json(util.load_file(os.path.join(
+                tmpd, 'var/lib/cloud/data/network-config-hashes.json')))))
+
+    def test_network_config_changed_when_rendered_file_changes(self):
+        """Edited or removed rendered files are rendered again."""
+        with mock.patch('cloudinit.net.eni.available', return_value=True):
+            with self.reRooted():
+                self.distro.apply_network_config(V1_NET_CFG, False)
+                self.assertFalse(
+                    self.distro.network_config_changed(V1_NET_CFG))
+                util.write_file(self.eni_path(), 'edited\n')
+                self.assertTrue(
+                    self.distro.network_config_changed(V1_NET_CFG))
+                self.distro.apply_network_config(V1_NET_CFG, False)
+                self.assertFalse(
+                    self.distro.network_config_changed(V1_NET_CFG))
+                util.del_file(self.eni_path())
+                self.assertTrue(
+                    self.distro.network_config_changed(V1_NET_CFG))
+
+    @mock.patch('cloudinit.distros.debian.Distro._bring_up_interfaces')
+    def test_network_config_brought_up_is_recorded(self, m_bring_up):
+        """Bring up owed by a render without bring_up is done later."""
+        m_bring_up.return_value = True
+        with mock.patch('cloudinit.net.eni.available', return_value=True):
+            with self.reRooted():
+                self.distro.apply_network_config(V1_NET_CFG, False)
+                self.assertFalse(
+                    self.distro.network_config_brought_up(V1_NET_CFG))
+                self.distro = self._get_distro('ubuntu', renderers=['eni'])
+                self.assertTrue(self.distro.bring_up_network_config(
+                    V1_NET_CFG))
+                self.assertFalse(
+                    self.distro.network_config_changed(V1_NET_CFG))
+                self.assertTrue(
+                    self.distro.network_config_brought_up(V1_NET_CFG))
+        m_bring_up.assert_called_once_with([])
+
 
 class TestNetCfgDistroUbuntuNetplan(TestNetCfgDistroBase):
     def setUp(self):
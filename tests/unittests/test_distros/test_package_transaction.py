@@ -0,0 +1,62 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from cloudinit.distros.package_transaction import (
+    PackageTransaction, PackageTransactionError)
+from cloudinit.tests.helpers import CiTestCase, mock
+
+
+class TestPackageTransaction(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestPackageTransaction, self).setUp()
+        self.distro = mock.Mock()
+        self.transaction = PackageTransaction(self.distro)
+
+    def test_requests_are_installed_in_one_transaction(self):
+        """Requests from several modules are combined and de-duplicated."""
+        self.transaction.request_update('mod1')
+        self.transaction.request_install(['pkg1', 'pkg2'], module='mod1')
+        self.transaction.request_update('mod2')
+        self.transaction.request_install(
+            ['pkg2', ['pkg3', '1.0']], module='mod2')
+        self.assertTrue(self.transaction.pending)
+        self.assertEqual([], self.distro.method_calls)
+
+        self.transaction.flush()
+        self.assertEqual(
+            [mock.call.update_package_sources(),
+             mock.call.install_packages(['pkg1', 'pkg2', ('pkg3', '1.0')])],
+            self.distro.method_calls)
+        self.assertFalse(self.transaction.pending)
+
+    def test_installed_packages_are_not_installed_again(self):
+        self.transaction.request_install('pkg1', module='mod1')
+        self.transaction.flush()
+        self.transaction.request_install(['pkg1'], module='mod2')
+        self.assertFalse(self.transaction.pending)
+        self.transaction.flush()
+        self.distro.install_packages.assert_called_once_with(['pkg1'])
+
+    def test_failure_is_attributed_to_requesting_module(self):
+        """A failed combined transaction is retried per module."""
+        def install_packages(pkglist):
+            if 'broken' in pkglist:
+                raise RuntimeError('no such package')
+        self.distro.install_packages.side_effect = install_packages
+        self.transaction.request_install(['pkg1'], module='mod1')
+        self.transaction.request_install(['broken'], module='mod2')
+        with self.assertRaises(PackageTransactionError) as ctx:
+            self.transaction.flush()
+        self.assertEqual(['mod2'], list(ctx.exception.failures))
+        self.assertEqual(
+            [mock.call(['pkg1', 'broken']), mock.call(['pkg1']),
+             mock.call(['broken'])],
+            self.distro.install_packages.call_args_list)
+        self.assertFalse(self.transaction.pending)
+        self.transaction.request_install(['pkg1'], module='mod3')
+        self.transaction.flush()
+        self.assertEqual(3, self.distro.install_packages.call_count)
+
+# vi: ts=4 expandtab
@@ -10,6 +10,7 @@ import re
 import shutil
 import socket
 import tempfile
+import threading
 
 from unittest import TestCase, mock
 from unittest.mock import call
@@ -461,6 +462,52 @@ class TestAptSourceConfig(t_help.FilesystemMockingTestCase):
         self.assertFalse(os.path.isfile(self.aptlistfile2))
         self.assertFalse(os.path.isfile(self.aptlistfile3))
 
+    def test_apt_v3_src_ppa_added_once(self):
+        """test_apt_v3_src_ppa_added_once - Test repeated ppa is added once"""
+        params = self._get_default_params()
+        cfg = {self.aptlistfile: {'source': 'ppa:smoser/cloud-init-test'},
+               self.aptlistfile2: {'source': 'ppa:smoser/cloud-init-test'}}
+
+        with mock.patch("cloudinit.subp.subp") as mockobj:
+            self._add_apt_sources(cfg, TARGET, template_params=params,
+                                  aa_repo_match=self.matcher)
+        mockobj.assert_called_once_with(
+            ['add-apt-repository', 'ppa:smoser/cloud-init-test'],
+            target=TARGET)
+
+    def test_apt_v3_src_keyids_fetched_concurrently(self):
+        """test_apt_v3_src_keyids_fetched_concurrently - Test key fetching
+
+        Distinct keys are fetched from the keyserver at the same time and a
+        key shared by several entries is fetched once.
+        """
+        params = self._get_default_params()
+        cfg = {self.aptlistfile: {'keyid': 'K1'},
+               self.aptlistfile2: {'keyid': 'K2',
+                                   'keyserver': 'test.random.com'},
+               self.aptlistfile3: {'keyid': 'K1'}}
+        both_fetching = threading.Barrier(2, timeout=5)
+
+        def getkeybyid(keyid, keyserver):
+            both_fetching.wait()
+            return 'key-%s-%s' % (keyid, keyserver)
+
+        with mock.patch.object(gpg, 'getkeybyid',
+                               side_effect=getkeybyid) as mockgetkey:
+            with mock.patch.object(cc_apt_configure,
+                                   'add_apt_key_raw') as mockadd:
+                self._add_apt_sources(cfg, TARGET, template_params=params,
+                                      aa_repo_match=self.matcher)
+
+        self.assertCountEqual(
+            [call('K1', 'keyserver.ubuntu.com'),
+             call('K2', 'test.random.com')], mockgetkey.call_args_list)
+        self.assertEqual(
+            [call('key-K1-keyserver.ubuntu.com', TARGET),
+             call('key-K2-test.random.com', TARGET),
+             call('key-K1-keyserver.ubuntu.com', TARGET)],
+            mockadd.call_args_list)
+
     @mock.patch("cloudinit.config.cc_apt_configure.util.get_dpkg_architecture")
     def test_apt_v3_list_rename(self, m_get_dpkg_architecture):
         """test_apt_v3_list_rename - Test find mirror and apt list renaming"""
@@ -1153,5 +1200,33 @@ class TestDebconfSelections(TestCase):
         cc_apt_configure.dpkg_reconfigure(['pkgfoo', 'pkgbar'])
         m_subp.assert_not_called()
 
+
+@mock.patch("cloudinit.config.cc_apt_configure.apply_apt_config")
+@mock.patch("cloudinit.config.cc_apt_configure.find_apt_mirror_info",
+            return_value={'MIRROR': 'http://mirror/', 'PRIMARY': 'p',
+                          'SECURITY': 's'})
+@mock.patch("cloudinit.config.cc_apt_configure.util.get_dpkg_architecture",
+            return_value='amd64')
+@mock.patch("cloudinit.config.cc_apt_configure.util.lsb_release",
+            return_value={'codename': 'fakerel'})
+@mock.patch("cloudinit.config.cc_apt_configure.add_apt_sources")
+class TestApplyAptPrefetch(TestCase):
+
+    def test_prefetch_replaces_foreground_update(self, m_add_sources, *_m):
+        """With prefetch_package_index the refresh runs in the background."""
+        mycloud = mock.Mock()
+        cfg = {'preserve_sources_list': True, 'sources': {'s1': {}},
+               'prefetch_package_index': True}
+        cc_apt_configure.apply_apt(cfg, mycloud, None)
+        self.assertFalse(m_add_sources.call_args[1]['update'])
+        mycloud.distro.prefetch_package_sources.assert_called_once_with()
+
+    def test_no_prefetch_by_default(self, m_add_sources, *_m):
+        mycloud = mock.Mock()
+        cfg = {'preserve_sources_list': True, 'sources': {'s1': {}}}
+        cc_apt_configure.apply_apt(cfg, mycloud, None)
+        self.assertTrue(m_add_sources.call_args[1]['update'])
+        mycloud.distro.prefetch_package_sources.assert_not_called()
+
 #
 # vi: ts=4 expandtab
@@ -1,6 +1,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import random
+import threading
 
 from cloudinit.config import cc_disk_setup
 from cloudinit.tests.helpers import CiTestCase, ExitStack, mock, TestCase
@@ -239,5 +240,92 @@ class TestMkfsCommandHandling(CiTestCase):
         subp.assert_called_once_with(
             ['/sbin/mkswap', '/dev/xdb1', '-L', 'swap', '-f'], shell=False)
 
+
+@mock.patch('cloudinit.config.cc_disk_setup.parent_disk',
+            side_effect=lambda dev: dev and dev.rstrip('0123456789'))
+@mock.patch('cloudinit.config.cc_disk_setup.util.udevadm_settle')
+class TestHandle(CiTestCase):
+
+    def setUp(self):
+        super(TestHandle, self).setUp()
+        self.cloud = mock.Mock()
+        self.cloud.device_name_to_device.return_value = None
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def record(self, device, *args, **kwargs):
+        with self.lock:
+            self.calls.append((device, kwargs))
+
+    @mock.patch('cloudinit.config.cc_disk_setup.mkfs')
+    @mock.patch('cloudinit.config.cc_disk_setup.mkpart')
+    def test_disks_handled_concurrently_with_one_settle_per_phase(
+            self, m_mkpart, m_mkfs, m_settle, _m_parent):
+        """Disks are partitioned in parallel, then formatted in parallel."""
+        partitioning = threading.Barrier(2, timeout=5)
+        formatting = threading.Barrier(2, timeout=5)
+
+        def mkpart(device, definition, settled):
+            self.record(device, settled=settled)
+            partitioning.wait()
+
+        def mkfs(fs_cfg, settled):
+            self.record(fs_cfg['device'], settled=settled)
+            if fs_cfg['device'].endswith('1'):
+                formatting.wait()
+
+        m_mkpart.side_effect = mkpart
+        m_mkfs.side_effect = mkfs
+        cfg = {
+            'disk_setup': {'/dev/xdb': {'layout': True},
+                           '/dev/xdc': {'layout': True}},
+            'fs_setup': [{'device': '/dev/xdb1'}, {'device': '/dev/xdb2'},
+                         {'device': '/dev/xdc1'}, 'invalid'],
+        }
+        cc_disk_setup.handle('disk_setup', cfg, self.cloud, mock.Mock(), [])
+
+        self.assertEqual(2, m_settle.call_count)
+        self.assertEqual(
+            ['/dev/xdb', '/dev/xdc'], sorted(c[0] for c in self.calls[:2]))
+        formatted = [c[0] for c in self.calls[2:]]
+        self.assertEqual(['/dev/xdb1', '/dev/xdb2', '/dev/xdc1'],
+                         sorted(formatted))
+        self.assertLess(
+            formatted.index('/dev/xdb1'), formatted.index('/dev/xdb2'))
+        self.assertEqual(
+            [{'settled': True}] * 5, [c[1] for c in self.calls])
+
+    @mock.patch('cloudinit.config.cc_disk_setup.mkfs')
+    def test_failure_does_not_stop_other_entries_of_disk(
+            self, m_mkfs, m_settle, _m_parent):
+        m_mkfs.side_effect = [Exception('mkfs failed'), None]
+        cfg = {'fs_setup': [{'device': '/dev/xdb1'},
+                            {'device': '/dev/xdb2'}]}
+        cc_disk_setup.handle('disk_setup', cfg, self.cloud, mock.Mock(), [])
+
+        self.assertEqual(2, m_mkfs.call_count)
+        self.assertEqual(1, m_settle.call_count)
+
+
+@mock.patch('cloudinit.config.cc_disk_setup.os.path.exists',
+            return_value=True)
+@mock.patch('cloudinit.config.cc_disk_setup.util.udevadm_settle')
+class TestAssertAndSettleDevice(TestCase):
+
+    def test_settles_for_existing_device(self, m_settle, _m_exists):
+        cc_disk_setup.assert_and_settle_device('/dev/xdb')
+        self.assertEqual(1, m_settle.call_count)
+
+    def test_settled_skips_settle_for_existing_device(
+            self, m_settle, _m_exists):
+        cc_disk_setup.assert_and_settle_device('/dev/xdb', settled=True)
+        self.assertEqual(0, m_settle.call_count)
+
+    def test_settled_still_settles_for_missing_device(
+            self, m_settle, m_exists):
+        m_exists.side_effect = [False, True]
+        cc_disk_setup.assert_and_settle_device('/dev/xdb', settled=True)
+        self.assertEqual(1, m_settle.call_count)
+
 #
 # vi: ts=4 expandtab
@@ -10,6 +10,7 @@ import errno
 import logging
 import os
 import re
+import threading
 import unittest
 from contextlib import ExitStack
 from unittest import mock
@@ -163,7 +164,28 @@ class TestConfig(TestCase):
             self.handle(self.name, {}, self.cloud_init, self.log, self.args)
 
             factory.assert_called_once_with('auto')
-            rsdevs.assert_called_once_with(myresizer, ['/'])
+            rsdevs.assert_called_once_with(
+                myresizer, ['/'], concurrent=False)
+
+    def test_handle_concurrent_enabled(self):
+        # disks are only resized concurrently when enabled in config
+        myresizer = object()
+        retval = (("/", cc_growpart.RESIZE.CHANGED, "my-message",),)
+        config = {'growpart': {'mode': 'auto', 'concurrent': True}}
+
+        with ExitStack() as mocks:
+            mocks.enter_context(
+                mock.patch.object(cc_growpart, 'resizer_factory',
+                                  return_value=myresizer))
+            rsdevs = mocks.enter_context(
+                mock.patch.object(cc_growpart, 'resize_devices',
+                                  return_value=retval))
+
+            self.handle(self.name, config, self.cloud_init, self.log,
+                        self.args)
+
+            rsdevs.assert_called_once_with(
+                myresizer, ['/'], concurrent=True)
 
 
 class TestResize(unittest.TestCase):
@@ -226,6 +248,42 @@ class TestResize(unittest.TestCase):
             cc_growpart.device_part_info = opinfo
             os.stat = real_stat
 
+    @mock.patch.object(cc_growpart, 'device_part_info')
+    @mock.patch.object(cc_growpart.os, 'stat')
+    def test_concurrent_resizes_disks_in_parallel(self, m_stat, m_info):
+        """Disks resize in parallel, partitions of one disk in order."""
+        m_stat.return_value = Bunch(st_mode=25008)
+        m_info.side_effect = part_info_or_type_error
+        devs = ["/dev/XXda1", "/dev/YYda1", "/dev/XXda2", "/dev/NOPART"]
+        both_disks_resizing = threading.Barrier(2, timeout=5)
+        lock = threading.Lock()
+        active = []
+        calls = []
+
+        class myresizer(object):
+            def resize(self, diskdev, partnum, partdev):
+                with lock:
+                    if diskdev in active:
+                        raise AssertionError("%s resized twice" % diskdev)
+                    active.append(diskdev)
+                    calls.append(partdev)
+                if partnum == "1":
+                    both_disks_resizing.wait()
+                with lock:
+                    active.remove(diskdev)
+                return (1024, 2048)
+
+        resized = cc_growpart.resize_devices(
+            myresizer(), devs, concurrent=True)
+
+        self.assertEqual(
+            devs, [entry for (entry, _action, _msg) in resized])
+        self.assertEqual(
+            [cc_growpart.RESIZE.CHANGED] * 3 + [cc_growpart.RESIZE.SKIPPED],
+            [action for (_entry, action, _msg) in resized])
+        self.assertLess(
+            calls.index("/dev/XXda1"), calls.index("/dev/XXda2"))
+
 
 def simple_device_part_info(devpath):
     # simple stupid return (/dev/vda, 1) for /dev/vda
@@ -234,6 +292,12 @@ def simple_device_part_info(devpath):
     return x
 
 
+def part_info_or_type_error(devpath):
+    if devpath == "/dev/NOPART":
+        raise TypeError("%s not a partition" % devpath)
+    return simple_device_part_info(devpath)
+
+
 class Bunch(object):
     def __init__(self, **kwds):
         self.__dict__.update(kwds)
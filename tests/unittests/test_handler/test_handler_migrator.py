@@ -0,0 +1,51 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import logging
+import os
+from unittest import mock
+
+from cloudinit.config import cc_migrator
+from cloudinit import helpers
+from cloudinit.settings import PER_INSTANCE, PER_ONCE
+from cloudinit.tests.helpers import CiTestCase
+from cloudinit.util import write_file
+
+LOG = logging.getLogger(__name__)
+
+
+class TestMigratorJournal(CiTestCase):
+
+    def setUp(self):
+        super(TestMigratorJournal, self).setUp()
+        self.paths = helpers.Paths(
+            {'cloud_dir': self.tmp_dir(), 'semaphore_backend': 'journal'})
+        self.sem_path = self.paths.get_cpath('sem')
+        self.cloud = mock.Mock(paths=self.paths)
+
+    def _write_journal(self, *entries):
+        write_file(os.path.join(self.sem_path, '.journal'), ''.join(
+            '["%s", "1: 2"]\n' % key for key in entries))
+
+    def test_non_canonical_entries_are_renamed(self):
+        """Journal entries with non-canonical names are canonicalized."""
+        self._write_journal('config-ssh', 'config-ntp.once', 'config_foo')
+        cc_migrator.handle('migrator', {}, self.cloud, LOG, [])
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertEqual(
+            ['config_foo', 'config_ntp.once', 'config_ssh'],
+            sorted(sems.entries))
+
+    def test_legacy_entries_are_migrated(self):
+        """apt-update-upgrade entries turn into its replacement modules."""
+        self._write_journal('apt-update-upgrade', 'apt_update_upgrade.once')
+        cc_migrator.handle('migrator', {}, self.cloud, LOG, [])
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertEqual(
+            ['apt_configure', 'apt_configure.once',
+             'package_update_upgrade_install',
+             'package_update_upgrade_install.once'],
+            sorted(sems.entries))
+        for freq in (PER_INSTANCE, PER_ONCE):
+            self.assertTrue(sems.has_run('apt-configure', freq))
+
+# vi: ts=4 expandtab
@@ -1,6 +1,9 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import errno
+import mmap
 import os.path
+import struct
 from unittest import mock
 
 from cloudinit.config import cc_mounts
@@ -152,6 +155,9 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
 
         self.add_patch('cloudinit.config.cc_mounts.subp.subp',
                        'm_subp_subp')
+        self.add_patch('cloudinit.config.cc_mounts.os.posix_fallocate',
+                       'm_fallocate', autospec=False,
+                       wraps=os.posix_fallocate)
 
         self.add_patch('cloudinit.config.cc_mounts.util.mounts',
                        'mock_util_mounts',
@@ -168,8 +174,8 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
         self.cc = {
             'swap': {
                 'filename': self.swap_path,
-                'size': '512',
-                'maxsize': '512'}}
+                'size': '1M',
+                'maxsize': '1M'}}
 
     def _makedirs(self, directory):
         directory = os.path.join(self.new_root, directory.lstrip('/'))
@@ -184,6 +190,18 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
 
         return dev
 
+    def assert_swap_header(self, pages):
+        pagesize = os.sysconf('SC_PAGE_SIZE')
+        with open(self.swap_path, 'rb') as stream:
+            header = stream.read(pagesize)
+        self.assertEqual(b'SWAPSPACE2', header[-10:])
+        self.assertEqual((1, pages - 1, 0),
+                         struct.unpack_from('=III', header, 1024))
+        self.assertEqual(0o600, os.stat(self.swap_path).st_mode & 0o777)
+        # neither fallocate, dd nor mkswap are run
+        self.assertEqual(mock.call(['swapon', '-a']),
+                         self.m_subp_subp.call_args_list[0])
+
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
     def test_swap_creation_method_fallocate_on_xfs(self, m_kernel_version,
@@ -192,10 +210,9 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
         m_get_mount_info.return_value = ["", "xfs"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
-        self.m_subp_subp.assert_has_calls([
-            mock.call(['fallocate', '-l', '0M', self.swap_path], capture=True),
-            mock.call(['mkswap', self.swap_path]),
-            mock.call(['swapon', '-a'])])
+        self.m_fallocate.assert_called_once_with(mock.ANY, 0, 2 ** 20)
+        self.assertEqual(2 ** 20, os.path.getsize(self.swap_path))
+        self.assert_swap_header(2 ** 20 // os.sysconf('SC_PAGE_SIZE'))
 
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
@@ -205,12 +222,9 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
         m_get_mount_info.return_value = ["", "xfs"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
-        self.m_subp_subp.assert_has_calls([
-            mock.call(['dd', 'if=/dev/zero',
-                       'of=' + self.swap_path,
-                       'bs=1M', 'count=0'], capture=True),
-            mock.call(['mkswap', self.swap_path]),
-            mock.call(['swapon', '-a'])])
+        self.assertEqual(0, self.m_fallocate.call_count)
+        self.assertEqual(2 ** 20, os.path.getsize(self.swap_path))
+        self.assert_swap_header(2 ** 20 // os.sysconf('SC_PAGE_SIZE'))
 
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
@@ -220,12 +234,9 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
         m_get_mount_info.return_value = ["", "btrfs"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
-        self.m_subp_subp.assert_has_calls([
-            mock.call(['dd', 'if=/dev/zero',
-                       'of=' + self.swap_path,
-                       'bs=1M', 'count=0'], capture=True),
-            mock.call(['mkswap', self.swap_path]),
-            mock.call(['swapon', '-a'])])
+        self.assertEqual(0, self.m_fallocate.call_count)
+        self.assertEqual(2 ** 20, os.path.getsize(self.swap_path))
+        self.assert_swap_header(2 ** 20 // os.sysconf('SC_PAGE_SIZE'))
 
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
@@ -235,10 +246,34 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
         m_get_mount_info.return_value = ["", "ext4"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
-        self.m_subp_subp.assert_has_calls([
-            mock.call(['fallocate', '-l', '0M', self.swap_path], capture=True),
-            mock.call(['mkswap', self.swap_path]),
-            mock.call(['swapon', '-a'])])
+        self.m_fallocate.assert_called_once_with(mock.ANY, 0, 2 ** 20)
+        self.assert_swap_header(2 ** 20 // os.sysconf('SC_PAGE_SIZE'))
+
+    @mock.patch('cloudinit.util.get_mount_info')
+    @mock.patch('cloudinit.util.kernel_version')
+    def test_swap_creation_falls_back_to_zeros(self, m_kernel_version,
+                                               m_get_mount_info):
+        """Zeros are written when space can not be allocated."""
+        m_kernel_version.return_value = (5, 14)
+        m_get_mount_info.return_value = ["", "ext4"]
+        self.m_fallocate.side_effect = OSError(
+            errno.EOPNOTSUPP, 'Operation not supported')
+
+        with mock.patch('cloudinit.config.cc_mounts.ZERO_CHUNK_SIZE',
+                        mmap.PAGESIZE):
+            cc_mounts.handle(
+                None, self.cc, self.mock_cloud, self.mock_log, [])
+        self.assertEqual(1, self.m_fallocate.call_count)
+        self.assertEqual(2 ** 20, os.path.getsize(self.swap_path))
+        self.assert_swap_header(2 ** 20 // os.sysconf('SC_PAGE_SIZE'))
+
+    @mock.patch('cloudinit.util.get_mount_info')
+    def test_swap_too_small_is_removed(self, m_get_mount_info):
+        m_get_mount_info.return_value = ["", "ext4"]
+        self.cc['swap']['size'] = '512'
+
+        cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        self.assertFalse(os.path.exists(self.swap_path))
 
 
 class TestFstabHandling(test_helpers.FilesystemMockingTestCase):
@@ -4,11 +4,12 @@ import base64
 import copy
 import gzip
 import io
+import os
 import shutil
 import tempfile
 
 from cloudinit.config.cc_write_files import (
-    handle, decode_perms, write_files)
+    STREAM_CHUNK_SIZE, handle, decode_contents, decode_perms, write_files)
 from cloudinit import log as logging
 from cloudinit import util
 
@@ -174,7 +175,8 @@ class TestWriteFiles(FilesystemMockingTestCase):
             for content, aliases in (gz, gz_b64, b64):
                 for enc in aliases:
                     cur = {'content': content,
-                           'path': '/tmp/file-%s-%s' % (name, enc),
+                           'path': os.path.join(
+                               self.tmp, 'file-%s-%s' % (name, enc)),
                            'encoding': enc}
                     files.append(cur)
                     expected.append((cur['path'], data))
@@ -189,6 +191,71 @@ class TestWriteFiles(FilesystemMockingTestCase):
             len(gz_aliases + gz_b64_aliases + b64_aliases) * len(datum))
         self.assertEqual(len(expected), flen_expected)
 
+    def test_entries_for_one_path_are_written_in_order(self):
+        self.patchUtils(self.tmp)
+        files = [{'path': '/tmp/ordered', 'content': str(i), 'append': True}
+                 for i in range(10)]
+        files.extend({'path': '/tmp/other-%d' % i, 'content': 'x'}
+                     for i in range(5))
+        write_files("test_ordered", files)
+        self.assertEqual('0123456789', util.load_file('/tmp/ordered'))
+
+    def test_undecodable_content_leaves_no_file(self):
+        path = os.path.join(self.tmp, 'broken')
+        content = base64.b64encode(_gzip_bytes(b'x' * 100000)[:-20])
+        with self.assertRaises(util.DecompressionError):
+            write_files("test_broken", [
+                {'path': path, 'content': content, 'encoding': 'gz+b64'}])
+        self.assertEqual([], os.listdir(self.tmp))
+
+    def test_undecodable_content_keeps_existing_file(self):
+        path = os.path.join(self.tmp, 'keep.conf')
+        util.write_file(path, 'original\n')
+        content = base64.b64encode(_gzip_bytes(b'x' * 100000)[:-20])
+        with self.assertRaises(util.DecompressionError):
+            write_files("test_broken", [
+                {'path': path, 'content': content, 'encoding': 'gz+b64'}])
+        self.assertEqual('original\n', util.load_file(path))
+        self.assertEqual(['keep.conf'], os.listdir(self.tmp))
+
+    def test_decoded_content_replaces_symlink_target(self):
+        target = os.path.join(self.tmp, 'target')
+        link = os.path.join(self.tmp, 'link')
+        util.write_file(target, 'original\n')
+        os.symlink(target, link)
+        write_files("test_link", [
+            {'path': link, 'content': base64.b64encode(b'new\n'),
+             'encoding': 'b64', 'permissions': '0600'}])
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual('new\n', util.load_file(target))
+        self.assertEqual(0o600, os.stat(target).st_mode & 0o777)
+
+    def test_undecodable_appended_content_is_not_appended(self):
+        path = os.path.join(self.tmp, 'appended')
+        util.write_file(path, 'existing\n')
+        with self.assertRaises(util.DecompressionError):
+            write_files("test_broken", [
+                {'path': path, 'content': b'\x1f\x8bnot gzip',
+                 'encoding': 'gzip', 'append': True}])
+        self.assertEqual('existing\n', util.load_file(path))
+
+
+class TestDecodeContents(CiTestCase):
+
+    def test_decoded_in_bounded_chunks(self):
+        """Large payloads are never decoded in one piece."""
+        data = os.urandom(STREAM_CHUNK_SIZE) * 8
+        content = base64.encodebytes(_gzip_bytes(data)).decode()
+        chunks = list(decode_contents(
+            content, ['application/base64', 'application/x-gzip']))
+        self.assertEqual(data, b''.join(chunks))
+        self.assertLessEqual(max(len(c) for c in chunks), STREAM_CHUNK_SIZE)
+
+    def test_concatenated_gzip_members(self):
+        content = _gzip_bytes(b'first ') + _gzip_bytes(b'second')
+        self.assertEqual(b'first second', b''.join(
+            decode_contents(content, ['application/x-gzip'])))
+
 
 class TestDecodePerms(CiTestCase):
 
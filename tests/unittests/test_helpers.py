@@ -2,11 +2,15 @@
 
 """Tests of the built-in user data handlers."""
 
+import json
 import os
 
 from cloudinit.tests import helpers as test_helpers
 
+from cloudinit import helpers
 from cloudinit import sources
+from cloudinit.settings import PER_ALWAYS, PER_INSTANCE, PER_ONCE
+from cloudinit.util import load_file, write_file
 
 
 class MyDataSource(sources.DataSource):
@@ -34,4 +38,196 @@ class TestPaths(test_helpers.ResourceUsingTestCase):
 
         self.assertIsNone(mypaths.get_ipath())
 
+
+class TestJournalSemaphores(test_helpers.CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestJournalSemaphores, self).setUp()
+        self.sem_path = self.tmp_path('sem')
+        self.journal = os.path.join(self.sem_path, '.journal')
+
+    def _journal_lines(self):
+        return [json.loads(line)
+                for line in load_file(self.journal).splitlines()]
+
+    def test_lock_records_entry_in_single_journal(self):
+        """Acquiring a lock appends one entry to the journal, no sem files."""
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertFalse(sems.has_run('config-ssh', PER_INSTANCE))
+        with sems.lock('config-ssh', PER_INSTANCE) as lk:
+            self.assertIsInstance(lk, helpers.JournalLock)
+        with sems.lock('config-ssh', PER_ONCE) as lk:
+            self.assertIsNotNone(lk)
+        self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+        self.assertEqual(['.journal'], os.listdir(self.sem_path))
+        self.assertEqual(
+            ['config_ssh', 'config_ssh.once'],
+            [key for (key, _value) in self._journal_lines()])
+
+    def test_lock_returns_none_if_already_run(self):
+        sems = helpers.JournalSemaphores(self.sem_path)
+        with sems.lock('config-ssh', PER_INSTANCE):
+            pass
+        with sems.lock('config-ssh', PER_INSTANCE) as lk:
+            self.assertIsNone(lk)
+
+    def test_always_never_has_run(self):
+        sems = helpers.JournalSemaphores(self.sem_path)
+        with sems.lock('config-ssh', PER_ALWAYS):
+            pass
+        self.assertFalse(sems.has_run('config-ssh', PER_ALWAYS))
+
+    def test_journal_is_read_once(self):
+        """Neither has_run nor lock read the journal after the first load."""
+        sems = helpers.JournalSemaphores(self.sem_path)
+        with sems.lock('config-ssh', PER_INSTANCE):
+            pass
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+        with test_helpers.mock.patch(
+                'cloudinit.helpers.util.load_file') as m_load:
+            self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+            self.assertFalse(sems.has_run('config-ntp', PER_INSTANCE))
+            with sems.lock('config-ntp', PER_INSTANCE):
+                pass
+            self.assertTrue(sems.clear('config-ssh', PER_INSTANCE))
+        self.assertEqual(0, m_load.call_count)
+
+    def test_flush_syncs_appends_once(self):
+        """flush() fsyncs all appends at once and closes the journal."""
+        sems = helpers.JournalSemaphores(self.sem_path)
+        with test_helpers.mock.patch('cloudinit.helpers.os.fsync') as m_sync:
+            for name in ('config-ssh', 'config-ntp', 'config-locale'):
+                with sems.lock(name, PER_INSTANCE):
+                    pass
+            self.assertEqual(0, m_sync.call_count)
+            sems.flush()
+            sems.flush()
+        self.assertEqual(1, m_sync.call_count)
+        self.assertIsNone(sems._fd)
+        with sems.lock('config-users-groups', PER_INSTANCE):
+            pass
+        self.assertEqual(4, len(self._journal_lines()))
+
+    def test_existing_sem_files_are_imported(self):
+        """Semaphore files are migrated when no journal exists yet."""
+        write_file(os.path.join(self.sem_path, 'config_ssh'), '1: 2\n')
+        write_file(os.path.join(self.sem_path, 'config_ntp.once'), '3: 4\n')
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+        self.assertTrue(sems.has_run('config-ntp', PER_ONCE))
+        with sems.lock('config-users-groups', PER_INSTANCE):
+            pass
+        entries = dict(self._journal_lines())
+        self.assertEqual('1: 2', entries['config_ssh'])
+        self.assertIn('config_users_groups', entries)
+
+    def test_unmigrated_name_warns(self):
+        """A non-canonical entry counts as run, as with FileSemaphores."""
+        write_file(self.journal, json.dumps(['config-ssh', '1: 2']) + '\n')
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+        self.assertIn(
+            'has run without canonicalized name', self.logs.getvalue())
+
+    def test_clear_removes_entry_and_legacy_file(self):
+        write_file(os.path.join(self.sem_path, 'config_ssh'), '1: 2\n')
+        sems = helpers.JournalSemaphores(self.sem_path)
+        with sems.lock('config-ntp', PER_INSTANCE):
+            pass
+        self.assertTrue(sems.clear('config-ssh', PER_INSTANCE))
+        self.assertFalse(sems.has_run('config-ssh', PER_INSTANCE))
+        self.assertTrue(sems.has_run('config-ntp', PER_INSTANCE))
+        self.assertEqual(['.journal'], os.listdir(self.sem_path))
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertFalse(sems.has_run('config-ssh', PER_INSTANCE))
+
+    def test_clear_all_removes_journal(self):
+        sems = helpers.JournalSemaphores(self.sem_path)
+        with sems.lock('config-ssh', PER_INSTANCE):
+            pass
+        sems.clear_all()
+        self.assertFalse(os.path.exists(self.sem_path))
+        self.assertFalse(sems.has_run('config-ssh', PER_INSTANCE))
+
+    def test_appends_keep_other_writers(self):
+        """Entries appended by another instance are not overwritten."""
+        sems1 = helpers.JournalSemaphores(self.sem_path)
+        sems2 = helpers.JournalSemaphores(self.sem_path)
+        self.assertFalse(sems1.has_run('config-ssh', PER_INSTANCE))
+        with sems2.lock('config-ntp', PER_INSTANCE):
+            pass
+        with sems1.lock('config-ssh', PER_INSTANCE):
+            pass
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertTrue(sems.has_run('config-ntp', PER_INSTANCE))
+        self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+
+    def test_superseded_lines_are_compacted_on_load(self):
+        sems = helpers.JournalSemaphores(self.sem_path)
+        sems.max_stale_lines = 2
+        for _ in range(3):
+            with sems.lock('config-ssh', PER_INSTANCE):
+                pass
+            sems.clear('config-ssh', PER_INSTANCE)
+        with sems.lock('config-ntp', PER_INSTANCE):
+            pass
+        self.assertEqual(7, len(self._journal_lines()))
+        sems = helpers.JournalSemaphores(self.sem_path)
+        sems.max_stale_lines = 2
+        self.assertTrue(sems.has_run('config-ntp', PER_INSTANCE))
+        self.assertEqual(['config_ntp'],
+                         [key for (key, _value) in self._journal_lines()])
+
+    def test_corrupt_journal_line_is_ignored(self):
+        write_file(self.journal, '["config_ntp", "1: 2"]\n["config_ss')
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertTrue(sems.has_run('config-ntp', PER_INSTANCE))
+        self.assertFalse(sems.has_run('config-ssh', PER_INSTANCE))
+        self.assertIn(
+            'Ignoring corrupt line in semaphore journal',
+            self.logs.getvalue())
+        with sems.lock('config-ssh', PER_INSTANCE):
+            pass
+        sems = helpers.JournalSemaphores(self.sem_path)
+        self.assertTrue(sems.has_run('config-ssh', PER_INSTANCE))
+
+
+class TestGetSemaphores(test_helpers.CiTestCase):
+
+    with_logs = True
+
+    def test_backend_selection(self):
+        """semaphore_backend in paths config selects the implementation."""
+        for cfg, expected in (({}, helpers.FileSemaphores),
+                              ({'semaphore_backend': 'file'},
+                               helpers.FileSemaphores),
+                              ({'semaphore_backend': 'journal'},
+                               helpers.JournalSemaphores)):
+            paths = helpers.Paths(cfg)
+            self.assertEqual(
+                expected, type(helpers.get_semaphores(paths, '/sem')))
+
+    def test_unknown_backend_warns_and_uses_files(self):
+        paths = helpers.Paths({'semaphore_backend': 'bogus'})
+        self.assertEqual(
+            helpers.FileSemaphores,
+            type(helpers.get_semaphores(paths, '/sem')))
+        self.assertIn(
+            "Unknown semaphore_backend 'bogus'", self.logs.getvalue())
+
+    def test_runners_use_configured_backend(self):
+        paths = helpers.Paths(
+            {'cloud_dir': self.tmp_dir(), 'semaphore_backend': 'journal'})
+        runners = helpers.Runners(paths)
+        self.assertEqual(
+            (True, 'ran'),
+            runners.run('config-ssh', lambda: 'ran', [], freq=PER_ONCE))
+        self.assertEqual(
+            (False, None),
+            runners.run('config-ssh', lambda: 'ran', [], freq=PER_ONCE))
+        self.assertEqual(['.journal'], os.listdir(paths.get_cpath('sem')))
+
 # vi: ts=4 expandtab
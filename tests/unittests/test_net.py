@@ -6,7 +6,7 @@ from cloudinit.net import cmdline
 from cloudinit.net import (
     eni, interface_has_own_mac, natural_sort_key, netplan, network_state,
     renderers, sysconfig)
-from cloudinit.sources.helpers import openstack
+from cloudinit.sources.helpers import netlink, openstack
 from cloudinit import temp_utils
 from cloudinit import subp
 from cloudinit import util
@@ -3964,6 +3964,21 @@ STARTMODE=auto
 
 class TestEniNetRendering(CiTestCase):
 
+    def test_unchanged_files_are_not_rewritten(self):
+        """Rendering identical content leaves the files alone."""
+        ns = network_state.parse_net_config_data(
+            {'version': 1, 'config': [{'type': 'physical', 'name': 'eth0'}]})
+        render_dir = self.tmp_dir()
+        renderer = eni.Renderer(
+            {'eni_path': 'interfaces', 'netrules_path': None})
+        renderer.render_network_state(ns, target=render_dir)
+        with mock.patch('cloudinit.net.renderer.util.write_file') as m_write:
+            renderer.render_network_state(ns, target=render_dir)
+            self.assertEqual(0, m_write.call_count)
+            os.chmod(os.path.join(render_dir, 'interfaces'), 0o600)
+            renderer.render_network_state(ns, target=render_dir)
+            self.assertEqual(1, m_write.call_count)
+
     @mock.patch("cloudinit.net.util.get_cmdline", return_value="root=myroot")
     @mock.patch("cloudinit.net.sys_dev_path")
     @mock.patch("cloudinit.net.read_sys_net")
@@ -5704,6 +5719,99 @@ class TestRenameInterfaces(CiTestCase):
             for i in range(len(renames))]
         mock_subp.assert_has_calls(expected)
 
+    @staticmethod
+    def _info(*names, up=False, downable=True):
+        return dict(
+            (name, {'downable': downable, 'mac': '00:00:00:00:00:%02x' % i,
+                    'name': name, 'up': up})
+            for i, name in enumerate(names))
+
+    def test_plan_swap_uses_one_temporary_name(self):
+        """Swapped names are a cycle broken with a single temporary name."""
+        ops, errors = net._plan_renames(
+            [('00:00:00:00:00:00', 'eth1', None, None),
+             ('00:00:00:00:00:01', 'eth0', None, None)],
+            self._info('eth0', 'eth1'))
+        self.assertEqual([], errors)
+        self.assertEqual(
+            [('eth0', 'cirename0'), ('eth1', 'eth0'), ('cirename0', 'eth1')],
+            [params for op, _mac, _name, params in ops])
+
+    def test_plan_chain_is_ordered_without_temporary_names(self):
+        """Renames onto names being vacated wait for them to be free."""
+        ops, errors = net._plan_renames(
+            [('00:00:00:00:00:00', 'eth1', None, None),
+             ('00:00:00:00:00:01', 'eth2', None, None)],
+            self._info('eth0', 'eth1', up=True))
+        self.assertEqual([], errors)
+        self.assertEqual([
+            ('down', '00:00:00:00:00:01', 'eth2', ('eth1',)),
+            ('rename', '00:00:00:00:00:01', 'eth2', ('eth1', 'eth2')),
+            ('down', '00:00:00:00:00:00', 'eth1', ('eth0',)),
+            ('rename', '00:00:00:00:00:00', 'eth1', ('eth0', 'eth1')),
+            ('up', '00:00:00:00:00:01', 'eth2', ('eth2',)),
+            ('up', '00:00:00:00:00:00', 'eth1', ('eth1',)),
+        ], ops)
+
+    def test_plan_moves_aside_interfaces_holding_a_new_name(self):
+        ops, errors = net._plan_renames(
+            [('00:00:00:00:00:00', 'eth1', None, None)],
+            self._info('eth0', 'eth1'))
+        self.assertEqual([], errors)
+        self.assertEqual(
+            [('eth1', 'cirename0'), ('eth0', 'eth1')],
+            [params for op, _mac, _name, params in ops])
+
+    def test_plan_busy_target(self):
+        """Busy interfaces holding a new name block the rename."""
+        info = self._info('eth0', 'eth1')
+        info['eth1'].update({'up': True, 'downable': False})
+        ops, errors = net._plan_renames(
+            [('00:00:00:00:00:00', 'eth1', None, None)], info)
+        self.assertEqual([], ops)
+        self.assertEqual(
+            ['[busy-target] Error renaming mac=00:00:00:00:00:00 from eth0'
+             ' to eth1.'], errors)
+
+    def test_plan_rotation_of_many_interfaces(self):
+        """A rotation of many names takes one extra rename."""
+        count = 2000
+        names = ['eth%d' % i for i in range(count)]
+        info = self._info(*names)
+        renames = [(info[name]['mac'], names[(i + 1) % count], None, None)
+                   for i, name in enumerate(names)]
+        ops, errors = net._plan_renames(renames, info)
+        self.assertEqual([], errors)
+        self.assertEqual(count + 1, len(ops))
+
+    @mock.patch('cloudinit.net.socket.if_nametoindex')
+    @mock.patch('cloudinit.subp.subp')
+    def test_rename_in_one_netlink_batch(self, mock_subp, m_index):
+        """Rename ops are sent as one rtnetlink batch by ifindex."""
+        m_index.side_effect = {'eth0': 2, 'eth1': 3}.get
+        with mock.patch(
+                'cloudinit.sources.helpers.netlink.send_rtnetlink_requests',
+                return_value=[0, 0, 0, 0, 16, 0, 0]) as m_send:
+            with self.assertRaises(Exception) as context_manager:
+                net._rename_interfaces(
+                    [('00:00:00:00:00:00', 'eth1', None, None),
+                     ('00:00:00:00:00:01', 'eth0', None, None)],
+                    current_info=self._info('eth0', 'eth1', up=True))
+        self.assertEqual(0, mock_subp.call_count)
+        self.assertEqual(
+            [netlink.link_request(2, False),
+             netlink.rename_request(2, 'cirename0'),
+             netlink.link_request(3, False),
+             netlink.rename_request(3, 'eth0'),
+             netlink.rename_request(2, 'eth1'),
+             netlink.link_request(2, True),
+             netlink.link_request(3, True)],
+            m_send.call_args[0][0])
+        self.assertEqual(
+            "[unknown] Error performing rename('cirename0', 'eth1') for"
+            " 00:00:00:00:00:00, eth1: Device or resource busy",
+            str(context_manager.exception))
+
 
 class TestNetworkState(CiTestCase):
 
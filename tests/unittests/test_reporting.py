@@ -352,6 +352,20 @@ class TestReportingEventStack(TestCase):
         self.assertEqual(report_start.call_count, 0)
         self.assertEqual(report_finish.call_count, 0)
 
+    @mock.patch('cloudinit.reporting.events.report_start_event')
+    @mock.patch('cloudinit.reporting.events.report_finish_event')
+    def test_current_event_stack_tracks_innermost_entered(
+            self, report_start, report_finish):
+        self.assertIsNone(events.current_event_stack())
+        parent = events.ReportEventStack("pname", "pdesc")
+        child = events.ReportEventStack("cname", "cdesc", parent=parent)
+        with parent:
+            self.assertIs(parent, events.current_event_stack())
+            with child:
+                self.assertIs(child, events.current_event_stack())
+            self.assertIs(parent, events.current_event_stack())
+        self.assertIsNone(events.current_event_stack())
+
     def test_reporting_event_has_sane_repr(self):
         myrep = events.ReportEventStack("fooname", "foodesc",
                                         reporting_enabled=True).__repr__()
@@ -100,6 +100,29 @@ class TestSimpleRun(helpers.FilesystemMockingTestCase):
             " distro 'ubuntu'",
             self.logs.getvalue())
         self.assertNotIn('spacewalk', which_ran)
+        self.assertEqual(1, mods.imports_avoided)
+
+    def test_none_ds_does_not_import_modules_which_previously_ran(self):
+        """Modules reported as previously ran are never imported."""
+        initer = stages.Init()
+        initer.read_cfg()
+        initer.initialize()
+        initer.fetch()
+        initer.instancify()
+        initer.update()
+        initer.cloudify().run('consume_data', initer.consume_data,
+                              args=[PER_INSTANCE], freq=PER_INSTANCE)
+
+        mods = stages.Modules(initer)
+        mods.run_section('cloud_init_modules')
+        mods = stages.Modules(initer)
+        with helpers.mock.patch(
+                'cloudinit.config.DeferredModule.load') as m_load:
+            (which_ran, failures) = mods.run_section('cloud_init_modules')
+        self.assertEqual([], failures)
+        self.assertEqual(['write-files', 'runcmd'], which_ran)
+        self.assertEqual(0, m_load.call_count)
+        self.assertEqual(3, mods.imports_avoided)
 
     def test_none_ds_runs_modules_which_distros_all(self):
         """Skip modules which define distros attribute as supporting 'all'.
@@ -887,20 +887,65 @@ class TestKernelVersion():
         assert expected == util.kernel_version()
 
 
-class TestFindDevs:
-    @mock.patch('cloudinit.subp.subp')
-    def test_find_devs_with(self, m_subp):
-        m_subp.return_value = (
-            '/dev/sda1: UUID="some-uuid" TYPE="ext4" PARTUUID="some-partid"',
-            ''
-        )
-        devlist = util.find_devs_with()
-        assert devlist == [
-            '/dev/sda1: UUID="some-uuid" TYPE="ext4" PARTUUID="some-partid"']
+BLKID_EXPORT = """\
+DEVNAME=/dev/sda1
+UUID=some-uuid
+TYPE=ext4
+PARTUUID=some-partid
+
+DEVNAME=/dev/sr0
+UUID=2021-05-11-10-00-00-00
+LABEL=config-2
+TYPE=iso9660
+
+DEVNAME=/dev/vdb
+LABEL_FATBOOT=CIDATA
+LABEL=my\\ data
+TYPE=vfat
+"""
+
+
+@mock.patch('cloudinit.util._block_device_names',
+            return_value=frozenset(['sda', 'sda1', 'sr0', 'vdb']))
+class TestFindDevsBlkidIndex:
+
+    @mock.patch('cloudinit.subp.subp', return_value=(BLKID_EXPORT, ''))
+    def test_queries_share_one_blkid_run(self, m_subp, _m_names):
+        """TYPE, LABEL and UUID queries are answered by one blkid run."""
+        assert ['/dev/sda1', '/dev/sr0', '/dev/vdb'] == util.find_devs_with()
+        assert ['/dev/sr0'] == util.find_devs_with('TYPE=iso9660')
+        assert ['/dev/sr0'] == util.find_devs_with('LABEL=config-2')
+        assert ['/dev/vdb'] == util.find_devs_with('LABEL_FATBOOT=CIDATA')
+        assert ['/dev/vdb'] == util.find_devs_with('LABEL=my data')
+        assert ['/dev/sda1'] == util.find_devs_with('UUID=some-uuid')
+        assert [] == util.find_devs_with('TYPE=ntfs')
+        assert 'TYPE' in util.blkid()['/dev/sr0']
+        assert [mock.call(['blkid', '-o', 'export'], rcs=[0, 2],
+                          decode='replace')] == m_subp.call_args_list
+
+    @mock.patch('cloudinit.subp.subp', return_value=(BLKID_EXPORT, ''))
+    def test_index_refreshed(self, m_subp, m_names):
+        """no_cache, new block devices and clearing rebuild the index."""
+        util.find_devs_with('TYPE=vfat')
+        util.find_devs_with('TYPE=vfat', no_cache=True)
+        assert ['blkid', '-o', 'export', '-c', '/dev/null'] == (
+            m_subp.call_args[0][0])
+        m_names.return_value = frozenset(['sda', 'sda1', 'sr0'])
+        util.find_devs_with('TYPE=vfat')
+        util.clear_blkid_index()
+        util.find_devs_with('TYPE=vfat')
+        util.find_devs_with('TYPE=vfat')
+        assert 4 == m_subp.call_count
+
+    @mock.patch('cloudinit.subp.subp', return_value=('/dev/sr0\n', ''))
+    def test_other_queries_run_blkid(self, m_subp, _m_names):
+        """Queries of a path or other output formats still run blkid."""
+        assert ['/dev/sr0'] == util.find_devs_with(path='/dev/sr0')
+        m_subp.assert_called_once_with(
+            ['blkid', '-odevice', '/dev/sr0'], rcs=[0, 2])
+
 
-        devlist = util.find_devs_with("LABEL_FATBOOT=A_LABEL")
-        assert devlist == [
-            '/dev/sda1: UUID="some-uuid" TYPE="ext4" PARTUUID="some-partid"']
+class TestFindDevs:
 
     @mock.patch('cloudinit.subp.subp')
     def test_find_devs_with_openbsd(self, m_subp):